@@ -1,13 +1,21 @@
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import create_react_agent
+from functools import lru_cache
+from langgraph.prebuilt import ToolNode, create_react_agent
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
 from tools.quotation_db_tool import search_quotation_details
 from tools.policy_rag_tool import search_policy_documents
 from tools.create_quotation_tool import create_quotation
+from tools.compare_quotations_tool import compare_quotations
 from tools.create_order_tool import create_order, update_order_payment, get_order_status
+from image_processing import ProcessedImage
+from vehicle_cache import CachedVehicle
+from budget import alimit_tool_call, answer_only_messages, current_budget, drop_tool_calls, limit_tool_call
+from prompt_cache import (
+    GeminiPrefixCache,
+    PromptCacheCallback,
+    build_static_prefix,
+)
 
 SYSTEM_PROMPT = """You are Zeus, a highly professional, accurate, and helpful AI assistant for a car insurance application in Thailand.
 
@@ -25,6 +33,7 @@ Your complete workflow when helping a user:
 - **NEVER hallucinate** car prices, policy rules, or premium rates. Always use the tools first.
 - **ALWAYS call `search_quotation_details`** when a car brand/model is mentioned, before stating any price.
 - **CRITICAL TOOL USAGE:** When calling `search_quotation_details`, split the name! If the user says "Honda Civic e:HEV RS", use `brand="Honda"`, `model="Civic"`, `sub_model="e:HEV RS"`. Do NOT pass "Honda Civic" as the model.
+- **When user compares several cars, trims or plans:** Call `compare_quotations` ONCE with all of them instead of one `search_quotation_details` per car. Set `create_quotations=true` only if the user asks for quotations for every compared option.
 - **ALWAYS call `search_policy_documents`** before stating any coverage detail or calculating a premium.
 - **CRITICAL: Always check 'Exclusions' before confirming coverage to the user.** Use the `section="Exclusion"` filter in the `search_policy_documents` tool to ensure a scenario is not excluded before saying it is covered.
 - **When user selects a plan:** Use `create_quotation` tool with the `car_model_id` and `plan_id` from the search results. Ask for customer details (name, email, phone) if not provided.
@@ -40,38 +49,129 @@ Your complete workflow when helping a user:
 - After creating an order, clearly display the order number, payment instructions, and policy number.
 """
 
-tools = [search_quotation_details, search_policy_documents, create_quotation, create_order, update_order_payment, get_order_status]
+MODEL_CHOICES = ("gemini-2.5-flash", "gemma-3-27b", "ollama", "openrouter")
+# Provider SDKs are imported on first use, so a model that is not enabled costs nothing at startup.
+ENABLED_MODELS = [
+    m.strip() for m in os.environ.get("ZEUS_ENABLED_MODELS", ",".join(MODEL_CHOICES)).split(",") if m.strip()
+]
 
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 
+tools = [
+    search_quotation_details, search_policy_documents, create_quotation, compare_quotations,
+    create_order, update_order_payment, get_order_status,
+]
+
+# Serialized once per process; also the payload uploaded to the Gemini context cache.
+STATIC_PREFIX = build_static_prefix(SYSTEM_PROMPT, tools)
+prompt_cache_callback = PromptCacheCallback(STATIC_PREFIX)
+
+
+@lru_cache(maxsize=1)
+def _prefix_cached_gemini_class():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    class _PrefixCachedGemini(ChatGoogleGenerativeAI):
+        """Gemini chat model whose system prompt and tool declarations live in cached content.
+
+        Gemini rejects requests that set ``system_instruction`` or ``tools`` alongside
+        ``cached_content``, so they are stripped here; the agent still binds the tools
+        so tool calls in the response are parsed and executed as usual.
+        """
+
+        def _prepare_request(self, *args, **kwargs):
+            request = super()._prepare_request(*args, **kwargs)
+            config = request.get("config")
+            if config is not None and config.cached_content:
+                config.system_instruction = None
+                config.tools = None
+                config.tool_config = None
+            return request
+
+    return _PrefixCachedGemini
+
+
+def _gemini_flash():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    cache_name = gemini_prefix_cache.name
+    if cache_name:
+        return _prefix_cached_gemini_class()(
+            model="gemini-2.5-flash",
+            google_api_key=os.environ["GEMINI_API_KEY"],
+            temperature=0.2,
+            cached_content=cache_name,
+        )
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        google_api_key=os.environ["GEMINI_API_KEY"],
+        temperature=0.2,
+    )
+
+
+def build_agent(llm):
+    """
+    ReAct graph over ``tools`` that respects the request's ``BudgetTracker``.
+
+    The model is chosen per step: normally ``llm`` with the tools bound, and once
+    the budget is spent ``llm`` without tools on a flattened transcript, so the
+    run ends with a best-effort answer instead of another tool call.
+    """
+    with_tools = llm.bind_tools(tools)
+    final_answer = RunnableLambda(answer_only_messages) | llm | RunnableLambda(drop_tool_calls)
+
+    def select_model(state, runtime):
+        tracker = current_budget.get()
+        if tracker is not None and tracker.start_step() is not None:
+            return final_answer
+        return with_tools
+
+    return create_react_agent(
+        select_model,
+        tools=ToolNode(tools, wrap_tool_call=limit_tool_call, awrap_tool_call=alimit_tool_call),
+        prompt=SYSTEM_PROMPT,
+    )
+
+
+@lru_cache(maxsize=None)
 def create_agent_executor(model_choice: str = "gemini-2.5-flash") -> create_react_agent:
+    """Build (once per model) a ReAct agent; compiled graphs are stateless and safe to share."""
+    if model_choice in MODEL_CHOICES and model_choice not in ENABLED_MODELS:
+        raise ValueError(f"Model {model_choice!r} is not enabled (ZEUS_ENABLED_MODELS)")
+
     if model_choice == "gemma-3-27b":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
         llm = ChatGoogleGenerativeAI(
             model="gemma-3-27b-it",
             google_api_key=os.environ["GEMINI_API_KEY"],
             temperature=0.2,
         )
     elif model_choice == "ollama":
+        from langchain_ollama import ChatOllama
+
         # Connecting to local Ollama instance
         llm = ChatOllama(
             model="glm4:9b", # Using glm4, as "glm-4.7-flash" is not a standard Ollama tag
-            base_url="http://localhost:11434",
+            base_url=OLLAMA_BASE_URL,
             temperature=0.2,
         )
     elif model_choice == "openrouter":
+        from langchain_openai import ChatOpenAI
+
         # Connecting to OpenRouter for Qwen 3
         llm = ChatOpenAI(
-            base_url="https://openrouter.ai/api/v1",
+            base_url=OPENROUTER_BASE_URL,
             api_key=os.environ.get("OPENROUTER_API_KEY"),
             model="qwen/qwen3-235b-a22b-thinking-2507",
             temperature=0.2,
         )
     else:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
         # Default to Gemini 2.5 Flash with Gemma 3 fallback
-        primary_llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            google_api_key=os.environ["GEMINI_API_KEY"],
-            temperature=0.2,
-        )
+        primary_llm = _gemini_flash()
         fallback_llm = ChatGoogleGenerativeAI(
             model="gemma-3-27b-it",
             google_api_key=os.environ["GEMINI_API_KEY"],
@@ -79,38 +179,63 @@ def create_agent_executor(model_choice: str = "gemini-2.5-flash") -> create_reac
         )
         llm = primary_llm.with_fallbacks([fallback_llm])
 
-    agent_executor = create_react_agent(
-        llm, 
-        tools=tools, 
-        prompt=SYSTEM_PROMPT
-    )
-    
-    return agent_executor
+    return build_agent(llm)
+
+
+# The cached content name is baked into the executors, so drop them whenever it changes.
+gemini_prefix_cache = GeminiPrefixCache(
+    model="gemini-2.5-flash",
+    static_prefix=STATIC_PREFIX,
+    tools=tools,
+    on_change=create_agent_executor.cache_clear,
+)
 
 
 def build_chat_history(raw_history: list[dict]) -> list:
-    """Convert raw DB records into LangChain message objects."""
+    """Convert raw DB records into LangChain message objects.
+
+    Past images are replayed as one-line references, never as payloads.
+    """
     messages = []
     for record in raw_history:
         if record["role"] == "user":
-            messages.append(HumanMessage(content=record["message"]))
+            content = record["message"]
+            images = [a["summary"] for a in record.get("attachments", []) if a.get("kind") == "image"]
+            if images:
+                content = "\n".join([content, *(f"[Attached image: {summary}]" for summary in images)])
+            messages.append(HumanMessage(content=content))
         elif record["role"] == "ai":
             messages.append(AIMessage(content=record["message"]))
     return messages
 
 
-def build_human_input(text_message: str, image_base64: str | None) -> list | str:
-    """Build a multimodal HumanMessage content if an image is provided."""
-    if not image_base64:
+def build_human_input(
+    text_message: str,
+    image: ProcessedImage | None,
+    recognised_vehicle: CachedVehicle | None = None,
+) -> list | str:
+    """Build a multimodal HumanMessage content if an image is provided.
+
+    When the exact image was already recognised, it is replaced by a text note
+    carrying the cached details; a perceptual-hash match is sent with the
+    details as a hint.
+    """
+    if image is None:
         return text_message
 
+    if recognised_vehicle is not None and recognised_vehicle.exact:
+        return f"{recognised_vehicle.fields.as_context(image)}\n{text_message}"
+
+    text = text_message or "Please analyze this image and help me with an insurance quotation."
+    if recognised_vehicle is not None:
+        text = f"{recognised_vehicle.fields.as_hint(image)}\n{text}"
     return [
         {
             "type": "image_url",
-            "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"},
+            "image_url": {"url": image.data_url},
         },
         {
             "type": "text",
-            "text": text_message or "Please analyze this image and help me with an insurance quotation.",
+            "text": text,
         },
     ]
@@ -0,0 +1,160 @@
+"""
+Chat history retention: moves idle sessions out of the hot ``chat_sessions``
+table into ``chat_sessions_archive`` (see ``migrations/005_chat_sessions_partitioning.sql``).
+
+Every ``ZEUS_ARCHIVE_INTERVAL_SECONDS`` each worker calls the
+``archive_chat_sessions`` RPC. The RPC archives at most
+``ZEUS_ARCHIVE_BATCH_SESSIONS`` sessions whose last turn is older than
+``ZEUS_CHAT_RETENTION_DAYS``, then drops the monthly partitions that emptied.
+Batches repeat with a ``ZEUS_ARCHIVE_BATCH_PAUSE_SECONDS`` pause until one comes
+back empty or ``ZEUS_ARCHIVE_MAX_BATCHES`` ran. A backlog therefore drains over
+several runs and never holds long locks on the tables that chat turns write.
+The RPC takes a Postgres advisory lock, so when several workers or pods run
+at once, only one of them archives and the rest skip.
+
+Creating the coming months' partitions is a job of its own
+(``ChatPartitionMaintainer``, every ``ZEUS_PARTITION_INTERVAL_SECONDS``) so it
+keeps running while archiving is off or failing. Otherwise turns would pile up
+in ``chat_sessions_default``.
+
+    python archival.py --once          # one run now, then exit (cron, manual backfill)
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from chat_store import forget_history_versions
+from periodic import PeriodicJob, once_main
+from telemetry import Counter, Histogram, registry
+
+logger = logging.getLogger("zeus.archival")
+
+ARCHIVE_ENABLED = os.environ.get("ZEUS_ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+RETENTION_DAYS = int(os.environ.get("ZEUS_CHAT_RETENTION_DAYS", "90"))
+ARCHIVE_INTERVAL_SECONDS = float(os.environ.get("ZEUS_ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_BATCH_SESSIONS = int(os.environ.get("ZEUS_ARCHIVE_BATCH_SESSIONS", "200"))
+ARCHIVE_BATCH_PAUSE_SECONDS = float(os.environ.get("ZEUS_ARCHIVE_BATCH_PAUSE_SECONDS", "2"))
+ARCHIVE_MAX_BATCHES = int(os.environ.get("ZEUS_ARCHIVE_MAX_BATCHES", "50"))
+PARTITION_MAINTENANCE_ENABLED = os.environ.get("ZEUS_PARTITION_MAINTENANCE_ENABLED", "true").lower() in ("1", "true", "yes")
+PARTITION_INTERVAL_SECONDS = float(os.environ.get("ZEUS_PARTITION_INTERVAL_SECONDS", "21600"))
+PARTITION_MONTHS_AHEAD = int(os.environ.get("ZEUS_PARTITION_MONTHS_AHEAD", "2"))
+
+ARCHIVED = registry.register(Counter(
+    "zeus_chat_archived_total", "Chat sessions and turns moved to chat_sessions_archive", ("kind",),
+))
+ARCHIVE_BATCH_DURATION = registry.register(Histogram(
+    "zeus_chat_archive_batch_seconds", "Duration of one archive_chat_sessions batch",
+))
+PARTITIONS_CREATED = registry.register(Counter(
+    "zeus_chat_partitions_created_total", "Monthly chat_sessions partitions created by ensure_chat_sessions_partitions",
+))
+
+
+def archive_batch(retention_days: int = RETENTION_DAYS, batch_sessions: int = ARCHIVE_BATCH_SESSIONS) -> dict:
+    """One ``archive_chat_sessions`` call (blocking)."""
+    from database import get_supabase_client
+
+    started = time.perf_counter()
+    response = get_supabase_client().rpc(
+        "archive_chat_sessions", {"p_idle_days": retention_days, "p_batch_size": batch_sessions},
+    ).execute()
+    ARCHIVE_BATCH_DURATION.observe(time.perf_counter() - started)
+    result = response.data or {}
+    # Their history now reads as archived; a stored version would keep answering 304.
+    forget_history_versions(result.get("session_ids") or [])
+    ARCHIVED.inc(result.get("sessions", 0), kind="sessions")
+    ARCHIVED.inc(result.get("turns", 0), kind="turns")
+    return result
+
+
+class ChatArchiver(PeriodicJob):
+    """Runs archive batches on a schedule in the background of the app lifespan."""
+
+    description = "Archive run"
+    log_icon = "🗄️ "
+    log_tag = "[ARCHIVE]"
+    logger = logger
+    enabled = ARCHIVE_ENABLED
+
+    def __init__(
+        self,
+        interval_seconds: float = ARCHIVE_INTERVAL_SECONDS,
+        pause_seconds: float = ARCHIVE_BATCH_PAUSE_SECONDS,
+        max_batches: int = ARCHIVE_MAX_BATCHES,
+    ) -> None:
+        super().__init__(interval_seconds)
+        self.pause_seconds = pause_seconds
+        self.max_batches = max_batches
+
+    async def run_once(self) -> dict:
+        """Archive batches until one is empty or ``max_batches`` ran; returns the totals of this run."""
+        started = time.perf_counter()
+        results, _ = await self.run_batches(
+            archive_batch, self.max_batches, full=lambda result: bool(result.get("sessions")), pause_seconds=self.pause_seconds,
+        )
+        totals = {
+            "sessions": sum(result.get("sessions", 0) for result in results),
+            "turns": sum(result.get("turns", 0) for result in results),
+            "batches": len(results),
+            "dropped_partitions": [name for result in results for name in result.get("dropped_partitions") or []],
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        if totals["sessions"] or totals["dropped_partitions"]:
+            logger.info(
+                "🗄️  [ARCHIVE] Archived %s session(s), %s turn(s) in %s batch(es); dropped partitions: %s",
+                totals["sessions"], totals["turns"], totals["batches"], ", ".join(totals["dropped_partitions"]) or "none",
+            )
+        return totals
+
+
+chat_archiver = ChatArchiver()
+
+
+def ensure_partitions(months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """One ``ensure_chat_sessions_partitions`` call (blocking); returns how many partitions it created."""
+    from database import get_supabase_client
+
+    response = get_supabase_client().rpc(
+        "ensure_chat_sessions_partitions", {"p_months_ahead": months_ahead},
+    ).execute()
+    created = response.data or 0
+    PARTITIONS_CREATED.inc(created)
+    return created
+
+
+class ChatPartitionMaintainer(PeriodicJob):
+    """Creates the coming months' chat_sessions partitions at start-up and on a schedule."""
+
+    description = "Partition maintenance"
+    log_icon = "🗄️ "
+    log_tag = "[PARTITIONS]"
+    logger = logger
+    enabled = PARTITION_MAINTENANCE_ENABLED
+    run_at_start = True
+
+    def __init__(self, interval_seconds: float = PARTITION_INTERVAL_SECONDS, months_ahead: int = PARTITION_MONTHS_AHEAD) -> None:
+        super().__init__(interval_seconds)
+        self.months_ahead = months_ahead
+
+    async def run_once(self) -> int:
+        created = await asyncio.to_thread(ensure_partitions, self.months_ahead)
+        if created:
+            logger.info("🗄️  [PARTITIONS] Created %s chat_sessions partition(s)", created)
+        return created
+
+
+chat_partition_maintainer = ChatPartitionMaintainer()
+
+
+def main() -> None:
+    once_main(__doc__, "run the archiver once and exit", ChatArchiver)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""
+Offline benchmark harness: the FastAPI app driven with a scripted chat model and
+an in-memory Supabase seeded from ``init_supabase_v2.sql``. No network or API
+keys are needed.
+"""
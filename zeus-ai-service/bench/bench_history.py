@@ -0,0 +1,21 @@
+"""build_chat_history over realistic session sizes."""
+
+import pytest
+
+from agent import build_chat_history
+
+
+def _rows(turns: int) -> list[dict]:
+    rows = []
+    for i in range(turns):
+        attachments = [{"kind": "image", "summary": f"photo {i:012x} (1024x768)"}] if i % 5 == 0 else []
+        rows.append({"role": "user", "message": f"Question {i}: how much is a Honda Civic e:HEV RS?", "attachments": attachments})
+        rows.append({"role": "ai", "message": "The Zeus Comprehensive Plus plan is 25,000 THB per year. " * 8, "attachments": []})
+    return rows
+
+
+@pytest.mark.parametrize("turns", [10, 50])
+def bench_build_chat_history(benchmark, turns):
+    rows = _rows(turns)
+    messages = benchmark(build_chat_history, rows)
+    assert len(messages) == 2 * turns
@@ -0,0 +1,105 @@
+"""search_quotation_details: every step of the relaxation cascade, _clean_sub_model, compare_quotations and the pricing matrix."""
+
+import json
+
+import numpy as np
+import pytest
+
+from pricing import DEFAULT_RATE_CARD, Catalog, PricingMatrix, diff_matrices, pricing_engine
+from tools.compare_quotations_tool import compare_quotations
+from tools.quotation_db_tool import _clean_sub_model, search_quotation_details
+
+CASCADE = {
+    "exact": {"brand": "Honda", "model": "Civic", "sub_model": "e:HEV RS", "year": 2024},
+    # No plan_premiums rows: priced by the rate card instead of ending in the catalogue.
+    "estimated": {"brand": "Honda", "model": "Jazz", "sub_model": "RS", "year": 2024},
+    "year_relaxed": {"brand": "Honda", "model": "Civic", "sub_model": "e:HEV RS", "year": 2019},
+    "sub_model_relaxed": {"brand": "Toyota", "model": "Camry", "sub_model": "Sport", "year": 2024},
+    "brand_model": {"brand": "Toyota", "model": "Camry", "sub_model": "Sport", "year": 2019},
+    "brand_only": {"brand": "Honda", "model": "Odyssey"},
+    "catalogue": {"brand": "Lada", "model": "Niva"},
+}
+
+
+@pytest.mark.parametrize("case", list(CASCADE))
+def bench_search_quotation_cascade(benchmark, patched_tools, case):
+    output = benchmark(search_quotation_details.invoke, CASCADE[case])
+    payload = json.loads(output)
+    benchmark.extra_info["output_chars"] = len(output)
+    if case == "catalogue":
+        assert "catalogue" in payload
+    else:
+        assert payload.get("rows"), payload
+    if case == "estimated":
+        estimated = payload["columns"].index("estimated")
+        assert all(row[estimated] for row in payload["rows"]) and "note" in payload
+
+
+@pytest.mark.parametrize("sub_model", ["e:HEV RS 2024", "Type R", "2.8 V 2025-", "Hybrid Premium (2024)"])
+def bench_clean_sub_model(benchmark, sub_model):
+    cleaned = benchmark(_clean_sub_model, sub_model)
+    assert "2024" not in cleaned and "2025" not in cleaned
+
+
+COMPARISON = {
+    "vehicles": [
+        {"brand": "Honda", "model": "Civic", "sub_model": "e:HEV RS", "year": 2024},
+        {"brand": "Toyota", "model": "Camry", "year": 2024},
+        {"brand": "Lada", "model": "Niva"},
+    ],
+    "plan_types": ["Type 1", "Type 2+"],
+}
+
+
+@pytest.mark.parametrize("create", [False, True], ids=["matrix", "bulk_insert"])
+def bench_compare_quotations(benchmark, patched_tools, create):
+    args = {**COMPARISON, "create_quotations": create, "session_id": "00000000-0000-0000-0000-000000000044"}
+    output = benchmark(compare_quotations.invoke, args)
+    payload = json.loads(output)
+    benchmark.extra_info["output_chars"] = len(output)
+    assert payload["matrix"]["rows"] and payload["not_found"] == ["Lada Niva"], payload
+    if create:
+        assert len(payload["quotations"]["rows"]) == sum(
+            cell is not None for row in payload["matrix"]["rows"] for cell in row[4:]
+        )
+
+
+def _synthetic_catalog(cars: int, plans: list[dict]) -> Catalog:
+    prices = np.random.default_rng(45).uniform(400_000, 8_000_000, cars).round(-3)
+    return Catalog(
+        cars=[
+            {"brand": "Synthetic", "model": f"Model {i}", "sub_model": None, "year": 2024,
+             "car_estimated_price": float(price), "car_model_id": i}
+            for i, price in enumerate(prices, start=1)
+        ],
+        plans=plans,
+        premiums=[],
+    )
+
+
+@pytest.mark.parametrize("cars", [100, 100_000])
+def bench_price_matrix(benchmark, patched_tools, cars):
+    """Full car x plan matrix from the rate card; the per-cell work is all NumPy."""
+    catalog = _synthetic_catalog(cars, pricing_engine.matrix().catalog.plans)
+    matrix = benchmark(PricingMatrix, catalog, DEFAULT_RATE_CARD)
+    benchmark.extra_info["cells"] = matrix.cells
+    # The EV plan is a specialty plan: never estimated.
+    assert matrix.cells["estimated"] == cars * 3
+
+
+def bench_pricing_lookup(benchmark, patched_tools):
+    pricing_engine.matrix()
+    row = benchmark(pricing_engine.lookup, 1, 1)
+    assert row is not None and not row["estimated"]
+
+
+def bench_reprice(benchmark, patched_tools):
+    """A 10% rate increase across the card, diffed against the current matrix."""
+    current = pricing_engine.matrix()
+    raised = {
+        plan_type: type(rates)(**{**rates.__dict__, "rates": tuple(r * 1.1 for r in rates.rates)})
+        for plan_type, rates in DEFAULT_RATE_CARD.items()
+    }
+    changes = benchmark(lambda: diff_matrices(current, PricingMatrix(current.catalog, raised)))
+    benchmark.extra_info.update(changes)
+    assert changes["changed"] == current.cells["estimated"] and changes["added"] == changes["removed"] == 0
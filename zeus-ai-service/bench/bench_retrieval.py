@@ -0,0 +1,35 @@
+"""Embedding, vector search and the full policy RAG tool, plus retrieval quality at the shipped threshold."""
+
+import pytest
+
+from bench.retrieval import build_index, evaluate, load_queries
+from tools.policy_rag_tool import search_policy_documents
+
+QUERY = "rideshare delivery for-hire use"
+
+
+def bench_embed_query(benchmark, embedder):
+    vector = benchmark(embedder.embed_query, QUERY)
+    assert len(vector) == 2000
+
+
+def bench_match_documents(benchmark, seeded_db, embedder):
+    vector = embedder.embed_query(QUERY)
+    rpc = lambda: seeded_db.rpc("match_documents", {"query_embedding": vector, "match_threshold": 0.4, "match_count": 5}).execute()
+    assert benchmark(rpc).data is not None
+
+
+def bench_search_policy_documents(benchmark, patched_tools):
+    output = benchmark(search_policy_documents.invoke, {"query": QUERY, "section": "Exclusion"})
+    benchmark.extra_info["chars"] = len(output)
+    assert "rows" in output
+
+
+@pytest.mark.parametrize("threshold", [0.1, 0.2, 0.3])
+def bench_retrieval_quality(benchmark, threshold):
+    """Thresholds are raw cosine here (the hashing embedder scores lower than Gemini)."""
+    db, embedder = build_index("hashing")
+    queries = load_queries()
+    report = benchmark.pedantic(evaluate, args=(db, embedder, queries), kwargs={"k": 5, "threshold": threshold}, rounds=3)
+    benchmark.extra_info.update({k: report[k] for k in ("recall@5", "mrr", "hit_rate", "empty_results")})
+    assert 0.0 <= report["recall@5"] <= 1.0
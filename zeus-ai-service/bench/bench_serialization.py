@@ -0,0 +1,27 @@
+"""JSON encoding of tool outputs: compact table encoding vs. the old indented row dicts."""
+
+import json
+
+import pytest
+
+from tools.compaction import compact_records, to_tool_json
+
+
+@pytest.fixture(scope="module")
+def quotation_rows(seeded_db):
+    return seeded_db.table("vw_quotation_details").select("*").execute().data
+
+
+def bench_compact_records(benchmark, quotation_rows):
+    output = benchmark(compact_records, "search_quotation_details", "Found quotation details.", quotation_rows)
+    benchmark.extra_info["chars"] = len(output)
+
+
+def bench_to_tool_json(benchmark, quotation_rows):
+    output = benchmark(to_tool_json, {"result": "ok", "data": quotation_rows[:30]})
+    benchmark.extra_info["chars"] = len(output)
+
+
+def bench_indented_json_baseline(benchmark, quotation_rows):
+    output = benchmark(json.dumps, {"result": "ok", "data": quotation_rows[:30]}, indent=2, ensure_ascii=True, default=str)
+    benchmark.extra_info["chars"] = len(output)
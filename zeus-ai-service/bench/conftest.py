@@ -0,0 +1,104 @@
+"""Shared fixtures for the micro-benchmarks (``python -m pytest -c bench/pytest.ini``)."""
+
+import time
+import statistics
+
+import pytest
+
+import bench.harness  # noqa: F401  — sets the bench environment before service imports
+from bench.fakes import FakeSupabase, HashingEmbeddings
+from bench.fixtures import load_seed_tables
+
+try:
+    import pytest_benchmark  # noqa: F401
+    HAVE_PYTEST_BENCHMARK = True
+except ImportError:
+    HAVE_PYTEST_BENCHMARK = False
+
+
+@pytest.fixture(scope="session")
+def seeded_db() -> FakeSupabase:
+    """In-memory Supabase seeded from init_supabase_v2.sql, zero latency, embeddings precomputed."""
+    db = FakeSupabase(load_seed_tables())
+    db.document_vectors()
+    return db
+
+
+@pytest.fixture(scope="session")
+def embedder() -> HashingEmbeddings:
+    return HashingEmbeddings()
+
+
+@pytest.fixture
+def patched_tools(seeded_db, embedder, monkeypatch):
+    """Point every tool module at the seeded fake Supabase and the local embedder."""
+    import tools.quotation_db_tool
+    import tools.policy_rag_tool
+    import tools.create_quotation_tool
+    import tools.create_order_tool
+    import tools.compare_quotations_tool
+    import pricing
+
+    for module in (tools.quotation_db_tool, tools.policy_rag_tool, tools.create_quotation_tool, tools.create_order_tool,
+                   tools.compare_quotations_tool, pricing):
+        monkeypatch.setattr(module, "get_supabase_client", lambda: seeded_db)
+    pricing.pricing_engine.invalidate()
+    monkeypatch.setattr(tools.policy_rag_tool, "get_embeddings_model", lambda: embedder)
+    return seeded_db
+
+
+# ── Fallback timer when pytest-benchmark is not installed ─────────────────────
+
+if not HAVE_PYTEST_BENCHMARK:
+    _results: list[tuple[str, list[float], dict]] = []
+
+    class _SimpleBenchmark:
+        """The subset of pytest-benchmark's fixture API the suite uses."""
+
+        def __init__(self, name: str, min_rounds: int = 20, max_time: float = 1.0) -> None:
+            self.name = name
+            self.min_rounds = min_rounds
+            self.max_time = max_time
+            self.extra_info: dict = {}
+
+        def __call__(self, fn, *args, **kwargs):
+            timings: list[float] = []
+            deadline = time.perf_counter() + self.max_time
+            result = None
+            while len(timings) < self.min_rounds or time.perf_counter() < deadline:
+                start = time.perf_counter()
+                result = fn(*args, **kwargs)
+                timings.append(time.perf_counter() - start)
+                if len(timings) >= 10_000:
+                    break
+            _results.append((self.name, timings, self.extra_info))
+            return result
+
+        def pedantic(self, fn, args=(), kwargs=None, rounds: int = 1, iterations: int = 1, **_):
+            kwargs = kwargs or {}
+            timings, result = [], None
+            for _ in range(rounds):
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    result = fn(*args, **kwargs)
+                timings.append((time.perf_counter() - start) / iterations)
+            _results.append((self.name, timings, self.extra_info))
+            return result
+
+    @pytest.fixture
+    def benchmark(request) -> _SimpleBenchmark:
+        return _SimpleBenchmark(request.node.name)
+
+    def pytest_terminal_summary(terminalreporter) -> None:
+        if not _results:
+            return
+        write = terminalreporter.write_line
+        write("")
+        write(f"{'benchmark':<58} {'rounds':>7} {'min µs':>10} {'median µs':>10} {'max µs':>10}")
+        for name, timings, extra in _results:
+            write(
+                f"{name[:58]:<58} {len(timings):>7} {min(timings) * 1e6:>10.1f} "
+                f"{statistics.median(timings) * 1e6:>10.1f} {max(timings) * 1e6:>10.1f}"
+            )
+            if extra:
+                write(f"    {extra}")
@@ -0,0 +1,258 @@
+"""
+EXPLAIN-based check that the hot queries are served by the indexes of
+``migrations/004_query_indexes.sql`` and ``migrations/006_status_sweeps.sql``.
+
+Runs the SQL equivalent of every query the service issues per chat turn or tool
+call against a real Postgres (with pgvector and pg_trgm) and asserts that the
+plan uses the expected index::
+
+    docker run -d --name zeus-pg -e POSTGRES_PASSWORD=pg -p 5432:5432 pgvector/pgvector:pg16
+    python -m bench.explain_check --dsn postgresql://postgres:pg@localhost:5432/postgres --setup
+
+``--setup`` DROPS AND RECREATES the schema: it runs ``init_supabase_v2.sql`` and
+every migration, then adds ``--rows`` synthetic chat turns, quotations and
+orders so the planner sees realistic table sizes. Without it the check only
+reads. On tables too small for an index to win (the catalog view has a few
+hundred rows), the query is re-planned with ``enable_seqscan = off``. An index
+that is usable but not chosen is reported as ``small`` and does not fail the check.
+
+Needs ``psycopg`` (``pip install "psycopg[binary]"``).
+"""
+
+import sys
+import json
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+SCHEMA_FILES = [SERVICE_DIR / "init_supabase_v2.sql", *sorted((SERVICE_DIR / "migrations").glob("*.sql"))]
+
+
+@dataclass(frozen=True)
+class Check:
+    name: str
+    sql: str
+    index: str
+
+
+def checks(samples: dict) -> list[Check]:
+    """The service's hot queries, as PostgREST would run them, with sample keys from the database."""
+    return [
+        Check("history fetch", f"""
+            SELECT id, role, message, created_at FROM chat_sessions
+            WHERE session_id = '{samples["session_id"]}' ORDER BY created_at LIMIT 20""",
+            "chat_sessions_session_id_created_at_idx"),
+        Check("history attachments", f"""
+            SELECT kind, summary FROM chat_attachments WHERE message_id = {samples["message_id"]}""",
+            "chat_attachments_message_id_idx"),
+        Check("session list", """
+            SELECT session_id, created_at, role, message FROM chat_sessions ORDER BY created_at DESC LIMIT 50""",
+            "chat_sessions_created_at_idx"),
+        Check("usage by session", f"""
+            SELECT * FROM chat_usage WHERE session_id = '{samples["session_id"]}' ORDER BY created_at""",
+            "chat_usage_session_id_idx"),
+        Check("quotations of session", f"""
+            SELECT * FROM quotations WHERE session_id = '{samples["quotation_session_id"]}'""",
+            "quotations_session_id_idx"),
+        Check("order by quotation", f"""
+            SELECT * FROM orders WHERE quotation_id = '{samples["quotation_id"]}'""",
+            "orders_quotation_id_key"),
+        Check("order by number", f"""
+            SELECT * FROM orders WHERE order_number = '{samples["order_number"]}'""",
+            "orders_order_number_key"),
+        Check("catalog brand search", """
+            SELECT * FROM vw_quotation_details WHERE brand ILIKE '%honda%'""",
+            "vw_quotation_details_brand_trgm_idx"),
+        Check("catalog model search", """
+            SELECT * FROM vw_quotation_details WHERE brand ILIKE '%toyota%' AND model ILIKE '%camry%'""",
+            "vw_quotation_details_model_trgm_idx"),
+        Check("quotation lookup", f"""
+            SELECT * FROM vw_quotation_details
+            WHERE car_model_id = {samples["car_model_id"]} AND plan_id = {samples["plan_id"]}""",
+            "vw_quotation_details_key"),
+        Check("policy vector search", f"""
+            SELECT id, section, 1 - (embedding <=> '{samples["embedding"]}') AS similarity
+            FROM policy_documents ORDER BY embedding <=> '{samples["embedding"]}' LIMIT 5""",
+            "policy_documents_embedding_hnsw_idx"),
+        Check("quotation expiry sweep", """
+            SELECT id FROM quotations
+            WHERE status IN ('draft', 'sent') AND valid_until < NOW() ORDER BY valid_until LIMIT 1000""",
+            "quotations_open_valid_until_idx"),
+        Check("unpaid order sweep", """
+            SELECT id FROM orders
+            WHERE payment_status IN ('pending', 'awaiting_confirmation') AND created_at < NOW() - INTERVAL '7 days'
+            ORDER BY created_at LIMIT 1000""",
+            "orders_unpaid_created_at_idx"),
+        Check("policy activation sweep", """
+            SELECT id FROM orders
+            WHERE payment_status = 'paid' AND policy_status = 'inactive' AND policy_start_date <= CURRENT_DATE
+            ORDER BY policy_start_date LIMIT 1000""",
+            "orders_paid_inactive_start_idx"),
+        Check("policy expiry sweep", """
+            SELECT id FROM orders
+            WHERE policy_status = 'active' AND policy_end_date < CURRENT_DATE ORDER BY policy_end_date LIMIT 1000""",
+            "orders_active_policy_end_idx"),
+    ]
+
+
+# ── Setup ─────────────────────────────────────────────────────────────────────
+
+SYNTHETIC_SQL = """
+-- Chat turns: %(rows)s rows over %(rows)s / 20 sessions, one attachment per 10 turns.
+INSERT INTO chat_sessions (session_id, role, message, created_at)
+SELECT md5((n / 20)::text)::uuid,
+       CASE WHEN n %% 2 = 0 THEN 'user' ELSE 'ai' END,
+       'synthetic turn ' || n,
+       NOW() - make_interval(secs => %(rows)s - n)
+FROM generate_series(1, %(rows)s) AS n;
+
+INSERT INTO chat_attachments (message_id, message_created_at, session_id, kind, summary)
+SELECT id, created_at, session_id, 'image', 'synthetic image' FROM chat_sessions WHERE id %% 10 = 0;
+
+INSERT INTO chat_usage (session_id, model, input_tokens, output_tokens)
+SELECT session_id, 'gemini-2.5-flash', 1000, 200 FROM chat_sessions WHERE role = 'ai';
+
+-- Quotations for every 10th turn's session, an order for half of them.
+INSERT INTO quotations (session_id, car_model_id, plan_id, customer_name, car_estimated_price,
+                        base_premium, deductible, total_premium, quotation_number, valid_until)
+SELECT md5((n / 2)::text)::uuid, v.car_model_id, v.plan_id, 'Synthetic', v.car_estimated_price,
+       v.base_premium, v.deductible, v.base_premium, 'QT-SYN-' || n, NOW() + INTERVAL '30 days'
+FROM generate_series(1, %(rows)s / 10) AS n
+JOIN LATERAL (SELECT * FROM vw_quotation_details OFFSET (n %% 100) LIMIT 1) v ON true;
+
+INSERT INTO orders (quotation_id, order_number, payment_method, policy_number)
+SELECT id, 'ORD-SYN-' || row_number() OVER (), 'promptpay', 'POL-SYN-' || row_number() OVER ()
+FROM quotations WHERE quotation_number LIKE 'QT-SYN-%%' AND right(quotation_number, 1) IN ('0', '2', '4', '6', '8');
+
+-- Policy documents are seeded without embeddings; give them random unit-ish vectors.
+UPDATE policy_documents
+SET embedding = (SELECT array_agg(random() - 0.5)::vector(2000) FROM generate_series(1, 2000) WHERE policy_documents.id IS NOT NULL);
+
+ANALYZE;
+"""
+
+
+def setup(conn, rows: int) -> None:
+    for path in SCHEMA_FILES:
+        print(f"  applying {path.relative_to(SERVICE_DIR)}")
+        conn.execute(path.read_text(encoding="utf-8"))
+    print(f"  adding {rows} synthetic chat turns")
+    conn.execute(SYNTHETIC_SQL % {"rows": int(rows)})
+    # REFRESH ... CONCURRENTLY from the catalog triggers left the view's statistics stale.
+    conn.execute("ANALYZE vw_quotation_details")
+
+
+def sample_keys(conn) -> dict:
+    def one(sql: str):
+        row = conn.execute(sql).fetchone()
+        if row is None:
+            raise SystemExit(f"no sample row for: {sql} (run with --setup on a scratch database)")
+        return row[0]
+
+    return {
+        "session_id": one("SELECT session_id FROM chat_sessions ORDER BY id DESC LIMIT 1"),
+        "message_id": one("SELECT message_id FROM chat_attachments LIMIT 1"),
+        "quotation_session_id": one("SELECT session_id FROM quotations LIMIT 1"),
+        "quotation_id": one("SELECT quotation_id FROM orders LIMIT 1"),
+        "order_number": one("SELECT order_number FROM orders LIMIT 1"),
+        "car_model_id": one("SELECT car_model_id FROM vw_quotation_details LIMIT 1"),
+        "plan_id": one("SELECT plan_id FROM vw_quotation_details LIMIT 1"),
+        "embedding": one("SELECT embedding::text FROM policy_documents WHERE embedding IS NOT NULL LIMIT 1"),
+    }
+
+
+# ── Plans ─────────────────────────────────────────────────────────────────────
+
+def _nodes(plan: dict) -> Iterator[dict]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _nodes(child)
+
+
+def explain(conn, sql: str, analyze: bool, force_index: bool = False) -> dict:
+    with conn.transaction():
+        if force_index:
+            conn.execute("SET LOCAL enable_seqscan = off")
+        options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+        (result,), = conn.execute(f"EXPLAIN ({options}) {sql}").fetchall()
+    return (json.loads(result) if isinstance(result, str) else result)[0]
+
+
+def index_names(conn, index: str) -> set[str]:
+    """``index`` and, for an index on a partitioned table, its per-partition indexes."""
+    rows = conn.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s""", (index,)).fetchall()
+    return {index, *(name for name, in rows)}
+
+
+def run_check(conn, check: Check, analyze: bool) -> dict:
+    expected = index_names(conn, check.index)
+    plan = explain(conn, check.sql, analyze)
+    indexes = {node.get("Index Name") for node in _nodes(plan["Plan"])} - {None}
+    status = "ok" if expected & indexes else None
+    if status is None:
+        forced = explain(conn, check.sql, analyze=False, force_index=True)
+        usable = bool(expected & {node.get("Index Name") for node in _nodes(forced["Plan"])})
+        status = "small" if usable else "FAIL"
+    return {
+        "name": check.name,
+        "status": status,
+        "index": check.index,
+        "plan": plan["Plan"]["Node Type"],
+        "used": sorted(indexes),
+        "cost": plan["Plan"]["Total Cost"],
+        "ms": plan.get("Execution Time"),
+    }
+
+
+def report(results: list[dict], out=sys.stdout) -> None:
+    print(f"\n  {'query':<24} {'status':<6} {'ms':>8}  {'cost':>9}  plan / indexes", file=out)
+    for r in results:
+        ms = f"{r['ms']:.3f}" if r["ms"] is not None else "-"
+        used = ", ".join(r["used"]) or "no index"
+        print(f"  {r['name']:<24} {r['status']:<6} {ms:>8}  {r['cost']:>9.1f}  {r['plan']}: {used}", file=out)
+        if r["status"] != "ok":
+            print(f"  {'':<24} expected {r['index']}", file=out)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Check that the service's hot queries use their indexes")
+    parser.add_argument("--dsn", required=True, help="Postgres connection string (a scratch database for --setup)")
+    parser.add_argument("--setup", action="store_true", help="DROP and recreate the schema, then add synthetic rows")
+    parser.add_argument("--rows", type=int, default=20000, help="synthetic chat turns for --setup")
+    parser.add_argument("--no-analyze", dest="analyze", action="store_false", help="plan only, do not execute")
+    parser.add_argument("--json", dest="json_path", help="also write the results as JSON")
+    return parser
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        import psycopg
+    except ImportError:
+        print('explain_check needs psycopg: pip install "psycopg[binary]"', file=sys.stderr)
+        return 2
+
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        if args.setup:
+            setup(conn, args.rows)
+        results = [run_check(conn, check, args.analyze) for check in checks(sample_keys(conn))]
+
+    report(results)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    failed = [r["name"] for r in results if r["status"] == "FAIL"]
+    if failed:
+        print(f"\n  {len(failed)} quer{'y' if len(failed) == 1 else 'ies'} not served by their index: {', '.join(failed)}")
+        return 1
+    print(f"\n  all {len(results)} queries can use their index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
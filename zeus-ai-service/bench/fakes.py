@@ -0,0 +1,738 @@
+"""
+Deterministic stand-ins for the service's external dependencies.
+
+* ``ScriptedChatModel`` — a LangChain chat model that replays scripted tool
+  calls and answers with configurable latency, token by token.
+* ``HashingEmbeddings`` — a local bag-of-words embedder with the same
+  ``embed_query`` / ``embed_documents`` interface as the Gemini embeddings.
+* ``FakeSupabase`` — an in-memory subset of the supabase-py query builder plus
+  the ``match_documents`` and ``create_order_for_quotation`` RPCs, with a
+  configurable per-call latency.
+"""
+
+import re
+import math
+import time
+import uuid
+import json
+import operator
+import asyncio
+import hashlib
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+from itertools import count
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from budget import FINAL_ANSWER_NOTE
+from telemetry import span
+from tools.compaction import estimate_tokens
+
+EMBEDDING_DIMENSIONS = 2000
+
+
+# ── Embeddings ────────────────────────────────────────────────────────────────
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbeddings:
+    """Feature-hashed unigrams + bigrams, L2-normalised. Cheap, stable across runs."""
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS, latency: float = 0.0) -> None:
+        self.dimensions = dimensions
+        self.latency = latency
+
+    def _features(self, text: str) -> Iterator[str]:
+        words = [w.lower() for w in _WORD_RE.findall(text)]
+        yield from words
+        yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+
+    def embed_query(self, text: str) -> list[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        vector = [0.0] * self.dimensions
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+# ── Supabase ──────────────────────────────────────────────────────────────────
+
+@dataclass
+class FakeResponse:
+    data: Any
+    count: Optional[int] = None
+
+
+# (parent, embedded) → (column on embedded, column on parent, "many" | "one")
+RELATIONSHIPS: dict[tuple[str, str], tuple[str, str, str]] = {
+    ("chat_sessions", "chat_attachments"): ("message_id", "id", "many"),
+    ("orders", "quotations"): ("id", "quotation_id", "one"),
+    ("quotations", "orders"): ("quotation_id", "id", "many"),
+}
+
+INSERT_DEFAULTS: dict[str, dict[str, Any]] = {
+    "quotations": {"status": "draft"},
+    "orders": {"payment_status": "pending", "policy_status": "inactive"},
+    "chat_attachments": {"payload": {}},
+}
+
+
+def _split_top_level(text: str) -> list[str]:
+    parts, depth, current = [], 0, []
+    for ch in text:
+        if ch == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        current.append(ch)
+    if "".join(current).strip():
+        parts.append("".join(current).strip())
+    return parts
+
+
+def _ilike(pattern: str) -> re.Pattern:
+    escaped = re.escape(pattern).replace("%", ".*").replace("_", ".")
+    return re.compile(f"^{escaped}$", re.IGNORECASE | re.DOTALL)
+
+
+_COMPARISONS = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+
+def _logic_tree(expression: str) -> Callable[[dict], bool]:
+    """Predicate for a PostgREST logic tree as passed to ``or_`` (``eq`` / ``ilike`` / comparison leaves, nested ``and(...)`` / ``or(...)``)."""
+    def parse(item: str) -> Callable[[dict], bool]:
+        for joiner, combine in (("and(", all), ("or(", any)):
+            if item.startswith(joiner) and item.endswith(")"):
+                children = [parse(part) for part in _split_top_level(item[len(joiner):-1])]
+                return lambda r: combine(child(r) for child in children)
+        column, op, value = item.split(".", 2)
+        if value.startswith('"') and value.endswith('"'):
+            value = value[1:-1]
+        if op == "ilike":
+            regex = _ilike(value.replace("*", "%"))
+            return lambda r: r.get(column) is not None and bool(regex.match(str(r[column])))
+        if op == "eq":
+            return lambda r: str(r.get(column)) == value
+        if op in _COMPARISONS:
+            compare = _COMPARISONS[op]
+            return lambda r: r.get(column) is not None and compare(r[column], type(r[column])(value))
+        raise NotImplementedError(f"fake Supabase has no logic-tree operator {op!r}")
+    return parse(f"or({expression})")
+
+
+def _sort_key(value: Any) -> tuple:
+    return (value is None, value if value is not None else 0)
+
+
+class FakeQuery:
+    """Chainable query over one in-memory table; ``execute()`` applies it."""
+
+    def __init__(self, db: "FakeSupabase", table: str) -> None:
+        self.db = db
+        self.table_name = table
+        self.verb = "GET"
+        self.columns = "*"
+        self.count_mode: Optional[str] = None
+        self.filters: list[Callable[[dict], bool]] = []
+        self.orderings: list[tuple[str, bool]] = []
+        self.row_limit: Optional[int] = None
+        self.row_offset = 0
+        self.payload: Any = None
+        self.on_conflict: Optional[str] = None
+        self.single_mode: Optional[str] = None
+        self._negate_next = False
+
+    # ── builders ──
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "FakeQuery":
+        self.columns, self.count_mode = columns, count
+        return self
+
+    def insert(self, rows: Any) -> "FakeQuery":
+        self.verb, self.payload = "POST", rows
+        return self
+
+    def upsert(self, rows: Any, on_conflict: Optional[str] = None) -> "FakeQuery":
+        self.verb, self.payload, self.on_conflict = "UPSERT", rows, on_conflict
+        return self
+
+    def update(self, values: dict) -> "FakeQuery":
+        self.verb, self.payload = "PATCH", values
+        return self
+
+    def delete(self) -> "FakeQuery":
+        self.verb = "DELETE"
+        return self
+
+    @property
+    def not_(self) -> "FakeQuery":
+        self._negate_next = True
+        return self
+
+    def _where(self, predicate: Callable[[dict], bool]) -> "FakeQuery":
+        if self._negate_next:
+            self._negate_next = False
+            positive = predicate
+            predicate = lambda r: not positive(r)  # noqa: E731
+        self.filters.append(predicate)
+        return self
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        return self._where(lambda r: r.get(column) == value or str(r.get(column)) == str(value))
+
+    def neq(self, column: str, value: Any) -> "FakeQuery":
+        return self._where(lambda r: r.get(column) != value)
+
+    def gt(self, column: str, value: Any) -> "FakeQuery":
+        return self._where(lambda r: r.get(column) is not None and r[column] > value)
+
+    def gte(self, column: str, value: Any) -> "FakeQuery":
+        return self._where(lambda r: r.get(column) is not None and r[column] >= value)
+
+    def lt(self, column: str, value: Any) -> "FakeQuery":
+        return self._where(lambda r: r.get(column) is not None and r[column] < value)
+
+    def lte(self, column: str, value: Any) -> "FakeQuery":
+        return self._where(lambda r: r.get(column) is not None and r[column] <= value)
+
+    def in_(self, column: str, values: list) -> "FakeQuery":
+        allowed = set(values)
+        return self._where(lambda r: r.get(column) in allowed)
+
+    def is_(self, column: str, value: Any) -> "FakeQuery":
+        expected = None if value in (None, "null") else value
+        return self._where(lambda r: r.get(column) is expected)
+
+    def ilike(self, column: str, pattern: str) -> "FakeQuery":
+        regex = _ilike(pattern)
+        return self._where(lambda r: r.get(column) is not None and bool(regex.match(str(r[column]))))
+
+    def or_(self, filters: str) -> "FakeQuery":
+        return self._where(_logic_tree(filters))
+
+    def order(self, column: str, desc: bool = False) -> "FakeQuery":
+        self.orderings.append((column, desc))
+        return self
+
+    def limit(self, n: int) -> "FakeQuery":
+        self.row_limit = n
+        return self
+
+    def range(self, start: int, end: int) -> "FakeQuery":
+        self.row_offset, self.row_limit = start, end - start + 1
+        return self
+
+    def single(self) -> "FakeQuery":
+        self.single_mode = "single"
+        return self
+
+    def maybe_single(self) -> "FakeQuery":
+        self.single_mode = "maybe"
+        return self
+
+    # ── execution ──
+    def _project(self, row: dict, columns: str, table: str) -> dict:
+        if columns.strip() == "*":
+            return dict(row)
+        out = {}
+        for item in _split_top_level(columns):
+            if "(" in item:
+                name, inner = item.split("(", 1)
+                name = name.strip()
+                child_col, parent_col, cardinality = RELATIONSHIPS[(table, name)]
+                children = [
+                    self._project(child, inner[:-1], name)
+                    for child in self.db.tables.get(name, [])
+                    if child.get(child_col) == row.get(parent_col)
+                ]
+                out[name] = children if cardinality == "many" else (children[0] if children else None)
+            elif item == "*":
+                out.update(row)
+            else:
+                out[item] = row.get(item)
+        return out
+
+    def _matching(self, rows: list[dict]) -> list[dict]:
+        return [r for r in rows if all(f(r) for f in self.filters)]
+
+    def _run(self) -> FakeResponse:
+        db = self.db
+        with db.lock:
+            rows = db.tables.setdefault(self.table_name, [])
+            if self.verb in ("POST", "UPSERT"):
+                payload = self.payload if isinstance(self.payload, list) else [self.payload]
+                inserted = [db._insert_row(self.table_name, dict(p), self.on_conflict if self.verb == "UPSERT" else None) for p in payload]
+                return FakeResponse([dict(r) for r in inserted])
+            matched = self._matching(rows)
+            if self.verb == "PATCH":
+                for row in matched:
+                    row.update(self.payload)
+                    if "updated_at" in row:
+                        row["updated_at"] = db.now()
+                return FakeResponse([dict(r) for r in matched])
+            if self.verb == "DELETE":
+                db.tables[self.table_name] = [r for r in rows if r not in matched]
+                return FakeResponse([dict(r) for r in matched])
+
+            for column, desc in reversed(self.orderings):
+                matched.sort(key=lambda r: _sort_key(r.get(column)), reverse=desc)
+            total = len(matched)
+            end = None if self.row_limit is None else self.row_offset + self.row_limit
+            data = [self._project(r, self.columns, self.table_name) for r in matched[self.row_offset:end]]
+
+        if self.single_mode:
+            if not data and self.single_mode == "maybe":
+                return None
+            if len(data) != 1:
+                raise RuntimeError(f"expected a single row from {self.table_name}, got {len(data)}")
+            return FakeResponse(data[0], total if self.count_mode else None)
+        return FakeResponse(data, total if self.count_mode else None)
+
+    def execute(self) -> FakeResponse:
+        with span("db", f"{self.verb} {self.table_name}"):
+            if self.db.latency:
+                time.sleep(self.db.latency)
+            return self._run()
+
+
+class FakeRpc:
+    def __init__(self, db: "FakeSupabase", name: str, params: dict) -> None:
+        self.db, self.name, self.params = db, name, params
+
+    def execute(self) -> FakeResponse:
+        with span("db", f"POST rpc/{self.name}"):
+            if self.db.latency:
+                time.sleep(self.db.latency)
+            handler = self.db.rpc_handlers.get(self.name)
+            if handler is None:
+                raise RuntimeError(f"fake Supabase has no RPC named {self.name}")
+            return FakeResponse(handler(self.db, **self.params))
+
+
+def _match_documents(db: "FakeSupabase", query_embedding: list[float], match_threshold: float = 0.4,
+                     match_count: int = 5, filter_section: Optional[str] = None) -> list[dict]:
+    """
+    Cosine similarity over ``policy_documents`` — same contract as the SQL function.
+
+    The hashing embedder scores lower than Gemini embeddings for the same pair,
+    so the caller's threshold is multiplied by ``db.threshold_scale``.
+    """
+    match_threshold *= db.threshold_scale
+    nonzero = [(i, v) for i, v in enumerate(query_embedding) if v]
+    query_norm = math.sqrt(sum(v * v for _, v in nonzero)) or 1.0
+    scored = []
+    for doc in db.document_vectors():
+        if filter_section and doc["section"] != filter_section:
+            continue
+        vector = doc["embedding"]
+        similarity = sum(v * vector[i] for i, v in nonzero if i < len(vector)) / (query_norm * doc["_norm"])
+        if similarity > match_threshold:
+            scored.append((similarity, doc))
+    scored.sort(key=lambda item: -item[0])
+    return [
+        {k: doc[k] for k in ("id", "plan_type", "section", "content", "metadata")} | {"similarity": similarity}
+        for similarity, doc in scored[:match_count]
+    ]
+
+
+def _lapsed(quotation: dict) -> bool:
+    valid_until = datetime.fromisoformat(str(quotation["valid_until"]).replace("Z", "+00:00"))
+    return valid_until < datetime.now(valid_until.tzinfo)
+
+
+def _create_order_for_quotation(db: "FakeSupabase", p_quotation_id: str, p_payment_method: str,
+                                p_order_number: str, p_policy_number: str) -> dict:
+    """Same contract as the SQL function in ``migrations/006_status_sweeps.sql``; atomic under ``db.lock``."""
+    with db.lock:
+        quotation = next((q for q in db.tables.get("quotations", []) if q["id"] == p_quotation_id), None)
+        if quotation is None:
+            return {"status": "not_found"}
+        if quotation.get("status", "draft") in ("draft", "sent") and _lapsed(quotation):
+            quotation["status"] = "expired"
+            quotation["updated_at"] = db.now()
+        summary = {k: quotation.get(k) for k in ("quotation_number", "customer_name", "total_premium", "valid_until", "status")}
+        if quotation.get("status") == "expired":
+            return {"status": "expired", "quotation": summary}
+        existing = next((o for o in db.tables.get("orders", []) if o.get("quotation_id") == p_quotation_id), None)
+        if existing is not None:
+            return {"status": "exists", "quotation": summary, "order": dict(existing)}
+        start = datetime.now(timezone.utc).date()
+        order = db._insert_row("orders", {
+            "quotation_id": p_quotation_id,
+            "order_number": p_order_number,
+            "payment_status": "pending" if p_payment_method == "pending" else "awaiting_confirmation",
+            "payment_method": p_payment_method,
+            "policy_number": p_policy_number,
+            "policy_start_date": start.isoformat(),
+            "policy_end_date": (start + timedelta(days=365)).isoformat(),
+            "policy_status": "inactive",
+        }, None)
+        quotation["status"] = "accepted"
+        quotation["updated_at"] = db.now()
+        return {"status": "created", "quotation": summary, "order": dict(order)}
+
+
+def _archive_chat_sessions(db: "FakeSupabase", p_idle_days: int = 90, p_batch_size: int = 200) -> dict:
+    """Same contract as the SQL function in ``migrations/005_chat_sessions_partitioning.sql`` (no partitions here)."""
+    with db.lock:
+        cutoff = (db._clock - timedelta(days=p_idle_days)).isoformat()
+        rows = db.tables.setdefault("chat_sessions", [])
+        last_at: dict[str, str] = {}
+        for row in rows:
+            last_at[row["session_id"]] = max(last_at.get(row["session_id"], ""), row["created_at"])
+        batch = [sid for sid, last in last_at.items() if last < cutoff][:p_batch_size]
+        attachments = db.tables.setdefault("chat_attachments", [])
+        archive = db.tables.setdefault("chat_sessions_archive", [])
+        turns = 0
+        for sid in batch:
+            session_rows = sorted((r for r in rows if r["session_id"] == sid), key=lambda r: (r["created_at"], r["id"]))
+            transcript = [
+                {**{k: r[k] for k in ("id", "role", "message", "created_at")},
+                 "attachments": [{k: v for k, v in a.items() if k not in ("id", "message_id", "message_created_at", "session_id")}
+                                 for a in attachments if a["message_id"] == r["id"]]}
+                for r in session_rows
+            ]
+            archive.append({
+                "session_id": sid,
+                "first_message_at": session_rows[0]["created_at"],
+                "last_message_at": session_rows[-1]["created_at"],
+                "turns": len(session_rows),
+                "preview": next((r["message"][:100] for r in session_rows if r["role"] == "user"), None),
+                "transcript": transcript,
+                "archived_at": db.now(),
+            })
+            turns += len(session_rows)
+        archived = set(batch)
+        db.tables["chat_sessions"] = [r for r in rows if r["session_id"] not in archived]
+        db.tables["chat_attachments"] = [a for a in attachments if a["session_id"] not in archived]
+        return {"sessions": len(batch), "turns": turns, "session_ids": batch, "dropped_partitions": [], "cutoff": cutoff}
+
+
+def _ensure_chat_sessions_partitions(db: "FakeSupabase", p_from: Optional[str] = None, p_months_ahead: int = 2) -> int:
+    """Same contract as the SQL function in ``migrations/005_chat_sessions_partitioning.sql`` (no partitions here)."""
+    return 0
+
+
+def _sweep_statuses(db: "FakeSupabase", p_batch_size: int = 1000, p_payment_days: int = 7) -> dict:
+    """Same contract as the SQL function in ``migrations/006_status_sweeps.sql``; the payment window uses ``db._clock``."""
+    with db.lock:
+        today = datetime.now(timezone.utc).date().isoformat()
+        unpaid_cutoff = (db._clock - timedelta(days=p_payment_days)).isoformat()
+        orders = db.tables.setdefault("orders", [])
+        sweeps = {
+            "quotations_expired": (
+                [q for q in db.tables.setdefault("quotations", [])
+                 if q.get("status", "draft") in ("draft", "sent") and _lapsed(q)],
+                {"status": "expired"},
+            ),
+            "orders_expired": (
+                [o for o in orders if o.get("payment_status") in ("pending", "awaiting_confirmation")
+                 and o["created_at"] < unpaid_cutoff],
+                {"payment_status": "expired", "policy_status": "cancelled"},
+            ),
+            "policies_activated": (
+                [o for o in orders if o.get("payment_status") == "paid" and o.get("policy_status") == "inactive"
+                 and (o.get("policy_start_date") or "9999") <= today <= (o.get("policy_end_date") or "9999")],
+                {"policy_status": "active"},
+            ),
+            "policies_expired": (
+                [o for o in orders if o.get("policy_status") == "active" and (o.get("policy_end_date") or "9999") < today],
+                {"policy_status": "expired"},
+            ),
+        }
+        result = {}
+        for kind, (rows, changes) in sweeps.items():
+            for row in rows[:p_batch_size]:
+                row.update(changes, updated_at=db.now())
+            result[kind] = min(len(rows), p_batch_size)
+        # The quotation of an expired order expires with it.
+        expired_for = {o["quotation_id"] for o in sweeps["orders_expired"][0][:p_batch_size]}
+        for quotation in db.tables["quotations"]:
+            if quotation["id"] in expired_for and quotation.get("status") == "accepted":
+                quotation.update(status="expired", updated_at=db.now())
+        return result
+
+
+def _restore_chat_session(db: "FakeSupabase", p_session_id: str) -> int:
+    with db.lock:
+        archive = db.tables.setdefault("chat_sessions_archive", [])
+        entry = next((a for a in archive if a["session_id"] == p_session_id), None)
+        if entry is None:
+            return 0
+        archive.remove(entry)
+        for turn in entry["transcript"]:
+            db.tables.setdefault("chat_sessions", []).append(
+                {"session_id": p_session_id, **{k: turn[k] for k in ("id", "role", "message", "created_at")}}
+            )
+            for attachment in turn["attachments"]:
+                db._insert_row("chat_attachments", {
+                    "message_id": turn["id"], "message_created_at": turn["created_at"],
+                    "session_id": p_session_id, **attachment,
+                }, None)
+        return len(entry["transcript"])
+
+
+class FakeSupabase:
+    """Drop-in for the subset of ``supabase.Client`` the service uses."""
+
+    def __init__(self, tables: dict[str, list[dict]], latency: float = 0.0,
+                 embedder: Optional[HashingEmbeddings] = None, threshold_scale: float = 0.5) -> None:
+        self.tables = tables
+        self.latency = latency
+        self.threshold_scale = threshold_scale
+        self.embedder = embedder or HashingEmbeddings()
+        self.lock = threading.RLock()
+        self.rpc_handlers: dict[str, Callable[..., Any]] = {
+            "match_documents": _match_documents,
+            "create_order_for_quotation": _create_order_for_quotation,
+            "archive_chat_sessions": _archive_chat_sessions,
+            "ensure_chat_sessions_partitions": _ensure_chat_sessions_partitions,
+            "restore_chat_session": _restore_chat_session,
+            "sweep_statuses": _sweep_statuses,
+        }
+        self._serials = {name: count(max((r["id"] for r in rows if isinstance(r.get("id"), int)), default=0) + 1)
+                         for name, rows in tables.items()}
+        self._clock = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        self._vectors: Optional[list[dict]] = None
+
+    def now(self) -> str:
+        # Strictly increasing timestamps keep "order by created_at" deterministic.
+        with self.lock:
+            self._clock += timedelta(microseconds=1)
+            return self._clock.isoformat()
+
+    def _insert_row(self, table: str, row: dict, on_conflict: Optional[str]) -> dict:
+        rows = self.tables.setdefault(table, [])
+        if on_conflict:
+            keys = [k.strip() for k in on_conflict.split(",")]
+            for existing in rows:
+                if all(existing.get(k) == row.get(k) for k in keys):
+                    existing.update(row)
+                    return existing
+        if "id" not in row:
+            serial = self._serials.setdefault(table, count(1))
+            row["id"] = str(uuid.uuid4()) if table in ("quotations", "orders", "policy_documents") else next(serial)
+        for key, value in INSERT_DEFAULTS.get(table, {}).items():
+            row.setdefault(key, value)
+        row.setdefault("created_at", self.now())
+        if table in ("quotations", "orders"):
+            row.setdefault("updated_at", row["created_at"])
+        rows.append(row)
+        if table == "policy_documents":
+            self._vectors = None
+        return row
+
+    def document_vectors(self) -> list[dict]:
+        """policy_documents with an embedding, embedding missing ones on first use."""
+        with self.lock:
+            if self._vectors is None:
+                for doc in self.tables.get("policy_documents", []):
+                    if not doc.get("embedding"):
+                        doc["embedding"] = self.embedder.embed_query(doc["content"])
+                    doc["_norm"] = math.sqrt(sum(v * v for v in doc["embedding"])) or 1.0
+                self._vectors = list(self.tables.get("policy_documents", []))
+            return self._vectors
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def from_(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> FakeRpc:
+        return FakeRpc(self, name, params or {})
+
+
+# ── Chat model ────────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class Scenario:
+    """One scripted user turn: the tool calls the model makes, then its answer."""
+
+    name: str
+    prompt: str
+    tool_calls: tuple[tuple[str, dict], ...] = ()
+    answer: str = "Here is the information you asked for."
+
+
+DEFAULT_SCENARIOS: tuple[Scenario, ...] = (
+    Scenario(
+        name="quote",
+        prompt="How much is insurance for a Honda Civic e:HEV RS 2024?",
+        tool_calls=(
+            ("search_quotation_details", {"brand": "Honda", "model": "Civic", "sub_model": "e:HEV RS", "year": 2024}),
+            ("search_policy_documents", {"query": "Type 1 flood and fire coverage"}),
+        ),
+        answer=(
+            "For the Honda Civic e:HEV RS 2024 the Zeus Comprehensive Plus (Type 1) plan costs 25,000 THB "
+            "per year with no deductible. Zeus Value Protect (Type 2+) is 13,000 THB with a 2,000 THB "
+            "deductible, and Zeus Budget Safe (Type 3+) is 9,500 THB. Type 1 covers flood and fire damage "
+            "up to the insured value. Would you like me to prepare a quotation?"
+        ),
+    ),
+    Scenario(
+        name="exclusion",
+        prompt="Am I still covered if I drive for Grab on weekends?",
+        tool_calls=(
+            ("search_policy_documents", {"query": "rideshare delivery for-hire use", "section": "Exclusion"}),
+        ),
+        answer=(
+            "No. Using a personally insured vehicle for Grab, Bolt or any other for-hire service voids the "
+            "coverage while the car is being used commercially. You would need a commercial-use endorsement."
+        ),
+    ),
+    Scenario(
+        name="relaxed",
+        prompt="What plans do you have for a Toyota Camry 2023?",
+        tool_calls=(
+            ("search_quotation_details", {"brand": "Toyota", "model": "Camry", "year": 2023}),
+        ),
+        answer=(
+            "We don't have a 2023 Camry on file, but the 2024 and 2025 Camry Hybrid Premium are available "
+            "under all three Zeus plans. Which model year is your car?"
+        ),
+    ),
+    Scenario(
+        name="compare",
+        prompt="Compare Type 1 and Type 2+ for a Honda Civic e:HEV RS 2024 and a Toyota Camry 2024.",
+        tool_calls=(
+            ("compare_quotations", {
+                "vehicles": [
+                    {"brand": "Honda", "model": "Civic", "sub_model": "e:HEV RS", "year": 2024},
+                    {"brand": "Toyota", "model": "Camry", "year": 2024},
+                ],
+                "plan_types": ["Type 1", "Type 2+"],
+            }),
+        ),
+        answer=(
+            "Here is the comparison. Type 1 costs 25,000 THB for the Civic e:HEV RS and 27,500 THB for the "
+            "Camry Hybrid Premium; Type 2+ is 13,000 THB and 14,200 THB. Shall I prepare quotations?"
+        ),
+    ),
+    Scenario(
+        name="smalltalk",
+        prompt="Hello, who are you?",
+        answer="Hello! I'm Zeus, your car insurance assistant. Tell me about your car and I'll find you a plan.",
+    ),
+)
+
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+def final_answer_turn(messages: list[BaseMessage]) -> Optional[int]:
+    """Index of the user turn when ``messages`` is the tool-less final-answer call, else None."""
+    if not messages or _message_text(messages[-1]) != FINAL_ANSWER_NOTE:
+        return None
+    return max((
+        i for i, m in enumerate(messages[:-1])
+        if isinstance(m, HumanMessage) and not _message_text(m).startswith("[Result of ")
+    ), default=-1)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Replays a ``Scenario`` chosen by the latest user message.
+
+    Each call looks at how many tool results follow that message to decide
+    whether to emit the next scripted tool call or stream the final answer.
+    """
+
+    scenarios: tuple[Scenario, ...] = DEFAULT_SCENARIOS
+    first_token_latency: float = 0.3
+    token_delay: float = 0.01
+    tool_call_latency: float = 0.2
+    model_name: str = "scripted-bench"
+
+    @property
+    def _llm_type(self) -> str:
+        return "zeus-bench-scripted"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name}
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ScriptedChatModel":
+        return self
+
+    def _scenario_for(self, messages: list[BaseMessage]) -> tuple[Scenario, int]:
+        final_turn = final_answer_turn(messages)
+        if final_turn is not None:
+            last_human, step = final_turn, len(messages)   # past every scripted tool call
+        else:
+            last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+            step = sum(1 for m in messages[last_human + 1:] if isinstance(m, ToolMessage))
+        text = _message_text(messages[last_human]) if last_human >= 0 else ""
+        for scenario in self.scenarios:
+            if scenario.prompt == text:
+                return scenario, step
+        digest = int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16)
+        return self.scenarios[digest % len(self.scenarios)], step
+
+    def _usage(self, messages: list[BaseMessage], output: str) -> dict:
+        input_tokens = sum(estimate_tokens(_message_text(m)) for m in messages)
+        output_tokens = estimate_tokens(output)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _next_message(self, messages: list[BaseMessage]) -> tuple[AIMessage, float]:
+        scenario, step = self._scenario_for(messages)
+        if step < len(scenario.tool_calls):
+            name, args = scenario.tool_calls[step]
+            call = {"name": name, "args": dict(args), "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+            return AIMessage(content="", tool_calls=[call], usage_metadata=self._usage(messages, json.dumps(args))), self.tool_call_latency
+        answer = scenario.answer
+        delay = self.first_token_latency + self.token_delay * len(answer.split())
+        return AIMessage(content=answer, usage_metadata=self._usage(messages, answer)), delay
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message, delay = self._next_message(messages)
+        time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message, delay = self._next_message(messages)
+        await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message, _ = self._next_message(messages)
+        if message.tool_calls:
+            await asyncio.sleep(self.tool_call_latency)
+            call = message.tool_calls[0]
+            chunk = AIMessageChunk(
+                content="",
+                tool_call_chunks=[{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}],
+                usage_metadata=message.usage_metadata,
+            )
+            yield ChatGenerationChunk(message=chunk)
+            return
+
+        await asyncio.sleep(self.first_token_latency)
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            text = word if i == len(words) - 1 else word + " "
+            chunk = AIMessageChunk(content=text, usage_metadata=message.usage_metadata if i == len(words) - 1 else None)
+            yield ChatGenerationChunk(message=chunk)
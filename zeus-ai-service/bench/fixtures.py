@@ -0,0 +1,192 @@
+"""
+Seed data for the benchmarks, read straight from the ``INSERT`` statements of
+``init_supabase_v2.sql`` so the fixtures never drift from the real schema.
+
+Only the SQL subset that file uses is understood: string / numeric / NULL
+literals and scalar ``(SELECT id FROM t WHERE col='x' [AND ...] [LIMIT 1])``
+lookups against rows inserted earlier. Function bodies are skipped.
+"""
+
+import re
+import json
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional
+
+SQL_PATH = Path(__file__).resolve().parent.parent / "init_supabase_v2.sql"
+
+# Tables keyed by UUID in the schema; everything else is SERIAL.
+UUID_TABLES = {"quotations", "orders", "policy_documents"}
+
+_INSERT_RE = re.compile(r"INSERT\s+INTO\s+(\w+)\s*\(([^)]*)\)\s*VALUES", re.IGNORECASE)
+_SUBSELECT_RE = re.compile(
+    r"^\(\s*SELECT\s+(\w+)\s+FROM\s+(\w+)\s+WHERE\s+(.+?)(?:\s+LIMIT\s+(\d+))?\s*\)$",
+    re.IGNORECASE | re.DOTALL,
+)
+# Function bodies ($$ ... $$) contain INSERTs with parameters, not seed rows.
+_DOLLAR_QUOTED_RE = re.compile(r"\$\$.*?\$\$", re.DOTALL)
+_CONDITION_RE = re.compile(r"(\w+)\s*=\s*('(?:[^']|'')*'|[\d.]+)")
+
+
+def _skip_ws_and_comments(sql: str, i: int) -> int:
+    while i < len(sql):
+        if sql[i].isspace():
+            i += 1
+        elif sql.startswith("--", i):
+            newline = sql.find("\n", i)
+            i = len(sql) if newline == -1 else newline + 1
+        else:
+            break
+    return i
+
+
+def _read_string(sql: str, i: int) -> tuple[str, int]:
+    """Read a '...' literal starting at ``sql[i] == "'"``; '' is an escaped quote."""
+    out = []
+    i += 1
+    while True:
+        j = sql.index("'", i)
+        out.append(sql[i:j])
+        if sql.startswith("''", j):
+            out.append("'")
+            i = j + 2
+        else:
+            return "".join(out), j + 1
+
+
+def _read_parenthesised(sql: str, i: int) -> tuple[str, int]:
+    depth, start = 0, i
+    while i < len(sql):
+        ch = sql[i]
+        if ch == "'":
+            _, i = _read_string(sql, i)
+            continue
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return sql[start:i + 1], i + 1
+        i += 1
+    raise ValueError("unbalanced parentheses in fixture SQL")
+
+
+def _literal(token: str) -> Any:
+    if token.upper() == "NULL":
+        return None
+    if token.startswith("'"):
+        return _read_string(token, 0)[0]
+    return float(token) if "." in token else int(token)
+
+
+def _lookup(expr: str, tables: dict[str, list[dict]]) -> Any:
+    match = _SUBSELECT_RE.match(expr.strip())
+    if not match:
+        raise ValueError(f"unsupported fixture expression: {expr[:80]}")
+    column, table, where, _ = match.groups()
+    conditions = [(name, _literal(value)) for name, value in _CONDITION_RE.findall(where)]
+    for row in tables.get(table, []):
+        if all(row.get(name) == value for name, value in conditions):
+            return row[column]
+    return None
+
+
+def _read_tuple(sql: str, i: int, tables: dict[str, list[dict]]) -> tuple[list, int]:
+    """Parse one ``( v1, v2, ... )`` row starting at ``sql[i] == "("``."""
+    values: list = []
+    i += 1
+    while True:
+        i = _skip_ws_and_comments(sql, i)
+        ch = sql[i]
+        if ch == "'":
+            value, i = _read_string(sql, i)
+        elif ch == "(":
+            expr, i = _read_parenthesised(sql, i)
+            value = _lookup(expr, tables)
+        else:
+            end = i
+            while sql[end] not in ",)":
+                end += 1
+            value, i = _literal(sql[i:end].strip()), end
+        values.append(value)
+        i = _skip_ws_and_comments(sql, i)
+        if sql[i] == ",":
+            i += 1
+        elif sql[i] == ")":
+            return values, i + 1
+
+
+def _coerce(table: str, row: dict) -> dict:
+    if "metadata" in row and isinstance(row["metadata"], str):
+        row["metadata"] = json.loads(row["metadata"])
+    return row
+
+
+def parse_inserts(sql: str) -> dict[str, list[dict]]:
+    """Execute the INSERT statements of ``sql`` into plain row dicts with generated ids."""
+    tables: dict[str, list[dict]] = {}
+    sql = _DOLLAR_QUOTED_RE.sub("", sql)
+    for match in _INSERT_RE.finditer(sql):
+        table = match.group(1)
+        columns = [c.strip() for c in match.group(2).split(",")]
+        rows = tables.setdefault(table, [])
+        i = match.end()
+        while True:
+            i = _skip_ws_and_comments(sql, i)
+            if sql[i] != "(":
+                break
+            values, i = _read_tuple(sql, i, tables)
+            row = dict(zip(columns, values))
+            row["id"] = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{table}/{len(rows)}")) if table in UUID_TABLES else len(rows) + 1
+            rows.append(_coerce(table, row))
+            i = _skip_ws_and_comments(sql, i)
+            if sql[i] == ",":
+                i += 1
+                continue
+            break
+    return tables
+
+
+def build_quotation_view(tables: dict[str, list[dict]]) -> list[dict]:
+    """Rows of ``vw_quotation_details`` (car_models ⋈ car_brands ⋈ plan_premiums ⋈ insurance_plans)."""
+    brands = {b["id"]: b for b in tables.get("car_brands", [])}
+    models = {m["id"]: m for m in tables.get("car_models", [])}
+    plans = {p["id"]: p for p in tables.get("insurance_plans", [])}
+    view = []
+    for premium in tables.get("plan_premiums", []):
+        car = models.get(premium["car_model_id"])
+        plan = plans.get(premium["plan_id"])
+        brand = brands.get(car["brand_id"]) if car else None
+        if not (car and plan and brand):
+            continue
+        view.append({
+            "brand": brand["name"],
+            "model": car["name"],
+            "sub_model": car["sub_model"],
+            "year": car["year"],
+            "car_estimated_price": car["estimated_price"],
+            "plan_type": plan["plan_type"],
+            "plan_name": plan["plan_name"],
+            "insurer_name": plan["insurer_name"],
+            "base_premium": premium["base_premium"],
+            "deductible": premium["deductible"],
+            "car_model_id": car["id"],
+            "plan_id": plan["id"],
+        })
+    return view
+
+
+@lru_cache(maxsize=1)
+def _seed(path: str) -> dict[str, list[dict]]:
+    tables = parse_inserts(Path(path).read_text(encoding="utf-8"))
+    tables["vw_quotation_details"] = build_quotation_view(tables)
+    for name in ("quotations", "orders", "chat_sessions", "chat_attachments"):
+        tables.setdefault(name, [])
+    return tables
+
+
+def load_seed_tables(path: Optional[Path] = None) -> dict[str, list[dict]]:
+    """A fresh, mutable copy of the seeded tables (parsed once per process)."""
+    seed = _seed(str(path or SQL_PATH))
+    return {name: [dict(row) for row in rows] for name, rows in seed.items()}
@@ -0,0 +1,119 @@
+"""
+Boot the real FastAPI app against the fakes in ``bench.fakes``.
+
+Everything above the LLM / Supabase / embedding boundary — routing, history
+replay, tools, compaction, persistence, SSE framing, telemetry — is the
+production code path.
+"""
+
+import os
+import sys
+import socket
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterator, Optional
+
+# Before the service modules are imported: quiet logs, no provider-side caches.
+os.environ.setdefault("ZEUS_LOG_LEVEL", "WARNING")
+os.environ.setdefault("GEMINI_CONTEXT_CACHE", "false")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("SUPABASE_URL", "http://bench.invalid")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "bench")
+
+import logging
+
+from bench.fakes import DEFAULT_SCENARIOS, FakeSupabase, HashingEmbeddings, Scenario, ScriptedChatModel
+from bench.fixtures import load_seed_tables
+
+
+@dataclass
+class BenchConfig:
+    first_token_latency: float = 0.3
+    token_delay: float = 0.01
+    tool_call_latency: float = 0.2
+    db_latency: float = 0.005
+    embedding_latency: float = 0.05
+    scenarios: tuple[Scenario, ...] = DEFAULT_SCENARIOS
+
+
+@dataclass
+class BenchService:
+    app: object
+    db: FakeSupabase
+    llm: ScriptedChatModel
+    embedder: HashingEmbeddings
+
+
+def _patch(module, name: str, value, undo: list) -> None:
+    undo.append((module, name, getattr(module, name)))
+    setattr(module, name, value)
+
+
+@contextmanager
+def patched_service(config: Optional[BenchConfig] = None, db: Optional[FakeSupabase] = None,
+                    llm=None) -> Iterator[BenchService]:
+    """Swap the external clients for fakes for the duration of the block."""
+    config = config or BenchConfig()
+    import main
+    import agent
+    import database
+    import tools.policy_rag_tool as policy_rag
+    from pricing import pricing_engine
+
+    embedder = HashingEmbeddings(latency=config.embedding_latency)
+    db = db or FakeSupabase(load_seed_tables(), latency=config.db_latency, embedder=HashingEmbeddings())
+    llm = llm or ScriptedChatModel(
+        scenarios=config.scenarios,
+        first_token_latency=config.first_token_latency,
+        token_delay=config.token_delay,
+        tool_call_latency=config.tool_call_latency,
+    )
+
+    @lru_cache(maxsize=None)
+    def bench_executor(model_choice: str = "gemini-2.5-flash"):
+        return agent.build_agent(llm)
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    undo: list = []
+    original_client = database.get_supabase_client
+    # Modules bind get_supabase_client at import time, so patch every copy.
+    for module in list(sys.modules.values()):
+        if getattr(module, "get_supabase_client", None) is original_client:
+            _patch(module, "get_supabase_client", lambda: db, undo)
+    _patch(main, "create_agent_executor", bench_executor, undo)
+    _patch(policy_rag, "get_embeddings_model", lambda: embedder, undo)
+    pricing_engine.invalidate()
+    try:
+        yield BenchService(app=main.app, db=db, llm=llm, embedder=embedder)
+    finally:
+        for module, name, value in reversed(undo):
+            setattr(module, name, value)
+        pricing_engine.invalidate()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def running_server(app, port: Optional[int] = None) -> Iterator[str]:
+    """Serve ``app`` with uvicorn on a background thread; yields the base URL."""
+    import uvicorn
+
+    port = port or _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("benchmark server failed to start")
+        threading.Event().wait(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
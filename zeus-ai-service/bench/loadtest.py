@@ -0,0 +1,302 @@
+"""
+Closed-loop load test of ``/api/chat``, ``/api/chat/stream`` and ``/ws/chat``.
+
+Boots the app in-process against the fakes (see ``bench.harness``), drives it
+over real HTTP at a fixed concurrency and reports throughput, latency
+percentiles, time to first token and the per-stage span breakdown collected by
+``telemetry``::
+
+    python -m bench.loadtest --endpoint stream --requests 200 --concurrency 16
+    python -m bench.loadtest --endpoint chat --turns-per-session 4 --json out.json
+    python -m bench.loadtest --endpoint ws --turns-per-session 4     # one socket per worker
+
+Pass ``--url`` to drive an already running server instead (no stage breakdown).
+"""
+
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from dataclasses import dataclass, asdict
+from typing import Iterable, Optional
+
+import httpx
+
+from bench.harness import BenchConfig, patched_service, running_server
+from telemetry import SPAN_DURATION
+
+
+@dataclass
+class Sample:
+    scenario: str
+    ok: bool
+    status: int
+    latency: float
+    ttft: Optional[float] = None
+    tokens: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class Turn:
+    """One request of the workload: which session it belongs to and what the user says."""
+
+    session_id: str
+    message: str
+    scenario: str = ""
+    model: str = "gemini-2.5-flash"
+    image_base64: Optional[str] = None
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def synthetic_workload(config: BenchConfig, requests: int, turns_per_session: int, model: str) -> list[list[Turn]]:
+    """Sessions of ``turns_per_session`` turns cycling through the scripted scenarios."""
+    sessions: list[list[Turn]] = []
+    scenarios = config.scenarios
+    for i in range(0, requests, turns_per_session):
+        session_id = str(uuid.uuid4())
+        sessions.append([
+            Turn(session_id, scenarios[(i + j) % len(scenarios)].prompt, scenarios[(i + j) % len(scenarios)].name, model)
+            for j in range(min(turns_per_session, requests - i))
+        ])
+    return sessions
+
+
+async def _send(client: httpx.AsyncClient, endpoint: str, turn: Turn) -> Sample:
+    body = {"session_id": turn.session_id, "message": turn.message, "llm_model": turn.model}
+    if turn.image_base64:
+        body["image_base64"] = turn.image_base64
+    start = time.perf_counter()
+    if endpoint == "chat":
+        response = await client.post("/api/chat", json=body)
+        latency = time.perf_counter() - start
+        ok = response.status_code == 200
+        return Sample(turn.scenario, ok, response.status_code, latency, error=None if ok else response.text[:200])
+
+    ttft, tokens, error = None, 0, None
+    async with client.stream("POST", "/api/chat/stream", json=body) as response:
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if "token" in event:
+                tokens += 1
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+            elif "error" in event:
+                error = event["error"]
+        status = response.status_code
+    latency = time.perf_counter() - start
+    return Sample(turn.scenario, status == 200 and error is None, status, latency, ttft, tokens, error)
+
+
+async def _send_ws(ws, turn: Turn) -> Sample:
+    frame = {"type": "chat", "session_id": turn.session_id, "id": uuid.uuid4().hex,
+             "message": turn.message, "llm_model": turn.model}
+    if turn.image_base64:
+        frame["image_base64"] = turn.image_base64
+    start = time.perf_counter()
+    await ws.send(json.dumps(frame))
+    ttft, tokens, error = None, 0, None
+    while True:
+        event = json.loads(await ws.recv())
+        if event.get("id") != frame["id"]:
+            continue  # "opened" and order pushes
+        if event["type"] == "token":
+            tokens += 1
+            if ttft is None:
+                ttft = time.perf_counter() - start
+        elif event["type"] in ("error", "done"):
+            error = event.get("error")
+            break
+    latency = time.perf_counter() - start
+    return Sample(turn.scenario, error is None, 101, latency, ttft, tokens, error)
+
+
+async def drive_ws(base_url: str, sessions: list[list[Turn]], concurrency: int, timeout: float = 120.0) -> tuple[list[Sample], float]:
+    """Like ``drive``, over ``/ws/chat``: each worker keeps one socket open for all of its sessions."""
+    import websockets
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for session in sessions:
+        queue.put_nowait(session)
+    samples: list[Sample] = []
+    url = base_url.replace("http", "ws", 1) + "/ws/chat"
+
+    async def worker() -> None:
+        async with websockets.connect(url, max_size=None, open_timeout=timeout) as ws:
+            while not queue.empty():
+                session = queue.get_nowait()
+                for turn in session:
+                    try:
+                        samples.append(await asyncio.wait_for(_send_ws(ws, turn), timeout))
+                    except (TimeoutError, websockets.ConnectionClosed) as exc:
+                        samples.append(Sample(turn.scenario, False, 0, 0.0, error=repr(exc)))
+                await ws.send(json.dumps({"type": "close", "session_id": session[0].session_id}))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+async def drive(base_url: str, endpoint: str, sessions: list[list[Turn]], concurrency: int,
+                timeout: float = 120.0, duplicates: int = 1) -> tuple[list[Sample], float]:
+    """
+    Run sessions on ``concurrency`` workers; turns within a session stay sequential.
+    With ``duplicates`` > 1 every turn is sent that many times at once, like a double-submitting client.
+    """
+    if endpoint == "ws":
+        return await drive_ws(base_url, sessions, concurrency, timeout)
+    queue: asyncio.Queue = asyncio.Queue()
+    for session in sessions:
+        queue.put_nowait(session)
+    samples: list[Sample] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker() -> None:
+            while not queue.empty():
+                session = queue.get_nowait()
+                for turn in session:
+                    sent = await asyncio.gather(
+                        *(_send(client, endpoint, turn) for _ in range(duplicates)), return_exceptions=True,
+                    )
+                    for sample in sent:
+                        if isinstance(sample, httpx.HTTPError):
+                            sample = Sample(turn.scenario, False, 0, 0.0, error=str(sample))
+                        elif isinstance(sample, BaseException):
+                            raise sample
+                        samples.append(sample)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return samples, wall
+
+
+def stage_breakdown(before: dict, after: dict) -> list[dict]:
+    """Mean and total time per span (kind, name) recorded between two snapshots."""
+    rows = []
+    for key, (total, count) in after.items():
+        prev_total, prev_count = before.get(key, (0.0, 0))
+        n = count - prev_count
+        if n <= 0:
+            continue
+        spent = total - prev_total
+        rows.append({"kind": key[0], "name": key[1], "count": n, "mean_ms": round(spent / n * 1000, 2), "total_s": round(spent, 3)})
+    return sorted(rows, key=lambda r: (r["kind"], -r["total_s"]))
+
+
+def summarize(samples: list[Sample], wall: float) -> dict:
+    ok = [s for s in samples if s.ok]
+    latencies = [s.latency for s in ok]
+    ttfts = [s.ttft for s in ok if s.ttft is not None]
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "wall_s": round(wall, 3),
+        "rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "latency_ms": {f"p{q}": ms(percentile(latencies, q)) for q in (50, 95, 99)},
+        "ttft_ms": {f"p{q}": ms(percentile(ttfts, q)) for q in (50, 95, 99)},
+        "by_scenario": {
+            name: {
+                "requests": len(group),
+                "p50_ms": ms(percentile([s.latency for s in group], 50)),
+                "p95_ms": ms(percentile([s.latency for s in group], 95)),
+            }
+            for name in sorted({s.scenario for s in ok})
+            for group in [[s for s in ok if s.scenario == name]]
+        },
+        "sample_errors": sorted({s.error for s in samples if s.error})[:5],
+    }
+
+
+def print_report(report: dict, out=sys.stdout) -> None:
+    print(f"\n{report['endpoint']} — {report['requests']} requests, concurrency {report['concurrency']}", file=out)
+    print(f"  throughput   {report['rps']} req/s over {report['wall_s']} s ({report['errors']} errors)", file=out)
+    lat, ttft = report["latency_ms"], report["ttft_ms"]
+    print(f"  latency ms   p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}", file=out)
+    if ttft["p50"] is not None:
+        print(f"  ttft ms      p50 {ttft['p50']}  p95 {ttft['p95']}  p99 {ttft['p99']}", file=out)
+    for name, row in report["by_scenario"].items():
+        print(f"  {name:<14} n={row['requests']:<5} p50 {row['p50_ms']} ms  p95 {row['p95_ms']} ms", file=out)
+    if report.get("stages"):
+        print("\n  kind      name                                   count   mean ms   total s", file=out)
+        for row in report["stages"]:
+            print(f"  {row['kind']:<9} {row['name'][:38]:<38} {row['count']:>6} {row['mean_ms']:>9} {row['total_s']:>9}", file=out)
+    for error in report["sample_errors"]:
+        print(f"  ! {error}", file=out)
+
+
+def run(args: argparse.Namespace, sessions: Optional[list[list[Turn]]] = None, llm=None) -> dict:
+    """Run one load test; ``sessions`` / ``llm`` let other tools (e.g. replay) supply their own workload."""
+    config = BenchConfig(
+        first_token_latency=args.first_token_latency,
+        token_delay=args.token_delay,
+        tool_call_latency=args.tool_call_latency,
+        db_latency=args.db_latency,
+        embedding_latency=args.embedding_latency,
+    )
+    sessions = sessions or synthetic_workload(config, args.requests, args.turns_per_session, args.model)
+
+    if args.url:
+        samples, wall = asyncio.run(drive(args.url, args.endpoint, sessions, args.concurrency, duplicates=args.duplicates))
+        stages = []
+    else:
+        with patched_service(config, llm=llm) as service, running_server(service.app) as base_url:
+            before = SPAN_DURATION.snapshot()
+            samples, wall = asyncio.run(drive(base_url, args.endpoint, sessions, args.concurrency, duplicates=args.duplicates))
+            stages = stage_breakdown(before, SPAN_DURATION.snapshot())
+
+    report = {"endpoint": args.endpoint, "concurrency": args.concurrency, **summarize(samples, wall), "stages": stages}
+    report["config"] = asdict(config) | {"turns_per_session": args.turns_per_session, "duplicates": args.duplicates}
+    report["config"].pop("scenarios", None)
+    return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load-test zeus-ai-service with a fake LLM and fake Supabase")
+    parser.add_argument("--endpoint", choices=("chat", "stream", "ws"), default="stream")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--turns-per-session", type=int, default=1)
+    parser.add_argument("--duplicates", type=int, default=1, help="copies of every turn sent at once (double-submits)")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="seconds before the first answer token")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between answer tokens")
+    parser.add_argument("--tool-call-latency", type=float, default=0.2, help="seconds for a tool-calling LLM step")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="seconds per Supabase call")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="seconds per query embedding")
+    parser.add_argument("--url", help="drive an already running server instead of booting one")
+    parser.add_argument("--json", dest="json_path", help="also write the report as JSON")
+    return parser
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.endpoint == "ws" and args.duplicates > 1:
+        parser.error("--duplicates needs an HTTP endpoint; a socket runs one turn per session at a time")
+    report = run(args)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
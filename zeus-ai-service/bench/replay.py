@@ -0,0 +1,545 @@
+"""
+Replay recorded ``chat_sessions`` traffic as a regression and capacity benchmark.
+
+Three steps, each a subcommand::
+
+    # 1. Export sessions (from Supabase, or a JSON dump such as session_id.json)
+    python -m bench.replay export --from-json session_id.json --out traffic.jsonl.gz
+    python -m bench.replay export --since 2026-02-01 --with-images --out traffic.jsonl.gz
+
+    # 2. Optionally record real LLM responses (tool calls included) once
+    python -m bench.replay record traffic.jsonl.gz --cassette traffic.cassette.json.gz
+
+    # 3. Replay against this build and compare with another build's report
+    python -m bench.replay run traffic.jsonl.gz --cassette traffic.cassette.json.gz --speed 10 --json new.json
+    python -m bench.replay compare old.json new.json
+
+The export is gzip'd JSON lines: a header, one ``blob`` line per distinct image
+and one ``session`` line per session whose turns carry the user text, the
+recorded AI reply, the offset from session start and an image reference.
+
+During ``run`` the LLM is ``RecordedChatModel``: it replays the cassette step
+by step (tool calls and all), falling back to the exported AI reply as a direct
+answer for turns that were never recorded. Supabase is the seeded in-memory
+fake, so only the service itself is measured.
+"""
+
+import re
+import sys
+import gzip
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterable, Optional
+from uuid import UUID
+
+import httpx
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult, LLMResult
+
+from bench.fakes import final_answer_turn
+from bench.harness import BenchConfig, patched_service, running_server
+from bench.loadtest import Sample, Turn, _send, stage_breakdown, summarize
+from telemetry import SPAN_DURATION
+from tools.compaction import estimate_tokens
+
+FORMAT = "zeus-replay/1"
+_THAI_RE = re.compile(r"[฀-๿]")
+_CONTEXT_PREFIX_RE = re.compile(r"^\[The user attached[^\n]*\]\n", re.DOTALL)
+
+
+# ── Session file ──────────────────────────────────────────────────────────────
+
+@dataclass
+class ReplayTurn:
+    offset: float                      # seconds since the session's first turn
+    user: str
+    ai: str = ""
+    image: Optional[str] = None        # sha256 of an exported blob
+
+    @property
+    def kind(self) -> str:
+        lang = "th" if _THAI_RE.search(self.user) else "en"
+        return f"{lang}/{'image' if self.image else 'text'}"
+
+
+@dataclass
+class ReplaySession:
+    session_id: str
+    started_at: float                  # epoch seconds of the first turn
+    turns: list[ReplayTurn] = field(default_factory=list)
+
+
+def _parse_ts(value: str) -> float:
+    text = value.replace(" ", "T")
+    if re.search(r"[+-]\d\d$", text):
+        text += ":00"
+    return datetime.fromisoformat(text.replace("Z", "+00:00")).timestamp()
+
+
+def sessions_from_rows(rows: Iterable[dict]) -> tuple[list[ReplaySession], dict[str, str]]:
+    """Pair user rows with the AI row that follows them, grouped per session."""
+    from chat_store import normalize_content
+
+    by_session: dict[str, list[dict]] = {}
+    for row in rows:
+        by_session.setdefault(row["session_id"], []).append(row)
+
+    sessions, blobs = [], {}
+    for session_id, session_rows in by_session.items():
+        session_rows.sort(key=lambda r: (r["created_at"], r.get("id", 0)))
+        start = _parse_ts(session_rows[0]["created_at"])
+        session = ReplaySession(session_id, start)
+        for row in session_rows:
+            text, _ = normalize_content(row["message"])
+            if row["role"] == "user":
+                image = None
+                for attachment in row.get("chat_attachments") or row.get("attachments") or []:
+                    data = (attachment.get("payload") or {}).get("data_base64")
+                    if attachment.get("kind") == "image" and data:
+                        image = attachment.get("sha256") or hashlib.sha256(data.encode()).hexdigest()
+                        blobs[image] = data
+                session.turns.append(ReplayTurn(round(_parse_ts(row["created_at"]) - start, 3), text, image=image))
+            elif session.turns and not session.turns[-1].ai:
+                session.turns[-1].ai = text
+        if session.turns:
+            sessions.append(session)
+    sessions.sort(key=lambda s: s.started_at)
+    return sessions, blobs
+
+
+def write_sessions(path: str, sessions: list[ReplaySession], blobs: dict[str, str]) -> None:
+    with gzip.open(path, "wt", encoding="utf-8") as fh:
+        fh.write(json.dumps({"format": FORMAT, "sessions": len(sessions), "blobs": len(blobs)}) + "\n")
+        for sha, data in blobs.items():
+            fh.write(json.dumps({"blob": sha, "data": data}) + "\n")
+        for s in sessions:
+            turns = [{k: v for k, v in (("t", t.offset), ("u", t.user), ("a", t.ai), ("i", t.image)) if v not in (None, "")} for t in s.turns]
+            fh.write(json.dumps({"session": s.session_id, "start": s.started_at, "turns": turns}, ensure_ascii=False) + "\n")
+
+
+def read_sessions(path: str) -> tuple[list[ReplaySession], dict[str, str]]:
+    sessions, blobs = [], {}
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        header = json.loads(fh.readline())
+        if header.get("format") != FORMAT:
+            raise ValueError(f"{path} is not a {FORMAT} file")
+        for line in fh:
+            entry = json.loads(line)
+            if "blob" in entry:
+                blobs[entry["blob"]] = entry["data"]
+            else:
+                sessions.append(ReplaySession(entry["session"], entry["start"], [
+                    ReplayTurn(t.get("t", 0.0), t.get("u", ""), t.get("a", ""), t.get("i")) for t in entry["turns"]
+                ]))
+    return sessions, blobs
+
+
+def export_from_supabase(since: Optional[str], limit: Optional[int], with_images: bool, page_size: int = 1000) -> list[dict]:
+    from database import get_supabase_client
+
+    client = get_supabase_client()
+    columns = "id, session_id, role, message, created_at"
+    if with_images:
+        columns += ", chat_attachments(kind, sha256, payload)"
+    rows, offset = [], 0
+    while True:
+        query = client.table("chat_sessions").select(columns).order("created_at", desc=False)
+        if since:
+            query = query.gte("created_at", since)
+        page = query.range(offset, offset + page_size - 1).execute().data or []
+        rows.extend(page)
+        offset += page_size
+        if len(page) < page_size or (limit and len({r["session_id"] for r in rows}) >= limit):
+            break
+    if limit:
+        keep = list(dict.fromkeys(r["session_id"] for r in rows))[:limit]
+        rows = [r for r in rows if r["session_id"] in set(keep)]
+    return rows
+
+
+# ── Recorded-response LLM ─────────────────────────────────────────────────────
+
+def _user_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        return " ".join(p.get("text", "") for p in content if isinstance(p, dict) and p.get("type") == "text")
+    return _CONTEXT_PREFIX_RE.sub("", content)
+
+
+def conversation_key(user_texts: Iterable[str]) -> str:
+    """Identifies a turn by every user message so far, so repeated phrases in different sessions differ."""
+    return hashlib.sha256("\x1f".join(user_texts).encode("utf-8")).hexdigest()[:20]
+
+
+def _key_for(messages: list[BaseMessage]) -> tuple[str, int]:
+    final_turn = final_answer_turn(messages)
+    if final_turn is not None:
+        # Budget-forced final answer: same turn, played as its recorded answer step.
+        humans = [i for i, m in enumerate(messages[:final_turn + 1])
+                  if isinstance(m, HumanMessage) and not _user_text(m).startswith("[Result of ")]
+        return conversation_key(_user_text(messages[i]) for i in humans), -1
+    humans = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    key = conversation_key(_user_text(messages[i]) for i in humans)
+    step = sum(1 for m in messages[(humans[-1] if humans else 0) + 1:] if isinstance(m, ToolMessage))
+    return key, step
+
+
+def fallback_cassette(sessions: list[ReplaySession]) -> dict[str, list[dict]]:
+    """Cassette that answers every turn directly with the exported AI reply."""
+    cassette = {}
+    for session in sessions:
+        users = []
+        for turn in session.turns:
+            users.append(turn.user)
+            cassette[conversation_key(users)] = [{"content": turn.ai or "(no recorded reply)"}]
+    return cassette
+
+
+def load_cassette(path: str) -> dict[str, list[dict]]:
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+class RecordedChatModel(BaseChatModel):
+    """Plays back recorded LLM steps (tool calls, then the answer) for each conversation turn."""
+
+    cassette: dict
+    first_token_latency: float = 0.3
+    token_delay: float = 0.01
+    tool_call_latency: float = 0.2
+    model_name: str = "recorded-replay"
+
+    @property
+    def _llm_type(self) -> str:
+        return "zeus-bench-recorded"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "RecordedChatModel":
+        return self
+
+    def _step(self, messages: list[BaseMessage]) -> AIMessage:
+        key, step = _key_for(messages)
+        steps = self.cassette.get(key) or [{"content": "(turn not in cassette)"}]
+        if step < 0:
+            recorded = next((s for s in reversed(steps) if not s.get("tool_calls")), {"content": "(no recorded answer)"})
+            step = len(steps)
+        else:
+            recorded = steps[min(step, len(steps) - 1)]
+        # A recorded tool step whose results have all been consumed is followed by the answer.
+        if step >= len(steps) and recorded.get("tool_calls"):
+            recorded = {"content": "(recording ended after tool calls)"}
+        tool_calls = [
+            {"name": c["name"], "args": c.get("args", {}), "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+            for c in recorded.get("tool_calls", [])
+        ]
+        content = recorded.get("content", "")
+        usage = recorded.get("usage") or {
+            "input_tokens": sum(estimate_tokens(str(m.content)) for m in messages),
+            "output_tokens": estimate_tokens(content),
+        }
+        usage.setdefault("total_tokens", usage["input_tokens"] + usage["output_tokens"])
+        return AIMessage(content=content, tool_calls=tool_calls, usage_metadata=usage)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._step(messages)
+        time.sleep(self.tool_call_latency if message.tool_calls else self.first_token_latency)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._step(messages)
+        await asyncio.sleep(self.tool_call_latency if message.tool_calls else self.first_token_latency)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._step(messages)
+        if message.tool_calls:
+            await asyncio.sleep(self.tool_call_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                    for i, c in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata,
+            ))
+            return
+        await asyncio.sleep(self.first_token_latency)
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            last = i == len(words) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=word if last else word + " ",
+                usage_metadata=message.usage_metadata if last else None,
+            ))
+
+
+class UsageTally(BaseCallbackHandler):
+    """Token usage and tool calls of every agent run in a replay."""
+
+    def __init__(self) -> None:
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.llm_calls = 0
+        self.tool_calls: Counter = Counter()
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        self.llm_calls += 1
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.input_tokens += usage.get("input_tokens", 0)
+                self.output_tokens += usage.get("output_tokens", 0)
+
+    def on_tool_start(self, serialized: dict, input_str: str, **kwargs: Any) -> None:
+        self.tool_calls[(serialized or {}).get("name") or kwargs.get("name") or "tool"] += 1
+
+
+class CassetteRecorder(BaseCallbackHandler):
+    """Captures each real LLM step, keyed like ``RecordedChatModel`` looks them up."""
+
+    def __init__(self) -> None:
+        self.cassette: dict[str, list[dict]] = {}
+        self._pending: dict[UUID, tuple[str, int]] = {}
+
+    def on_chat_model_start(self, serialized: dict, messages: list[list[BaseMessage]], *, run_id: UUID, **kwargs: Any) -> None:
+        self._pending[run_id] = _key_for(messages[0])
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        key_step = self._pending.pop(run_id, None)
+        if key_step is None:
+            return
+        key, step = key_step
+        message = response.generations[0][0].message
+        steps = self.cassette.setdefault(key, [])
+        content = message.content if isinstance(message.content, str) else " ".join(
+            p.get("text", "") for p in message.content if isinstance(p, dict)
+        )
+        entry = {"content": content, "tool_calls": [{"name": c["name"], "args": c["args"]} for c in message.tool_calls]}
+        if message.usage_metadata:
+            entry["usage"] = {k: message.usage_metadata[k] for k in ("input_tokens", "output_tokens", "total_tokens")}
+        if step < len(steps):
+            steps[step] = entry
+        else:
+            steps.append(entry)
+
+
+# ── Driver ────────────────────────────────────────────────────────────────────
+
+async def replay(base_url: str, sessions: list[ReplaySession], blobs: dict[str, str], endpoint: str,
+                 speed: float, max_concurrency: int, model: str) -> tuple[list[Sample], float]:
+    """
+    Open-loop replay: each session starts at its original offset and keeps its
+    think time between turns, both divided by ``speed`` (0 = as fast as possible).
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    samples: list[Sample] = []
+    origin = sessions[0].started_at if sessions else 0.0
+    limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0, limits=limits) as client:
+        t0 = time.perf_counter()
+
+        async def wait_until(offset: float) -> None:
+            if speed > 0:
+                delay = offset / speed - (time.perf_counter() - t0)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+        async def run_session(session: ReplaySession) -> None:
+            await wait_until(session.started_at - origin)
+            session_id = str(uuid.uuid4())
+            session_start = time.perf_counter() - t0
+            for turn in session.turns:
+                if speed > 0:
+                    await wait_until(session_start * speed + turn.offset)
+                turn_request = Turn(session_id, turn.user, turn.kind, model, blobs.get(turn.image) if turn.image else None)
+                async with semaphore:
+                    try:
+                        samples.append(await _send(client, endpoint, turn_request))
+                    except httpx.HTTPError as exc:
+                        samples.append(Sample(turn.kind, False, 0, 0.0, error=str(exc)))
+
+        await asyncio.gather(*(run_session(s) for s in sessions))
+        wall = time.perf_counter() - t0
+    return samples, wall
+
+
+def run_replay(args: argparse.Namespace) -> dict:
+    sessions, blobs = read_sessions(args.sessions)
+    if args.limit:
+        sessions = sessions[:args.limit]
+    cassette = fallback_cassette(sessions)
+    if args.cassette:
+        cassette.update(load_cassette(args.cassette))
+
+    config = BenchConfig(first_token_latency=args.first_token_latency, token_delay=args.token_delay,
+                         tool_call_latency=args.tool_call_latency, db_latency=args.db_latency,
+                         embedding_latency=args.embedding_latency)
+    llm = RecordedChatModel(cassette=cassette, first_token_latency=config.first_token_latency,
+                            token_delay=config.token_delay, tool_call_latency=config.tool_call_latency)
+    tally = UsageTally()
+
+    import main
+    original_callbacks = main._agent_callbacks
+    main._agent_callbacks = lambda *callbacks: original_callbacks(*callbacks) + [tally]
+    try:
+        with patched_service(config, llm=llm) as service, running_server(service.app) as base_url:
+            before = SPAN_DURATION.snapshot()
+            samples, wall = asyncio.run(replay(base_url, sessions, blobs, args.endpoint, args.speed, args.concurrency, args.model))
+            stages = stage_breakdown(before, SPAN_DURATION.snapshot())
+    finally:
+        main._agent_callbacks = original_callbacks
+
+    turns = [t for s in sessions for t in s.turns]
+    return {
+        "endpoint": args.endpoint,
+        "concurrency": args.concurrency,
+        "speed": args.speed,
+        "sessions": len(sessions),
+        "mix": dict(Counter(t.kind for t in turns)),
+        **summarize(samples, wall),
+        "tokens": {"input": tally.input_tokens, "output": tally.output_tokens, "llm_calls": tally.llm_calls},
+        "tool_calls": dict(tally.tool_calls),
+        "stages": stages,
+    }
+
+
+def record(args: argparse.Namespace) -> dict:
+    """Replay sessions once against the real model and Supabase, capturing each LLM step."""
+    sessions, blobs = read_sessions(args.sessions)
+    if args.limit:
+        sessions = sessions[:args.limit]
+    recorder = CassetteRecorder()
+
+    # bench.harness set placeholder credentials; the recording needs the real ones from .env.
+    from dotenv import load_dotenv
+    load_dotenv(override=True)
+    import main
+    original_callbacks = main._agent_callbacks
+    main._agent_callbacks = lambda *callbacks: original_callbacks(*callbacks) + [recorder]
+    try:
+        with running_server(main.app) as base_url:
+            asyncio.run(replay(base_url, sessions, blobs, "chat", 0, args.concurrency, args.model))
+    finally:
+        main._agent_callbacks = original_callbacks
+
+    with gzip.open(args.cassette, "wt", encoding="utf-8") as fh:
+        json.dump(recorder.cassette, fh, ensure_ascii=False)
+    return recorder.cassette
+
+
+# ── Compare ───────────────────────────────────────────────────────────────────
+
+def _flatten(report: dict) -> dict[str, float]:
+    flat = {"rps": report["rps"], "errors": report["errors"]}
+    for group in ("latency_ms", "ttft_ms", "tokens"):
+        for key, value in (report.get(group) or {}).items():
+            if value is not None:
+                flat[f"{group}.{key}"] = value
+    for tool, n in (report.get("tool_calls") or {}).items():
+        flat[f"tool_calls.{tool}"] = n
+    for row in report.get("stages") or []:
+        flat[f"stage.{row['kind']}.{row['name']}.mean_ms"] = row["mean_ms"]
+    return flat
+
+
+def compare(baseline: dict, candidate: dict, out=sys.stdout) -> None:
+    a, b = _flatten(baseline), _flatten(candidate)
+    print(f"{'metric':<56} {'baseline':>12} {'candidate':>12} {'delta':>9}", file=out)
+    for key in sorted(set(a) | set(b)):
+        old, new = a.get(key), b.get(key)
+        delta = ""
+        if old not in (None, 0) and new is not None:
+            delta = f"{(new - old) / old * 100:+.1f}%"
+        print(f"{key[:56]:<56} {str(old if old is not None else '-'):>12} {str(new if new is not None else '-'):>12} {delta:>9}", file=out)
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+
+def _add_timing_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--tool-call-latency", type=float, default=0.2)
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export, record and replay chat_sessions traffic")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="write sessions to a compact .jsonl.gz file")
+    p_export.add_argument("--out", required=True)
+    p_export.add_argument("--from-json", help="read rows from a JSON dump instead of Supabase")
+    p_export.add_argument("--since", help="only sessions with turns at or after this timestamp")
+    p_export.add_argument("--limit", type=int, help="at most this many sessions")
+    p_export.add_argument("--with-images", action="store_true", help="include uploaded images (Supabase only)")
+
+    p_record = sub.add_parser("record", help="capture real LLM responses into a cassette (needs API keys)")
+    p_record.add_argument("sessions")
+    p_record.add_argument("--cassette", required=True)
+    p_record.add_argument("--limit", type=int)
+    p_record.add_argument("--concurrency", type=int, default=2)
+    p_record.add_argument("--model", default="gemini-2.5-flash")
+
+    p_run = sub.add_parser("run", help="replay sessions against this build")
+    p_run.add_argument("sessions")
+    p_run.add_argument("--cassette")
+    p_run.add_argument("--endpoint", choices=("chat", "stream"), default="stream")
+    p_run.add_argument("--speed", type=float, default=0.0, help="time compression (1 = original timing, 0 = no waits)")
+    p_run.add_argument("--concurrency", type=int, default=32, help="max in-flight requests")
+    p_run.add_argument("--limit", type=int)
+    p_run.add_argument("--model", default="gemini-2.5-flash")
+    p_run.add_argument("--json", dest="json_path")
+    _add_timing_args(p_run)
+
+    p_compare = sub.add_parser("compare", help="diff two replay reports")
+    p_compare.add_argument("baseline")
+    p_compare.add_argument("candidate")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        if args.from_json:
+            with open(args.from_json, encoding="utf-8") as fh:
+                rows = json.load(fh)
+        else:
+            rows = export_from_supabase(args.since, args.limit, args.with_images)
+        sessions, blobs = sessions_from_rows(rows)
+        if args.limit:
+            sessions = sessions[:args.limit]
+        write_sessions(args.out, sessions, blobs)
+        print(f"exported {len(sessions)} sessions, {sum(len(s.turns) for s in sessions)} turns, {len(blobs)} images → {args.out}")
+    elif args.command == "record":
+        cassette = record(args)
+        print(f"recorded {sum(len(v) for v in cassette.values())} LLM steps for {len(cassette)} turns → {args.cassette}")
+    elif args.command == "run":
+        report = run_replay(args)
+        from bench.loadtest import print_report
+        print_report(report)
+        print(f"  mix          {report['mix']}")
+        print(f"  tokens       {report['tokens']}")
+        print(f"  tool calls   {report['tool_calls']}")
+        if args.json_path:
+            with open(args.json_path, "w", encoding="utf-8") as fh:
+                json.dump(report, fh, indent=2, ensure_ascii=False)
+        return 1 if report["errors"] else 0
+    else:
+        with open(args.baseline, encoding="utf-8") as fa, open(args.candidate, encoding="utf-8") as fb:
+            compare(json.load(fa), json.load(fb))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
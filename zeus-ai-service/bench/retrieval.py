@@ -0,0 +1,160 @@
+"""
+Retrieval quality vs. latency for ``search_policy_documents``.
+
+Scores a labelled query set (``bench/data/policy_queries.json``, relevance by
+``policy_documents.metadata.topic``) against the ``match_documents`` contract
+and reports recall@k, MRR and hit rate next to search latency for a sweep of
+``match_threshold`` values::
+
+    python -m bench.retrieval                       # local hashing embedder
+    python -m bench.retrieval --embedder gemini     # real embeddings (needs GEMINI_API_KEY)
+    python -m bench.retrieval --thresholds 0.3,0.4,0.5 --k 5
+
+Gemini document embeddings are cached under ``bench/.cache`` so repeated
+sweeps only embed the queries.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+from bench.fakes import FakeSupabase, HashingEmbeddings
+from bench.fixtures import load_seed_tables
+from bench.loadtest import percentile
+
+QUERIES_PATH = Path(__file__).resolve().parent / "data" / "policy_queries.json"
+CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+VECTOR_DIMENSIONS = 2000
+
+
+@dataclass(frozen=True)
+class LabelledQuery:
+    query: str
+    relevant: frozenset[str]
+    section: Optional[str] = None
+
+
+def load_queries(path: Path = QUERIES_PATH) -> list[LabelledQuery]:
+    with open(path, encoding="utf-8") as fh:
+        return [LabelledQuery(q["query"], frozenset(q["relevant"]), q.get("section")) for q in json.load(fh)]
+
+
+class _GeminiEmbeddings:
+    """Gemini embeddings trimmed to the schema's 2000 dims, with an on-disk document cache."""
+
+    def __init__(self) -> None:
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        self._model = GoogleGenerativeAIEmbeddings(
+            model="models/gemini-embedding-001",
+            google_api_key=os.environ["GEMINI_API_KEY"],
+        )
+        self._cache_path = CACHE_DIR / "gemini_doc_embeddings.json"
+        self._cache: dict[str, list[float]] = (
+            json.loads(self._cache_path.read_text()) if self._cache_path.exists() else {}
+        )
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._model.embed_query(text)[:VECTOR_DIMENSIONS]
+
+    def embed_document(self, text: str) -> list[float]:
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if key not in self._cache:
+            self._cache[key] = self._model.embed_documents([text])[0][:VECTOR_DIMENSIONS]
+            CACHE_DIR.mkdir(exist_ok=True)
+            self._cache_path.write_text(json.dumps(self._cache))
+        return self._cache[key]
+
+
+def build_index(embedder_name: str = "hashing") -> tuple[FakeSupabase, object]:
+    """Seeded policy_documents with embeddings from the chosen embedder (threshold applied as-is)."""
+    tables = load_seed_tables()
+    if embedder_name == "gemini":
+        embedder = _GeminiEmbeddings()
+        for doc in tables["policy_documents"]:
+            doc["embedding"] = embedder.embed_document(doc["content"])
+    else:
+        embedder = HashingEmbeddings()
+    db = FakeSupabase(tables, embedder=embedder if embedder_name == "hashing" else HashingEmbeddings(), threshold_scale=1.0)
+    db.document_vectors()
+    return db, embedder
+
+
+def _topic(row: dict) -> Optional[str]:
+    return (row.get("metadata") or {}).get("topic")
+
+
+def evaluate(db: FakeSupabase, embedder, queries: list[LabelledQuery], k: int = 5, threshold: float = 0.4) -> dict:
+    """recall@k, MRR and hit rate over ``queries``, plus embed / search latency percentiles."""
+    recalls, reciprocal_ranks, embed_times, search_times = [], [], [], []
+    empty = 0
+    for labelled in queries:
+        start = time.perf_counter()
+        vector = embedder.embed_query(labelled.query)
+        embed_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        rows = db.rpc("match_documents", {
+            "query_embedding": vector,
+            "match_threshold": threshold,
+            "match_count": k,
+            "filter_section": labelled.section,
+        }).execute().data
+        search_times.append(time.perf_counter() - start)
+
+        topics = [_topic(row) for row in rows]
+        empty += not rows
+        found = labelled.relevant.intersection(topics)
+        recalls.append(len(found) / len(labelled.relevant))
+        rank = next((i for i, topic in enumerate(topics, 1) if topic in labelled.relevant), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+    n = len(queries) or 1
+    return {
+        "k": k,
+        "threshold": threshold,
+        "queries": len(queries),
+        f"recall@{k}": round(sum(recalls) / n, 4),
+        "mrr": round(sum(reciprocal_ranks) / n, 4),
+        "hit_rate": round(sum(1 for rr in reciprocal_ranks if rr) / n, 4),
+        "empty_results": empty,
+        "embed_p50_ms": round(percentile(embed_times, 50) * 1000, 3),
+        "search_p50_ms": round(percentile(search_times, 50) * 1000, 3),
+        "search_p95_ms": round(percentile(search_times, 95) * 1000, 3),
+    }
+
+
+def sweep(db: FakeSupabase, embedder, queries: list[LabelledQuery], thresholds: Iterable[float], k: int) -> list[dict]:
+    return [evaluate(db, embedder, queries, k=k, threshold=t) for t in thresholds]
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Recall@k / MRR / latency sweep for policy retrieval")
+    parser.add_argument("--embedder", choices=("hashing", "gemini"), default="hashing")
+    parser.add_argument("--thresholds", default="0.0,0.1,0.2,0.3,0.4,0.5")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args(argv)
+
+    db, embedder = build_index(args.embedder)
+    queries = load_queries()
+    rows = sweep(db, embedder, queries, [float(t) for t in args.thresholds.split(",")], args.k)
+
+    print(f"\n{args.embedder} embedder — {len(queries)} labelled queries, k={args.k}")
+    print(f"  threshold  recall@{args.k}   mrr    hit    empty  search p50 ms")
+    for row in rows:
+        print(f"  {row['threshold']:>9} {row[f'recall@{args.k}']:>9} {row['mrr']:>6} {row['hit_rate']:>6} {row['empty_results']:>6} {row['search_p50_ms']:>13}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump({"embedder": args.embedder, "results": rows}, fh, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
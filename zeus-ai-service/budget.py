@@ -0,0 +1,234 @@
+"""
+Per-request budgets for the ReAct loop.
+
+Every agent run gets a ``BudgetTracker`` (via ``current_budget``) that meters:
+
+* LLM steps — the last allowed step is run without tools, so the model has to answer;
+* tool calls per tool — calls over the cap get a "budget exhausted" tool result
+  instead of running, and the model carries on with what it has;
+* total tokens and a soft deadline — once either is spent, the next step is the
+  tool-less final answer;
+* a hard timeout — the caller gives up on the run entirely and replies with
+  ``TIMEOUT_REPLY``.
+
+The LangGraph recursion limit is set above the step budget as a backstop only.
+Budget hits are counted on ``/metrics`` by model and reason.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter as TallyCounter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import LLMResult
+
+from telemetry import Counter, registry
+
+logger = logging.getLogger("zeus.budget")
+
+FINAL_ANSWER_NOTE = (
+    "[System note: the research budget for this request is used up. Do not call any tools. "
+    "Answer the user now, in their language, using only the information above, and say "
+    "briefly what you could not check.]"
+)
+TOOL_BUDGET_NOTE = (
+    "Tool budget exhausted: {tool} was already called {count} time(s) for this request. "
+    "Do not call it again; answer with the information already gathered."
+)
+TIMEOUT_REPLY = (
+    "ขออภัยค่ะ ระบบใช้เวลาประมวลผลนานเกินไป กรุณาลองใหม่อีกครั้ง "
+    "(Sorry, this request took too long to process. Please try again.)"
+)
+
+BUDGET_EXHAUSTED = registry.register(Counter(
+    "zeus_agent_budget_exhausted_total",
+    "Agent runs that hit a budget, by model and reason (steps, tokens, deadline, tool_calls, timeout)",
+    ("model", "reason"),
+))
+
+
+def _tool_limits_from_env() -> dict[str, int]:
+    limits = {"create_quotation": 2, "compare_quotations": 2, "create_order": 2, "update_order_payment": 2}
+    raw = os.environ.get("ZEUS_AGENT_TOOL_LIMITS")
+    if raw:
+        try:
+            limits.update({name: int(n) for name, n in json.loads(raw).items()})
+        except (ValueError, AttributeError) as exc:
+            logger.warning("⚠️  [BUDGET] Ignoring invalid ZEUS_AGENT_TOOL_LIMITS: %s", exc)
+    return limits
+
+
+@dataclass(frozen=True)
+class AgentBudget:
+    max_llm_steps: int = 8
+    max_tool_calls: int = 4
+    tool_limits: dict[str, int] = field(default_factory=dict)
+    max_tokens: int = 100_000
+    deadline_seconds: float = 45.0
+    hard_timeout_seconds: float = 60.0
+
+    @classmethod
+    def from_env(cls) -> "AgentBudget":
+        return cls(
+            max_llm_steps=int(os.environ.get("ZEUS_AGENT_MAX_STEPS", "8")),
+            max_tool_calls=int(os.environ.get("ZEUS_AGENT_MAX_TOOL_CALLS", "4")),
+            tool_limits=_tool_limits_from_env(),
+            max_tokens=int(os.environ.get("ZEUS_AGENT_MAX_TOKENS", "100000")),
+            deadline_seconds=float(os.environ.get("ZEUS_AGENT_DEADLINE_SECONDS", "45")),
+            hard_timeout_seconds=float(os.environ.get("ZEUS_AGENT_HARD_TIMEOUT_SECONDS", "60")),
+        )
+
+    @property
+    def recursion_limit(self) -> int:
+        # Each step is an agent node plus a tools node; leave room for the final answer.
+        return 2 * self.max_llm_steps + 3
+
+    def tool_limit(self, name: str) -> int:
+        return self.tool_limits.get(name, self.max_tool_calls)
+
+
+AGENT_BUDGET = AgentBudget.from_env()
+
+
+class BudgetTracker(BaseCallbackHandler):
+    """Spend of one agent run against an ``AgentBudget``; also a callback that counts tokens."""
+
+    def __init__(self, budget: AgentBudget = AGENT_BUDGET, model: str = "unknown") -> None:
+        self.budget = budget
+        self.model = model
+        self.started = time.monotonic()
+        self.steps = 0
+        self.tokens = 0
+        self.tool_calls: TallyCounter = TallyCounter()
+        self.exhausted: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def hard_deadline(self) -> float:
+        return self.started + self.budget.hard_timeout_seconds
+
+    def _hit(self, reason: str) -> None:
+        BUDGET_EXHAUSTED.inc(model=self.model, reason=reason)
+        if self.exhausted is None:
+            self.exhausted = reason
+
+    def start_step(self) -> Optional[str]:
+        """Count an LLM step; returns why this step must be the final, tool-less one (if it must)."""
+        with self._lock:
+            self.steps += 1
+            if self.exhausted in ("steps", "tokens", "deadline"):
+                return self.exhausted
+            if self.steps >= self.budget.max_llm_steps:
+                reason = "steps"
+            elif self.tokens >= self.budget.max_tokens:
+                reason = "tokens"
+            elif time.monotonic() - self.started >= self.budget.deadline_seconds:
+                reason = "deadline"
+            else:
+                return None
+            self._hit(reason)
+        logger.warning("⏳ [BUDGET] %s budget exhausted after %s step(s), %s tokens; forcing a final answer", reason, self.steps - 1, self.tokens)
+        return reason
+
+    def allow_tool(self, name: str) -> bool:
+        with self._lock:
+            self.tool_calls[name] += 1
+            if self.tool_calls[name] <= self.budget.tool_limit(name):
+                return True
+            self._hit("tool_calls")
+        logger.warning("⏳ [BUDGET] %s over its limit of %s call(s); skipped", name, self.budget.tool_limit(name))
+        return False
+
+    def timed_out(self) -> None:
+        with self._lock:
+            self._hit("timeout")
+            self.exhausted = "timeout"
+        logger.warning("⏳ [BUDGET] Agent run exceeded %ss and was abandoned", self.budget.hard_timeout_seconds)
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    with self._lock:
+                        self.tokens += usage.get("total_tokens") or usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+                    return
+
+
+current_budget: ContextVar[Optional[BudgetTracker]] = ContextVar("zeus_agent_budget", default=None)
+
+
+# ── Graph hooks ───────────────────────────────────────────────────────────────
+
+def answer_only_messages(messages: list[BaseMessage]) -> list[BaseMessage]:
+    """
+    Rewrite a ReAct transcript for a call without tools: tool calls and tool
+    results become plain text, and the final-answer instruction is appended.
+    """
+    rewritten: list[BaseMessage] = []
+    for message in messages:
+        if isinstance(message, AIMessage) and message.tool_calls:
+            calls = "; ".join(f"{c['name']}({json.dumps(c['args'], ensure_ascii=False)})" for c in message.tool_calls)
+            text = message.content if isinstance(message.content, str) else ""
+            rewritten.append(AIMessage(content=f"{text}\n[Called {calls}]".strip()))
+        elif isinstance(message, ToolMessage):
+            rewritten.append(HumanMessage(content=f"[Result of {message.name or 'tool'}]\n{message.content}"))
+        else:
+            rewritten.append(message)
+    rewritten.append(HumanMessage(content=FINAL_ANSWER_NOTE))
+    return rewritten
+
+
+def drop_tool_calls(message: AIMessage) -> AIMessage:
+    """A final answer must end the run, even if the model ignored the instruction."""
+    if not message.tool_calls:
+        return message
+    return AIMessage(content=message.content, id=message.id, usage_metadata=message.usage_metadata)
+
+
+def _over_budget_result(request) -> Optional[ToolMessage]:
+    tracker = current_budget.get()
+    name = request.tool_call["name"]
+    if tracker is None or tracker.allow_tool(name):
+        return None
+    return ToolMessage(
+        content=TOOL_BUDGET_NOTE.format(tool=name, count=tracker.budget.tool_limit(name)),
+        name=name,
+        tool_call_id=request.tool_call["id"],
+        status="error",
+    )
+
+
+def limit_tool_call(request, execute):
+    """``ToolNode`` wrapper enforcing the per-tool call caps."""
+    return _over_budget_result(request) or execute(request)
+
+
+async def alimit_tool_call(request, execute):
+    return _over_budget_result(request) or await execute(request)
+
+
+async def iterate_until(iterator: AsyncIterator, deadline: float) -> AsyncIterator:
+    """Yield from ``iterator`` until ``deadline`` (``time.monotonic()``); raises ``TimeoutError`` past it."""
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            try:
+                item = await asyncio.wait_for(iterator.__anext__(), remaining)
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,494 @@
+"""
+Chat over WebSocket (``/ws/chat``): one long-lived socket carries the turns of
+several sessions, and pushes order status changes for them.
+
+Each turn over ``/api/chat/stream`` costs a new HTTP request (a new connection
+on a flaky mobile network), a history fetch and stream setup. A socket keeps
+every session it has open warm between turns:
+
+* its history rows stay cached. Before each turn ``history_version`` is
+  checked, which reads Redis when there is a shared backend and one index row
+  otherwise. The history is read again only when another writer added a turn:
+  another socket, an HTTP request or another worker;
+* its model's agent executor is built when the session opens, off the event
+  loop, before the first message arrives.
+
+Protocol: JSON text frames. Server frames carry ``type`` and, except for
+``pong`` and protocol errors, the ``session_id`` they belong to::
+
+    → {"type": "open", "session_id": "...", "llm_model": "gemini-2.5-flash"}
+    ← {"type": "opened", "session_id": "...", "llm_model": "...", "orders": [...]}
+    → {"type": "chat", "session_id": "...", "id": "turn-1", "message": "...", "image_base64": "..."}
+    ← {"type": "token" | "tool_start" | "tool_end" | "error" | "done", "session_id": "...", "id": "turn-1", ...}
+    ← {"type": "order_status", "session_id": "...", "order": {...}, "previous": {...} | null}
+    → {"type": "close", "session_id": "..."}      ← {"type": "closed", "session_id": "..."}
+    → {"type": "ping"}                            ← {"type": "pong"}
+
+Turn frames carry the fields of the SSE events of ``/api/chat/stream``. A turn's
+``id`` is its idempotency key, so a turn re-sent after a reconnect is replayed
+instead of run again. Sending ``chat`` for a session that is not open opens it.
+Each session runs one turn at a time; a ``chat`` frame for a busy session gets
+an ``error`` frame with code ``busy``.
+
+Backpressure: frames wait in a per-socket outbox, written by a single writer.
+While the client is behind, the tokens of a turn merge into the last queued
+token frame, so a slow reader gets fewer, larger frames and the agent never
+waits for the socket. A client whose backlog passes
+``ZEUS_WS_MAX_BUFFER_BYTES``, or that does not take a frame for
+``ZEUS_WS_SEND_TIMEOUT_SECONDS``, is disconnected with close code 1013. Turns
+already running still finish and store their reply, which the client reads from
+history, or gets replayed, after it reconnects.
+
+Order status: every ``ZEUS_WS_ORDER_POLL_SECONDS`` (0 turns it off) each
+worker reads the orders of all sessions open on its sockets in one query, and
+pushes every payment or policy status that changed. The status sweeps,
+payments confirmed elsewhere and other workers' turns are all included. A turn
+that called an order tool triggers a check at once.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Callable, Optional
+
+from starlette.websockets import WebSocket
+
+from agent import ENABLED_MODELS, MODEL_CHOICES
+from chat_store import HISTORY_LIMIT, fetch_history, history_version
+from database import get_supabase_client
+from image_processing import MAX_REQUEST_BODY_BYTES
+from periodic import PeriodicJob
+from telemetry import Counter, Gauge, registry
+
+logger = logging.getLogger("zeus.chat_socket")
+
+WS_MAX_SESSIONS = int(os.environ.get("ZEUS_WS_MAX_SESSIONS", "16"))
+WS_MAX_BUFFER_BYTES = int(os.environ.get("ZEUS_WS_MAX_BUFFER_BYTES", str(1024 * 1024)))
+WS_SEND_TIMEOUT_SECONDS = float(os.environ.get("ZEUS_WS_SEND_TIMEOUT_SECONDS", "30"))
+WS_ORDER_POLL_SECONDS = float(os.environ.get("ZEUS_WS_ORDER_POLL_SECONDS", "10"))
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+# Close code for a client that does not keep up (RFC 6455 "Try Again Later").
+CLOSE_TRY_AGAIN_LATER = 1013
+# Fields of an SSE event that name its frame type, in the order they are checked.
+EVENT_TYPES = ("token", "tool_start", "tool_end", "error", "done")
+CLIENT_FRAME_TYPES = ("open", "chat", "close", "ping")
+# Tools whose run may create or change an order.
+ORDER_TOOLS = frozenset({"create_order", "update_order_payment"})
+ORDER_COLUMNS = "order_number, payment_status, policy_status, policy_number, policy_start_date, policy_end_date, updated_at"
+ORDER_STATUS_FIELDS = ("payment_status", "policy_status")
+# Session ids per order query; keeps the ``in.(...)`` filter well inside URL limits.
+ORDER_QUERY_SESSIONS = 100
+
+WS_CONNECTIONS = registry.register(Gauge(
+    "zeus_ws_connections", "Chat WebSockets currently open in this worker",
+))
+WS_FRAMES = registry.register(Counter(
+    "zeus_ws_frames_total", "Chat WebSocket frames by direction (in, out) and type", ("direction", "type"),
+))
+WS_TOKENS_COALESCED = registry.register(Counter(
+    "zeus_ws_coalesced_tokens_total", "Token frames merged into a queued one because the client was behind",
+))
+WS_SLOW_CLIENTS = registry.register(Counter(
+    "zeus_ws_slow_clients_total", "Chat WebSockets closed because the client did not keep up", ("reason",),
+))
+WS_HISTORY = registry.register(Counter(
+    "zeus_ws_history_total", "History reads of open socket sessions: hit (cached), stale (changed elsewhere), miss",
+    ("outcome",),
+))
+ORDER_PUSHES = registry.register(Counter(
+    "zeus_ws_order_status_pushes_total", "Order status changes pushed to chat WebSockets",
+))
+
+
+def model_error(model: Optional[str]) -> Optional[str]:
+    if model in MODEL_CHOICES and model not in ENABLED_MODELS:
+        return f"model {model!r} is not enabled on this service (enabled: {', '.join(ENABLED_MODELS)})"
+    return None
+
+
+# ── Sessions ──────────────────────────────────────────────────────────────────
+
+class WarmSession:
+    """A session open on a socket: its history rows and model, kept between turns."""
+
+    def __init__(self, session_id: str, model: str) -> None:
+        self.session_id = session_id
+        self.model = model
+        self.ready: Optional[asyncio.Task] = None
+        self.turn: Optional[asyncio.Task] = None
+        self._rows: Optional[list[dict]] = None
+        self._version: Optional[str] = None
+
+    def history(self) -> list[dict]:
+        """What ``fetch_history`` returns, read again only when another writer added a turn (blocking)."""
+        # Read before the fetch: a turn added in between shows up as stale on the next check.
+        version = history_version(self.session_id)
+        if self._rows is not None and version == self._version:
+            WS_HISTORY.inc(outcome="hit")
+            return self._rows
+        WS_HISTORY.inc(outcome="miss" if self._rows is None else "stale")
+        self._rows = fetch_history(self.session_id, restore_archived=True)
+        self._version = version
+        return self._rows
+
+    def remember(self, user_row: Optional[dict], ai_row: Optional[dict],
+                 user_attachments: list[dict], ai_attachments: list[dict]) -> None:
+        """Adds a turn this socket just stored, so the next turn does not read it back."""
+        if self._rows is None or not user_row or not ai_row:
+            self._rows = None
+            return
+        for row, attachments in ((user_row, user_attachments), (ai_row, ai_attachments)):
+            if len(self._rows) < HISTORY_LIMIT:
+                summaries = [{"kind": a["kind"], "summary": a.get("summary")} for a in attachments]
+                self._rows.append({**row, "attachments": summaries})
+        self._version = str(ai_row["id"])
+
+    def invalidate(self) -> None:
+        self._rows = None
+
+
+# ── Outbox ────────────────────────────────────────────────────────────────────
+
+class Outbox:
+    """Frames waiting for one socket; queued tokens of a turn merge, past ``max_bytes`` it overflows."""
+
+    def __init__(self, max_bytes: int = WS_MAX_BUFFER_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.closed = False
+        self.overflowed = False
+        # [frame, bytes]: token frames stay dicts so later tokens can merge in, the rest are serialized.
+        self._items: deque[list] = deque()
+        self._bytes = 0
+        self._ready = asyncio.Event()
+
+    def put(self, frame: dict) -> None:
+        if self.closed:
+            return
+        last = self._items[-1] if self._items else None
+        if (
+            frame["type"] == "token" and last is not None and isinstance(last[0], dict)
+            and last[0]["session_id"] == frame["session_id"] and last[0]["id"] == frame["id"]
+        ):
+            last[0]["token"] += frame["token"]
+            last[1] += len(frame["token"])
+            self._bytes += len(frame["token"])
+            WS_TOKENS_COALESCED.inc()
+        else:
+            item = dict(frame) if frame["type"] == "token" else _serialize(frame)
+            size = len(frame["token"]) if frame["type"] == "token" else len(item)
+            self._items.append([item, size])
+            self._bytes += size
+        if self._bytes > self.max_bytes:
+            self.overflowed = True
+            self.close()
+            return
+        self._ready.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._items.clear()
+        self._bytes = 0
+        self._ready.set()
+
+    async def get(self) -> Optional[str]:
+        """The next frame to write; None once the outbox is closed."""
+        while not self._items:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        item, size = self._items.popleft()
+        self._bytes -= size
+        return item if isinstance(item, str) else _serialize(item)
+
+
+def _serialize(frame: dict) -> str:
+    # Thai text is a third the size as UTF-8 than as \u escapes.
+    return json.dumps(frame, ensure_ascii=False, default=str)
+
+
+# ── Order status ──────────────────────────────────────────────────────────────
+
+def fetch_session_orders(session_ids: list[str]) -> list[dict]:
+    """The orders of these sessions, found through their quotations (blocking)."""
+    client = get_supabase_client()
+    orders = []
+    for start in range(0, len(session_ids), ORDER_QUERY_SESSIONS):
+        quotations = (
+            client.table("quotations")
+            .select(f"quotation_number, session_id, orders({ORDER_COLUMNS})")
+            .in_("session_id", session_ids[start:start + ORDER_QUERY_SESSIONS])
+            .execute()
+        ).data or []
+        for quotation in quotations:
+            embedded = quotation.get("orders") or []
+            # orders.quotation_id is unique, so PostgREST may embed a single object.
+            for order in embedded if isinstance(embedded, list) else [embedded]:
+                orders.append({
+                    "session_id": quotation["session_id"],
+                    "quotation_number": quotation["quotation_number"],
+                    **order,
+                })
+    return orders
+
+
+def _status(order: dict) -> tuple:
+    return tuple(order.get(field) for field in ORDER_STATUS_FIELDS)
+
+
+OrderListener = Callable[[str, dict, Optional[dict]], None]
+
+
+class OrderWatcher(PeriodicJob):
+    """Polls the orders of every session open on a socket in this worker and reports status changes."""
+
+    description = "Order status check"
+    log_icon = "📦"
+    log_tag = "[ORDERS]"
+    logger = logger
+
+    def __init__(self, interval_seconds: float = WS_ORDER_POLL_SECONDS) -> None:
+        super().__init__(interval_seconds)
+        self._listeners: dict[str, set[OrderListener]] = {}
+        self._statuses: dict[str, tuple] = {}
+        self._orders: dict[str, set[str]] = {}
+
+    def _baseline(self, orders: list[dict]) -> None:
+        for order in orders:
+            self._statuses.setdefault(order["order_number"], _status(order))
+            self._orders.setdefault(order["session_id"], set()).add(order["order_number"])
+
+    async def watch(self, session_id: str, listener: OrderListener) -> Optional[list[dict]]:
+        """Reports the session's order status changes to ``listener``; returns its orders now (None when off)."""
+        if not self.running:
+            return None
+        self._listeners.setdefault(session_id, set()).add(listener)
+        orders = await asyncio.to_thread(fetch_session_orders, [session_id])
+        self._baseline(orders)
+        return orders
+
+    def unwatch(self, session_id: str, listener: OrderListener) -> None:
+        listeners = self._listeners.get(session_id)
+        if listeners is None:
+            return
+        listeners.discard(listener)
+        if not listeners:
+            del self._listeners[session_id]
+            for number in self._orders.pop(session_id, ()):
+                self._statuses.pop(number, None)
+
+    async def run_once(self) -> int:
+        """Reads the watched sessions' orders and reports the changes; returns how many orders changed."""
+        sessions = list(self._listeners)
+        if not sessions:
+            return 0
+        orders = await asyncio.to_thread(fetch_session_orders, sessions)
+        changed = 0
+        for order in orders:
+            listeners = self._listeners.get(order["session_id"])
+            if not listeners:
+                continue
+            number, status = order["order_number"], _status(order)
+            previous = self._statuses.get(number)
+            self._statuses[number] = status
+            self._orders.setdefault(order["session_id"], set()).add(number)
+            if status == previous:
+                continue
+            changed += 1
+            before = dict(zip(ORDER_STATUS_FIELDS, previous)) if previous else None
+            for listener in list(listeners):
+                listener(order["session_id"], order, before)
+        if changed:
+            logger.info("📦 [ORDERS] %s order status change(s) pushed to open sockets", changed)
+        return changed
+
+
+order_watcher = OrderWatcher()
+
+
+# ── Connection ────────────────────────────────────────────────────────────────
+
+TurnRunner = Callable[[WarmSession, dict], AsyncIterator[dict]]
+
+
+class ChatConnection:
+    """One accepted socket: its open sessions, their turns and the writer draining its outbox."""
+
+    def __init__(self, websocket: WebSocket, run_turn: TurnRunner, build_executor: Callable[[str], object]) -> None:
+        self.websocket = websocket
+        self.run_turn = run_turn
+        self.build_executor = build_executor
+        self.outbox = Outbox()
+        self.sessions: dict[str, WarmSession] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def send(self, frame: dict) -> None:
+        WS_FRAMES.inc(direction="out", type=frame["type"])
+        self.outbox.put(frame)
+
+    def _error(self, code: str, message: str, **fields) -> None:
+        self.send({"type": "error", "code": code, "error": message, **fields})
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def serve(self) -> None:
+        WS_CONNECTIONS.inc()
+        writer = asyncio.create_task(self._write())
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                self._handle(message.get("text"))
+        finally:
+            self.outbox.close()
+            for session_id in self.sessions:
+                order_watcher.unwatch(session_id, self._push_order)
+            # Running turns finish and store their reply; the client reads it after reconnecting.
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            writer.cancel()
+            WS_CONNECTIONS.inc(-1)
+
+    async def _write(self) -> None:
+        while (text := await self.outbox.get()) is not None:
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), timeout=WS_SEND_TIMEOUT_SECONDS)
+            except TimeoutError:
+                WS_SLOW_CLIENTS.inc(reason="send_timeout")
+                await self._drop_slow_client()
+                return
+            except Exception:
+                return  # disconnected; the receive loop sees it too
+        if self.outbox.overflowed:
+            WS_SLOW_CLIENTS.inc(reason="buffer_full")
+            await self._drop_slow_client()
+
+    async def _drop_slow_client(self) -> None:
+        logger.warning("🐢 [WS] Closing a socket whose client is not reading")
+        self.outbox.close()
+        try:
+            await self.websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason="client too slow")
+        except Exception:
+            pass
+
+    # ── Client frames ──
+
+    def _handle(self, text: Optional[str]) -> None:
+        if text is None:
+            self._error("bad_frame", "frames must be JSON text")
+            return
+        if len(text) > MAX_REQUEST_BODY_BYTES:
+            self._error("too_large", f"frame exceeds {MAX_REQUEST_BODY_BYTES // (1024 * 1024)} MB")
+            return
+        try:
+            frame = json.loads(text)
+        except ValueError:
+            frame = None
+        kind = frame.get("type") if isinstance(frame, dict) else None
+        WS_FRAMES.inc(direction="in", type=kind if kind in CLIENT_FRAME_TYPES else "unknown")
+        if kind not in CLIENT_FRAME_TYPES:
+            self._error("bad_frame", f"expected a JSON object whose type is one of {', '.join(CLIENT_FRAME_TYPES)}")
+            return
+        if kind == "ping":
+            self.send({"type": "pong"})
+            return
+        session_id = frame.get("session_id")
+        if not isinstance(session_id, str) or not session_id:
+            self._error("bad_frame", f"{kind} needs a session_id")
+            return
+        if kind == "open":
+            self._open(session_id, frame.get("llm_model"))
+        elif kind == "chat":
+            self._chat(session_id, frame)
+        else:
+            self._close(session_id)
+
+    def _session(self, session_id: str, model: Optional[str]) -> Optional[WarmSession]:
+        error = model_error(model)
+        if error:
+            self._error("bad_model", error, session_id=session_id)
+            return None
+        session = self.sessions.get(session_id)
+        if session is not None:
+            return session
+        if len(self.sessions) >= WS_MAX_SESSIONS:
+            self._error("too_many_sessions", f"at most {WS_MAX_SESSIONS} sessions per socket; close one first",
+                        session_id=session_id)
+            return None
+        session = self.sessions[session_id] = WarmSession(session_id, model or DEFAULT_MODEL)
+        session.ready = self._spawn(self._warm(session))
+        self._spawn(self._opened(session))
+        return session
+
+    def _open(self, session_id: str, model: Optional[str]) -> None:
+        opened = session_id in self.sessions
+        session = self._session(session_id, model)
+        if session is not None and opened:
+            session.model = model or session.model
+            self.send({"type": "opened", "session_id": session_id, "llm_model": session.model})
+
+    async def _warm(self, session: WarmSession) -> None:
+        """What the session's first turn waits for: its executor and history."""
+        try:
+            await asyncio.to_thread(self.build_executor, session.model)
+            await asyncio.to_thread(session.history)
+        except Exception as exc:
+            # The first turn reads the history (and reports the error) itself.
+            logger.warning("⚠️  [WS] Could not warm session %s: %s", session.session_id, exc)
+
+    async def _opened(self, session: WarmSession) -> None:
+        frame = {"type": "opened", "session_id": session.session_id, "llm_model": session.model}
+        try:
+            frame["orders"] = await order_watcher.watch(session.session_id, self._push_order)
+        except Exception as exc:
+            logger.warning("⚠️  [ORDERS] Could not read the orders of session %s: %s", session.session_id, exc)
+        await session.ready
+        self.send(frame)
+
+    def _chat(self, session_id: str, frame: dict) -> None:
+        turn_id = frame.get("id")
+        if turn_id is not None and (not isinstance(turn_id, str) or len(turn_id) > 200):
+            self._error("bad_frame", "id must be a string of at most 200 characters", session_id=session_id)
+            return
+        session = self._session(session_id, frame.get("llm_model"))
+        if session is None:
+            return
+        if session.turn is not None:
+            self._error("busy", "this session is still answering the previous message", session_id=session_id, id=turn_id)
+            return
+        session.turn = self._spawn(self._turn(session, frame, turn_id))
+
+    async def _turn(self, session: WarmSession, frame: dict, turn_id: Optional[str]) -> None:
+        tools: set[str] = set()
+        try:
+            await session.ready
+            async for event in self.run_turn(session, frame):
+                kind = next((name for name in EVENT_TYPES if name in event), "event")
+                if kind == "tool_start":
+                    tools.add(event["tool_start"])
+                self.send({"type": kind, "session_id": session.session_id, "id": turn_id, **event})
+        except Exception as exc:
+            logger.error("❌ [WS] Turn failed: %s", exc)
+            self.send({"type": "error", "session_id": session.session_id, "id": turn_id, "error": str(exc)})
+        finally:
+            session.turn = None
+            if tools & ORDER_TOOLS:
+                order_watcher.poke()
+
+    def _close(self, session_id: str) -> None:
+        if self.sessions.pop(session_id, None) is not None:
+            order_watcher.unwatch(session_id, self._push_order)
+        self.send({"type": "closed", "session_id": session_id})
+
+    def _push_order(self, session_id: str, order: dict, previous: Optional[dict]) -> None:
+        ORDER_PUSHES.inc()
+        public = {key: value for key, value in order.items() if key != "session_id"}
+        self.send({"type": "order_status", "session_id": session_id, "order": public, "previous": previous})
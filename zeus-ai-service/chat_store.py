@@ -0,0 +1,429 @@
+"""
+Persistence of chat turns in ``chat_sessions`` plus out-of-band ``chat_attachments``.
+
+``chat_sessions.message`` only ever holds plain text. Anything else a turn
+produced — the uploaded image, provider metadata such as Gemini thought
+signatures — goes to ``chat_attachments`` and is never replayed to the model;
+history replay only sees a one-line ``summary`` per attachment.
+
+Sessions idle for longer than the retention period are moved to
+``chat_sessions_archive`` by ``archival.py``. They are read back from there, and
+restored into ``chat_sessions`` when a new turn arrives for them.
+"""
+
+import os
+import json
+import base64
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable, Optional
+
+from database import get_supabase_client
+from image_processing import ProcessedImage
+from shared_state import SharedCache
+
+logger = logging.getLogger("zeus.chat_store")
+
+# Only the summary of an attachment is read back on the hot path.
+HISTORY_COLUMNS = "id, role, message, created_at, chat_attachments(kind, summary)"
+ARCHIVE_COLUMNS = "session_id, first_message_at, last_message_at, turns, archived_at"
+
+# Turns of a session ``fetch_history`` replays to the model.
+HISTORY_LIMIT = 20
+HISTORY_PAGE_MAX = int(os.environ.get("ZEUS_HISTORY_PAGE_MAX", "500"))
+# The last message id of each session, kept only on a shared backend (see ``history_version``).
+_history_versions = SharedCache(
+    "history_version", ttl_seconds=float(os.environ.get("ZEUS_HISTORY_VERSION_TTL_SECONDS", "3600")),
+)
+
+
+# ── Normalization ─────────────────────────────────────────────────────────────
+
+def normalize_content(content: Any) -> tuple[str, list[dict]]:
+    """
+    Split model output into plain text and out-of-band metadata parts.
+
+    Accepts a string, a LangChain multimodal content list, or a legacy row where
+    that list was stored as a JSON string.
+    """
+    if isinstance(content, str):
+        stripped = content.lstrip()
+        if not stripped.startswith("[{"):
+            return content, []
+        try:
+            content = json.loads(stripped)
+        except ValueError:
+            return content, []
+
+    if not isinstance(content, list):
+        return str(content), []
+
+    texts: list[str] = []
+    metadata: list[dict] = []
+    for part in content:
+        if isinstance(part, str):
+            texts.append(part)
+        elif isinstance(part, dict):
+            if part.get("type", "text") == "text" and "text" in part:
+                texts.append(part["text"])
+            extra = {k: v for k, v in part.items() if k not in ("type", "text")}
+            if extra:
+                metadata.append(extra)
+    return "\n".join(texts), metadata
+
+
+def image_attachment(image: ProcessedImage, summary: Optional[str] = None) -> dict:
+    return {
+        "kind": "image",
+        "sha256": image.sha256,
+        "mime_type": image.mime_type,
+        "summary": summary or f"photo {image.sha256[:12]} ({image.width}x{image.height})",
+        "payload": {
+            "width": image.width,
+            "height": image.height,
+            "bytes": image.processed_bytes,
+            "dhash": image.dhash,
+            "data_base64": image.data_base64,
+        },
+    }
+
+
+def model_metadata_attachment(model: str, parts: list[dict]) -> dict:
+    return {
+        "kind": "model_metadata",
+        "summary": f"{model} metadata ({len(parts)} part(s))",
+        "payload": {"model": model, "parts": parts},
+    }
+
+
+# ── Read / write ──────────────────────────────────────────────────────────────
+
+def _plain_row(row: dict) -> None:
+    """Reduce a legacy multimodal AI row to text and lift its embedded attachments."""
+    if row.get("role") == "ai":
+        row["message"], _ = normalize_content(row["message"])
+    row["attachments"] = row.pop("chat_attachments", None) or []
+
+
+def save_message(session_id: str, role: str, message: str, attachments: Optional[list[dict]] = None) -> Optional[dict]:
+    """Insert one turn and its attachments, AI output normalized to text; returns the chat_sessions row."""
+    # Only model output can be a content list; user text that looks like JSON stays as typed.
+    text = normalize_content(message)[0] if role == "ai" else message
+    client = get_supabase_client()
+    response = client.table("chat_sessions").insert(
+        {"session_id": session_id, "role": role, "message": text}
+    ).execute()
+    row = response.data[0] if response.data else None
+
+    if row and attachments:
+        client.table("chat_attachments").insert([
+            {"message_id": row["id"], "message_created_at": row["created_at"], "session_id": session_id, **attachment}
+            for attachment in attachments
+        ]).execute()
+        logger.info("📎 [ATTACHMENTS] Stored %s attachment(s) for message %s", len(attachments), row['id'])
+    if row and _history_versions.shared:
+        _history_versions.set(session_id, str(row["id"]))
+    return row
+
+
+def fetch_history(session_id: str, limit: int = HISTORY_LIMIT, restore_archived: bool = False) -> list[dict]:
+    """
+    Fetch a session's turns with legacy multimodal rows reduced to plain text.
+
+    With ``restore_archived`` (a new turn is about to be added), a session with
+    no turns in ``chat_sessions`` is looked up in the archive and restored first,
+    so the model sees its history. A new session costs one primary-key read of
+    the archive, not a call to the restoring write function.
+    """
+    rows = _fetch_hot_history(session_id, limit)
+    if rows or not restore_archived or not is_archived(session_id):
+        return rows
+    restored = restore_archived_session(session_id)
+    if not restored:
+        return rows
+    forget_history_versions([session_id])
+    logger.info("🗄️  [ARCHIVE] Restored %s archived turn(s) of session %s", restored, session_id)
+    return _fetch_hot_history(session_id, limit)
+
+
+def _fetch_hot_history(session_id: str, limit: int) -> list[dict]:
+    client = get_supabase_client()
+    response = (
+        client.table("chat_sessions")
+        .select(HISTORY_COLUMNS)
+        .eq("session_id", session_id)
+        .order("created_at", desc=False)
+        .limit(limit)
+        .execute()
+    )
+    rows = response.data or []
+    for row in rows:
+        _plain_row(row)
+    return rows
+
+
+# ── History pages ─────────────────────────────────────────────────────────────
+# Pages are keyset-paginated on (created_at, id), which the
+# (session_id, created_at) index serves from either end. A cursor is that pair
+# of one message, opaque to clients.
+
+class InvalidCursor(ValueError):
+    """A history cursor that was not issued by ``encode_cursor``."""
+
+
+def encode_cursor(row: dict) -> str:
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        created_at, message_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        _timestamp(created_at)
+        return created_at, int(message_id)
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(f"invalid history cursor: {cursor!r}") from exc
+
+
+def _timestamp(value: str) -> datetime:
+    # PostgREST trims trailing zeros from the fraction, so timestamps do not compare as strings.
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _position(row: dict) -> tuple[datetime, int]:
+    return _timestamp(row["created_at"]), row["id"]
+
+
+@dataclass
+class HistoryPage:
+    """Consecutive turns of a session, oldest first, with cursors to the turns on either side."""
+    messages: list[dict]
+    has_more_before: bool
+    has_more_after: bool
+    archived: bool = False
+    archived_at: Optional[str] = None
+
+    @property
+    def before_cursor(self) -> Optional[str]:
+        return encode_cursor(self.messages[0]) if self.messages else None
+
+    @property
+    def after_cursor(self) -> Optional[str]:
+        return encode_cursor(self.messages[-1]) if self.messages else None
+
+
+def fetch_history_page(
+    session_id: str,
+    limit: int = 100,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    latest: bool = False,
+) -> HistoryPage:
+    """
+    Up to ``limit`` turns of a session: the first ones, the ones right after
+    the ``after`` cursor, the ones right before ``before``, or with ``latest``
+    the last ones. Archived sessions are paged from their transcript.
+    """
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    anchor = decode_cursor(after or before) if (after or before) else None
+    backwards = bool(before) or (latest and not after)
+
+    query = (
+        get_supabase_client()
+        .table("chat_sessions")
+        .select(HISTORY_COLUMNS)
+        .eq("session_id", session_id)
+    )
+    if anchor is not None:
+        # (created_at, id) <= / >= the anchor, so the index range starts at the anchor row itself.
+        created_at, message_id = anchor
+        strict, inclusive = ("lt", "lte") if backwards else ("gt", "gte")
+        query = query.or_(
+            f'created_at.{strict}."{created_at}",and(created_at.eq."{created_at}",id.{inclusive}.{message_id})'
+        )
+    # One extra row tells whether there are more; one more covers the anchor itself.
+    rows = (
+        query.order("created_at", desc=backwards).order("id", desc=backwards).limit(limit + 2).execute().data
+    ) or []
+    # A hot session always returns at least the anchor row, so an empty result means it is not hot.
+    if not rows:
+        archived = fetch_archived_session(session_id)
+        if archived:
+            return _page_transcript(archived, limit, anchor, backwards)
+    for row in rows:
+        _plain_row(row)
+    return _page(rows, limit, anchor, backwards)
+
+
+def _page(rows: list[dict], limit: int, anchor: Optional[tuple[str, int]], backwards: bool) -> HistoryPage:
+    """A page from ``rows`` ordered away from the anchor (descending when ``backwards``)."""
+    if anchor is not None:
+        position = (_timestamp(anchor[0]), anchor[1])
+        rows = [r for r in rows if (_position(r) < position if backwards else _position(r) > position)]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+        return HistoryPage(rows, has_more_before=more, has_more_after=anchor is not None)
+    return HistoryPage(rows, has_more_before=anchor is not None, has_more_after=more)
+
+
+def _page_transcript(archived: dict, limit: int, anchor: Optional[tuple[str, int]], backwards: bool) -> HistoryPage:
+    messages = archived["messages"]
+    page = _page(messages[::-1] if backwards else messages, limit, anchor, backwards)
+    page.archived, page.archived_at = True, archived["archived_at"]
+    return page
+
+
+def history_version(session_id: str) -> str:
+    """
+    Changes whenever a turn is added to the session: the id of its last turn
+    (``a<turns>`` for an archived session, ``0`` for an unknown one).
+
+    On a shared backend ``save_message`` keeps it up to date, so a conditional
+    history request is answered without touching the database. With the
+    per-process memory backend another worker may have added the turn, so the
+    last id is read from the (session_id, created_at) index every time.
+    """
+    if _history_versions.shared:
+        cached = _history_versions.get(session_id)
+        if cached is not None:
+            return cached
+    response = (
+        get_supabase_client()
+        .table("chat_sessions")
+        .select("id")
+        .eq("session_id", session_id)
+        .order("created_at", desc=True)
+        .order("id", desc=True)
+        .limit(1)
+        .execute()
+    )
+    if response.data:
+        version = str(response.data[0]["id"])
+    else:
+        archived = (
+            get_supabase_client()
+            .table("chat_sessions_archive")
+            .select("turns")
+            .eq("session_id", session_id)
+            .limit(1)
+            .execute()
+        ).data
+        version = f"a{archived[0]['turns']}" if archived else "0"
+    if _history_versions.shared:
+        _history_versions.set(session_id, version)
+    return version
+
+
+def forget_history_versions(session_ids: Iterable[str]) -> None:
+    """Drop the stored versions of sessions that were archived or restored; the next check reads them again."""
+    if _history_versions.shared:
+        for session_id in session_ids:
+            _history_versions.delete(session_id)
+
+
+# ── Archive ───────────────────────────────────────────────────────────────────
+
+def fetch_archived_session(session_id: str, limit: Optional[int] = None) -> Optional[dict]:
+    """
+    An archived session: its archive row plus ``messages`` in the shape of
+    ``fetch_history`` rows (attachment payloads are left out). None if the session
+    is not archived.
+    """
+    response = (
+        get_supabase_client()
+        .table("chat_sessions_archive")
+        .select(f"{ARCHIVE_COLUMNS}, transcript")
+        .eq("session_id", session_id)
+        .limit(1)
+        .execute()
+    )
+    if not response.data:
+        return None
+    row = response.data[0]
+    transcript = row.pop("transcript") or []
+    row["messages"] = [
+        {
+            "id": turn["id"],
+            "role": turn["role"],
+            "message": turn["message"],
+            "created_at": turn["created_at"],
+            "attachments": [
+                {"kind": a.get("kind"), "summary": a.get("summary")} for a in turn.get("attachments") or []
+            ],
+        }
+        for turn in transcript[:limit]
+    ]
+    return row
+
+
+def list_archived_sessions(limit: int = 1000) -> list[dict]:
+    """Archived sessions, most recent first, without their transcripts."""
+    response = (
+        get_supabase_client()
+        .table("chat_sessions_archive")
+        .select("session_id, last_message_at, preview, turns, archived_at")
+        .order("last_message_at", desc=True)
+        .limit(limit)
+        .execute()
+    )
+    return response.data or []
+
+
+def is_archived(session_id: str) -> bool:
+    response = (
+        get_supabase_client()
+        .table("chat_sessions_archive")
+        .select("session_id")
+        .eq("session_id", session_id)
+        .limit(1)
+        .execute()
+    )
+    return bool(response.data)
+
+
+def restore_archived_session(session_id: str) -> int:
+    """Move an archived session back into ``chat_sessions``; returns the turns restored (0 if not archived)."""
+    response = get_supabase_client().rpc("restore_chat_session", {"p_session_id": session_id}).execute()
+    return int(response.data or 0)
+
+
+def save_usage(session_id: str, message_id: Optional[int], model: str, usage: dict, request_id: Optional[str] = None) -> None:
+    """Record the token / tool-call totals of one agent run in ``chat_usage``."""
+    get_supabase_client().table("chat_usage").insert({
+        "session_id": session_id,
+        "message_id": message_id,
+        "request_id": request_id,
+        "model": model,
+        "input_tokens": usage["input_tokens"],
+        "output_tokens": usage["output_tokens"],
+        "cached_tokens": usage["cached_tokens"],
+        "llm_calls": usage["llm_calls"],
+        "tool_calls": usage["tool_calls"],
+        "cost_usd": usage["cost_usd"],
+    }).execute()
+
+
+def fetch_session_usage(session_id: str) -> dict:
+    """Per-turn usage rows of a session and their totals."""
+    response = (
+        get_supabase_client()
+        .table("chat_usage")
+        .select("message_id, model, input_tokens, output_tokens, cached_tokens, llm_calls, tool_calls, cost_usd, created_at")
+        .eq("session_id", session_id)
+        .order("created_at", desc=False)
+        .execute()
+    )
+    rows = response.data or []
+    totals = {key: sum(row[key] or 0 for row in rows) for key in ("input_tokens", "output_tokens", "cached_tokens", "llm_calls")}
+    tool_calls: dict[str, int] = {}
+    for row in rows:
+        for tool, calls in (row["tool_calls"] or {}).items():
+            tool_calls[tool] = tool_calls.get(tool, 0) + calls
+    totals["tool_calls"] = tool_calls
+    costs = [row["cost_usd"] for row in rows]
+    totals["cost_usd"] = None if not rows or None in costs else round(sum(float(c) for c in costs), 6)
+    totals["turns"] = len(rows)
+    return {"session_id": session_id, "totals": totals, "turns": rows}
@@ -0,0 +1,158 @@
+"""
+Response compression: brotli or gzip, whichever the client prefers in
+``Accept-Encoding`` (brotli needs the optional ``brotli`` package).
+
+Bodies smaller than ``ZEUS_COMPRESSION_MIN_BYTES`` are sent as they are. A
+streamed body (NDJSON history exports) is compressed chunk by chunk and
+flushed after every chunk, so each line still reaches the client as soon as it
+is written. Server-Sent Events are never compressed: they are flushed token by
+token, and the Next.js proxy passes them through verbatim.
+
+Every response of a compressible type carries ``Vary: Accept-Encoding``, also
+when it is sent uncompressed (a small body, or a client that accepts no
+encoding we offer), so a shared cache never serves one encoding to a client
+that asked for another.
+"""
+
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from telemetry import Counter, registry
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_ENABLED = os.environ.get("ZEUS_COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_BYTES = int(os.environ.get("ZEUS_COMPRESSION_MIN_BYTES", "500"))
+GZIP_LEVEL = int(os.environ.get("ZEUS_GZIP_LEVEL", "6"))
+# Quality 4 compresses JSON better than gzip -6 at a similar CPU cost; 11 is for static assets.
+BROTLI_QUALITY = int(os.environ.get("ZEUS_BROTLI_QUALITY", "4"))
+
+UNCOMPRESSED_TYPES = ("text/event-stream", "image/", "audio/", "video/", "application/zip", "application/gzip")
+
+COMPRESSED_BYTES = registry.register(Counter(
+    "zeus_http_compressed_bytes_total",
+    "Bytes of compressed response bodies before (raw) and after (sent) compression",
+    ("encoding", "stage"),
+))
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The encoding to use for an ``Accept-Encoding`` header: ``br``, ``gzip`` or None."""
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    weights: dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        weights[name.strip()] = quality
+    wildcard = weights.get("*", 0.0)
+    ranked = [(weights.get(name, wildcard), -rank, name) for rank, name in enumerate(offered)]
+    quality, _, name = max(ranked)
+    return name if quality > 0 else None
+
+
+class _Encoder:
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._gzip = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        out = self._gzip.compress(data)
+        return out + self._gzip.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """Pure ASGI, so streamed bodies pass through without being buffered."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_BYTES) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        await _Responder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _Responder:
+    def __init__(self, app: ASGIApp, encoding: Optional[str], minimum_size: int) -> None:
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.start: Optional[Message] = None
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    @staticmethod
+    def _varies(headers: Headers) -> bool:
+        """Whether the representation depends on Accept-Encoding, compressed this time or not."""
+        return "content-encoding" not in headers and not headers.get("content-type", "").startswith(UNCOMPRESSED_TYPES)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            varies = self._varies(headers)
+            if varies:
+                headers.add_vary_header("Accept-Encoding")
+            self.start = message
+            self.passthrough = not varies or self.encoding is None or message["status"] in (204, 304)
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body, more = message.get("body", b""), message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            if self.passthrough or (not more and len(body) < self.minimum_size):
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            self.encoder = _Encoder(self.encoding)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            compressed = self.encoder.compress(body, final=not more)
+            if more:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(compressed))
+            self._count(body, compressed)
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": compressed, "more_body": more})
+            return
+
+        if self.passthrough:
+            await self.send(message)
+            return
+        compressed = self.encoder.compress(body, final=not more)
+        self._count(body, compressed)
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more})
+
+    def _count(self, raw: bytes, sent: bytes) -> None:
+        COMPRESSED_BYTES.inc(len(raw), encoding=self.encoding, stage="raw")
+        COMPRESSED_BYTES.inc(len(sent), encoding=self.encoding, stage="sent")
@@ -1,13 +1,22 @@
 import os
 from functools import lru_cache
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from telemetry import instrument_httpx_client
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 load_dotenv()
 
 
 @lru_cache(maxsize=1)
-def get_supabase_client() -> Client:
+def get_supabase_client() -> "Client":
+    """Process-wide client; the SDK is imported here and the client built by the worker's warm-up."""
+    from supabase import create_client
+
     url: str = os.environ["SUPABASE_URL"]
     key: str = os.environ["SUPABASE_SERVICE_KEY"]
-    return create_client(url, key)
+    client = create_client(url, key)
+    instrument_httpx_client(client.postgrest.session)
+    return client
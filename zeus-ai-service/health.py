@@ -0,0 +1,204 @@
+"""
+Dependency health: background probes of the database and the model providers.
+
+Each enabled dependency is probed every ``ZEUS_HEALTH_PROBE_INTERVAL_SECONDS``
+with a cheap call (one-row select, model metadata lookup, Ollama tag list,
+OpenRouter key info) bounded by ``ZEUS_HEALTH_PROBE_TIMEOUT_SECONDS``. Results
+are cached in-process, so ``/ready`` and ``/health/deep`` only read them and
+cost nothing on the request path, however often a load balancer polls.
+
+Readiness fails while any dependency listed in ``ZEUS_HEALTH_CRITICAL`` is down
+or its last result is older than three intervals. The other probes are reported
+but only inform. A provider outage that hits every pod takes every pod out of
+rotation, so list only the dependencies whose loss makes this pod useless.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Awaitable, Callable, Optional
+
+from telemetry import Gauge, Histogram, registry
+
+logger = logging.getLogger("zeus.health")
+
+PROBE_INTERVAL_SECONDS = float(os.environ.get("ZEUS_HEALTH_PROBE_INTERVAL_SECONDS", "15"))
+PROBE_TIMEOUT_SECONDS = float(os.environ.get("ZEUS_HEALTH_PROBE_TIMEOUT_SECONDS", "3"))
+CRITICAL_DEPENDENCIES = {
+    d.strip() for d in os.environ.get("ZEUS_HEALTH_CRITICAL", "database,gemini").split(",") if d.strip()
+}
+
+DEPENDENCY_UP = registry.register(Gauge(
+    "zeus_dependency_up", "1 if the last probe of the dependency succeeded, else 0", ("dependency",),
+))
+PROBE_DURATION = registry.register(Histogram(
+    "zeus_dependency_probe_seconds", "Latency of background dependency probes", ("dependency",),
+))
+
+
+@dataclass
+class ProbeResult:
+    status: str = "unknown"          # unknown | up | down
+    latency_ms: Optional[float] = None
+    checked_at: Optional[float] = None   # time.time()
+    error: Optional[str] = None
+    consecutive_failures: int = 0
+
+    def stale(self, now: float) -> bool:
+        return self.checked_at is None or now - self.checked_at > 3 * PROBE_INTERVAL_SECONDS
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "status": "stale" if self.status != "unknown" and self.stale(now) else self.status,
+            "latency_ms": self.latency_ms,
+            "checked_seconds_ago": round(now - self.checked_at, 1) if self.checked_at else None,
+            "error": self.error,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+@dataclass
+class Probe:
+    name: str
+    check: Callable[[], Awaitable[None]]
+    critical: bool = False
+    result: ProbeResult = field(default_factory=ProbeResult)
+
+    async def run(self) -> None:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.check(), PROBE_TIMEOUT_SECONDS)
+        except Exception as exc:
+            error = f"timed out after {PROBE_TIMEOUT_SECONDS:g}s" if isinstance(exc, TimeoutError) else str(exc)[:200]
+            if self.result.status != "down":
+                logger.warning("🩺 [HEALTH] %s is down: %s", self.name, error)
+            self.result = ProbeResult("down", None, time.time(), error, self.result.consecutive_failures + 1)
+        else:
+            if self.result.status == "down":
+                logger.info("🩺 [HEALTH] %s recovered", self.name)
+            self.result = ProbeResult("up", None, time.time(), None, 0)
+        elapsed = time.perf_counter() - started
+        self.result.latency_ms = round(elapsed * 1000, 1)
+        PROBE_DURATION.observe(elapsed, dependency=self.name)
+        DEPENDENCY_UP.set(1 if self.result.status == "up" else 0, dependency=self.name)
+
+
+# ── Checks ────────────────────────────────────────────────────────────────────
+
+@lru_cache(maxsize=1)
+def _genai_client():
+    from google import genai
+
+    return genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+
+
+def _model_lookup(model: str) -> Callable[[], Awaitable[None]]:
+    """Metadata lookup of a Gemini model: authenticates and reaches the API without spending tokens."""
+    async def check() -> None:
+        await _genai_client().aio.models.get(model=model)
+    return check
+
+
+async def _check_database() -> None:
+    from database import get_supabase_client
+
+    def select_one():
+        get_supabase_client().table("car_brands").select("id").limit(1).execute()
+
+    await asyncio.to_thread(select_one)
+
+
+def _http_get(url: str, headers: Optional[dict] = None) -> Callable[[], Awaitable[None]]:
+    async def check() -> None:
+        import httpx
+
+        async with httpx.AsyncClient(timeout=PROBE_TIMEOUT_SECONDS) as client:
+            response = await client.get(url, headers=headers)
+            response.raise_for_status()
+    return check
+
+
+def default_probes() -> list[Probe]:
+    """Probes for what this deployment actually uses (``ZEUS_ENABLED_MODELS``, configured keys)."""
+    from agent import ENABLED_MODELS, OLLAMA_BASE_URL, OPENROUTER_BASE_URL
+
+    probes = []
+    if os.environ.get("SUPABASE_URL"):
+        probes.append(Probe("database", _check_database))
+    if os.environ.get("GEMINI_API_KEY"):
+        probes.append(Probe("embedding", _model_lookup("gemini-embedding-001")))
+        if {"gemini-2.5-flash", "gemma-3-27b"} & set(ENABLED_MODELS):
+            probes.append(Probe("gemini", _model_lookup("gemini-2.5-flash")))
+    if "ollama" in ENABLED_MODELS:
+        probes.append(Probe("ollama", _http_get(f"{OLLAMA_BASE_URL}/api/tags")))
+    if "openrouter" in ENABLED_MODELS and os.environ.get("OPENROUTER_API_KEY"):
+        probes.append(Probe(
+            "openrouter",
+            _http_get(f"{OPENROUTER_BASE_URL}/key", {"Authorization": f"Bearer {os.environ['OPENROUTER_API_KEY']}"}),
+        ))
+    for probe in probes:
+        probe.critical = probe.name in CRITICAL_DEPENDENCIES
+    return probes
+
+
+# ── Monitor ───────────────────────────────────────────────────────────────────
+
+class HealthMonitor:
+    """Runs every probe concurrently on a fixed schedule and keeps the last result of each."""
+
+    def __init__(self, probes: Optional[list[Probe]] = None, interval_seconds: float = PROBE_INTERVAL_SECONDS) -> None:
+        self._probes = probes
+        self.interval_seconds = interval_seconds
+        self.rounds = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def probes(self) -> list[Probe]:
+        if self._probes is None:
+            self._probes = default_probes()
+        return self._probes
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(probe.run() for probe in self.probes))
+        self.rounds += 1
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.check_all()
+            except Exception as exc:
+                logger.error("❌ [HEALTH] Probe round failed: %s", exc)
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def critical_down(self) -> list[str]:
+        """Critical dependencies that are down, stale, or not probed yet."""
+        now = time.time()
+        return [
+            probe.name for probe in self.probes
+            if probe.critical and (probe.result.status != "up" or probe.result.stale(now))
+        ]
+
+    def report(self) -> dict:
+        now = time.time()
+        return {
+            "rounds": self.rounds,
+            "interval_seconds": self.interval_seconds,
+            "dependencies": {
+                probe.name: {"critical": probe.critical, **probe.result.to_dict(now)} for probe in self.probes
+            },
+        }
+
+
+health_monitor = HealthMonitor()
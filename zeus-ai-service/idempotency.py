@@ -0,0 +1,311 @@
+"""
+Idempotent chat requests: a re-sent message costs one agent run, not one per copy.
+
+Mobile clients on flaky networks re-send a message when the reply is slow, and
+users tap send again. Each copy used to run the agent and store the turn again.
+A request is identified by one of two keys:
+
+* the client's ``Idempotency-Key`` header, scoped to the session and kept for
+  ``ZEUS_IDEMPOTENCY_KEY_TTL_SECONDS``. Re-using a key with a different request
+  is a conflict (422);
+* otherwise a hash of session, message, model and image, kept for only
+  ``ZEUS_IDEMPOTENCY_WINDOW_SECONDS`` (0 turns it off). The same text sent
+  again later is a new question.
+
+A copy that arrives while the first run is in flight waits for that run and
+gets the same result. A streamed copy receives every event from the start.
+Completed results are replayed from the shared store (``shared_state``), so
+with Redis a copy that lands on another worker is replayed too. With Redis, a
+copy that lands on another worker while the first run is still going waits up
+to ``ZEUS_IDEMPOTENCY_WAIT_SECONDS`` for it. Only completed runs are stored; a
+failed run is not, so a retry after an error runs again.
+
+Runs are detached from the request that started them. A client that
+disconnects does not cancel the run, and its retry is served the result.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from shared_state import SharedCache
+from telemetry import Counter, registry
+
+logger = logging.getLogger("zeus.idempotency")
+
+IDEMPOTENCY_ENABLED = os.environ.get("ZEUS_IDEMPOTENCY_ENABLED", "true").lower() in ("1", "true", "yes")
+IDEMPOTENCY_KEY_TTL_SECONDS = float(os.environ.get("ZEUS_IDEMPOTENCY_KEY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_WINDOW_SECONDS = float(os.environ.get("ZEUS_IDEMPOTENCY_WINDOW_SECONDS", "30"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get("ZEUS_IDEMPOTENCY_WAIT_SECONDS", "90"))
+# How often a copy polls the shared store while another worker runs the original.
+POLL_INTERVAL_SECONDS = 0.25
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+IDEMPOTENT_REQUESTS = registry.register(Counter(
+    "zeus_idempotent_requests_total",
+    "Chat requests by how they were answered: executed, coalesced (joined an in-flight run), replayed, conflict",
+    ("endpoint", "outcome"),
+))
+
+
+class IdempotencyConflict(Exception):
+    """An ``Idempotency-Key`` re-used for a different request."""
+
+
+@dataclass(frozen=True)
+class RequestKey:
+    endpoint: str
+    key: str
+    fingerprint: str
+    ttl_seconds: float
+    client_supplied: bool
+
+
+def request_key(
+    endpoint: str,
+    session_id: str,
+    message: str,
+    model: str,
+    image_base64: Optional[str] = None,
+    client_key: Optional[str] = None,
+) -> Optional[RequestKey]:
+    """The idempotency key of a chat request, or None when the request should simply run."""
+    if not IDEMPOTENCY_ENABLED:
+        return None
+    image_digest = hashlib.sha256(image_base64.encode("ascii", "ignore")).hexdigest() if image_base64 else None
+    fingerprint = hashlib.sha256(
+        json.dumps([session_id, message, model, image_digest], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    if client_key:
+        scoped = hashlib.sha256(f"{session_id}\n{client_key}".encode("utf-8")).hexdigest()
+        return RequestKey(endpoint, f"{endpoint}:key:{scoped}", fingerprint, IDEMPOTENCY_KEY_TTL_SECONDS, True)
+    if IDEMPOTENCY_WINDOW_SECONDS <= 0:
+        return None
+    return RequestKey(endpoint, f"{endpoint}:hash:{fingerprint}", fingerprint, IDEMPOTENCY_WINDOW_SECONDS, False)
+
+
+# ── Streams ───────────────────────────────────────────────────────────────────
+
+class StreamRun:
+    """The events of one streamed run, replayed from the first to every subscriber."""
+
+    def __init__(self) -> None:
+        self.chunks: list[str] = []
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self) -> None:
+        self.done = True
+        self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                return
+            await changed.wait()
+
+
+def _sse(event: dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def stream_result(chunks: list[str]) -> Optional[dict]:
+    """The reply and final event of a completed SSE stream; None when it ended without ``done``."""
+    tokens, done = [], None
+    for chunk in chunks:
+        event = json.loads(chunk[len("data: "):])
+        if "error" in event:
+            return None
+        if "token" in event:
+            tokens.append(event["token"])
+        elif event.get("done"):
+            done = event
+    return {"reply": "".join(tokens), "done": done} if done else None
+
+
+def replay_stream(result: dict) -> list[str]:
+    """A stored stream as two events: the whole reply, then the final event."""
+    return [_sse({"token": result["reply"]}), _sse({**result["done"], "replayed": True})]
+
+
+# ── Store ─────────────────────────────────────────────────────────────────────
+
+class IdempotencyStore:
+    """Coalesces in-flight copies per worker and replays completed results from the shared store."""
+
+    def __init__(self, wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS) -> None:
+        self.wait_seconds = wait_seconds
+        self._results = SharedCache("idempotency")
+        self._inflight: dict[str, tuple[str, Any]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def _detach(self, coro: Awaitable) -> asyncio.Task:
+        """Run ``coro`` independently of the request that started it, holding a reference until it finishes."""
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        # The starting request may be gone; an exception then has no other reader.
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    def _count(self, key: RequestKey, outcome: str) -> None:
+        IDEMPOTENT_REQUESTS.inc(endpoint=key.endpoint, outcome=outcome)
+        if outcome != "executed":
+            logger.info("🔁 [IDEMPOTENCY] %s request %s (%s)", outcome.capitalize(), key.key[:24], key.endpoint)
+
+    def _check(self, key: RequestKey, fingerprint: str) -> None:
+        if fingerprint != key.fingerprint:
+            self._count(key, "conflict")
+            raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+
+    async def _shared_call(self, method: Callable, *args: Any) -> Any:
+        """Call the shared store off the event loop when it is Redis; the memory backend answers inline."""
+        if self._results.shared:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def _stored(self, key: RequestKey) -> Optional[Any]:
+        entry = await self._shared_call(self._results.get, key.key)
+        if entry is None:
+            return None
+        self._check(key, entry["fingerprint"])
+        return entry["result"]
+
+    async def _store(self, key: RequestKey, result: Any) -> None:
+        entry = {"fingerprint": key.fingerprint, "result": result}
+        await self._shared_call(self._results.set, key.key, entry, key.ttl_seconds)
+
+    def _joinable(self, key: RequestKey) -> Optional[Any]:
+        """The in-flight run of this key on this worker, if any."""
+        inflight = self._inflight.get(key.key)
+        if inflight is None:
+            return None
+        self._check(key, inflight[0])
+        return inflight[1]
+
+    async def _pending_elsewhere(self, key: RequestKey) -> bool:
+        return await self._shared_call(self._results.get, f"{key.key}:pending") is not None
+
+    async def _wait_for_other_worker(self, key: RequestKey) -> Optional[Any]:
+        """With a shared store: the result of a run another worker has in flight, if it completes in time."""
+        if not self._results.shared or not await self._pending_elsewhere(key):
+            return None
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            result = await self._stored(key)
+            if result is not None:
+                return result
+            if not await self._pending_elsewhere(key):
+                return None
+        return None
+
+    async def _existing(self, key: RequestKey) -> tuple[Optional[str], Any]:
+        """How a copy is answered without running it: ("replayed", result), ("coalesced", run) or (None, None)."""
+        result = await self._stored(key)
+        if result is None:
+            run = self._joinable(key)
+            if run is not None:
+                return "coalesced", run
+            result = await self._wait_for_other_worker(key)
+        if result is not None:
+            return "replayed", result
+        # A copy on this worker may have started the run while the lookups above awaited Redis.
+        run = self._joinable(key)
+        return ("coalesced", run) if run is not None else (None, None)
+
+    def _begin(self, key: RequestKey, run: Any) -> None:
+        self._inflight[key.key] = (key.fingerprint, run)
+
+    async def _mark_pending(self, key: RequestKey) -> None:
+        """Tell copies on other workers to wait for this run; called first thing by the detached run."""
+        if self._results.shared:
+            await asyncio.to_thread(self._results.set, f"{key.key}:pending", 1, self.wait_seconds)
+
+    async def _end(self, key: RequestKey) -> None:
+        self._inflight.pop(key.key, None)
+        if self._results.shared:
+            await asyncio.to_thread(self._results.delete, f"{key.key}:pending")
+
+    async def execute(self, key: RequestKey, run: Callable[[], Awaitable[dict]]) -> tuple[dict, str]:
+        """The result of a JSON request and how it was obtained: ``executed``, ``coalesced`` or ``replayed``."""
+        outcome, found = await self._existing(key)
+        if outcome == "replayed":
+            self._count(key, outcome)
+            return found, outcome
+        if outcome == "coalesced":
+            self._count(key, outcome)
+            return await asyncio.shield(found), outcome
+
+        async def detached() -> dict:
+            try:
+                await self._mark_pending(key)
+                value = await run()
+                await self._store(key, value)
+                return value
+            finally:
+                await self._end(key)
+
+        task = self._detach(detached())
+        self._begin(key, task)
+        self._count(key, "executed")
+        return await asyncio.shield(task), "executed"
+
+    async def stream(self, key: RequestKey, run: Callable[[], AsyncIterator[str]]) -> tuple[AsyncIterator[str], str]:
+        """The SSE events of a streamed request and how they were obtained, as for ``execute``."""
+        outcome, found = await self._existing(key)
+        if outcome == "replayed":
+            self._count(key, outcome)
+            return _iterate(replay_stream(found)), outcome
+        if outcome == "coalesced":
+            self._count(key, outcome)
+            return found.subscribe(), outcome
+
+        stream_run = StreamRun()
+
+        async def pump() -> None:
+            try:
+                await self._mark_pending(key)
+                async for chunk in run():
+                    stream_run.publish(chunk)
+                result = stream_result(stream_run.chunks)
+                if result is not None:
+                    await self._store(key, result)
+            except Exception as exc:
+                logger.error("❌ [IDEMPOTENCY] Streamed run failed: %s", exc)
+                stream_run.publish(_sse({"error": str(exc)}))
+            finally:
+                stream_run.finish()
+                await self._end(key)
+
+        self._begin(key, stream_run)
+        self._detach(pump())
+        self._count(key, "executed")
+        return stream_run.subscribe(), "executed"
+
+
+async def _iterate(chunks: list[str]) -> AsyncIterator[str]:
+    for chunk in chunks:
+        yield chunk
+
+
+idempotency_store = IdempotencyStore()
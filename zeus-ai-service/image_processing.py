@@ -0,0 +1,162 @@
+"""
+Preprocessing for user-uploaded images before they reach a vision model.
+
+Uploads are decoded, validated, EXIF-stripped (after applying the orientation
+tag), downscaled to a size the vision models actually use and re-encoded as
+JPEG. All of the CPU-bound work, base64 decoding and hashing included, runs on a
+small thread pool (Pillow and hashlib release the GIL on large buffers), and
+results are memoized by the SHA-256 of the original bytes so re-uploads of the
+same photo skip the work entirely.
+"""
+
+import io
+import os
+import base64
+import asyncio
+import hashlib
+import binascii
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger("zeus.image")
+
+MAX_IMAGE_BYTES = int(os.environ.get("ZEUS_MAX_IMAGE_BYTES", str(8 * 1024 * 1024)))
+MAX_REQUEST_BODY_BYTES = int(os.environ.get("ZEUS_MAX_REQUEST_BODY_BYTES", str(12 * 1024 * 1024)))
+MAX_IMAGE_SIDE = int(os.environ.get("ZEUS_MAX_IMAGE_SIDE", "1024"))
+JPEG_QUALITY = int(os.environ.get("ZEUS_IMAGE_JPEG_QUALITY", "85"))
+IMAGE_WORKERS = int(os.environ.get("ZEUS_IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+PROCESSED_CACHE_SIZE = 128
+
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "GIF", "BMP"}
+
+# Decompression bombs: Pillow only warns between MAX_IMAGE_PIXELS and twice that
+# and raises above it, so _process_sync rejects anything over the limit itself.
+MAX_IMAGE_PIXELS = 50_000_000
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+class ImageValidationError(ValueError):
+    """The upload is not a usable image (bad base64, too large, unsupported format)."""
+
+
+@dataclass(frozen=True)
+class ProcessedImage:
+    data_base64: str
+    mime_type: str
+    sha256: str
+    dhash: str
+    width: int
+    height: int
+    original_bytes: int
+    processed_bytes: int
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.data_base64}"
+
+
+_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="zeus-image")
+_processed: "OrderedDict[str, ProcessedImage]" = OrderedDict()
+_processed_lock = threading.Lock()
+
+
+def decode_base64_image(image_base64: str) -> bytes:
+    """Decode a raw or ``data:`` URL base64 payload, enforcing the size cap."""
+    if image_base64.startswith("data:"):
+        image_base64 = image_base64.partition(",")[2]
+    # base64 inflates by 4/3; check before allocating the decoded buffer
+    if len(image_base64) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise ImageValidationError(f"Image exceeds the {MAX_IMAGE_BYTES // (1024 * 1024)} MB limit.")
+    try:
+        return base64.b64decode(image_base64, validate=True)
+    except (binascii.Error, ValueError) as exc:
+        raise ImageValidationError("Image is not valid base64.") from exc
+
+
+def _dhash(img: Image.Image, size: int = 8) -> str:
+    """64-bit difference hash; stable across re-encodes, resizes and screenshots of the same photo."""
+    pixels = list(img.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def _process_sync(raw: bytes, digest: str) -> ProcessedImage:
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            if img.format not in ALLOWED_FORMATS:
+                raise ImageValidationError(f"Unsupported image format: {img.format}.")
+            # Checked on the header, before anything is decoded.
+            if img.width * img.height > MAX_IMAGE_PIXELS:
+                raise ImageValidationError(f"Image is too large: {img.width}x{img.height} pixels.")
+            # JPEG can decode directly at a reduced scale, which is much cheaper than a full decode + resize
+            img.draft("RGB", (MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ("RGBA", "LA", "P"):
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.Resampling.LANCZOS)
+            perceptual = _dhash(img)
+
+            out = io.BytesIO()
+            # Saving without an ``exif=`` argument drops EXIF (GPS, device serials, ...)
+            img.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            width, height = img.size
+    except UnidentifiedImageError as exc:
+        raise ImageValidationError("Upload is not a recognised image.") from exc
+    except (Image.DecompressionBombError, OSError) as exc:
+        raise ImageValidationError(f"Could not decode image: {exc}") from exc
+
+    encoded = out.getvalue()
+    return ProcessedImage(
+        data_base64=base64.b64encode(encoded).decode("ascii"),
+        mime_type="image/jpeg",
+        sha256=digest,
+        dhash=perceptual,
+        width=width,
+        height=height,
+        original_bytes=len(raw),
+        processed_bytes=len(encoded),
+    )
+
+
+def _preprocess_sync(image_base64: str) -> ProcessedImage:
+    raw = decode_base64_image(image_base64)
+    digest = hashlib.sha256(raw).hexdigest()
+
+    with _processed_lock:
+        cached = _processed.get(digest)
+        if cached is not None:
+            _processed.move_to_end(digest)
+    if cached is not None:
+        logger.info("🖼️  [IMAGE] Reusing processed image %s", digest[:12])
+        return cached
+
+    processed = _process_sync(raw, digest)
+    with _processed_lock:
+        _processed[digest] = processed
+        if len(_processed) > PROCESSED_CACHE_SIZE:
+            _processed.popitem(last=False)
+
+    logger.info(
+        "🖼️  [IMAGE] %s: %s KB → %s KB (%sx%s)", digest[:12], processed.original_bytes // 1024, processed.processed_bytes // 1024, processed.width, processed.height
+    )
+    return processed
+
+
+async def preprocess_image(image_base64: str) -> ProcessedImage:
+    """Decode, validate, strip, downscale and re-encode an uploaded image off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, _preprocess_sync, image_base64)
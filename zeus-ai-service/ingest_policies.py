@@ -0,0 +1,596 @@
+"""
+Load policy books from disk into ``policy_documents``: chunked, tagged,
+de-duplicated and embedded in one pass.
+
+Every stage is a generator, so a book of any size streams through with only
+one embedding batch and one insert batch in memory:
+
+    read (txt / md / pdf)  →  sentences  →  chunks  →  tags  →  dedupe  →  embed  →  insert
+
+* Files are read line by line (PDFs page by page, with the optional ``pypdf``;
+  text extracted with ``pdftotext`` works too, its form feeds count as page
+  breaks). Markdown headings and heading-like lines ("SECTION 4", "หมวด 2",
+  short ALL-CAPS lines) give each chunk its heading path.
+* Sentences end at ``.!?`` followed by whitespace, and, for Thai, which has no
+  sentence punctuation, at whitespace between two Thai words.
+* Chunks pack whole sentences up to ``--chunk-chars`` and repeat the last
+  ``--overlap-chars`` of the previous chunk. They never span two headings.
+* ``section`` comes from keywords in the heading, else in the chunk (English
+  and Thai). ``plan_type`` comes from the one plan type the heading or chunk
+  names, else ``All``. ``--section`` / ``--plan-type`` override both.
+* A chunk within ``--dedupe-distance`` bits (64-bit SimHash over character
+  4-grams) of one already loaded, in this run or in the table, is skipped.
+* Embedding runs on a background thread one batch ahead of the inserts. A
+  batch that still fails after retries is inserted without embeddings, for
+  ``ingest_embeddings.py`` to fill in later.
+
+Usage:
+    # Load a new insurer's policy book
+    python ingest_policies.py books/acme/ --insurer "Acme Insurance"
+
+    # Preview chunks and tags without embedding or writing anything
+    python ingest_policies.py books/acme/type1.md --dry-run
+
+    # Insert now, embed later with ingest_embeddings.py
+    python ingest_policies.py books/acme/ --no-embed
+
+Requires .env to be configured with GEMINI_API_KEY, SUPABASE_URL, SUPABASE_SERVICE_KEY.
+"""
+
+import os
+import re
+import sys
+import time
+import queue
+import hashlib
+import argparse
+import threading
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, TypeVar
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from ingest_embeddings import BATCH_SIZE, SLEEP_BETWEEN_BATCHES, VECTOR_DIMENSIONS, embed_with_retry
+
+
+CHUNK_CHARS = int(os.environ.get("ZEUS_INGEST_CHUNK_CHARS", "900"))
+OVERLAP_CHARS = int(os.environ.get("ZEUS_INGEST_OVERLAP_CHARS", "150"))
+MIN_CHUNK_CHARS = 40
+# A paragraph without blank lines is still cut into blocks of this size.
+MAX_BLOCK_CHARS = 20000
+DEDUPE_DISTANCE = 3
+INSERT_BATCH_SIZE = 100
+SOURCE_SUFFIXES = (".txt", ".md", ".markdown", ".pdf")
+
+T = TypeVar("T")
+
+
+@dataclass
+class Block:
+    """A paragraph of a source file."""
+    source: str
+    text: str
+    heading: tuple[str, ...]
+    page: int
+
+
+@dataclass
+class Chunk:
+    source: str
+    text: str
+    heading: tuple[str, ...]
+    page: int
+    index: int
+    section: Optional[str] = None
+    plan_type: Optional[str] = None
+    fingerprint: Optional[int] = None
+
+    def metadata(self, insurer: Optional[str]) -> dict:
+        metadata = {
+            "source": self.source,
+            "page": self.page,
+            "chunk": self.index,
+            "simhash": f"{self.fingerprint:016x}" if self.fingerprint is not None else None,
+        }
+        if self.heading:
+            metadata["heading"] = " › ".join(self.heading)
+        if insurer:
+            metadata["insurer"] = insurer
+        return metadata
+
+
+@dataclass
+class IngestStats:
+    files: int = 0
+    chunks: int = 0
+    duplicates: int = 0
+    embedded: int = 0
+    inserted: int = 0
+    failed_batches: int = 0
+    by_tag: dict = field(default_factory=dict)
+
+
+# ── Reading ───────────────────────────────────────────────────────────────────
+
+_MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*$")
+_NUMBERED_HEADING = re.compile(
+    r"^(?:section|part|chapter|article|หมวด(?:ที่)?|ส่วน(?:ที่)?|บทที่)\s*[\dIVXivx๐-๙]+\b.{0,80}$", re.IGNORECASE,
+)
+_PAGE_NUMBER = re.compile(r"^\W*(?:page|หน้า(?:ที่)?)?\s*[\d๐-๙]+\s*(?:(?:/|of|จาก)\s*[\d๐-๙]+)?\W*$", re.IGNORECASE)
+
+
+def _plain_heading(line: str) -> bool:
+    if line.endswith((".", ":", ";", ",")) or len(line) > 90:
+        return False
+    if _NUMBERED_HEADING.match(line):
+        return True
+    letters = [ch for ch in line if ch.isascii() and ch.isalpha()]
+    return len(line) <= 60 and len(letters) >= 3 and all(ch.isupper() for ch in letters)
+
+
+def _text_lines(path: Path) -> Iterator[tuple[int, str]]:
+    page = 1
+    with open(path, encoding="utf-8", errors="replace") as handle:
+        for raw in handle:
+            parts = raw.split("\f")
+            for i, part in enumerate(parts):
+                if i:
+                    page += 1
+                    yield page, ""
+                yield page, part
+
+
+def _pdf_lines(path: Path) -> Iterator[tuple[int, str]]:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise SystemExit(f"❌ {path}: reading PDFs needs pypdf (pip install pypdf), or extract the text with pdftotext first")
+    for number, page in enumerate(PdfReader(path).pages, start=1):
+        for line in (page.extract_text() or "").splitlines():
+            yield number, line
+        yield number, ""
+
+
+def read_blocks(path: Path, source: Optional[str] = None) -> Iterator[Block]:
+    """The paragraphs of one file, with the heading path they sit under."""
+    source = source or path.name
+    lines = _pdf_lines(path) if path.suffix.lower() == ".pdf" else _text_lines(path)
+    headings: list[tuple[int, str]] = []
+    buffer: list[str] = []
+    size, block_page = 0, 1
+
+    def flush() -> Iterator[Block]:
+        nonlocal size
+        if buffer:
+            yield Block(source, " ".join(buffer), tuple(text for _, text in headings), block_page)
+            buffer.clear()
+            size = 0
+
+    for page, raw in lines:
+        line = raw.strip()
+        if not line or _PAGE_NUMBER.match(line):
+            yield from flush()
+            continue
+        markdown = _MARKDOWN_HEADING.match(line)
+        if markdown or _plain_heading(line):
+            yield from flush()
+            # Plain-text headings rank below a Markdown document title.
+            level = len(markdown.group(1)) if markdown else 2
+            text = markdown.group(2) if markdown else line
+            headings[:] = [h for h in headings if h[0] < level] + [(level, text)]
+            continue
+        if not buffer:
+            block_page = page
+        buffer.append(line)
+        size += len(line) + 1
+        if size >= MAX_BLOCK_CHARS:
+            yield from flush()
+    yield from flush()
+
+
+def source_files(paths: Iterable[str]) -> Iterator[Path]:
+    for name in paths:
+        path = Path(name)
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob("*") if p.is_file() and p.suffix.lower() in SOURCE_SUFFIXES)
+        elif path.is_file():
+            yield path
+        else:
+            raise SystemExit(f"❌ No such file or directory: {name}")
+
+
+# ── Sentences & chunks ────────────────────────────────────────────────────────
+
+# Thai letters that can end or start a word; ๆ (repetition) and ฯ (abbreviation)
+# are followed by a space inside sentences, so they do not end one.
+_THAI_END = "ก-ฮะ-ฺเ-ๅ็-๎"
+_THAI_START = "ก-ฮเ-ไ"
+_SENTENCE_BREAK = re.compile(rf"(?<=[.!?])\s+(?=\S)|(?<=[{_THAI_END}])\s+(?=[{_THAI_START}])")
+_ABBREVIATIONS = ("e.g.", "i.e.", "etc.", "no.", "vs.", "mr.", "mrs.", "ms.", "dr.", "approx.", "art.", "sec.")
+
+
+def split_sentences(text: str) -> list[str]:
+    """Sentences of a paragraph, Thai and English mixed."""
+    sentences: list[str] = []
+    for piece in _SENTENCE_BREAK.split(text):
+        if sentences and sentences[-1].lower().endswith(_ABBREVIATIONS):
+            sentences[-1] = f"{sentences[-1]} {piece}"
+        elif piece:
+            sentences.append(piece)
+    return sentences
+
+
+def _hard_split(sentence: str, max_chars: int) -> Iterator[str]:
+    """A sentence longer than a chunk, cut at the last space before the limit (or at the limit)."""
+    while len(sentence) > max_chars:
+        cut = sentence.rfind(" ", max_chars // 2, max_chars)
+        cut = cut if cut > 0 else max_chars
+        yield sentence[:cut].strip()
+        sentence = sentence[cut:].strip()
+    if sentence:
+        yield sentence
+
+
+def chunk_blocks(blocks: Iterable[Block], max_chars: int = CHUNK_CHARS, overlap_chars: int = OVERLAP_CHARS,
+                 min_chars: int = MIN_CHUNK_CHARS) -> Iterator[Chunk]:
+    """Whole sentences packed into chunks of at most ``max_chars``, overlapping by up to ``overlap_chars``."""
+    buffer: list[tuple[str, int]] = []
+    emitted: list[tuple[str, int]] = []
+    size, fresh, index = 0, False, 0
+    key: Optional[tuple] = None
+
+    def emit() -> Optional[Chunk]:
+        nonlocal index, emitted
+        sentences = list(buffer)
+        # A short tail under a heading borrows sentences from the chunk before it, and is kept
+        # even when none fit; only a heading whose whole text is that short is dropped.
+        kept = sum(len(sentence) + 1 for sentence, _ in sentences)
+        for previous in reversed(emitted):
+            if kept >= min_chars or kept + len(previous[0]) + 1 > max_chars:
+                break
+            if previous not in sentences:
+                sentences.insert(0, previous)
+                kept += len(previous[0]) + 1
+        text = " ".join(sentence for sentence, _ in sentences)
+        if len(text) < min_chars and not emitted:
+            return None
+        index += 1
+        emitted = sentences
+        return Chunk(key[0], text, key[1], sentences[0][1], index)
+
+    for block in blocks:
+        if (block.source, block.heading) != key:
+            if fresh and (chunk := emit()):
+                yield chunk
+            if key is None or block.source != key[0]:
+                index = 0
+            buffer, emitted, size, fresh, key = [], [], 0, False, (block.source, block.heading)
+        for sentence in split_sentences(block.text):
+            for piece in _hard_split(sentence, max_chars):
+                if buffer and size + len(piece) > max_chars:
+                    if fresh and (chunk := emit()):
+                        yield chunk
+                    overlap: list[tuple[str, int]] = []
+                    kept = 0
+                    for previous in reversed(buffer):
+                        if kept + len(previous[0]) + 1 > overlap_chars:
+                            break
+                        overlap.insert(0, previous)
+                        kept += len(previous[0]) + 1
+                    if kept + len(piece) > max_chars:
+                        overlap, kept = [], 0
+                    buffer, size, fresh = overlap, kept, False
+                buffer.append((piece, block.page))
+                size += len(piece) + 1
+                fresh = True
+    if fresh and (chunk := emit()):
+        yield chunk
+
+
+# ── Tags ──────────────────────────────────────────────────────────────────────
+
+# Checked in this order; a phrase counted for one section is removed before the
+# next, so "not covered" is an exclusion and not also a coverage.
+SECTION_KEYWORDS = {
+    "Exclusion": ("exclusion", "exclusions", "excluded", "not covered", "does not cover", "will not pay",
+                  "ข้อยกเว้น", "ไม่คุ้มครอง", "ไม่ครอบคลุม", "ไม่รับผิดชอบ"),
+    "Definition": ("definition", "definitions", "means", "refers to", "คำนิยาม", "นิยาม", "หมายถึง", "หมายความว่า"),
+    "Coverage": ("coverage", "covers", "covered", "insured against", "compensate", "ความคุ้มครอง", "คุ้มครอง", "ชดใช้"),
+    "Condition": ("condition", "conditions", "must", "required", "premium", "deductible", "claim", "discount",
+                  "เงื่อนไข", "ข้อตกลง", "เบี้ยประกัน", "ค่าเสียหายส่วนแรก", "เคลม", "ส่วนลด"),
+}
+DEFAULT_SECTION = "Condition"
+
+PLAN_TYPE_PATTERNS = (
+    ("Type 2+", r"type\s*2\s*(?:\+|plus)|ชั้น\s*2\s*(?:\+|พลัส)"),
+    ("Type 3+", r"type\s*3\s*(?:\+|plus)|ชั้น\s*3\s*(?:\+|พลัส)"),
+    ("Type 1", r"type\s*1(?![\d.+])|ชั้น\s*1(?![\d.+])"),
+    ("Type 2", r"type\s*2(?![\d.+]|\s*(?:\+|plus))|ชั้น\s*2(?![\d.+]|\s*(?:\+|พลัส))"),
+    ("Type 3", r"type\s*3(?![\d.+]|\s*(?:\+|plus))|ชั้น\s*3(?![\d.+]|\s*(?:\+|พลัส))"),
+)
+DEFAULT_PLAN_TYPE = "All"
+
+
+def _keyword_pattern(keyword: str) -> re.Pattern:
+    # Thai has no spaces between words, so Thai keywords match anywhere.
+    return re.compile(rf"\b{re.escape(keyword)}\b" if keyword.isascii() else re.escape(keyword), re.IGNORECASE)
+
+
+_SECTION_PATTERNS = {section: [_keyword_pattern(k) for k in keywords] for section, keywords in SECTION_KEYWORDS.items()}
+_PLAN_TYPE_REGEXES = [(plan_type, re.compile(pattern, re.IGNORECASE)) for plan_type, pattern in PLAN_TYPE_PATTERNS]
+
+
+def classify_section(text: str) -> tuple[Optional[str], int]:
+    """The section whose keywords occur most often in ``text`` (ties: the earlier section), and that count."""
+    best, best_hits = None, 0
+    for section, patterns in _SECTION_PATTERNS.items():
+        hits = 0
+        for pattern in patterns:
+            text, found = pattern.subn(" ", text)
+            hits += found
+        if hits > best_hits:
+            best, best_hits = section, hits
+    return best, best_hits
+
+
+def plan_types_in(text: str) -> set[str]:
+    return {plan_type for plan_type, regex in _PLAN_TYPE_REGEXES if regex.search(text)}
+
+
+def tag_chunks(chunks: Iterable[Chunk], section: Optional[str] = None, plan_type: Optional[str] = None) -> Iterator[Chunk]:
+    """Set ``section`` and ``plan_type``: the override, else the innermost heading that tells, else the text."""
+    for chunk in chunks:
+        if section:
+            chunk.section = section
+        else:
+            for heading in reversed(chunk.heading):
+                chunk.section = classify_section(heading)[0]
+                if chunk.section:
+                    break
+            else:
+                chunk.section = classify_section(chunk.text)[0] or DEFAULT_SECTION
+        if plan_type:
+            chunk.plan_type = plan_type
+        else:
+            for text in (*reversed(chunk.heading), chunk.text):
+                found = plan_types_in(text)
+                if len(found) == 1:
+                    chunk.plan_type = found.pop()
+                    break
+                if found:
+                    break
+            chunk.plan_type = chunk.plan_type or DEFAULT_PLAN_TYPE
+        yield chunk
+
+
+# ── Near-duplicates ───────────────────────────────────────────────────────────
+
+_BIT_WEIGHTS = np.uint64(1) << np.arange(64, dtype=np.uint64)
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def simhash(text: str, shingle: int = 4) -> int:
+    """64-bit SimHash over character shingles, which works for Thai without word segmentation."""
+    normalized = _NON_WORD.sub(" ", text.lower()).strip()
+    grams = {normalized[i:i + shingle] for i in range(max(1, len(normalized) - shingle + 1))}
+    digests = np.frombuffer(
+        b"".join(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest() for gram in grams), dtype="<u8",
+    )
+    bits = (digests[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(digests)
+    return int(_BIT_WEIGHTS[votes > 0].sum())
+
+
+class NearDuplicateIndex:
+    """SimHash fingerprints split into bands: two within ``distance`` bits share at least one band."""
+
+    def __init__(self, distance: int = DEDUPE_DISTANCE) -> None:
+        self.distance = distance
+        self.bands = distance + 1
+        self.width = 64 // self.bands
+        self._buckets: list[dict[int, list[int]]] = [{} for _ in range(self.bands)]
+        self.size = 0
+
+    def _keys(self, fingerprint: int) -> Iterator[tuple[int, int]]:
+        mask = (1 << self.width) - 1
+        for band in range(self.bands):
+            yield band, (fingerprint >> (band * self.width)) & mask
+
+    def seen(self, fingerprint: int) -> bool:
+        for band, key in self._keys(fingerprint):
+            for other in self._buckets[band].get(key, ()):
+                if (fingerprint ^ other).bit_count() <= self.distance:
+                    return True
+        return False
+
+    def add(self, fingerprint: int) -> None:
+        for band, key in self._keys(fingerprint):
+            self._buckets[band].setdefault(key, []).append(fingerprint)
+        self.size += 1
+
+
+def dedupe_chunks(chunks: Iterable[Chunk], index: NearDuplicateIndex, stats: IngestStats) -> Iterator[Chunk]:
+    for chunk in chunks:
+        chunk.fingerprint = simhash(chunk.text)
+        if index.seen(chunk.fingerprint):
+            stats.duplicates += 1
+            continue
+        index.add(chunk.fingerprint)
+        yield chunk
+
+
+def existing_fingerprints(client, index: NearDuplicateIndex, page_size: int = 1000) -> None:
+    """Add the documents already in ``policy_documents``, so a re-run loads nothing twice."""
+    offset = 0
+    while True:
+        rows = (
+            client.table("policy_documents").select("content").order("id")
+            .range(offset, offset + page_size - 1).execute().data
+        ) or []
+        for row in rows:
+            index.add(simhash(row["content"]))
+        if len(rows) < page_size:
+            return
+        offset += page_size
+
+
+# ── Embedding & storage ───────────────────────────────────────────────────────
+
+def batched(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def prefetch(items: Iterable[T], depth: int = 1) -> Iterator[T]:
+    """Produce ``items`` on a background thread, at most ``depth`` ahead of the consumer."""
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    done = object()
+    failure: list[BaseException] = []
+
+    def produce() -> None:
+        try:
+            for item in items:
+                buffer.put(item)
+        except BaseException as exc:
+            failure.append(exc)
+        finally:
+            buffer.put(done)
+
+    threading.Thread(target=produce, name="ingest-prefetch", daemon=True).start()
+    while (item := buffer.get()) is not done:
+        yield item
+    if failure:
+        raise failure[0]
+
+
+def embed_batches(batches: Iterable[list[Chunk]], embeddings_model, stats: IngestStats
+                  ) -> Iterator[list[tuple[Chunk, Optional[list[float]]]]]:
+    """Each batch with its embeddings; ``None`` for every chunk of a batch that kept failing."""
+    for number, batch in enumerate(batches):
+        if number:
+            time.sleep(SLEEP_BETWEEN_BATCHES)
+        try:
+            vectors = embed_with_retry(embeddings_model, [chunk.text for chunk in batch])
+        except Exception as e:
+            print(f"    ❌ Embedding batch {number + 1} failed permanently: {e} (inserted without embeddings)")
+            stats.failed_batches += 1
+            yield [(chunk, None) for chunk in batch]
+            continue
+        stats.embedded += len(batch)
+        yield [(chunk, vector[:VECTOR_DIMENSIONS]) for chunk, vector in zip(batch, vectors)]
+
+
+def insert_rows(client, embedded: Iterable[tuple[Chunk, Optional[list[float]]]], insurer: Optional[str],
+                stats: IngestStats, batch_size: int = INSERT_BATCH_SIZE) -> None:
+    for batch in batched(embedded, batch_size):
+        client.table("policy_documents").insert([
+            {
+                "plan_type": chunk.plan_type,
+                "section": chunk.section,
+                "content": chunk.text,
+                "metadata": chunk.metadata(insurer),
+                "embedding": vector,
+            }
+            for chunk, vector in batch
+        ]).execute()
+        stats.inserted += len(batch)
+        print(f"  💾 Inserted {stats.inserted} chunk(s)")
+
+
+def chunk_sources(paths: Iterable[Path], args: argparse.Namespace, stats: IngestStats) -> Iterator[Chunk]:
+    """Tagged chunks of every file, counted in ``stats``."""
+    def blocks() -> Iterator[Block]:
+        for path in paths:
+            stats.files += 1
+            print(f"📄 {path}")
+            yield from read_blocks(path)
+
+    for chunk in tag_chunks(chunk_blocks(blocks(), args.chunk_chars, args.overlap_chars, args.min_chars),
+                            args.section, args.plan_type):
+        stats.chunks += 1
+        tag = f"{chunk.plan_type}/{chunk.section}"
+        stats.by_tag[tag] = stats.by_tag.get(tag, 0) + 1
+        yield chunk
+
+
+def print_summary(stats: IngestStats, dry_run: bool) -> None:
+    print(f"\n{'='*60}")
+    print(f"📊 Policy Ingestion Summary{' (dry run)' if dry_run else ''}")
+    print(f"{'='*60}")
+    print(f"  Files read                : {stats.files}")
+    print(f"  Chunks                    : {stats.chunks}")
+    print(f"  ♻️  Near-duplicates skipped : {stats.duplicates}")
+    if not dry_run:
+        print(f"  ✅ Embedded               : {stats.embedded}")
+        print(f"  💾 Inserted               : {stats.inserted}")
+        print(f"  ❌ Failed embedding batches: {stats.failed_batches}")
+    for tag, count in sorted(stats.by_tag.items()):
+        print(f"     {tag:<28}: {count}")
+    print(f"{'='*60}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Chunk, tag, embed and load policy books into policy_documents")
+    parser.add_argument("paths", nargs="+", help="Files or directories (.txt, .md, .pdf)")
+    parser.add_argument("--insurer", default=None, help="Insurer name, stored in metadata")
+    parser.add_argument("--plan-type", default=None, help="Tag every chunk with this plan_type (e.g. 'Type 1')")
+    parser.add_argument("--section", default=None, help="Tag every chunk with this section (e.g. 'Exclusion')")
+    parser.add_argument("--chunk-chars", type=int, default=CHUNK_CHARS, help="Maximum characters per chunk")
+    parser.add_argument("--overlap-chars", type=int, default=OVERLAP_CHARS, help="Characters repeated from the previous chunk")
+    parser.add_argument("--min-chars", type=int, default=MIN_CHUNK_CHARS, help="Drop chunks shorter than this")
+    parser.add_argument("--dedupe-distance", type=int, default=DEDUPE_DISTANCE,
+                        help="Skip chunks within this many SimHash bits of a loaded one (0 = exact only)")
+    parser.add_argument("--embed-batch", type=int, default=BATCH_SIZE, help="Chunks per embedding request")
+    parser.add_argument("--no-embed", action="store_true", help="Insert without embeddings (run ingest_embeddings.py later)")
+    parser.add_argument("--dry-run", action="store_true", help="Print chunks and tags; embed and write nothing")
+    return parser
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    if args.overlap_chars >= args.chunk_chars:
+        raise SystemExit("❌ --overlap-chars must be smaller than --chunk-chars")
+    stats = IngestStats()
+    index = NearDuplicateIndex(args.dedupe_distance)
+    chunks = chunk_sources(source_files(args.paths), args, stats)
+
+    if args.dry_run:
+        for chunk in dedupe_chunks(chunks, index, stats):
+            print(f"  [{chunk.plan_type}/{chunk.section}] p.{chunk.page} {' › '.join(chunk.heading)}")
+            print(f"      {chunk.text[:160]}{'...' if len(chunk.text) > 160 else ''}")
+        print_summary(stats, dry_run=True)
+        return
+
+    from database import get_supabase_client
+
+    client = get_supabase_client()
+    existing_fingerprints(client, index)
+    print(f"♻️  {index.size} existing document(s) fingerprinted for de-duplication")
+    unique = dedupe_chunks(chunks, index, stats)
+
+    if args.no_embed:
+        embedded = ((chunk, None) for chunk in unique)
+    else:
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        embeddings_model = GoogleGenerativeAIEmbeddings(
+            model="models/gemini-embedding-001",
+            google_api_key=os.environ["GEMINI_API_KEY"],
+        )
+        batches = prefetch(embed_batches(batched(unique, args.embed_batch), embeddings_model, stats))
+        embedded = (row for batch in batches for row in batch)
+
+    insert_rows(client, embedded, args.insurer, stats)
+    print_summary(stats, dry_run=False)
+    if stats.failed_batches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,16 @@
 
 -- 1. Enable pgvector extension
 CREATE EXTENSION IF NOT EXISTS vector;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Drop old tables/views to avoid conflicts during re-initialization
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_matviews WHERE schemaname = 'public' AND matviewname = 'vw_quotation_details') THEN
+        DROP MATERIALIZED VIEW vw_quotation_details CASCADE;
+    END IF;
+END;
+$$;
 DROP VIEW IF EXISTS vw_quotation_details CASCADE;
 DROP TABLE IF EXISTS orders CASCADE;
 DROP TABLE IF EXISTS quotations CASCADE;
@@ -15,7 +23,10 @@ DROP TABLE IF EXISTS insurance_plans CASCADE;
 DROP TABLE IF EXISTS car_models CASCADE;
 DROP TABLE IF EXISTS car_brands CASCADE;
 DROP TABLE IF EXISTS policy_documents CASCADE;
+DROP TABLE IF EXISTS chat_attachments CASCADE;
 DROP TABLE IF EXISTS chat_sessions CASCADE;
+DROP TABLE IF EXISTS chat_sessions_archive CASCADE;
+DROP TABLE IF EXISTS chat_usage CASCADE;
 
 -- ============================================================
 -- 2. Core Relational Tables
@@ -53,9 +64,14 @@ CREATE TABLE plan_premiums (
     plan_id INT REFERENCES insurance_plans(id),
     car_model_id INT REFERENCES car_models(id),
     base_premium NUMERIC(12, 2) NOT NULL,
-    deductible NUMERIC(12, 2) DEFAULT 0
+    deductible NUMERIC(12, 2) DEFAULT 0,
+    -- vw_quotation_details_key relies on it (see migrations/004_query_indexes.sql)
+    CONSTRAINT plan_premiums_car_model_id_plan_id_key UNIQUE (car_model_id, plan_id)
 );
 
+CREATE INDEX IF NOT EXISTS car_models_brand_id_idx ON car_models (brand_id);
+CREATE INDEX IF NOT EXISTS plan_premiums_plan_id_idx ON plan_premiums (plan_id);
+
 -- ============================================================
 -- 3. Quotation & Order Management Tables
 -- ============================================================
@@ -73,16 +89,16 @@ CREATE TABLE quotations (
     total_premium NUMERIC(12, 2) NOT NULL,
     quotation_number VARCHAR(50) UNIQUE NOT NULL,
     valid_until TIMESTAMPTZ NOT NULL,
-    status VARCHAR(50) DEFAULT 'draft', -- draft, sent, accepted, expired
+    status VARCHAR(50) DEFAULT 'draft', -- draft, sent, accepted, expired (set by sweep_statuses)
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
 CREATE TABLE orders (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-    quotation_id UUID REFERENCES quotations(id),
+    quotation_id UUID UNIQUE REFERENCES quotations(id),
     order_number VARCHAR(50) UNIQUE NOT NULL,
-    payment_status VARCHAR(50) DEFAULT 'pending', -- pending, paid, failed, refunded
+    payment_status VARCHAR(50) DEFAULT 'pending', -- pending, awaiting_confirmation, paid, failed, refunded, expired
     payment_method VARCHAR(50),
     payment_date TIMESTAMPTZ,
     policy_number VARCHAR(50) UNIQUE,
@@ -93,6 +109,17 @@ CREATE TABLE orders (
     updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+CREATE INDEX IF NOT EXISTS quotations_session_id_idx ON quotations (session_id);
+-- Rows sweep_statuses() may still change (see migrations/006_status_sweeps.sql).
+CREATE INDEX IF NOT EXISTS quotations_open_valid_until_idx
+    ON quotations (valid_until) WHERE status IN ('draft', 'sent');
+CREATE INDEX IF NOT EXISTS orders_unpaid_created_at_idx
+    ON orders (created_at) WHERE payment_status IN ('pending', 'awaiting_confirmation');
+CREATE INDEX IF NOT EXISTS orders_paid_inactive_start_idx
+    ON orders (policy_start_date) WHERE payment_status = 'paid' AND policy_status = 'inactive';
+CREATE INDEX IF NOT EXISTS orders_active_policy_end_idx
+    ON orders (policy_end_date) WHERE policy_status = 'active';
+
 -- ============================================================
 -- 4. Advanced RAG Table
 -- ============================================================
@@ -106,27 +133,234 @@ CREATE TABLE policy_documents (
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
-CREATE INDEX IF NOT EXISTS policy_documents_embedding_idx
+-- HNSW rather than ivfflat: no training step, good recall at this corpus size.
+CREATE INDEX IF NOT EXISTS policy_documents_embedding_hnsw_idx
     ON policy_documents
-    USING ivfflat (embedding vector_cosine_ops)
-    WITH (lists = 100);
+    USING hnsw (embedding vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+CREATE INDEX IF NOT EXISTS policy_documents_section_idx ON policy_documents (section);
 
 -- ============================================================
 -- 5. Session Table
 -- ============================================================
+-- Partitioned by month, plus a DEFAULT partition; idle sessions move to
+-- chat_sessions_archive (see migrations/005_chat_sessions_partitioning.sql).
+-- Unique keys of a partitioned table must include created_at.
 CREATE TABLE chat_sessions (
-    id BIGSERIAL PRIMARY KEY,
+    id BIGSERIAL,
     session_id UUID NOT NULL,
     role TEXT NOT NULL CHECK (role IN ('user', 'ai')),
     message TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE chat_sessions_default PARTITION OF chat_sessions DEFAULT;
+
+-- Creates the monthly partitions from p_from's month through p_months_ahead
+-- months after the current one. Returns how many partitions it created.
+-- Turns that landed in chat_sessions_default because a month's partition was
+-- missing move into that partition when it is created.
+CREATE OR REPLACE FUNCTION ensure_chat_sessions_partitions(
+    p_from TIMESTAMPTZ DEFAULT NOW(),
+    p_months_ahead INT DEFAULT 2
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', p_from AT TIME ZONE 'UTC');
+    last_month TIMESTAMP := date_trunc('month', NOW() AT TIME ZONE 'UTC') + make_interval(months => p_months_ahead);
+    partition_name TEXT;
+    range_from TIMESTAMPTZ;
+    range_to TIMESTAMPTZ;
+    created INT := 0;
+BEGIN
+    -- Every worker calls this; one at a time creates partitions.
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_chat_sessions_partitions'));
+    WHILE month_start <= last_month LOOP
+        partition_name := 'chat_sessions_p' || to_char(month_start, 'YYYYMM');
+        range_from := month_start AT TIME ZONE 'UTC';
+        range_to := (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC';
+        IF to_regclass(partition_name) IS NULL THEN
+            IF EXISTS (SELECT 1 FROM chat_sessions_default WHERE created_at >= range_from AND created_at < range_to) THEN
+                -- A partition cannot be created while the default partition holds
+                -- rows of its range: detach the default, create the month, move the
+                -- rows, re-attach. chat_attachments' foreign key would block the
+                -- detach, so it is dropped and re-added in the same transaction.
+                ALTER TABLE chat_attachments DROP CONSTRAINT IF EXISTS chat_attachments_message_fkey;
+                ALTER TABLE chat_sessions DETACH PARTITION chat_sessions_default;
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF chat_sessions FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, range_from, range_to
+                );
+                INSERT INTO chat_sessions (id, session_id, role, message, created_at)
+                SELECT id, session_id, role, message, created_at
+                FROM chat_sessions_default
+                WHERE created_at >= range_from AND created_at < range_to;
+                DELETE FROM chat_sessions_default WHERE created_at >= range_from AND created_at < range_to;
+                ALTER TABLE chat_sessions ATTACH PARTITION chat_sessions_default DEFAULT;
+                ALTER TABLE chat_attachments
+                    ADD CONSTRAINT chat_attachments_message_fkey
+                    FOREIGN KEY (message_id, message_created_at)
+                    REFERENCES chat_sessions (id, created_at) ON DELETE CASCADE;
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF chat_sessions FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, range_from, range_to
+                );
+            END IF;
+            created := created + 1;
+        END IF;
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+-- Drops the monthly partitions that end before p_before and hold no rows.
+CREATE OR REPLACE FUNCTION drop_empty_chat_sessions_partitions(p_before TIMESTAMPTZ)
+RETURNS TEXT[]
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    partition_name TEXT;
+    has_rows BOOLEAN;
+    dropped TEXT[] := '{}';
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'chat_sessions'::regclass
+          AND c.relname ~ '^chat_sessions_p[0-9]{6}$'
+          AND (to_date(substr(c.relname, 16), 'YYYYMM') + INTERVAL '1 month') AT TIME ZONE 'UTC' <= p_before
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I)', partition_name) INTO has_rows;
+        IF NOT has_rows THEN
+            -- Detach first: chat_attachments' foreign key blocks a plain DROP.
+            EXECUTE format('ALTER TABLE chat_sessions DETACH PARTITION %I', partition_name);
+            EXECUTE format('DROP TABLE %I', partition_name);
+            dropped := dropped || partition_name;
+        END IF;
+    END LOOP;
+    RETURN dropped;
+END;
+$$;
+
+SELECT ensure_chat_sessions_partitions(NOW(), 2);
+
+CREATE INDEX IF NOT EXISTS chat_sessions_session_id_created_at_idx ON chat_sessions (session_id, created_at);
+CREATE INDEX IF NOT EXISTS chat_sessions_created_at_idx ON chat_sessions (created_at DESC);
+
+-- Out-of-band payloads of a chat turn (uploaded images, provider metadata such as
+-- thought signatures). chat_sessions.message stays plain text; history replay
+-- only reads the one-line summary.
+CREATE TABLE chat_attachments (
+    id BIGSERIAL PRIMARY KEY,
+    message_id BIGINT NOT NULL,
+    message_created_at TIMESTAMPTZ NOT NULL,
+    session_id UUID NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('image', 'model_metadata')),
+    sha256 TEXT,
+    mime_type TEXT,
+    summary TEXT,
+    payload JSONB NOT NULL DEFAULT '{}'::JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CONSTRAINT chat_attachments_message_fkey FOREIGN KEY (message_id, message_created_at)
+        REFERENCES chat_sessions (id, created_at) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS chat_attachments_message_id_idx ON chat_attachments (message_id);
+CREATE INDEX IF NOT EXISTS chat_attachments_sha256_idx ON chat_attachments (sha256) WHERE sha256 IS NOT NULL;
+
+-- The service passes message_created_at; this keeps writers that only know
+-- message_id (older deployments during a rollout, scripts) working.
+CREATE OR REPLACE FUNCTION chat_attachments_fill_message_created_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    SELECT created_at INTO NEW.message_created_at FROM chat_sessions WHERE id = NEW.message_id;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS chat_attachments_fill_message_created_at ON chat_attachments;
+CREATE TRIGGER chat_attachments_fill_message_created_at
+    BEFORE INSERT ON chat_attachments
+    FOR EACH ROW WHEN (NEW.message_created_at IS NULL)
+    EXECUTE FUNCTION chat_attachments_fill_message_created_at();
+
+-- One row per archived session; the transcript (attachments and payloads
+-- included) is a single TOAST-compressed JSONB document.
+CREATE TABLE chat_sessions_archive (
+    session_id UUID PRIMARY KEY,
+    first_message_at TIMESTAMPTZ NOT NULL,
+    last_message_at TIMESTAMPTZ NOT NULL,
+    turns INTEGER NOT NULL,
+    preview TEXT,
+    transcript JSONB NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS chat_sessions_archive_last_message_at_idx ON chat_sessions_archive (last_message_at DESC);
+
+DO $$
+BEGIN
+    ALTER TABLE chat_sessions_archive ALTER COLUMN transcript SET COMPRESSION lz4;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'lz4 not available, chat_sessions_archive.transcript keeps the default compression: %', SQLERRM;
+END;
+$$;
+
+-- One row per agent run, written after the AI reply is stored. message_id is
+-- deliberately not a foreign key: usage is kept when turns are deleted or
+-- archived (see migrations/002_chat_usage.sql).
+CREATE TABLE chat_usage (
+    id BIGSERIAL PRIMARY KEY,
+    session_id UUID NOT NULL,
+    message_id BIGINT,
+    request_id TEXT,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    llm_calls INTEGER NOT NULL DEFAULT 0,
+    tool_calls JSONB NOT NULL DEFAULT '{}'::JSONB,
+    cost_usd NUMERIC(12, 6),
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+CREATE INDEX IF NOT EXISTS chat_usage_session_id_idx ON chat_usage (session_id, created_at);
+CREATE INDEX IF NOT EXISTS chat_usage_model_created_at_idx ON chat_usage (model, created_at);
+
+-- Daily spend per model, for dashboards.
+CREATE OR REPLACE VIEW chat_usage_daily AS
+SELECT
+    date_trunc('day', created_at) AS day,
+    model,
+    COUNT(*) AS turns,
+    SUM(input_tokens) AS input_tokens,
+    SUM(output_tokens) AS output_tokens,
+    SUM(cached_tokens) AS cached_tokens,
+    SUM(llm_calls) AS llm_calls,
+    SUM(cost_usd) AS cost_usd
+FROM chat_usage
+GROUP BY 1, 2;
+
 -- ============================================================
--- 6. Read-Only View: vw_quotation_details
+-- 6. Read-Only Materialized View: vw_quotation_details
 -- ============================================================
-CREATE VIEW vw_quotation_details AS
-SELECT 
+-- Materialized: read on every catalog search, written only when the catalog
+-- changes; the triggers below refresh it (see migrations/004_query_indexes.sql).
+CREATE MATERIALIZED VIEW vw_quotation_details AS
+SELECT
     cb.name AS brand,
     cm.name AS model,
     cm.sub_model,
@@ -144,6 +378,53 @@ JOIN car_brands cb ON cm.brand_id = cb.id
 JOIN plan_premiums pp ON pp.car_model_id = cm.id
 JOIN insurance_plans ip ON pp.plan_id = ip.id;
 
+-- Unique key: required by REFRESH ... CONCURRENTLY, and serves create_quotation's lookup.
+CREATE UNIQUE INDEX IF NOT EXISTS vw_quotation_details_key ON vw_quotation_details (car_model_id, plan_id);
+-- search_quotation_details filters with ILIKE '%term%', which only trigram indexes can serve.
+CREATE INDEX IF NOT EXISTS vw_quotation_details_brand_trgm_idx ON vw_quotation_details USING gin (brand gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS vw_quotation_details_model_trgm_idx ON vw_quotation_details USING gin (model gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS vw_quotation_details_sub_model_trgm_idx ON vw_quotation_details USING gin (sub_model gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS vw_quotation_details_year_idx ON vw_quotation_details (year);
+
+-- Materialized views are not covered by RLS; grant what the old view allowed
+-- (the Supabase API roles; skipped on a plain local Postgres).
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        GRANT SELECT ON vw_quotation_details TO anon, authenticated, service_role;
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION refresh_quotation_details()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY vw_quotation_details;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS car_brands_refresh_quotation_details ON car_brands;
+CREATE TRIGGER car_brands_refresh_quotation_details
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON car_brands
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_quotation_details();
+DROP TRIGGER IF EXISTS car_models_refresh_quotation_details ON car_models;
+CREATE TRIGGER car_models_refresh_quotation_details
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON car_models
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_quotation_details();
+DROP TRIGGER IF EXISTS insurance_plans_refresh_quotation_details ON insurance_plans;
+CREATE TRIGGER insurance_plans_refresh_quotation_details
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON insurance_plans
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_quotation_details();
+DROP TRIGGER IF EXISTS plan_premiums_refresh_quotation_details ON plan_premiums;
+CREATE TRIGGER plan_premiums_refresh_quotation_details
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON plan_premiums
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_quotation_details();
+
 -- ============================================================
 -- 7. RLS Policies
 -- ============================================================
@@ -154,6 +435,9 @@ ALTER TABLE plan_coverages ENABLE ROW LEVEL SECURITY;
 ALTER TABLE plan_premiums ENABLE ROW LEVEL SECURITY;
 ALTER TABLE policy_documents ENABLE ROW LEVEL SECURITY;
 ALTER TABLE chat_sessions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE chat_attachments ENABLE ROW LEVEL SECURITY;
+ALTER TABLE chat_sessions_archive ENABLE ROW LEVEL SECURITY;
+ALTER TABLE chat_usage ENABLE ROW LEVEL SECURITY;
 ALTER TABLE quotations ENABLE ROW LEVEL SECURITY;
 ALTER TABLE orders ENABLE ROW LEVEL SECURITY;
 
@@ -165,6 +449,9 @@ CREATE POLICY "Allow public read on plan_premiums" ON plan_premiums FOR SELECT U
 CREATE POLICY "Allow public read on policy_documents" ON policy_documents FOR SELECT USING (true);
 CREATE POLICY "Allow service role full access to policy_documents" ON policy_documents FOR ALL USING (true);
 CREATE POLICY "Allow service role full access to chat_sessions" ON chat_sessions FOR ALL USING (true);
+CREATE POLICY "Allow service role full access to chat_attachments" ON chat_attachments FOR ALL USING (true);
+CREATE POLICY "Allow service role full access to chat_sessions_archive" ON chat_sessions_archive FOR ALL USING (true);
+CREATE POLICY "Allow service role full access to chat_usage" ON chat_usage FOR ALL USING (true);
 CREATE POLICY "Allow service role full access to quotations" ON quotations FOR ALL USING (true);
 CREATE POLICY "Allow service role full access to orders" ON orders FOR ALL USING (true);
 
@@ -204,6 +491,302 @@ BEGIN
 END;
 $$;
 
+-- Order creation in one transaction (see migrations/003_order_rpcs.sql); a
+-- lapsed quotation is marked expired on the spot (migrations/006_status_sweeps.sql).
+-- Returns {"status": "not_found" | "expired" | "exists" | "created",
+--          "quotation": {...}, "order": {...}}; order numbers are generated by
+-- the caller so their format stays in one place.
+CREATE OR REPLACE FUNCTION create_order_for_quotation(
+    p_quotation_id UUID,
+    p_payment_method VARCHAR,
+    p_order_number VARCHAR,
+    p_policy_number VARCHAR
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    q quotations%ROWTYPE;
+    o orders%ROWTYPE;
+    quotation_json JSONB;
+BEGIN
+    SELECT * INTO q FROM quotations WHERE id = p_quotation_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    IF q.status IN ('draft', 'sent') AND q.valid_until < NOW() THEN
+        UPDATE quotations SET status = 'expired', updated_at = NOW()
+        WHERE id = p_quotation_id
+        RETURNING * INTO q;
+    END IF;
+
+    quotation_json := jsonb_build_object(
+        'quotation_number', q.quotation_number,
+        'customer_name', q.customer_name,
+        'total_premium', q.total_premium,
+        'valid_until', q.valid_until,
+        'status', q.status
+    );
+
+    IF q.status = 'expired' THEN
+        RETURN jsonb_build_object('status', 'expired', 'quotation', quotation_json);
+    END IF;
+
+    SELECT * INTO o FROM orders WHERE quotation_id = p_quotation_id;
+    IF FOUND THEN
+        RETURN jsonb_build_object('status', 'exists', 'quotation', quotation_json, 'order', to_jsonb(o));
+    END IF;
+
+    INSERT INTO orders (
+        quotation_id, order_number, payment_status, payment_method,
+        policy_number, policy_start_date, policy_end_date, policy_status
+    ) VALUES (
+        p_quotation_id,
+        p_order_number,
+        CASE WHEN p_payment_method = 'pending' THEN 'pending' ELSE 'awaiting_confirmation' END,
+        p_payment_method,
+        p_policy_number,
+        CURRENT_DATE,
+        CURRENT_DATE + 365,
+        'inactive'  -- becomes active after payment
+    )
+    RETURNING * INTO o;
+
+    UPDATE quotations SET status = 'accepted', updated_at = NOW() WHERE id = p_quotation_id;
+
+    RETURN jsonb_build_object('status', 'created', 'quotation', quotation_json, 'order', to_jsonb(o));
+END;
+$$;
+
+-- Chat retention (see migrations/005_chat_sessions_partitioning.sql)
+-- Archives up to p_batch_size sessions whose last turn is older than
+-- p_idle_days, then drops the partitions that emptied. Only one caller runs at a
+-- time (the others get {"skipped": "locked"}), so every worker can schedule it.
+-- Returns {"sessions", "turns", "session_ids", "dropped_partitions", "cutoff"}.
+CREATE OR REPLACE FUNCTION archive_chat_sessions(
+    p_idle_days INT DEFAULT 90,
+    p_batch_size INT DEFAULT 200
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    cutoff TIMESTAMPTZ := NOW() - make_interval(days => p_idle_days);
+    archived_sessions INT;
+    archived_turns INT;
+    archived_ids UUID[];
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('zeus.archive_chat_sessions')) THEN
+        RETURN jsonb_build_object('skipped', 'locked');
+    END IF;
+
+    WITH batch AS (
+        SELECT old.session_id
+        FROM (SELECT DISTINCT session_id FROM chat_sessions WHERE created_at < cutoff) old
+        WHERE NOT EXISTS (
+            SELECT 1 FROM chat_sessions recent
+            WHERE recent.session_id = old.session_id AND recent.created_at >= cutoff
+        )
+        LIMIT p_batch_size
+    ),
+    turns AS (
+        SELECT cs.session_id, cs.id, cs.role, cs.message, cs.created_at,
+               (SELECT COALESCE(jsonb_agg(
+                           to_jsonb(a) - 'id' - 'message_id' - 'message_created_at' - 'session_id' ORDER BY a.id
+                       ), '[]'::JSONB)
+                FROM chat_attachments a
+                WHERE a.message_id = cs.id AND a.message_created_at = cs.created_at) AS attachments
+        FROM chat_sessions cs
+        JOIN batch USING (session_id)
+    ),
+    archived AS (
+        INSERT INTO chat_sessions_archive (session_id, first_message_at, last_message_at, turns, preview, transcript)
+        SELECT
+            session_id,
+            MIN(created_at),
+            MAX(created_at),
+            COUNT(*),
+            LEFT((ARRAY_AGG(message ORDER BY created_at) FILTER (WHERE role = 'user'))[1], 100),
+            jsonb_agg(jsonb_build_object(
+                'id', id, 'role', role, 'message', message, 'created_at', created_at, 'attachments', attachments
+            ) ORDER BY created_at, id)
+        FROM turns
+        GROUP BY session_id
+        -- A session restored and left idle again: append to what is already archived.
+        ON CONFLICT (session_id) DO UPDATE SET
+            first_message_at = LEAST(chat_sessions_archive.first_message_at, EXCLUDED.first_message_at),
+            last_message_at = GREATEST(chat_sessions_archive.last_message_at, EXCLUDED.last_message_at),
+            turns = chat_sessions_archive.turns + EXCLUDED.turns,
+            transcript = chat_sessions_archive.transcript || EXCLUDED.transcript,
+            archived_at = NOW()
+        RETURNING session_id
+    ),
+    deleted AS (
+        DELETE FROM chat_sessions cs
+        USING archived
+        WHERE cs.session_id = archived.session_id
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM archived), (SELECT COUNT(*) FROM deleted),
+           (SELECT COALESCE(array_agg(session_id), '{}') FROM archived)
+    INTO archived_sessions, archived_turns, archived_ids;
+
+    PERFORM ensure_chat_sessions_partitions(NOW(), 2);
+
+    RETURN jsonb_build_object(
+        'sessions', archived_sessions,
+        'turns', archived_turns,
+        'session_ids', to_jsonb(archived_ids),
+        'dropped_partitions', to_jsonb(drop_empty_chat_sessions_partitions(cutoff)),
+        'cutoff', cutoff
+    );
+END;
+$$;
+
+-- Moves an archived session back into chat_sessions (and its attachments back
+-- into chat_attachments) so the conversation can continue with its history.
+-- Turns keep their ids and timestamps; months whose partition was dropped land
+-- in chat_sessions_default. Returns the number of turns restored, 0 if the
+-- session is not archived.
+CREATE OR REPLACE FUNCTION restore_chat_session(p_session_id UUID)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    archive chat_sessions_archive%ROWTYPE;
+    restored INT;
+BEGIN
+    DELETE FROM chat_sessions_archive WHERE session_id = p_session_id RETURNING * INTO archive;
+    IF NOT FOUND THEN
+        RETURN 0;
+    END IF;
+
+    INSERT INTO chat_sessions (id, session_id, role, message, created_at)
+    SELECT (turn->>'id')::BIGINT, p_session_id, turn->>'role', turn->>'message', (turn->>'created_at')::TIMESTAMPTZ
+    FROM jsonb_array_elements(archive.transcript) AS turn;
+    GET DIAGNOSTICS restored = ROW_COUNT;
+
+    INSERT INTO chat_attachments (message_id, message_created_at, session_id, kind, sha256, mime_type, summary, payload, created_at)
+    SELECT (turn->>'id')::BIGINT, (turn->>'created_at')::TIMESTAMPTZ, p_session_id,
+           attachment->>'kind', attachment->>'sha256', attachment->>'mime_type', attachment->>'summary',
+           COALESCE(attachment->'payload', '{}'::JSONB), (attachment->>'created_at')::TIMESTAMPTZ
+    FROM jsonb_array_elements(archive.transcript) AS turn,
+         jsonb_array_elements(turn->'attachments') AS attachment;
+
+    RETURN restored;
+END;
+$$;
+
+-- Date-driven status sweeps (see migrations/006_status_sweeps.sql)
+-- Changes at most p_batch_size rows of each kind. Returns
+-- {"quotations_expired", "orders_expired", "policies_activated",
+--  "policies_expired"}, or {"skipped": "locked"}.
+CREATE OR REPLACE FUNCTION sweep_statuses(
+    p_batch_size INT DEFAULT 1000,
+    p_payment_days INT DEFAULT 7
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    quotations_expired INT;
+    orders_expired INT;
+    policies_activated INT;
+    policies_expired INT;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('zeus.sweep_statuses')) THEN
+        RETURN jsonb_build_object('skipped', 'locked');
+    END IF;
+
+    UPDATE quotations SET status = 'expired', updated_at = NOW()
+    WHERE id IN (
+        SELECT id FROM quotations
+        WHERE status IN ('draft', 'sent') AND valid_until < NOW()
+        ORDER BY valid_until
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    );
+    GET DIAGNOSTICS quotations_expired = ROW_COUNT;
+
+    -- The quotation of an expired order expires with it. Left 'accepted', it
+    -- could never be ordered again (orders_quotation_id_key) and
+    -- create_order_for_quotation would keep handing back the dead order.
+    WITH expired_orders AS (
+        UPDATE orders SET payment_status = 'expired', policy_status = 'cancelled', updated_at = NOW()
+        WHERE id IN (
+            SELECT id FROM orders
+            WHERE payment_status IN ('pending', 'awaiting_confirmation')
+              AND created_at < NOW() - make_interval(days => p_payment_days)
+            ORDER BY created_at
+            LIMIT p_batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING quotation_id
+    ), expired_quotations AS (
+        UPDATE quotations SET status = 'expired', updated_at = NOW()
+        WHERE id IN (SELECT quotation_id FROM expired_orders) AND status = 'accepted'
+    )
+    SELECT COUNT(*) INTO orders_expired FROM expired_orders;
+
+    UPDATE orders SET policy_status = 'active', updated_at = NOW()
+    WHERE id IN (
+        SELECT id FROM orders
+        WHERE payment_status = 'paid' AND policy_status = 'inactive'
+          AND policy_start_date <= CURRENT_DATE
+          AND (policy_end_date IS NULL OR policy_end_date >= CURRENT_DATE)
+        ORDER BY policy_start_date
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    );
+    GET DIAGNOSTICS policies_activated = ROW_COUNT;
+
+    UPDATE orders SET policy_status = 'expired', updated_at = NOW()
+    WHERE id IN (
+        SELECT id FROM orders
+        WHERE policy_status = 'active' AND policy_end_date < CURRENT_DATE
+        ORDER BY policy_end_date
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    );
+    GET DIAGNOSTICS policies_expired = ROW_COUNT;
+
+    RETURN jsonb_build_object(
+        'quotations_expired', quotations_expired,
+        'orders_expired', orders_expired,
+        'policies_activated', policies_activated,
+        'policies_expired', policies_expired
+    );
+END;
+$$;
+
+-- The partition and sweep functions run as the table owner; restore_chat_session
+-- writes chat history. Only the service may call them.
+REVOKE EXECUTE ON FUNCTION ensure_chat_sessions_partitions(TIMESTAMPTZ, INT) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION drop_empty_chat_sessions_partitions(TIMESTAMPTZ) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION archive_chat_sessions(INT, INT) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION restore_chat_session(UUID) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION sweep_statuses(INT, INT) FROM PUBLIC;
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        REVOKE EXECUTE ON FUNCTION ensure_chat_sessions_partitions(TIMESTAMPTZ, INT) FROM anon, authenticated;
+        REVOKE EXECUTE ON FUNCTION drop_empty_chat_sessions_partitions(TIMESTAMPTZ) FROM anon, authenticated;
+        REVOKE EXECUTE ON FUNCTION archive_chat_sessions(INT, INT) FROM anon, authenticated;
+        REVOKE EXECUTE ON FUNCTION restore_chat_session(UUID) FROM anon, authenticated;
+        REVOKE EXECUTE ON FUNCTION sweep_statuses(INT, INT) FROM anon, authenticated;
+        GRANT EXECUTE ON FUNCTION ensure_chat_sessions_partitions(TIMESTAMPTZ, INT) TO service_role;
+        GRANT EXECUTE ON FUNCTION archive_chat_sessions(INT, INT) TO service_role;
+        GRANT EXECUTE ON FUNCTION restore_chat_session(UUID) TO service_role;
+        GRANT EXECUTE ON FUNCTION sweep_statuses(INT, INT) TO service_role;
+    END IF;
+END;
+$$;
+
 -- ============================================================
 -- 9. Comprehensive Mock Data - Car Brands & Models
 -- ============================================================
@@ -0,0 +1,181 @@
+"""
+Non-blocking, structured logging for the service.
+
+Handlers never run on the event loop: every logger writes into a
+``QueueHandler`` and a ``QueueListener`` thread does the formatting and the
+stream I/O. Records carry the ``request_id`` / ``session_id`` of the request
+that produced them, can be emitted as JSON lines, and the per-step detail
+logged by the tools is sampled per request under load.
+
+Environment:
+
+* ``ZEUS_LOG_LEVEL``    — root level for ``zeus.*`` loggers (default ``INFO``)
+* ``ZEUS_LOG_FORMAT``   — ``json`` or ``text`` (default ``text``)
+* ``ZEUS_LOG_SAMPLE_RATE`` — fraction of requests whose ``zeus.tools`` INFO/DEBUG
+  lines are kept (default ``1.0``); warnings and errors are always kept
+"""
+
+import os
+import sys
+import copy
+import json
+import queue
+import zlib
+import atexit
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from typing import Optional
+
+from telemetry import request_id_var
+
+LOG_LEVEL = os.environ.get("ZEUS_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("ZEUS_LOG_FORMAT", "text").lower()
+LOG_SAMPLE_RATE = float(os.environ.get("ZEUS_LOG_SAMPLE_RATE", "1.0"))
+SAMPLED_LOGGER_PREFIX = "zeus.tools"
+
+session_id_var: ContextVar[Optional[str]] = ContextVar("zeus_session_id", default=None)
+
+_TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+# ── Filters ───────────────────────────────────────────────────────────────────
+
+class ContextFilter(logging.Filter):
+    """Stamp records with the correlation IDs of the current request."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.session_id = session_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the low-severity records of high-volume loggers.
+
+    The decision is made per request ID, so a sampled request keeps its whole
+    tool trace instead of random lines from many requests.
+    """
+
+    def __init__(self, prefix: str = SAMPLED_LOGGER_PREFIX, rate: float = LOG_SAMPLE_RATE) -> None:
+        super().__init__()
+        self.prefix = prefix
+        self.threshold = int(max(0.0, min(rate, 1.0)) * 0xFFFFFFFF)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not record.name.startswith(self.prefix):
+            return True
+        if self.threshold >= 0xFFFFFFFF:
+            return True
+        key = getattr(record, "request_id", None) or record.thread
+        return zlib.crc32(str(key).encode()) <= self.threshold
+
+
+# ── Formatters ────────────────────────────────────────────────────────────────
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the correlation IDs as top-level fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, _DATE_FORMAT),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "session_id": getattr(record, "session_id", None),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue the record as-is; the stdlib ``prepare`` would format the message
+    on the calling thread, which is exactly the work we want off the loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+# ── Setup ─────────────────────────────────────────────────────────────────────
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> logging.handlers.QueueListener:
+    """Route all logging through a background queue listener (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(
+        JsonFormatter() if fmt == "json" else logging.Formatter(_TEXT_FORMAT, datefmt=_DATE_FORMAT)
+    )
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    # Filters run on the calling thread, where the context variables are set.
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(logging.INFO)
+    logging.getLogger("zeus").setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def _restart_after_fork() -> None:
+    """
+    Threads do not survive ``fork()``: a worker forked from a preloaded master
+    gets a fresh queue (so the master's backlog is not printed twice) and its own
+    listener thread.
+    """
+    global _listener
+    if _listener is None:
+        return
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, _DeferredQueueHandler):
+            handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def shutdown_logging() -> None:
+    """
+    Flush queued records and stop the listener thread.
+
+    The stream handlers move onto the root logger first, so what is logged
+    afterwards (uvicorn's shutdown lines, ``serve.py``'s worker exit) is still
+    written, just on the calling thread.
+    """
+    global _listener
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _DeferredQueueHandler):
+            root.removeHandler(handler)
+            for target in _listener.handlers:
+                for record_filter in handler.filters:
+                    target.addFilter(record_filter)
+                root.addHandler(target)
+    _listener.stop()
+    _listener = None
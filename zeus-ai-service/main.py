@@ -1,29 +1,93 @@
 import os
 import json
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException
+from startup import mark_imported, readiness, warm_up
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, field_validator
 from typing import Optional, AsyncGenerator
+import time
 import uuid
+import hashlib
 
 from langchain_core.messages import HumanMessage
 from database import get_supabase_client
-from agent import create_agent_executor, build_chat_history, build_human_input
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
+from tools.policy_rag_tool import get_embeddings_model
+from agent import (
+    ENABLED_MODELS,
+    MODEL_CHOICES,
+    create_agent_executor,
+    build_chat_history,
+    build_human_input,
+    gemini_prefix_cache,
+    prompt_cache_callback,
+    STATIC_PREFIX,
+)
+from prompt_cache import GEMINI_CONTEXT_CACHE_ENABLED, prompt_cache_stats
+from image_processing import (
+    MAX_IMAGE_BYTES,
+    MAX_REQUEST_BODY_BYTES,
+    ImageValidationError,
+    ProcessedImage,
+    preprocess_image,
+)
+from chat_store import (
+    HISTORY_PAGE_MAX,
+    InvalidCursor,
+    decode_cursor,
+    fetch_history,
+    fetch_history_page,
+    history_version,
+    list_archived_sessions,
+    save_message,
+    normalize_content,
+    image_attachment,
+    model_metadata_attachment,
+    save_usage,
+    fetch_session_usage,
 )
+from vehicle_cache import CachedVehicle, VehicleFields, vehicle_cache, recognised_vehicle, tool_calls_from_messages
+from telemetry import (
+    ACTIVE_STREAMS,
+    HTTP_DURATION,
+    HTTP_REQUESTS,
+    SPAN_DURATION,
+    STREAM_TTFT,
+    TelemetryCallback,
+    configure_tracing,
+    render_metrics,
+    request_id_var,
+    shutdown_tracing,
+    span,
+)
+from shared_state import close_shared_backend
+from health import health_monitor
+from archival import chat_archiver, chat_partition_maintainer
+from chat_socket import ChatConnection, WarmSession, order_watcher
+from compression import CompressionMiddleware
+from status_sweeps import status_sweeper
+from pricing import pricing_engine
+from idempotency import REPLAYED_HEADER, IdempotencyConflict, idempotency_store, request_key
+from usage import UsageCallback
+from budget import TIMEOUT_REPLY, BudgetTracker, current_budget, iterate_until
+from logging_config import configure_logging, session_id_var, shutdown_logging
+
+configure_logging()
 logger = logging.getLogger("zeus")
-logger.setLevel(logging.INFO)
+mark_imported()
+
+# Executors built in each worker's warm-up so the first request does not pay for it.
+WARM_MODELS = [
+    m.strip() for m in os.environ.get("ZEUS_WARM_MODELS", "gemini-2.5-flash").split(",")
+    if m.strip() and (m.strip() not in MODEL_CHOICES or m.strip() in ENABLED_MODELS)
+]
 
 # ── Pydantic Models ────────────────────────────────────────────────────────────
 
@@ -35,26 +99,83 @@ class ChatRequest(BaseModel):
     message: str = Field(..., description="User's text message")
     image_base64: Optional[str] = Field(
         default=None,
-        description="Optional base64-encoded JPEG/PNG image",
+        max_length=MAX_IMAGE_BYTES * 4 // 3 + 64,
+        description="Optional base64-encoded JPEG/PNG/WebP image",
     )
     llm_model: Optional[str] = Field(
         default="gemini-2.5-flash",
         description="Select LLM model: 'gemini-2.5-flash', 'gemma-3-27b', 'ollama', or 'openrouter'",
     )
 
+    @field_validator("llm_model")
+    @classmethod
+    def _model_enabled(cls, value: Optional[str]) -> Optional[str]:
+        if value in MODEL_CHOICES and value not in ENABLED_MODELS:
+            raise ValueError(f"model {value!r} is not enabled on this service (enabled: {', '.join(ENABLED_MODELS)})")
+        return value
+
+
+class TokenUsage(BaseModel):
+    input_tokens: int
+    output_tokens: int
+    cached_tokens: int
+    total_tokens: int
+    llm_calls: int
+    tool_calls: dict[str, int]
+    cost_usd: Optional[float] = None
+    models: list[str] = []
+
 
 class ChatResponse(BaseModel):
     session_id: str
     reply: str
     model_used: str
+    usage: Optional[TokenUsage] = None
+    budget_exhausted: Optional[str] = None
 
 
 # ── App Lifespan ───────────────────────────────────────────────────────────────
 
+def _warm_up_steps() -> list:
+    """What a worker builds before it reports ready, in order; each step is timed on ``/ready``."""
+    steps = []
+    if GEMINI_CONTEXT_CACHE_ENABLED and os.environ.get("GEMINI_API_KEY") and "gemini-2.5-flash" in ENABLED_MODELS:
+        # First: a new cache name rebuilds the executors.
+        steps.append(("prefix_cache", gemini_prefix_cache.start))
+    if os.environ.get("SUPABASE_URL"):
+        steps.append(("supabase_client", get_supabase_client))
+        steps.append(("pricing_matrix", pricing_engine.try_matrix))
+    if os.environ.get("GEMINI_API_KEY"):
+        steps.append(("embedding_client", get_embeddings_model))
+    for model in WARM_MODELS:
+        steps.append((f"executor:{model}", lambda model=model: create_agent_executor(model_choice=model)))
+    return steps
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Instead of creating one executor, we will create them per-request based on the model
+    # Runs per worker. Warm-up runs in the background: /health answers at once, /ready once it is done.
+    configure_tracing()
+    health_monitor.start()
+    chat_partition_maintainer.start()
+    chat_archiver.start()
+    status_sweeper.start()
+    order_watcher.start()
+    warm_up_task = asyncio.create_task(warm_up(_warm_up_steps()))
     yield
+    # The server has already drained in-flight requests; flush what is still buffered.
+    logger.info("🛑 [SHUTDOWN] Flushing telemetry and closing shared state")
+    warm_up_task.cancel()
+    await health_monitor.close()
+    await chat_partition_maintainer.close()
+    await chat_archiver.close()
+    await status_sweeper.close()
+    await order_watcher.close()
+    if GEMINI_CONTEXT_CACHE_ENABLED:
+        await gemini_prefix_cache.close()
+    shutdown_tracing()
+    close_shared_backend()
+    shutdown_logging()
 
 
 app = FastAPI(
@@ -63,116 +184,263 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Browser origins allowed to call the API, and to open /ws/chat.
+ALLOWED_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[REPLAYED_HEADER, "ETag"],
 )
+app.add_middleware(CompressionMiddleware)
+
+
+@app.middleware("http")
+async def limit_request_body(request: Request, call_next):
+    """Reject oversized uploads from the Content-Length header before reading the body."""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_REQUEST_BODY_BYTES:
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"Request body exceeds {MAX_REQUEST_BODY_BYTES // (1024 * 1024)} MB."},
+        )
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Request span + per-route latency/status metrics; propagates X-Request-ID."""
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        with span("request", request.method, path=request.url.path):
+            response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_DURATION.observe(time.perf_counter() - start, method=request.method, route=route)
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=status)
+        request_id_var.reset(token)
+
+
+def _agent_callbacks(usage: UsageCallback, budget: BudgetTracker) -> list:
+    return [prompt_cache_callback, TelemetryCallback(), usage, budget]
 
 
 # ── Helper: Persist messages to Supabase ─────────────────────────────────────
 
-def _save_message(session_id: str, role: str, message: str) -> None:
-    client = get_supabase_client()
-    client.table("chat_sessions").insert(
-        {"session_id": session_id, "role": role, "message": message}
-    ).execute()
-
-
-def _fetch_history(session_id: str, limit: int = 20) -> list[dict]:
-    client = get_supabase_client()
-    response = (
-        client.table("chat_sessions")
-        .select("role, message")
-        .eq("session_id", session_id)
-        .order("created_at", desc=False)
-        .limit(limit)
-        .execute()
-    )
-    return response.data or []
+def _save_turn(
+    session_id: str,
+    user_message: str,
+    ai_content,
+    model: str,
+    image: Optional[ProcessedImage],
+    vehicle: Optional[VehicleFields],
+    usage: Optional[dict] = None,
+    warm: Optional[WarmSession] = None,
+) -> str:
+    """Persist a user/AI turn as plain text; image and provider metadata go to chat_attachments, usage to chat_usage."""
+    ai_reply, metadata_parts = normalize_content(ai_content)
+
+    user_attachments = []
+    if image is not None:
+        summary = f"photo of {vehicle.describe()} (ref {image.sha256[:12]})" if vehicle else None
+        user_attachments.append(image_attachment(image, summary))
+    ai_attachments = [model_metadata_attachment(model, metadata_parts)] if metadata_parts else []
+
+    with span("stage", "persist"):
+        user_row = save_message(session_id, "user", user_message, user_attachments)
+        ai_row = save_message(session_id, "ai", ai_reply, ai_attachments)
+        if usage is not None:
+            try:
+                save_usage(session_id, ai_row["id"] if ai_row else None, model, usage, request_id_var.get())
+            except Exception as exc:
+                # Accounting must never cost the user their reply.
+                logger.warning("⚠️  [USAGE] Failed to store usage: %s", exc)
+    if warm is not None:
+        warm.remember(user_row, ai_row, user_attachments, ai_attachments)
+    return ai_reply
+
+
+async def _prepare_image(request: "ChatRequest") -> Optional[ProcessedImage]:
+    """Preprocess the optional upload, mapping validation failures to HTTP 400."""
+    if not request.image_base64:
+        return None
+    try:
+        with span("stage", "image.preprocess"):
+            return await preprocess_image(request.image_base64)
+    except ImageValidationError as exc:
+        logger.warning("⚠️  [IMAGE] Rejected upload: %s", exc)
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+async def _remember_vehicle(
+    image: Optional[ProcessedImage],
+    cached: Optional[CachedVehicle],
+    tool_calls: list[tuple[str, dict]],
+    message: str,
+) -> Optional[VehicleFields]:
+    """Cache what the model read from an image it was sent, taken from its first quotation search."""
+    if image is None:
+        return None
+    if cached is not None and cached.exact:
+        return cached.fields
+    fields = recognised_vehicle(tool_calls, message)
+    if fields is not None:
+        await vehicle_cache.aput(image, fields)
+    return fields
 
 
 # ── Endpoint ──────────────────────────────────────────────────────────────────
 
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    logger.info("="*80)
+async def chat(request: ChatRequest, response: Response, idempotency_key: Optional[str] = Header(None)):
+    session_id_var.set(request.session_id)
+    logger.debug("="*80)
     logger.info("📨 [CHAT REQUEST] New chat request received")
-    logger.info(f"   Session ID: {request.session_id}")
-    logger.info(f"   Model: {request.llm_model}")
-    logger.info(f"   Message: {request.message[:100]}..." if len(request.message) > 100 else f"   Message: {request.message}")
-    logger.info(f"   Has Image: {request.image_base64 is not None}")
-    
+    logger.debug("   Session ID: %s", request.session_id)
+    logger.debug("   Model: %s", request.llm_model)
+    logger.debug("   Message: %.100s", request.message)
+    logger.debug("   Has Image: %s", request.image_base64 is not None)
+
+    key = request_key(
+        "chat", request.session_id, request.message, request.llm_model, request.image_base64, idempotency_key,
+    )
+    if key is None:
+        return await _run_chat(request)
+    try:
+        result, outcome = await idempotency_store.execute(key, lambda: _run_chat(request))
+    except IdempotencyConflict as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    if outcome != "executed":
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
+
+
+async def _run_chat(request: ChatRequest) -> dict:
+    """One agent run for ``/api/chat``; the response body as a dict, so it can be replayed."""
+    image = await _prepare_image(request)
+
     try:
         logger.info("📚 [HISTORY] Fetching chat history...")
-        raw_history = _fetch_history(request.session_id)
-        logger.info(f"   Retrieved {len(raw_history)} previous messages")
+        with span("stage", "history.fetch"):
+            raw_history = fetch_history(request.session_id, restore_archived=True)
+        logger.debug("   Retrieved %s previous messages", len(raw_history))
         chat_history = build_chat_history(raw_history)
 
-        human_input = build_human_input(request.message, request.image_base64)
+        recognised = await vehicle_cache.aget(image) if image else None
+        human_input = build_human_input(request.message, image, recognised)
 
-        logger.info(f"🤖 [AGENT] Creating agent executor with model: {request.llm_model}")
+        logger.info("🤖 [AGENT] Creating agent executor with model: %s", request.llm_model)
         # Create agent executor on the fly with the requested model
         agent_executor = create_agent_executor(model_choice=request.llm_model)
 
         messages = chat_history + [HumanMessage(content=human_input)]
+        usage_callback = UsageCallback(request.llm_model)
+        budget = BudgetTracker(model=request.llm_model)
+        budget_token = current_budget.set(budget)
         logger.info("🔄 [AGENT] Invoking agent executor...")
-        result = await agent_executor.ainvoke({"messages": messages})
+        try:
+            with span("stage", "agent.run", model=request.llm_model):
+                result = await asyncio.wait_for(
+                    agent_executor.ainvoke(
+                        {"messages": messages},
+                        config={
+                            "callbacks": _agent_callbacks(usage_callback, budget),
+                            "recursion_limit": budget.budget.recursion_limit,
+                        },
+                    ),
+                    timeout=budget.budget.hard_timeout_seconds,
+                )
+        except TimeoutError:
+            budget.timed_out()
+            result = None
+        finally:
+            current_budget.reset(budget_token)
+        usage = usage_callback.summary().to_dict()
         logger.info("✅ [AGENT] Agent execution completed")
 
-        last_message = result["messages"][-1]
-        raw_content = last_message.content if hasattr(last_message, "content") else str(last_message)
-        
-        if isinstance(raw_content, list):
-            # Extract text from multimodal response list
-            text_parts = [item["text"] for item in raw_content if isinstance(item, dict) and "text" in item]
-            ai_reply = "\n".join(text_parts) if text_parts else str(raw_content)
+        if result is None:
+            vehicle = recognised.fields if recognised is not None and recognised.exact else None
+            raw_content = TIMEOUT_REPLY
         else:
-            ai_reply = str(raw_content)
+            new_messages = result["messages"][len(messages):]
+            vehicle = await _remember_vehicle(image, recognised, tool_calls_from_messages(new_messages), request.message)
+            last_message = result["messages"][-1]
+            raw_content = last_message.content if hasattr(last_message, "content") else str(last_message)
 
         logger.info("💾 [STORAGE] Saving messages to database...")
-        _save_message(request.session_id, "user", request.message)
-        _save_message(request.session_id, "ai", ai_reply)
+        ai_reply = _save_turn(request.session_id, request.message, raw_content, request.llm_model, image, vehicle, usage)
         logger.info("✅ [STORAGE] Messages saved successfully")
 
-        logger.info(f"📤 [RESPONSE] Sending reply ({len(ai_reply)} chars)")
-        logger.info("="*80)
+        logger.info("📤 [RESPONSE] Sending reply (%s chars)", len(ai_reply))
+        logger.debug("="*80)
         return ChatResponse(
             session_id=request.session_id, 
             reply=ai_reply,
-            model_used=request.llm_model
-        )
+            model_used=request.llm_model,
+            usage=TokenUsage(**usage),
+            budget_exhausted=budget.exhausted,
+        ).model_dump()
 
     except Exception as exc:
-        logger.error(f"❌ [ERROR] Chat request failed: {exc}")
-        logger.error("="*80)
+        logger.error("❌ [ERROR] Chat request failed: %s", exc)
+        logger.debug("="*80)
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
-async def _stream_agent_response(request: ChatRequest) -> AsyncGenerator[str, None]:
-    """Generator that yields SSE-formatted chunks from the agent."""
-    logger.info("="*80)
+async def _stream_agent_response(
+    request: ChatRequest, image: Optional[ProcessedImage], warm: Optional[WarmSession] = None,
+) -> AsyncGenerator[str, None]:
+    """Generator that yields SSE-formatted chunks from the agent; ``warm`` supplies and keeps a socket session's history."""
+    session_id_var.set(request.session_id)
+    logger.debug("="*80)
     logger.info("🌊 [STREAM] Starting streaming response")
-    logger.info(f"   Session ID: {request.session_id}")
-    logger.info(f"   Model: {request.llm_model}")
-    logger.info(f"   Message: {request.message[:100]}..." if len(request.message) > 100 else f"   Message: {request.message}")
+    logger.debug("   Session ID: %s", request.session_id)
+    logger.debug("   Model: %s", request.llm_model)
+    logger.debug("   Message: %.100s", request.message)
     
+    stream_start = time.perf_counter()
     logger.info("📚 [HISTORY] Fetching chat history...")
-    raw_history = _fetch_history(request.session_id)
-    logger.info(f"   Retrieved {len(raw_history)} previous messages")
+    with span("stage", "history.fetch"):
+        if warm is not None:
+            # Blocking (version check, maybe a fetch): off the loop, which every socket of the worker shares.
+            raw_history = await asyncio.to_thread(warm.history)
+        else:
+            raw_history = fetch_history(request.session_id, restore_archived=True)
+    logger.debug("   Retrieved %s previous messages", len(raw_history))
     chat_history = build_chat_history(raw_history)
-    human_input = build_human_input(request.message, request.image_base64)
+    recognised = await vehicle_cache.aget(image) if image else None
+    human_input = build_human_input(request.message, image, recognised)
     
-    logger.info(f"🤖 [AGENT] Creating streaming agent executor with model: {request.llm_model}")
+    logger.info("🤖 [AGENT] Creating streaming agent executor with model: %s", request.llm_model)
     agent_executor = create_agent_executor(model_choice=request.llm_model)
     messages = chat_history + [HumanMessage(content=human_input)]
     logger.info("🔄 [STREAM] Starting agent event stream...")
 
     full_reply = []
+    tool_calls = []
+    usage_callback = UsageCallback(request.llm_model)
+    budget = BudgetTracker(model=request.llm_model)
+    current_budget.set(budget)
+    agent_start = time.perf_counter()
+    events = agent_executor.astream_events(
+        {"messages": messages},
+        config={
+            "callbacks": _agent_callbacks(usage_callback, budget),
+            "recursion_limit": budget.budget.recursion_limit,
+        },
+        version="v2",
+    )
     try:
-        async for event in agent_executor.astream_events({"messages": messages}, version="v2"):
+        async for event in iterate_until(events, budget.hard_deadline):
             kind = event.get("event")
             # Stream only final AI text tokens (not tool calls)
             if kind == "on_chat_model_stream":
@@ -183,60 +451,156 @@ async def _stream_agent_response(request: ChatRequest) -> AsyncGenerator[str, No
                         for part in content:
                             if isinstance(part, dict) and part.get("type") == "text":
                                 text = part["text"]
+                                if not full_reply:
+                                    STREAM_TTFT.observe(time.perf_counter() - stream_start, model=request.llm_model)
                                 full_reply.append(text)
                                 yield f"data: {json.dumps({'token': text})}\n\n"
                     elif isinstance(content, str) and content:
+                        if not full_reply:
+                            STREAM_TTFT.observe(time.perf_counter() - stream_start, model=request.llm_model)
                         full_reply.append(content)
                         yield f"data: {json.dumps({'token': content})}\n\n"
             elif kind == "on_tool_start":
                 tool_name = event.get("name", "tool")
-                logger.info(f"🔧 [TOOL START] {tool_name}")
+                logger.info("🔧 [TOOL START] %s", tool_name)
+                tool_calls.append((tool_name, event.get("data", {}).get("input") or {}))
                 yield f"data: {json.dumps({'tool_start': tool_name})}\n\n"
             elif kind == "on_tool_end":
                 tool_name = event.get("name", "tool")
-                logger.info(f"✅ [TOOL END] {tool_name}")
+                logger.info("✅ [TOOL END] %s", tool_name)
                 yield f"data: {json.dumps({'tool_end': tool_name})}\n\n"
+    except TimeoutError:
+        budget.timed_out()
+        if not full_reply:
+            full_reply.append(TIMEOUT_REPLY)
+            yield f"data: {json.dumps({'token': TIMEOUT_REPLY})}\n\n"
     except Exception as exc:
-        logger.error(f"❌ [STREAM ERROR] {exc}")
-        logger.error("="*80)
+        logger.error("❌ [STREAM ERROR] %s", exc)
+        logger.debug("="*80)
         yield f"data: {json.dumps({'error': str(exc)})}\n\n"
         return
+    finally:
+        SPAN_DURATION.observe(time.perf_counter() - agent_start, kind="stage", name="agent.run")
+        usage = usage_callback.summary().to_dict()
+
+    vehicle = await _remember_vehicle(image, recognised, tool_calls, request.message)
 
     ai_reply = "".join(full_reply)
     if ai_reply:
         logger.info("💾 [STORAGE] Saving streamed messages to database...")
-        _save_message(request.session_id, "user", request.message)
-        _save_message(request.session_id, "ai", ai_reply)
-        logger.info(f"✅ [STORAGE] Saved {len(ai_reply)} chars of AI response")
+        _save_turn(request.session_id, request.message, ai_reply, request.llm_model, image, vehicle, usage, warm)
+        logger.info("✅ [STORAGE] Saved %s chars of AI response", len(ai_reply))
 
     logger.info("🏁 [STREAM] Stream completed successfully")
-    logger.info("="*80)
-    yield f"data: {json.dumps({'done': True, 'session_id': request.session_id, 'model_used': request.llm_model})}\n\n"
+    logger.debug("="*80)
+    done = {
+        'done': True,
+        'session_id': request.session_id,
+        'model_used': request.llm_model,
+        'usage': usage,
+        'budget_exhausted': budget.exhausted,
+    }
+    yield f"data: {json.dumps(done)}\n\n"
+
+
+async def _prepared_stream(request: ChatRequest, warm: Optional[WarmSession] = None) -> AsyncGenerator[str, None]:
+    """
+    ``_stream_agent_response`` with the upload preprocessed inside the run, so a
+    replayed or coalesced duplicate does not decode it again; a rejected upload
+    is an error event.
+    """
+    try:
+        image = await _prepare_image(request)
+    except HTTPException as exc:
+        yield f"data: {json.dumps({'error': exc.detail})}\n\n"
+        return
+    async for chunk in _stream_agent_response(request, image, warm):
+        yield chunk
+
+
+async def _tracked_stream(stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """Counts open SSE streams, which a graceful shutdown waits for."""
+    ACTIVE_STREAMS.inc()
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        ACTIVE_STREAMS.inc(-1)
 
 
 @app.post("/api/chat/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(request: ChatRequest, idempotency_key: Optional[str] = Header(None)):
     """Streaming endpoint — returns Server-Sent Events (SSE).
     Each event is a JSON object:
       - { "token": "..." }         — partial AI text
       - { "tool_start": "name" }   — tool being called
       - { "tool_end": "name" }     — tool finished
       - { "error": "..." }         — error occurred
-      - { "done": true, "session_id": ..., "model_used": ... } — final event
+      - { "done": true, "session_id": ..., "model_used": ..., "usage": {...}, "budget_exhausted": null | reason } — final event
+    A replayed duplicate gets the whole reply as one token event and "replayed": true on the final event.
+    A rejected image is a 400, or an error event when the request is deduplicated (the image is only
+    processed by the run that executes).
     """
-    return StreamingResponse(
-        _stream_agent_response(request),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-        },
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    }
+    key = request_key(
+        "stream", request.session_id, request.message, request.llm_model, request.image_base64, idempotency_key,
     )
+    if key is None:
+        stream = _stream_agent_response(request, await _prepare_image(request))
+    else:
+        try:
+            stream, outcome = await idempotency_store.stream(key, lambda: _prepared_stream(request))
+        except IdempotencyConflict as exc:
+            raise HTTPException(status_code=422, detail=str(exc)) from exc
+        if outcome != "executed":
+            headers[REPLAYED_HEADER] = "true"
+    return StreamingResponse(_tracked_stream(stream), media_type="text/event-stream", headers=headers)
+
+
+async def _socket_turn(session: WarmSession, frame: dict) -> AsyncGenerator[dict, None]:
+    """One ``chat`` frame on ``/ws/chat``: the events of ``/api/chat/stream``, as dicts."""
+    request_id_var.set(uuid.uuid4().hex)
+    try:
+        fields = {name: frame[name] for name in ("message", "image_base64") if name in frame}
+        request = ChatRequest(session_id=session.session_id, llm_model=frame.get("llm_model") or session.model, **fields)
+    except ValidationError as exc:
+        error = exc.errors()[0]
+        yield {"error": f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"}
+        return
+
+    key = request_key("ws", request.session_id, request.message, request.llm_model, request.image_base64, frame.get("id"))
+    if key is None:
+        stream = _prepared_stream(request, session)
+    else:
+        try:
+            stream, outcome = await idempotency_store.stream(key, lambda: _prepared_stream(request, session))
+        except IdempotencyConflict as exc:
+            yield {"error": str(exc)}
+            return
+        if outcome != "executed":
+            # The turn was stored by the run this copy joined, not through this session.
+            session.invalidate()
+    async for chunk in stream:
+        yield json.loads(chunk[len("data: "):])
+
+
+@app.websocket("/ws/chat")
+async def chat_ws(websocket: WebSocket):
+    """Chat over one long-lived socket: several sessions, order status pushes (protocol in ``chat_socket``)."""
+    origin = websocket.headers.get("origin")
+    if origin and origin not in ALLOWED_ORIGINS:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    await ChatConnection(websocket, _socket_turn, create_agent_executor).serve()
 
 
 @app.get("/api/sessions")
-async def get_sessions():
-    """Get list of all unique chat sessions with their last message timestamp."""
+async def get_sessions(include_archived: bool = False):
+    """Get list of all unique chat sessions with their last message timestamp; archived ones on request."""
     logger.info("📋 [SESSIONS] Fetching all chat sessions")
     try:
         client = get_supabase_client()
@@ -245,7 +609,7 @@ async def get_sessions():
         response = client.table("chat_sessions").select("session_id, created_at, role, message").order("created_at", desc=True).execute()
         
         if not response.data:
-            logger.info("   No sessions found")
+            logger.debug("   No sessions found")
             return {"sessions": []}
         
         # Group by session_id and get the latest message for each
@@ -258,32 +622,215 @@ async def get_sessions():
                 sessions_dict[session_id] = {
                     "session_id": session_id,
                     "last_message_at": row["created_at"],
-                    "preview": preview
+                    "preview": preview,
+                    "archived": False,
                 }
         
         sessions = list(sessions_dict.values())
-        logger.info(f"✅ [SESSIONS] Found {len(sessions)} unique sessions")
+        if include_archived:
+            sessions += [
+                {
+                    "session_id": row["session_id"],
+                    "last_message_at": row["last_message_at"],
+                    "preview": row["preview"] or "...",
+                    "archived": True,
+                }
+                for row in list_archived_sessions()
+                if row["session_id"] not in sessions_dict
+            ]
+        logger.info("✅ [SESSIONS] Found %s unique sessions", len(sessions))
         return {"sessions": sessions}
     
     except Exception as exc:
-        logger.error(f"❌ [ERROR] Failed to fetch sessions: {exc}")
+        logger.error("❌ [ERROR] Failed to fetch sessions: %s", exc)
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
+# History is revalidated, never served from a cache unseen: "no-cache" lets a
+# client keep a copy but makes it ask with If-None-Match every time.
+HISTORY_CACHE_CONTROL = "private, no-cache"
+
+
+def _history_etag(session_id: str, version: str, query: str) -> str:
+    """A weak ETag: the session's last message id plus a digest of the requested page."""
+    digest = hashlib.sha256(f"{session_id}\n{version}\n{query}".encode("utf-8")).hexdigest()[:16]
+    return f'W/"{version}-{digest}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Weak comparison (RFC 9110 §13.1.2): the W/ prefix does not matter.
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def _ndjson(value: dict) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str) + "\n"
+
+
+async def _history_ndjson(session_id: str, after: Optional[str]) -> AsyncGenerator[str, None]:
+    """Every turn after the cursor, one JSON object per line, read from the database a page at a time."""
+    cursor, count = after, 0
+    try:
+        while True:
+            page = await asyncio.to_thread(fetch_history_page, session_id, HISTORY_PAGE_MAX, after=cursor)
+            if count == 0:
+                yield _ndjson({"type": "session", "session_id": session_id,
+                               "archived": page.archived, "archived_at": page.archived_at})
+            for message in page.messages:
+                yield _ndjson({"type": "message", **message})
+            count += len(page.messages)
+            cursor = page.after_cursor or cursor
+            if not page.has_more_after:
+                break
+    except Exception as exc:
+        logger.error("❌ [ERROR] History export failed: %s", exc)
+        yield _ndjson({"type": "error", "error": str(exc)})
+        return
+    logger.info("✅ [HISTORY] Exported %s messages", count)
+    yield _ndjson({"type": "end", "count": count, "after_cursor": cursor})
+
+
 @app.get("/api/history/{session_id}")
-async def get_history(session_id: str):
-    """Get full chat history for a specific session."""
-    logger.info(f"📚 [HISTORY] Fetching history for session: {session_id}")
+async def get_history(
+    session_id: str,
+    request: Request,
+    limit: int = Query(100, ge=1, le=HISTORY_PAGE_MAX),
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    latest: bool = False,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """
+    A page of a session's chat history, oldest first: the first ``limit`` turns,
+    the ones after or before a cursor, or with ``latest`` the last ones.
+    ``format=ndjson`` streams every turn after ``after`` instead. Answers
+    ``If-None-Match`` with 304 while no turn was added to the session.
+    """
+    session_id_var.set(session_id)
+    if after and before:
+        raise HTTPException(status_code=422, detail="Pass either after or before, not both.")
+    if format == "ndjson" and (before or latest):
+        raise HTTPException(status_code=422, detail="format=ndjson streams forward; page with after.")
     try:
-        raw_history = _fetch_history(session_id, limit=100)
-        logger.info(f"✅ [HISTORY] Retrieved {len(raw_history)} messages")
-        return {"session_id": session_id, "messages": raw_history}
-    
+        for cursor in (after, before):
+            if cursor:
+                decode_cursor(cursor)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    try:
+        version = await asyncio.to_thread(history_version, session_id)
+    except Exception as exc:
+        logger.error("❌ [ERROR] Failed to fetch history: %s", exc)
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+    etag = _history_etag(session_id, version, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": HISTORY_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        logger.debug("   History not modified (%s)", etag)
+        return Response(status_code=304, headers=headers)
+
+    if format == "ndjson":
+        logger.info("📚 [HISTORY] Exporting history for session: %s", session_id)
+        return StreamingResponse(
+            _history_ndjson(session_id, after), media_type="application/x-ndjson", headers=headers,
+        )
+
+    logger.info("📚 [HISTORY] Fetching history for session: %s", session_id)
+    try:
+        page = await asyncio.to_thread(fetch_history_page, session_id, limit, after, before, latest)
+    except Exception as exc:
+        logger.error("❌ [ERROR] Failed to fetch history: %s", exc)
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+    logger.info("✅ [HISTORY] Retrieved %s %smessages", len(page.messages), "archived " if page.archived else "")
+    body = {
+        "session_id": session_id,
+        "messages": page.messages,
+        "archived": page.archived,
+        "page": {
+            "limit": limit,
+            "has_more_before": page.has_more_before,
+            "has_more_after": page.has_more_after,
+            # An empty page keeps the cursor it was asked with, so a client can keep polling from it.
+            "before_cursor": page.before_cursor or before,
+            "after_cursor": page.after_cursor or after,
+        },
+    }
+    if page.archived:
+        body["archived_at"] = page.archived_at
+    return JSONResponse(body, headers=headers)
+
+
+@app.get("/api/usage/{session_id}")
+async def get_usage(session_id: str):
+    """Token, tool-call and cost totals of a session, with one row per turn."""
+    session_id_var.set(session_id)
+    try:
+        return await asyncio.to_thread(fetch_session_usage, session_id)
     except Exception as exc:
-        logger.error(f"❌ [ERROR] Failed to fetch history: {exc}")
+        logger.error("❌ [ERROR] Failed to fetch usage: %s", exc)
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus exposition of span latencies, TTFT, HTTP and cache counters."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/prompt-cache")
+async def prompt_cache_metrics():
+    """Cached vs. uncached prompt tokens since process start."""
+    return {
+        "static_prefix": {
+            "digest": STATIC_PREFIX.digest,
+            "tokens_estimated": STATIC_PREFIX.token_estimate,
+            "gemini_cached_content": gemini_prefix_cache.name,
+        },
+        **prompt_cache_stats.snapshot(),
+    }
+
+
+@app.get("/metrics/vehicle-cache")
+async def vehicle_cache_metrics():
+    """Hit/miss/eviction counters of the image → vehicle recognition cache."""
+    return vehicle_cache.stats()
+
+
 @app.get("/health")
 async def health():
+    """Liveness: the process is up and serving."""
     return {"status": "ok", "service": "zeus-ai-service"}
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: 503 until this worker has finished warm-up and while a critical
+    dependency is down. Reads cached probe results only.
+    """
+    unavailable = health_monitor.critical_down()
+    body = {
+        "service": "zeus-ai-service",
+        "enabled_models": ENABLED_MODELS,
+        **readiness.to_dict(),
+        "ready": readiness.ready and not unavailable,
+        "warmed_up": readiness.ready,
+        "unavailable": unavailable,
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+@app.get("/health/deep")
+async def deep_health():
+    """Last background probe of every dependency, with latency; 503 while a critical one is down."""
+    unavailable = health_monitor.critical_down()
+    body = {
+        "status": "degraded" if unavailable else "ok",
+        "service": "zeus-ai-service",
+        "unavailable": unavailable,
+        **health_monitor.report(),
+    }
+    return JSONResponse(body, status_code=503 if unavailable else 200)
@@ -0,0 +1,76 @@
+-- ============================================================
+-- 001: Out-of-band chat attachments
+-- ============================================================
+-- chat_sessions.message holds plain text only. Uploaded images and provider
+-- metadata (e.g. Gemini thought signatures) are stored here and never replayed
+-- to the model; history replay only reads `summary`.
+--
+-- Existing rows whose message is a serialized multimodal list are normalized
+-- to text by the service on read, and by the backfill at the end of this file.
+
+CREATE TABLE IF NOT EXISTS chat_attachments (
+    id BIGSERIAL PRIMARY KEY,
+    message_id BIGINT NOT NULL REFERENCES chat_sessions(id) ON DELETE CASCADE,
+    session_id UUID NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('image', 'model_metadata')),
+    sha256 TEXT,
+    mime_type TEXT,
+    summary TEXT,
+    payload JSONB NOT NULL DEFAULT '{}'::JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS chat_attachments_message_id_idx ON chat_attachments (message_id);
+CREATE INDEX IF NOT EXISTS chat_attachments_sha256_idx ON chat_attachments (sha256) WHERE sha256 IS NOT NULL;
+
+ALTER TABLE chat_attachments ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow service role full access to chat_attachments" ON chat_attachments;
+CREATE POLICY "Allow service role full access to chat_attachments" ON chat_attachments FOR ALL USING (true);
+
+-- Backfill: move the non-text parts of legacy multimodal AI rows into
+-- chat_attachments, then keep only their concatenated text.
+CREATE OR REPLACE FUNCTION pg_temp.try_jsonb(value TEXT)
+RETURNS JSONB
+LANGUAGE plpgsql IMMUTABLE
+AS $$
+BEGIN
+    RETURN value::JSONB;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$;
+
+WITH legacy AS MATERIALIZED (
+    SELECT id, session_id, pg_temp.try_jsonb(message) AS parts
+    FROM chat_sessions
+    WHERE role = 'ai'
+      AND message LIKE '[{%'
+      AND jsonb_typeof(pg_temp.try_jsonb(message)) = 'array'
+)
+INSERT INTO chat_attachments (message_id, session_id, kind, summary, payload)
+SELECT
+    l.id,
+    l.session_id,
+    'model_metadata',
+    'legacy multimodal metadata',
+    jsonb_build_object('parts', jsonb_agg(part - 'type' - 'text'))
+FROM legacy l, jsonb_array_elements(l.parts) AS part
+WHERE (part - 'type' - 'text') <> '{}'::JSONB
+GROUP BY l.id, l.session_id;
+
+WITH legacy AS MATERIALIZED (
+    SELECT id, pg_temp.try_jsonb(message) AS parts
+    FROM chat_sessions
+    WHERE role = 'ai'
+      AND message LIKE '[{%'
+      AND jsonb_typeof(pg_temp.try_jsonb(message)) = 'array'
+)
+UPDATE chat_sessions cs
+SET message = sub.text
+FROM (
+    SELECT l.id, string_agg(part ->> 'text', E'\n') AS text
+    FROM legacy l, jsonb_array_elements(l.parts) AS part
+    WHERE part ? 'text'
+    GROUP BY l.id
+) sub
+WHERE cs.id = sub.id;
@@ -0,0 +1,43 @@
+-- ============================================================
+-- 002: Per-turn token and cost accounting
+-- ============================================================
+-- One row per agent run (/api/chat or /api/chat/stream), written by the
+-- service after the AI reply is stored. message_id points at that AI row but
+-- is deliberately not a foreign key: usage history is kept even when chat
+-- turns are deleted or archived.
+
+CREATE TABLE IF NOT EXISTS chat_usage (
+    id BIGSERIAL PRIMARY KEY,
+    session_id UUID NOT NULL,
+    message_id BIGINT,
+    request_id TEXT,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    llm_calls INTEGER NOT NULL DEFAULT 0,
+    tool_calls JSONB NOT NULL DEFAULT '{}'::JSONB,
+    cost_usd NUMERIC(12, 6),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS chat_usage_session_id_idx ON chat_usage (session_id, created_at);
+CREATE INDEX IF NOT EXISTS chat_usage_model_created_at_idx ON chat_usage (model, created_at);
+
+ALTER TABLE chat_usage ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow service role full access to chat_usage" ON chat_usage;
+CREATE POLICY "Allow service role full access to chat_usage" ON chat_usage FOR ALL USING (true);
+
+-- Daily spend per model, for dashboards.
+CREATE OR REPLACE VIEW chat_usage_daily AS
+SELECT
+    date_trunc('day', created_at) AS day,
+    model,
+    COUNT(*) AS turns,
+    SUM(input_tokens) AS input_tokens,
+    SUM(output_tokens) AS output_tokens,
+    SUM(cached_tokens) AS cached_tokens,
+    SUM(llm_calls) AS llm_calls,
+    SUM(cost_usd) AS cost_usd
+FROM chat_usage
+GROUP BY 1, 2;
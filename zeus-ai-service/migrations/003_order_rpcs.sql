@@ -0,0 +1,74 @@
+-- ============================================================
+-- 003: Transactional order creation
+-- ============================================================
+-- create_order used to take four round trips (read quotation, look for an
+-- existing order, insert, mark the quotation accepted), and a retry racing the
+-- first call could insert two orders. create_order_for_quotation does it in one
+-- call and one transaction: the quotation row is locked, so concurrent calls
+-- for the same quotation serialize and all but the first get the existing order.
+--
+-- The unique index is the backstop. It fails to build if duplicates already
+-- exist; find them with
+--   SELECT quotation_id, COUNT(*) FROM orders GROUP BY 1 HAVING COUNT(*) > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS orders_quotation_id_key ON orders (quotation_id);
+
+-- Returns {"status": "not_found" | "expired" | "exists" | "created",
+--          "quotation": {...}, "order": {...}}; order numbers are generated by
+-- the caller so their format stays in one place.
+CREATE OR REPLACE FUNCTION create_order_for_quotation(
+    p_quotation_id UUID,
+    p_payment_method VARCHAR,
+    p_order_number VARCHAR,
+    p_policy_number VARCHAR
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    q quotations%ROWTYPE;
+    o orders%ROWTYPE;
+    quotation_json JSONB;
+BEGIN
+    SELECT * INTO q FROM quotations WHERE id = p_quotation_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    quotation_json := jsonb_build_object(
+        'quotation_number', q.quotation_number,
+        'customer_name', q.customer_name,
+        'total_premium', q.total_premium,
+        'valid_until', q.valid_until,
+        'status', q.status
+    );
+
+    IF q.valid_until < NOW() OR q.status = 'expired' THEN
+        RETURN jsonb_build_object('status', 'expired', 'quotation', quotation_json);
+    END IF;
+
+    SELECT * INTO o FROM orders WHERE quotation_id = p_quotation_id;
+    IF FOUND THEN
+        RETURN jsonb_build_object('status', 'exists', 'quotation', quotation_json, 'order', to_jsonb(o));
+    END IF;
+
+    INSERT INTO orders (
+        quotation_id, order_number, payment_status, payment_method,
+        policy_number, policy_start_date, policy_end_date, policy_status
+    ) VALUES (
+        p_quotation_id,
+        p_order_number,
+        CASE WHEN p_payment_method = 'pending' THEN 'pending' ELSE 'awaiting_confirmation' END,
+        p_payment_method,
+        p_policy_number,
+        CURRENT_DATE,
+        CURRENT_DATE + 365,
+        'inactive'  -- becomes active after payment
+    )
+    RETURNING * INTO o;
+
+    UPDATE quotations SET status = 'accepted', updated_at = NOW() WHERE id = p_quotation_id;
+
+    RETURN jsonb_build_object('status', 'created', 'quotation', quotation_json, 'order', to_jsonb(o));
+END;
+$$;
@@ -0,0 +1,144 @@
+-- ============================================================
+-- 004: Indexes for the hot query paths
+-- ============================================================
+-- Every query the service runs per chat turn or tool call, and the index that
+-- serves it (bench/explain_check.py asserts these plans):
+--
+--   history fetch      chat_sessions  session_id = ? ORDER BY created_at LIMIT n
+--   session list       chat_sessions  ORDER BY created_at DESC
+--   usage by session   chat_usage     (002 already indexes it)
+--   quotations of a    quotations     session_id = ?
+--     session
+--   order by quotation orders         quotation_id = ?  (unique, see 003)
+--   catalog search     vw_quotation_details  brand/model/sub_model ILIKE '%x%'
+--   quotation lookup   vw_quotation_details  car_model_id = ? AND plan_id = ?
+--   policy search      policy_documents      ORDER BY embedding <=> ? LIMIT k
+--
+-- vw_quotation_details becomes a materialized view. The catalog is a four-way
+-- join read on every search but written only when brands, models, plans or
+-- premiums change. Statement-level triggers on those tables refresh it
+-- CONCURRENTLY, so readers never block and never see stale prices. The view
+-- is a few hundred rows, so a refresh takes milliseconds.
+--
+-- A concurrent refresh needs the view's (car_model_id, plan_id) key to be
+-- unique. Without a matching constraint on plan_premiums, a duplicate premium
+-- row would make every refresh fail and abort the catalog write that fired
+-- it. The constraint fails to build if duplicates already exist; find them with
+--   SELECT car_model_id, plan_id, COUNT(*) FROM plan_premiums GROUP BY 1, 2 HAVING COUNT(*) > 1;
+--
+-- Safe to re-run.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- ── Chat history ─────────────────────────────────────────────────────────────
+CREATE INDEX IF NOT EXISTS chat_sessions_session_id_created_at_idx ON chat_sessions (session_id, created_at);
+CREATE INDEX IF NOT EXISTS chat_sessions_created_at_idx ON chat_sessions (created_at DESC);
+
+-- ── Quotations & orders ──────────────────────────────────────────────────────
+CREATE INDEX IF NOT EXISTS quotations_session_id_idx ON quotations (session_id);
+CREATE UNIQUE INDEX IF NOT EXISTS orders_quotation_id_key ON orders (quotation_id);
+
+-- ── Catalog joins ────────────────────────────────────────────────────────────
+CREATE INDEX IF NOT EXISTS car_models_brand_id_idx ON car_models (brand_id);
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'plan_premiums_car_model_id_plan_id_key') THEN
+        ALTER TABLE plan_premiums
+            ADD CONSTRAINT plan_premiums_car_model_id_plan_id_key UNIQUE (car_model_id, plan_id);
+    END IF;
+END;
+$$;
+DROP INDEX IF EXISTS plan_premiums_car_model_id_plan_id_idx;
+CREATE INDEX IF NOT EXISTS plan_premiums_plan_id_idx ON plan_premiums (plan_id);
+
+-- ── Materialized catalog view ────────────────────────────────────────────────
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_views WHERE schemaname = 'public' AND viewname = 'vw_quotation_details') THEN
+        DROP VIEW vw_quotation_details;
+    END IF;
+END;
+$$;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS vw_quotation_details AS
+SELECT
+    cb.name AS brand,
+    cm.name AS model,
+    cm.sub_model,
+    cm.year,
+    cm.estimated_price AS car_estimated_price,
+    ip.plan_type,
+    ip.plan_name,
+    ip.insurer_name,
+    pp.base_premium,
+    pp.deductible,
+    cm.id AS car_model_id,
+    ip.id AS plan_id
+FROM car_models cm
+JOIN car_brands cb ON cm.brand_id = cb.id
+JOIN plan_premiums pp ON pp.car_model_id = cm.id
+JOIN insurance_plans ip ON pp.plan_id = ip.id;
+
+-- Unique key: required by REFRESH ... CONCURRENTLY, and serves create_quotation's lookup.
+CREATE UNIQUE INDEX IF NOT EXISTS vw_quotation_details_key ON vw_quotation_details (car_model_id, plan_id);
+-- search_quotation_details filters with ILIKE '%term%', which only trigram indexes can serve.
+CREATE INDEX IF NOT EXISTS vw_quotation_details_brand_trgm_idx ON vw_quotation_details USING gin (brand gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS vw_quotation_details_model_trgm_idx ON vw_quotation_details USING gin (model gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS vw_quotation_details_sub_model_trgm_idx ON vw_quotation_details USING gin (sub_model gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS vw_quotation_details_year_idx ON vw_quotation_details (year);
+
+-- Materialized views are not covered by RLS; grant what the old view allowed
+-- (the Supabase API roles; skipped on a plain local Postgres).
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        GRANT SELECT ON vw_quotation_details TO anon, authenticated, service_role;
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION refresh_quotation_details()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY vw_quotation_details;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS car_brands_refresh_quotation_details ON car_brands;
+CREATE TRIGGER car_brands_refresh_quotation_details
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON car_brands
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_quotation_details();
+DROP TRIGGER IF EXISTS car_models_refresh_quotation_details ON car_models;
+CREATE TRIGGER car_models_refresh_quotation_details
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON car_models
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_quotation_details();
+DROP TRIGGER IF EXISTS insurance_plans_refresh_quotation_details ON insurance_plans;
+CREATE TRIGGER insurance_plans_refresh_quotation_details
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON insurance_plans
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_quotation_details();
+DROP TRIGGER IF EXISTS plan_premiums_refresh_quotation_details ON plan_premiums;
+CREATE TRIGGER plan_premiums_refresh_quotation_details
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON plan_premiums
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_quotation_details();
+
+-- ── Policy document vectors ──────────────────────────────────────────────────
+-- ivfflat with lists = 100 was sized for ~100k rows; with under a thousand
+-- documents most lists are empty and probes = 1 misses matches. HNSW needs no
+-- training, keeps recall at any corpus size and supports the 2000 dimensions.
+DROP INDEX IF EXISTS policy_documents_embedding_idx;
+CREATE INDEX IF NOT EXISTS policy_documents_embedding_hnsw_idx
+    ON policy_documents
+    USING hnsw (embedding vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+CREATE INDEX IF NOT EXISTS policy_documents_section_idx ON policy_documents (section);
+
+ANALYZE chat_sessions;
+ANALYZE quotations;
+ANALYZE orders;
+ANALYZE policy_documents;
+ANALYZE vw_quotation_details;
@@ -0,0 +1,373 @@
+-- ============================================================
+-- 005: Monthly partitions and an archive for chat history
+-- ============================================================
+-- chat_sessions grew forever. Every turn and every attachment (uploaded images
+-- included) stayed in the tables that the history reads and inserts touch.
+-- After this migration:
+--
+--   chat_sessions          PARTITION BY RANGE (created_at), one partition per
+--                          month (chat_sessions_pYYYYMM) plus a DEFAULT one.
+--                          The primary key becomes (id, created_at) because a
+--                          partitioned table's unique keys must include the
+--                          partition key. ids still come from the same sequence.
+--   chat_attachments       gains message_created_at, and its foreign key becomes
+--                          (message_id, message_created_at). PostgREST embeds
+--                          chat_attachments(...) in history reads exactly as before.
+--   chat_sessions_archive  one row per archived session. The whole transcript,
+--                          attachments and payloads included, is one JSONB
+--                          document, TOAST-compressed (lz4 where the server has it).
+--
+-- archive_chat_sessions() moves sessions idle for longer than the retention
+-- period to the archive in small batches, then drops monthly partitions that
+-- are empty and past the cutoff. The service calls it from archival.py.
+-- restore_chat_session() moves an archived session back when someone writes to
+-- it again.
+--
+-- Converting the table copies every row once, under an exclusive lock. Run it
+-- in a quiet window. Safe to re-run.
+
+-- ── Partition maintenance ────────────────────────────────────────────────────
+-- Creates the monthly partitions from p_from's month through p_months_ahead
+-- months after the current one. Returns how many partitions it created.
+-- Turns that landed in chat_sessions_default because a month's partition was
+-- missing move into that partition when it is created.
+CREATE OR REPLACE FUNCTION ensure_chat_sessions_partitions(
+    p_from TIMESTAMPTZ DEFAULT NOW(),
+    p_months_ahead INT DEFAULT 2
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', p_from AT TIME ZONE 'UTC');
+    last_month TIMESTAMP := date_trunc('month', NOW() AT TIME ZONE 'UTC') + make_interval(months => p_months_ahead);
+    partition_name TEXT;
+    range_from TIMESTAMPTZ;
+    range_to TIMESTAMPTZ;
+    created INT := 0;
+BEGIN
+    -- Every worker calls this; one at a time creates partitions.
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_chat_sessions_partitions'));
+    WHILE month_start <= last_month LOOP
+        partition_name := 'chat_sessions_p' || to_char(month_start, 'YYYYMM');
+        range_from := month_start AT TIME ZONE 'UTC';
+        range_to := (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC';
+        IF to_regclass(partition_name) IS NULL THEN
+            IF EXISTS (SELECT 1 FROM chat_sessions_default WHERE created_at >= range_from AND created_at < range_to) THEN
+                -- A partition cannot be created while the default partition holds
+                -- rows of its range: detach the default, create the month, move the
+                -- rows, re-attach. chat_attachments' foreign key would block the
+                -- detach, so it is dropped and re-added in the same transaction.
+                ALTER TABLE chat_attachments DROP CONSTRAINT IF EXISTS chat_attachments_message_fkey;
+                ALTER TABLE chat_sessions DETACH PARTITION chat_sessions_default;
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF chat_sessions FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, range_from, range_to
+                );
+                INSERT INTO chat_sessions (id, session_id, role, message, created_at)
+                SELECT id, session_id, role, message, created_at
+                FROM chat_sessions_default
+                WHERE created_at >= range_from AND created_at < range_to;
+                DELETE FROM chat_sessions_default WHERE created_at >= range_from AND created_at < range_to;
+                ALTER TABLE chat_sessions ATTACH PARTITION chat_sessions_default DEFAULT;
+                ALTER TABLE chat_attachments
+                    ADD CONSTRAINT chat_attachments_message_fkey
+                    FOREIGN KEY (message_id, message_created_at)
+                    REFERENCES chat_sessions (id, created_at) ON DELETE CASCADE;
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF chat_sessions FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, range_from, range_to
+                );
+            END IF;
+            created := created + 1;
+        END IF;
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+-- Drops the monthly partitions that end before p_before and hold no rows.
+CREATE OR REPLACE FUNCTION drop_empty_chat_sessions_partitions(p_before TIMESTAMPTZ)
+RETURNS TEXT[]
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    partition_name TEXT;
+    has_rows BOOLEAN;
+    dropped TEXT[] := '{}';
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'chat_sessions'::regclass
+          AND c.relname ~ '^chat_sessions_p[0-9]{6}$'
+          AND (to_date(substr(c.relname, 16), 'YYYYMM') + INTERVAL '1 month') AT TIME ZONE 'UTC' <= p_before
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I)', partition_name) INTO has_rows;
+        IF NOT has_rows THEN
+            -- Detach first: chat_attachments' foreign key blocks a plain DROP.
+            EXECUTE format('ALTER TABLE chat_sessions DETACH PARTITION %I', partition_name);
+            EXECUTE format('DROP TABLE %I', partition_name);
+            dropped := dropped || partition_name;
+        END IF;
+    END LOOP;
+    RETURN dropped;
+END;
+$$;
+
+-- ── Partitioned chat_sessions ────────────────────────────────────────────────
+DO $$
+DECLARE
+    oldest TIMESTAMPTZ;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'chat_sessions'::regclass) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE chat_attachments DROP CONSTRAINT IF EXISTS chat_attachments_message_id_fkey;
+    ALTER TABLE chat_sessions RENAME TO chat_sessions_unpartitioned;
+    ALTER TABLE chat_sessions_unpartitioned RENAME CONSTRAINT chat_sessions_pkey TO chat_sessions_unpartitioned_pkey;
+    DROP INDEX IF EXISTS chat_sessions_session_id_created_at_idx;
+    DROP INDEX IF EXISTS chat_sessions_created_at_idx;
+
+    CREATE TABLE chat_sessions (
+        id BIGINT NOT NULL DEFAULT nextval('chat_sessions_id_seq'),
+        session_id UUID NOT NULL,
+        role TEXT NOT NULL CHECK (role IN ('user', 'ai')),
+        message TEXT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+    ALTER SEQUENCE chat_sessions_id_seq OWNED BY chat_sessions.id;
+    CREATE TABLE chat_sessions_default PARTITION OF chat_sessions DEFAULT;
+
+    SELECT MIN(created_at) INTO oldest FROM chat_sessions_unpartitioned;
+    PERFORM ensure_chat_sessions_partitions(COALESCE(oldest, NOW()), 2);
+
+    INSERT INTO chat_sessions (id, session_id, role, message, created_at)
+    SELECT id, session_id, role, message, created_at FROM chat_sessions_unpartitioned;
+    DROP TABLE chat_sessions_unpartitioned;
+END;
+$$;
+
+CREATE INDEX IF NOT EXISTS chat_sessions_session_id_created_at_idx ON chat_sessions (session_id, created_at);
+CREATE INDEX IF NOT EXISTS chat_sessions_created_at_idx ON chat_sessions (created_at DESC);
+
+ALTER TABLE chat_sessions ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow service role full access to chat_sessions" ON chat_sessions;
+CREATE POLICY "Allow service role full access to chat_sessions" ON chat_sessions FOR ALL USING (true);
+
+-- ── Attachments follow their turn's partition key ────────────────────────────
+ALTER TABLE chat_attachments ADD COLUMN IF NOT EXISTS message_created_at TIMESTAMPTZ;
+UPDATE chat_attachments a
+SET message_created_at = cs.created_at
+FROM chat_sessions cs
+WHERE cs.id = a.message_id AND a.message_created_at IS NULL;
+ALTER TABLE chat_attachments ALTER COLUMN message_created_at SET NOT NULL;
+
+-- The service passes message_created_at; this keeps writers that only know
+-- message_id (older deployments during a rollout, scripts) working.
+CREATE OR REPLACE FUNCTION chat_attachments_fill_message_created_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    SELECT created_at INTO NEW.message_created_at FROM chat_sessions WHERE id = NEW.message_id;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS chat_attachments_fill_message_created_at ON chat_attachments;
+CREATE TRIGGER chat_attachments_fill_message_created_at
+    BEFORE INSERT ON chat_attachments
+    FOR EACH ROW WHEN (NEW.message_created_at IS NULL)
+    EXECUTE FUNCTION chat_attachments_fill_message_created_at();
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'chat_attachments_message_fkey') THEN
+        ALTER TABLE chat_attachments
+            ADD CONSTRAINT chat_attachments_message_fkey
+            FOREIGN KEY (message_id, message_created_at)
+            REFERENCES chat_sessions (id, created_at) ON DELETE CASCADE;
+    END IF;
+END;
+$$;
+
+-- ── Archive ──────────────────────────────────────────────────────────────────
+-- transcript: [{"id", "role", "message", "created_at", "attachments": [...]}]
+-- in created_at order; attachments keep their payloads.
+CREATE TABLE IF NOT EXISTS chat_sessions_archive (
+    session_id UUID PRIMARY KEY,
+    first_message_at TIMESTAMPTZ NOT NULL,
+    last_message_at TIMESTAMPTZ NOT NULL,
+    turns INTEGER NOT NULL,
+    preview TEXT,
+    transcript JSONB NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS chat_sessions_archive_last_message_at_idx ON chat_sessions_archive (last_message_at DESC);
+
+DO $$
+BEGIN
+    ALTER TABLE chat_sessions_archive ALTER COLUMN transcript SET COMPRESSION lz4;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'lz4 not available, chat_sessions_archive.transcript keeps the default compression: %', SQLERRM;
+END;
+$$;
+
+ALTER TABLE chat_sessions_archive ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow service role full access to chat_sessions_archive" ON chat_sessions_archive;
+CREATE POLICY "Allow service role full access to chat_sessions_archive" ON chat_sessions_archive FOR ALL USING (true);
+
+-- Archives up to p_batch_size sessions whose last turn is older than
+-- p_idle_days, then drops the partitions that emptied. Only one caller runs at a
+-- time (the others get {"skipped": "locked"}), so every worker can schedule it.
+-- Returns {"sessions", "turns", "session_ids", "dropped_partitions", "cutoff"}.
+CREATE OR REPLACE FUNCTION archive_chat_sessions(
+    p_idle_days INT DEFAULT 90,
+    p_batch_size INT DEFAULT 200
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    cutoff TIMESTAMPTZ := NOW() - make_interval(days => p_idle_days);
+    archived_sessions INT;
+    archived_turns INT;
+    archived_ids UUID[];
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('zeus.archive_chat_sessions')) THEN
+        RETURN jsonb_build_object('skipped', 'locked');
+    END IF;
+
+    WITH batch AS (
+        SELECT old.session_id
+        FROM (SELECT DISTINCT session_id FROM chat_sessions WHERE created_at < cutoff) old
+        WHERE NOT EXISTS (
+            SELECT 1 FROM chat_sessions recent
+            WHERE recent.session_id = old.session_id AND recent.created_at >= cutoff
+        )
+        LIMIT p_batch_size
+    ),
+    turns AS (
+        SELECT cs.session_id, cs.id, cs.role, cs.message, cs.created_at,
+               (SELECT COALESCE(jsonb_agg(
+                           to_jsonb(a) - 'id' - 'message_id' - 'message_created_at' - 'session_id' ORDER BY a.id
+                       ), '[]'::JSONB)
+                FROM chat_attachments a
+                WHERE a.message_id = cs.id AND a.message_created_at = cs.created_at) AS attachments
+        FROM chat_sessions cs
+        JOIN batch USING (session_id)
+    ),
+    archived AS (
+        INSERT INTO chat_sessions_archive (session_id, first_message_at, last_message_at, turns, preview, transcript)
+        SELECT
+            session_id,
+            MIN(created_at),
+            MAX(created_at),
+            COUNT(*),
+            LEFT((ARRAY_AGG(message ORDER BY created_at) FILTER (WHERE role = 'user'))[1], 100),
+            jsonb_agg(jsonb_build_object(
+                'id', id, 'role', role, 'message', message, 'created_at', created_at, 'attachments', attachments
+            ) ORDER BY created_at, id)
+        FROM turns
+        GROUP BY session_id
+        -- A session restored and left idle again: append to what is already archived.
+        ON CONFLICT (session_id) DO UPDATE SET
+            first_message_at = LEAST(chat_sessions_archive.first_message_at, EXCLUDED.first_message_at),
+            last_message_at = GREATEST(chat_sessions_archive.last_message_at, EXCLUDED.last_message_at),
+            turns = chat_sessions_archive.turns + EXCLUDED.turns,
+            transcript = chat_sessions_archive.transcript || EXCLUDED.transcript,
+            archived_at = NOW()
+        RETURNING session_id
+    ),
+    deleted AS (
+        DELETE FROM chat_sessions cs
+        USING archived
+        WHERE cs.session_id = archived.session_id
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM archived), (SELECT COUNT(*) FROM deleted),
+           (SELECT COALESCE(array_agg(session_id), '{}') FROM archived)
+    INTO archived_sessions, archived_turns, archived_ids;
+
+    PERFORM ensure_chat_sessions_partitions(NOW(), 2);
+
+    RETURN jsonb_build_object(
+        'sessions', archived_sessions,
+        'turns', archived_turns,
+        'session_ids', to_jsonb(archived_ids),
+        'dropped_partitions', to_jsonb(drop_empty_chat_sessions_partitions(cutoff)),
+        'cutoff', cutoff
+    );
+END;
+$$;
+
+-- Moves an archived session back into chat_sessions (and its attachments back
+-- into chat_attachments) so the conversation can continue with its history.
+-- Turns keep their ids and timestamps; months whose partition was dropped land
+-- in chat_sessions_default. Returns the number of turns restored, 0 if the
+-- session is not archived.
+CREATE OR REPLACE FUNCTION restore_chat_session(p_session_id UUID)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    archive chat_sessions_archive%ROWTYPE;
+    restored INT;
+BEGIN
+    DELETE FROM chat_sessions_archive WHERE session_id = p_session_id RETURNING * INTO archive;
+    IF NOT FOUND THEN
+        RETURN 0;
+    END IF;
+
+    INSERT INTO chat_sessions (id, session_id, role, message, created_at)
+    SELECT (turn->>'id')::BIGINT, p_session_id, turn->>'role', turn->>'message', (turn->>'created_at')::TIMESTAMPTZ
+    FROM jsonb_array_elements(archive.transcript) AS turn;
+    GET DIAGNOSTICS restored = ROW_COUNT;
+
+    INSERT INTO chat_attachments (message_id, message_created_at, session_id, kind, sha256, mime_type, summary, payload, created_at)
+    SELECT (turn->>'id')::BIGINT, (turn->>'created_at')::TIMESTAMPTZ, p_session_id,
+           attachment->>'kind', attachment->>'sha256', attachment->>'mime_type', attachment->>'summary',
+           COALESCE(attachment->'payload', '{}'::JSONB), (attachment->>'created_at')::TIMESTAMPTZ
+    FROM jsonb_array_elements(archive.transcript) AS turn,
+         jsonb_array_elements(turn->'attachments') AS attachment;
+
+    RETURN restored;
+END;
+$$;
+
+-- The partition functions run as the table owner; restore_chat_session
+-- writes chat history. Only the service may call them.
+REVOKE EXECUTE ON FUNCTION ensure_chat_sessions_partitions(TIMESTAMPTZ, INT) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION drop_empty_chat_sessions_partitions(TIMESTAMPTZ) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION archive_chat_sessions(INT, INT) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION restore_chat_session(UUID) FROM PUBLIC;
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        REVOKE EXECUTE ON FUNCTION ensure_chat_sessions_partitions(TIMESTAMPTZ, INT) FROM anon, authenticated;
+        REVOKE EXECUTE ON FUNCTION drop_empty_chat_sessions_partitions(TIMESTAMPTZ) FROM anon, authenticated;
+        REVOKE EXECUTE ON FUNCTION archive_chat_sessions(INT, INT) FROM anon, authenticated;
+        REVOKE EXECUTE ON FUNCTION restore_chat_session(UUID) FROM anon, authenticated;
+        GRANT EXECUTE ON FUNCTION ensure_chat_sessions_partitions(TIMESTAMPTZ, INT) TO service_role;
+        GRANT EXECUTE ON FUNCTION archive_chat_sessions(INT, INT) TO service_role;
+        GRANT EXECUTE ON FUNCTION restore_chat_session(UUID) TO service_role;
+    END IF;
+END;
+$$;
+
+ANALYZE chat_sessions;
+ANALYZE chat_attachments;
@@ -0,0 +1,202 @@
+-- ============================================================
+-- 006: Date-driven status sweeps for quotations, orders and policies
+-- ============================================================
+-- Statuses that depend only on the calendar were never written. A quotation
+-- past valid_until stayed 'draft' and was only recognised as lapsed when
+-- someone tried to order it, and no policy ever became 'expired'. Every reader
+-- had to re-derive the status from the dates. After this migration
+-- sweep_statuses() writes them in set-based batches:
+--
+--   quotations  draft/sent past valid_until                   -> status 'expired'
+--   orders      unpaid (pending/awaiting_confirmation) for
+--               longer than the payment window                -> payment_status 'expired',
+--                                                                policy_status 'cancelled',
+--                                                                its quotation status 'expired'
+--   policies    paid, inactive, start date reached            -> policy_status 'active'
+--               active, past policy_end_date                  -> policy_status 'expired'
+--
+-- Each kind of sweep has a partial index that holds only the rows it may
+-- still change. A sweep reads the rows that are due from the front of that
+-- index and never scans settled history. The service calls the function on a
+-- schedule from status_sweeps.py. It takes a transaction-scoped advisory lock,
+-- so when several workers call it at once only one sweeps and the others get
+-- {"skipped": "locked"}. Rows locked by a concurrent request are skipped and
+-- picked up by the next batch.
+--
+-- Safe to re-run.
+
+-- ── Sweep indexes ────────────────────────────────────────────────────────────
+CREATE INDEX IF NOT EXISTS quotations_open_valid_until_idx
+    ON quotations (valid_until) WHERE status IN ('draft', 'sent');
+CREATE INDEX IF NOT EXISTS orders_unpaid_created_at_idx
+    ON orders (created_at) WHERE payment_status IN ('pending', 'awaiting_confirmation');
+CREATE INDEX IF NOT EXISTS orders_paid_inactive_start_idx
+    ON orders (policy_start_date) WHERE payment_status = 'paid' AND policy_status = 'inactive';
+CREATE INDEX IF NOT EXISTS orders_active_policy_end_idx
+    ON orders (policy_end_date) WHERE policy_status = 'active';
+
+-- ── Sweeps ───────────────────────────────────────────────────────────────────
+-- Changes at most p_batch_size rows of each kind. Returns
+-- {"quotations_expired", "orders_expired", "policies_activated",
+--  "policies_expired"}, or {"skipped": "locked"}.
+CREATE OR REPLACE FUNCTION sweep_statuses(
+    p_batch_size INT DEFAULT 1000,
+    p_payment_days INT DEFAULT 7
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    quotations_expired INT;
+    orders_expired INT;
+    policies_activated INT;
+    policies_expired INT;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('zeus.sweep_statuses')) THEN
+        RETURN jsonb_build_object('skipped', 'locked');
+    END IF;
+
+    UPDATE quotations SET status = 'expired', updated_at = NOW()
+    WHERE id IN (
+        SELECT id FROM quotations
+        WHERE status IN ('draft', 'sent') AND valid_until < NOW()
+        ORDER BY valid_until
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    );
+    GET DIAGNOSTICS quotations_expired = ROW_COUNT;
+
+    -- The quotation of an expired order expires with it. Left 'accepted', it
+    -- could never be ordered again (orders_quotation_id_key) and
+    -- create_order_for_quotation would keep handing back the dead order.
+    WITH expired_orders AS (
+        UPDATE orders SET payment_status = 'expired', policy_status = 'cancelled', updated_at = NOW()
+        WHERE id IN (
+            SELECT id FROM orders
+            WHERE payment_status IN ('pending', 'awaiting_confirmation')
+              AND created_at < NOW() - make_interval(days => p_payment_days)
+            ORDER BY created_at
+            LIMIT p_batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING quotation_id
+    ), expired_quotations AS (
+        UPDATE quotations SET status = 'expired', updated_at = NOW()
+        WHERE id IN (SELECT quotation_id FROM expired_orders) AND status = 'accepted'
+    )
+    SELECT COUNT(*) INTO orders_expired FROM expired_orders;
+
+    UPDATE orders SET policy_status = 'active', updated_at = NOW()
+    WHERE id IN (
+        SELECT id FROM orders
+        WHERE payment_status = 'paid' AND policy_status = 'inactive'
+          AND policy_start_date <= CURRENT_DATE
+          AND (policy_end_date IS NULL OR policy_end_date >= CURRENT_DATE)
+        ORDER BY policy_start_date
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    );
+    GET DIAGNOSTICS policies_activated = ROW_COUNT;
+
+    UPDATE orders SET policy_status = 'expired', updated_at = NOW()
+    WHERE id IN (
+        SELECT id FROM orders
+        WHERE policy_status = 'active' AND policy_end_date < CURRENT_DATE
+        ORDER BY policy_end_date
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    );
+    GET DIAGNOSTICS policies_expired = ROW_COUNT;
+
+    RETURN jsonb_build_object(
+        'quotations_expired', quotations_expired,
+        'orders_expired', orders_expired,
+        'policies_activated', policies_activated,
+        'policies_expired', policies_expired
+    );
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION sweep_statuses(INT, INT) FROM PUBLIC;
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        REVOKE EXECUTE ON FUNCTION sweep_statuses(INT, INT) FROM anon, authenticated;
+        GRANT EXECUTE ON FUNCTION sweep_statuses(INT, INT) TO service_role;
+    END IF;
+END;
+$$;
+
+-- Quotations whose order an earlier version of the sweep expired were left
+-- 'accepted' and could not be ordered again.
+UPDATE quotations q SET status = 'expired', updated_at = NOW()
+FROM orders o
+WHERE o.quotation_id = q.id AND q.status = 'accepted' AND o.payment_status = 'expired';
+
+-- ── Order creation ───────────────────────────────────────────────────────────
+-- A quotation that lapsed since the last sweep is marked expired on the spot,
+-- so its status is right for every later reader.
+CREATE OR REPLACE FUNCTION create_order_for_quotation(
+    p_quotation_id UUID,
+    p_payment_method VARCHAR,
+    p_order_number VARCHAR,
+    p_policy_number VARCHAR
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    q quotations%ROWTYPE;
+    o orders%ROWTYPE;
+    quotation_json JSONB;
+BEGIN
+    SELECT * INTO q FROM quotations WHERE id = p_quotation_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    IF q.status IN ('draft', 'sent') AND q.valid_until < NOW() THEN
+        UPDATE quotations SET status = 'expired', updated_at = NOW()
+        WHERE id = p_quotation_id
+        RETURNING * INTO q;
+    END IF;
+
+    quotation_json := jsonb_build_object(
+        'quotation_number', q.quotation_number,
+        'customer_name', q.customer_name,
+        'total_premium', q.total_premium,
+        'valid_until', q.valid_until,
+        'status', q.status
+    );
+
+    IF q.status = 'expired' THEN
+        RETURN jsonb_build_object('status', 'expired', 'quotation', quotation_json);
+    END IF;
+
+    SELECT * INTO o FROM orders WHERE quotation_id = p_quotation_id;
+    IF FOUND THEN
+        RETURN jsonb_build_object('status', 'exists', 'quotation', quotation_json, 'order', to_jsonb(o));
+    END IF;
+
+    INSERT INTO orders (
+        quotation_id, order_number, payment_status, payment_method,
+        policy_number, policy_start_date, policy_end_date, policy_status
+    ) VALUES (
+        p_quotation_id,
+        p_order_number,
+        CASE WHEN p_payment_method = 'pending' THEN 'pending' ELSE 'awaiting_confirmation' END,
+        p_payment_method,
+        p_policy_number,
+        CURRENT_DATE,
+        CURRENT_DATE + 365,
+        'inactive'  -- becomes active after payment
+    )
+    RETURNING * INTO o;
+
+    UPDATE quotations SET status = 'accepted', updated_at = NOW() WHERE id = p_quotation_id;
+
+    RETURN jsonb_build_object('status', 'created', 'quotation', quotation_json, 'order', to_jsonb(o));
+END;
+$$;
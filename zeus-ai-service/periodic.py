@@ -0,0 +1,129 @@
+"""
+Background jobs that call the database on a schedule in the app lifespan.
+
+``PeriodicJob`` is the loop shared by the status sweeps, chat archiving and
+the WebSocket order watcher. It runs the job every ``interval_seconds``, or
+sooner when poked. It logs a failing job once, not on every run, and starts
+and stops with the lifespan. Jobs are off without ``SUPABASE_URL``.
+``run_batches`` repeats a batched RPC until a batch comes back short, the RPC
+skips (another worker holds its advisory lock) or the batch limit is reached.
+``once_main`` is the ``--once`` command line of a job module.
+"""
+
+import os
+import asyncio
+import logging
+import argparse
+from typing import Any, Callable, Optional
+
+
+class PeriodicJob:
+    """
+    Calls ``run_once`` every ``interval_seconds``. Subclasses set ``description``,
+    ``log_icon`` and ``log_tag`` (for log lines), ``logger`` and ``enabled``. With
+    ``run_at_start`` the first run is at start-up, not one interval later.
+    """
+
+    description = "Job"
+    log_icon = "⏱️ "
+    log_tag = "[JOB]"
+    logger = logging.getLogger("zeus.periodic")
+    enabled = True
+    run_at_start = False
+
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self.last_run: Any = None
+        self._failing = False
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def run_once(self) -> Any:
+        raise NotImplementedError
+
+    def failed(self, exc: Exception) -> None:
+        """Called on every failed run, before the once-only warning; for failure metrics."""
+
+    def poke(self) -> None:
+        """Run now instead of at the next interval."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run_batches(
+        self,
+        batch: Callable[[], dict],
+        max_batches: int,
+        full: Callable[[dict], bool],
+        pause_seconds: float = 0.0,
+    ) -> tuple[list[dict], Optional[str]]:
+        """
+        Call the blocking ``batch`` in a thread, ``pause_seconds`` apart, while
+        ``full(result)`` and fewer than ``max_batches`` ran; returns the results
+        and why the RPC skipped, if it did.
+        """
+        results: list[dict] = []
+        for index in range(max_batches):
+            if index and pause_seconds:
+                await asyncio.sleep(pause_seconds)
+            result = await asyncio.to_thread(batch)
+            if result.get("skipped"):
+                self.logger.debug("%s %s Skipped: %s", self.log_icon, self.log_tag, result["skipped"])
+                return results, result["skipped"]
+            results.append(result)
+            if not full(result):
+                break
+        return results, None
+
+    async def _wait(self) -> None:
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=self.interval_seconds)
+        except TimeoutError:
+            pass
+        self._wake.clear()
+
+    async def _loop(self) -> None:
+        if not self.run_at_start:
+            await self._wait()
+        while True:
+            try:
+                self.last_run = await self.run_once()
+                if self._failing:
+                    self.logger.info("%s %s %s works again", self.log_icon, self.log_tag, self.description)
+                self._failing = False
+            except Exception as exc:
+                self.failed(exc)
+                # A migration that is not applied yet fails every run; say so once.
+                if not self._failing:
+                    self.logger.warning("⚠️  %s %s failed: %s", self.log_tag, self.description, exc)
+                self._failing = True
+            await self._wait()
+
+    def start(self) -> None:
+        if self.enabled and self.interval_seconds > 0 and os.environ.get("SUPABASE_URL") and self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._wake = None
+
+
+def once_main(description: str, help_text: str, make_job: Callable[[], PeriodicJob]) -> None:
+    """``python <job module>.py --once``: one run now, printed, then exit."""
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help=help_text)
+    args = parser.parse_args()
+    if not args.once:
+        parser.print_help()
+        return
+
+    from logging_config import configure_logging
+
+    configure_logging()
+    print(asyncio.run(make_job().run_once()))
@@ -0,0 +1,432 @@
+"""
+Premium pricing engine: the whole ``car_models`` × ``insurance_plans`` premium
+matrix, computed with NumPy from each car's ``estimated_price``.
+
+``plan_premiums`` only prices the key models by hand, so a search for any other
+car used to miss every step of the search cascade and end in the catalogue dump.
+The engine fills those gaps from a rate card. For each plan type the card sets a
+premium rate per vehicle-value band, rounded to 500 THB with a floor, plus a
+deductible per value band. The rates are the "Premium Pricing Tiers" of the
+policy documents, calibrated to the seeded premiums. Hand-set premiums always
+win, and a computed cell is flagged ``estimated``. A specialty plan (a second
+plan of a type already offered, such as the EV plan) is only offered where
+``plan_premiums`` prices it.
+
+The catalog is read once per ``ZEUS_PRICING_TTL_SECONDS`` with four small
+selects and held as arrays. ``search_quotation_details``, ``compare_quotations``
+and ``create_quotation`` then look cells up in memory, with no database round
+trip. ``ZEUS_PRICING_RATE_CARD`` points at a JSON rate card (same shape as
+``DEFAULT_RATE_CARD``) that replaces the built-in one. Every reload re-reads
+the file when it has changed, so editing it reprices every worker within one
+TTL, without a restart. A card that fails to load is logged, and the previous
+card stays in use.
+
+    python pricing.py                          # coverage of the current matrix
+    python pricing.py --rate-card rates.json   # what a new rate card would change
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database import get_supabase_client
+from telemetry import Counter, Gauge, Histogram, registry
+
+logger = logging.getLogger("zeus.pricing")
+
+PRICING_ESTIMATES_ENABLED = os.environ.get("ZEUS_PRICING_ESTIMATES", "true").lower() in ("1", "true", "yes")
+PRICING_TTL_SECONDS = float(os.environ.get("ZEUS_PRICING_TTL_SECONDS", "300"))
+PRICING_RATE_CARD = os.environ.get("ZEUS_PRICING_RATE_CARD", "")
+
+PREMIUM_ROUNDING = 500.0
+# PostgREST caps a response at 1000 rows by default.
+PAGE_SIZE = 1000
+
+PRICING_LOOKUPS = registry.register(Counter(
+    "zeus_pricing_lookups_total", "Car/plan premium lookups served by the pricing matrix", ("source",),
+))
+PRICING_CELLS = registry.register(Gauge(
+    "zeus_pricing_cells", "Car/plan cells offered by the pricing matrix", ("source",),
+))
+PRICING_BUILD_DURATION = registry.register(Histogram(
+    "zeus_pricing_build_seconds", "Time to load the catalog and compute the premium matrix", ("phase",),
+))
+
+
+# ── Rate card ─────────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class PlanTypeRates:
+    """
+    Rates of one plan type. ``price_edges`` and ``deductible_edges`` are ascending
+    vehicle values (THB) where the next band starts; there is one rate and one
+    deductible more than edges.
+    """
+    price_edges: tuple[float, ...]
+    rates: tuple[float, ...]
+    deductible_edges: tuple[float, ...]
+    deductibles: tuple[float, ...]
+    minimum_premium: float = 0.0
+
+    def __post_init__(self) -> None:
+        for edges, values in ((self.price_edges, self.rates), (self.deductible_edges, self.deductibles)):
+            if len(values) != len(edges) + 1:
+                raise ValueError(f"{len(edges)} band edges need {len(edges) + 1} values, got {len(values)}")
+            if list(edges) != sorted(edges):
+                raise ValueError(f"band edges must be ascending: {edges}")
+
+    def premiums(self, prices: np.ndarray) -> np.ndarray:
+        rates = np.asarray(self.rates, dtype=float)[np.searchsorted(self.price_edges, prices, side="right")]
+        premiums = np.round(prices * rates / PREMIUM_ROUNDING) * PREMIUM_ROUNDING
+        return np.maximum(premiums, self.minimum_premium)
+
+    def deductibles_for(self, prices: np.ndarray) -> np.ndarray:
+        return np.asarray(self.deductibles, dtype=float)[np.searchsorted(self.deductible_edges, prices, side="right")]
+
+
+RateCard = dict[str, PlanTypeRates]
+
+DEFAULT_RATE_CARD: RateCard = {
+    "Type 1": PlanTypeRates(
+        price_edges=(1_000_000, 2_000_000, 4_000_000),
+        rates=(0.020, 0.017, 0.017, 0.0165),
+        deductible_edges=(2_000_000, 2_800_000, 6_000_000),
+        deductibles=(0, 3_000, 5_000, 10_000),
+        minimum_premium=10_000,
+    ),
+    "Type 2+": PlanTypeRates(
+        price_edges=(1_000_000, 2_000_000, 4_000_000),
+        rates=(0.0105, 0.0087, 0.0083, 0.008),
+        deductible_edges=(1_950_000, 2_500_000),
+        deductibles=(2_000, 3_000, 5_000),
+        minimum_premium=5_000,
+    ),
+    "Type 3+": PlanTypeRates(
+        price_edges=(1_000_000, 2_000_000, 4_000_000),
+        rates=(0.0083, 0.0065, 0.0061, 0.006),
+        deductible_edges=(1_100_000, 2_300_000),
+        deductibles=(2_000, 3_000, 5_000),
+        minimum_premium=4_000,
+    ),
+}
+
+
+def load_rate_card(path: str) -> RateCard:
+    """A rate card from JSON: ``{"Type 1": {"price_edges": [...], "rates": [...], ...}, ...}``."""
+    raw = json.loads(Path(path).read_text(encoding="utf-8"))
+    return {
+        plan_type: PlanTypeRates(**{k: tuple(v) if isinstance(v, list) else v for k, v in rates.items()})
+        for plan_type, rates in raw.items()
+    }
+
+
+# ── Catalog ───────────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class Catalog:
+    """Cars (with their brand) and plans ordered by id, and the hand-set premiums."""
+    cars: list[dict]
+    plans: list[dict]
+    premiums: list[dict]
+
+
+def _select_all(client, table: str, columns: str) -> list[dict]:
+    rows: list[dict] = []
+    while True:
+        page = client.table(table).select(columns).order("id").range(len(rows), len(rows) + PAGE_SIZE - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+
+
+def load_catalog() -> Catalog:
+    """The catalog tables (blocking)."""
+    client = get_supabase_client()
+    brands = {row["id"]: row["name"] for row in _select_all(client, "car_brands", "id, name")}
+    cars = [
+        {
+            "brand": brands[row["brand_id"]],
+            "model": row["name"],
+            "sub_model": row["sub_model"],
+            "year": row["year"],
+            "car_estimated_price": float(row["estimated_price"]),
+            "car_model_id": row["id"],
+        }
+        # The catalog view inner-joins the brand; so does the matrix.
+        for row in _select_all(client, "car_models", "id, brand_id, name, sub_model, year, estimated_price")
+        if row["brand_id"] in brands
+    ]
+    plans = [
+        {
+            "plan_type": row["plan_type"],
+            "plan_name": row["plan_name"],
+            "insurer_name": row["insurer_name"],
+            "plan_id": row["id"],
+        }
+        for row in _select_all(client, "insurance_plans", "id, plan_type, plan_name, insurer_name")
+    ]
+    premiums = _select_all(client, "plan_premiums", "id, car_model_id, plan_id, base_premium, deductible")
+    return Catalog(cars=cars, plans=plans, premiums=premiums)
+
+
+# ── Matrix ────────────────────────────────────────────────────────────────────
+
+class PricingMatrix:
+    """
+    Premiums of every car × plan. ``premium`` and ``deductible`` are (cars, plans)
+    arrays with NaN where the plan is not offered. ``estimated`` marks the cells
+    computed from the rate card.
+    """
+
+    def __init__(self, catalog: Catalog, rate_card: RateCard, estimates: bool = True) -> None:
+        self.catalog = catalog
+        self.rate_card = rate_card
+        self.car_index = {car["car_model_id"]: i for i, car in enumerate(catalog.cars)}
+        self.plan_index = {plan["plan_id"]: j for j, plan in enumerate(catalog.plans)}
+        # Lower-cased brand / model name → car rows, so a search only visits the cars it names.
+        self.brand_index: dict[str, list[int]] = {}
+        self.model_index: dict[str, list[int]] = {}
+        for i, car in enumerate(catalog.cars):
+            self.brand_index.setdefault((car["brand"] or "").lower(), []).append(i)
+            self.model_index.setdefault((car["model"] or "").lower(), []).append(i)
+
+        prices = np.array([car["car_estimated_price"] for car in catalog.cars], dtype=float)
+        shape = (len(catalog.cars), len(catalog.plans))
+        self.premium = np.full(shape, np.nan)
+        self.deductible = np.full(shape, np.nan)
+        if estimates:
+            offered_types: set[str] = set()
+            for j, plan in enumerate(catalog.plans):
+                rates = rate_card.get(plan["plan_type"])
+                # Only the first plan of a type is general; later ones are specialty plans.
+                if rates is not None and plan["plan_type"] not in offered_types:
+                    self.premium[:, j] = rates.premiums(prices)
+                    self.deductible[:, j] = rates.deductibles_for(prices)
+                offered_types.add(plan["plan_type"])
+        self.estimated = ~np.isnan(self.premium)
+
+        # Hand-set premiums override the rate card.
+        hand_set = [
+            (self.car_index[row["car_model_id"]], self.plan_index[row["plan_id"]],
+             float(row["base_premium"]), float(row["deductible"] or 0))
+            for row in catalog.premiums
+            if row["car_model_id"] in self.car_index and row["plan_id"] in self.plan_index
+        ]
+        if hand_set:
+            rows, cols, premiums, deductibles = (np.array(column) for column in zip(*hand_set))
+            self.premium[rows, cols] = premiums
+            self.deductible[rows, cols] = deductibles
+            self.estimated[rows, cols] = False
+
+        offered = ~np.isnan(self.premium)
+        self.cells = {
+            "table": int((offered & ~self.estimated).sum()),
+            "estimated": int(self.estimated.sum()),
+        }
+        self._records: Optional[list[dict]] = None
+        self._car_records: Optional[list[list[dict]]] = None
+
+    def _record(self, i: int, j: int) -> dict:
+        return {
+            **self.catalog.cars[i],
+            **self.catalog.plans[j],
+            "base_premium": float(self.premium[i, j]),
+            "deductible": float(self.deductible[i, j]),
+            "estimated": bool(self.estimated[i, j]),
+        }
+
+    def lookup(self, car_model_id: int, plan_id: int) -> Optional[dict]:
+        """The ``vw_quotation_details``-shaped row of one cell, or None when not offered."""
+        i = self.car_index.get(car_model_id)
+        j = self.plan_index.get(plan_id)
+        if i is None or j is None or np.isnan(self.premium[i, j]):
+            return None
+        return self._record(i, j)
+
+    def _by_car(self) -> list[list[dict]]:
+        """The offered cells of each car row, by plan."""
+        if self._car_records is None:
+            by_car: list[list[dict]] = [[] for _ in self.catalog.cars]
+            for i, j in np.argwhere(~np.isnan(self.premium)):
+                by_car[i].append(self._record(i, j))
+            self._car_records = by_car
+        return self._car_records
+
+    def records(self) -> list[dict]:
+        """Every offered cell as a ``vw_quotation_details``-shaped row, by car then plan."""
+        if self._records is None:
+            self._records = [row for rows in self._by_car() for row in rows]
+        return self._records
+
+    def search(self, brand: Optional[str] = None, model: Optional[str] = None) -> list[dict]:
+        """
+        The offered cells of the cars whose brand and model contain the given
+        terms, case-insensitively (``ILIKE '%term%'``), by car then plan. Only
+        the distinct names are scanned, then only the rows they index.
+        """
+        cars: Optional[set[int]] = None
+        for index, term in ((self.brand_index, brand), (self.model_index, model)):
+            if not term:
+                continue
+            term = term.lower()
+            named = {i for name, rows in index.items() if term in name for i in rows}
+            cars = named if cars is None else cars & named
+        if cars is None:
+            return self.records()
+        by_car = self._by_car()
+        return [row for i in sorted(cars) for row in by_car[i]]
+
+
+def diff_matrices(old: PricingMatrix, new: PricingMatrix) -> dict:
+    """What repricing ``old`` into ``new`` (same catalog) changes."""
+    before, after = ~np.isnan(old.premium), ~np.isnan(new.premium)
+    both = before & after
+    changed = both & (old.premium != new.premium)
+    change = (new.premium[changed] - old.premium[changed]) / old.premium[changed]
+    return {
+        "cells": int(after.sum()),
+        "changed": int(changed.sum()),
+        "added": int((after & ~before).sum()),
+        "removed": int((before & ~after).sum()),
+        "mean_change_pct": round(float(change.mean()) * 100, 2) if change.size else 0.0,
+    }
+
+
+# ── Engine ────────────────────────────────────────────────────────────────────
+
+class PricingEngine:
+    """The current matrix; the catalog, and the rate card file if any, are reloaded every ``ttl_seconds``."""
+
+    def __init__(
+        self,
+        rate_card: Optional[RateCard] = None,
+        ttl_seconds: float = PRICING_TTL_SECONDS,
+        estimates: bool = PRICING_ESTIMATES_ENABLED,
+        rate_card_path: Optional[str] = None,
+    ) -> None:
+        self.rate_card_path = rate_card_path
+        self._rate_card_mtime: Optional[float] = None
+        if rate_card_path:
+            # A bad card at startup fails loudly; later edits fall back to the previous card.
+            self._rate_card_mtime = os.stat(rate_card_path).st_mtime
+            rate_card = load_rate_card(rate_card_path)
+        self.rate_card = rate_card or DEFAULT_RATE_CARD
+        self.ttl_seconds = ttl_seconds
+        self.estimates = estimates
+        self._matrix: Optional[PricingMatrix] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh_rate_card(self) -> None:
+        """Re-read the rate card file if it changed since it was last loaded."""
+        if not self.rate_card_path:
+            return
+        try:
+            mtime = os.stat(self.rate_card_path).st_mtime
+            if mtime == self._rate_card_mtime:
+                return
+            self.rate_card = load_rate_card(self.rate_card_path)
+        except Exception as exc:
+            logger.warning("⚠️  [PRICING] Rate card %s not reloaded, keeping the current one: %s", self.rate_card_path, exc)
+            return
+        self._rate_card_mtime = mtime
+        logger.info("💰 [PRICING] Loaded rate card %s", self.rate_card_path)
+
+    def _price(self, catalog: Catalog, rate_card: RateCard) -> PricingMatrix:
+        started = time.perf_counter()
+        matrix = PricingMatrix(catalog, rate_card, self.estimates)
+        PRICING_BUILD_DURATION.observe(time.perf_counter() - started, phase="price")
+        for source, cells in matrix.cells.items():
+            PRICING_CELLS.set(cells, source=source)
+        return matrix
+
+    def matrix(self) -> PricingMatrix:
+        """The current matrix, reloading the catalog once it is older than the TTL (blocking)."""
+        if self._matrix is not None and time.monotonic() < self._expires_at:
+            return self._matrix
+        with self._lock:
+            if self._matrix is not None and time.monotonic() < self._expires_at:
+                return self._matrix
+            started = time.perf_counter()
+            try:
+                catalog = load_catalog()
+            except Exception as exc:
+                if self._matrix is None:
+                    raise
+                # Keep serving the last matrix; try again after another TTL.
+                logger.warning("⚠️  [PRICING] Catalog reload failed, keeping the current matrix: %s", exc)
+                self._expires_at = time.monotonic() + self.ttl_seconds
+                return self._matrix
+            PRICING_BUILD_DURATION.observe(time.perf_counter() - started, phase="load")
+            self._refresh_rate_card()
+            previous, self._matrix = self._matrix, self._price(catalog, self.rate_card)
+            self._expires_at = time.monotonic() + self.ttl_seconds
+            logger.info(
+                "💰 [PRICING] %s cars x %s plans: %s hand-set, %s estimated cells",
+                len(catalog.cars), len(catalog.plans), self._matrix.cells["table"], self._matrix.cells["estimated"],
+            )
+            if previous is not None and previous.rate_card is not self.rate_card:
+                logger.info("💰 [PRICING] Repriced: %s", diff_matrices(previous, self._matrix))
+            return self._matrix
+
+    def try_matrix(self) -> Optional[PricingMatrix]:
+        """The current matrix, or None when the catalog cannot be loaded (callers query the view instead)."""
+        try:
+            return self.matrix()
+        except Exception as exc:
+            logger.warning("⚠️  [PRICING] Pricing matrix unavailable: %s", exc)
+            return None
+
+    def lookup(self, car_model_id: int, plan_id: int) -> Optional[dict]:
+        """One car/plan cell in O(1); None when the plan is not offered for the car."""
+        row = self.matrix().lookup(car_model_id, plan_id)
+        PRICING_LOOKUPS.inc(source="miss" if row is None else "estimated" if row["estimated"] else "table")
+        return row
+
+    def preview(self, rate_card: RateCard) -> dict:
+        """What pricing the loaded catalog with ``rate_card`` would change; the current matrix is kept."""
+        current = self.matrix()
+        return diff_matrices(current, PricingMatrix(current.catalog, rate_card, self.estimates))
+
+    def invalidate(self) -> None:
+        """Reload the catalog on the next lookup (after ``plan_premiums`` or car prices changed)."""
+        self._expires_at = 0.0
+
+
+pricing_engine = PricingEngine(rate_card_path=PRICING_RATE_CARD or None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate-card", help="JSON rate card to compare with the current one")
+    args = parser.parse_args()
+
+    from logging_config import configure_logging
+
+    configure_logging()
+    engine = PricingEngine(rate_card_path=PRICING_RATE_CARD or None)
+    matrix = engine.matrix()
+    print(json.dumps({
+        "cars": len(matrix.catalog.cars),
+        "plans": len(matrix.catalog.plans),
+        **matrix.cells,
+        "not_offered": int(np.isnan(matrix.premium).sum()),
+    }))
+    if args.rate_card:
+        rate_card = load_rate_card(args.rate_card)
+        print(json.dumps({"rate_card": {k: asdict(v) for k, v in rate_card.items()}, **engine.preview(rate_card)}))
+
+
+if __name__ == "__main__":
+    main()
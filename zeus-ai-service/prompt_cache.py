@@ -0,0 +1,297 @@
+"""
+Prompt-prefix caching for the static part of every agent LLM call.
+
+The system prompt and the tool JSON schemas are identical on every ReAct step of
+every request. Two layers keep them cheap:
+
+* Local: the prefix is serialized and token-counted once per process
+  (``StaticPrefix``), and compiled agent executors are reused per model.
+* Provider: for Gemini the prefix is uploaded as cached content
+  (``GeminiPrefixCache``) that is created and kept alive from the app lifespan,
+  so requests only send the conversation itself.
+
+``PromptCacheCallback`` records cached vs. uncached prompt tokens from the
+usage metadata of every LLM call.
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from tools.compaction import estimate_tokens
+from telemetry import registry
+from shared_state import SharedCache
+
+logger = logging.getLogger("zeus.prompt_cache")
+
+GEMINI_CONTEXT_CACHE_ENABLED = os.environ.get("GEMINI_CONTEXT_CACHE", "false").lower() in ("1", "true", "yes")
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+
+# ── Local static prefix ───────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class StaticPrefix:
+    system_prompt: str
+    tool_schemas: tuple[dict, ...]
+    serialized: str
+    token_estimate: int
+    digest: str
+
+
+def build_static_prefix(system_prompt: str, tools: list) -> StaticPrefix:
+    """Serialize the system prompt + tool schemas once and precompute their size."""
+    tool_schemas = tuple(convert_to_openai_tool(t) for t in tools)
+    serialized = json.dumps(
+        {"system": system_prompt, "tools": tool_schemas},
+        ensure_ascii=False,
+        separators=(",", ":"),
+        sort_keys=True,
+    )
+    prefix = StaticPrefix(
+        system_prompt=system_prompt,
+        tool_schemas=tool_schemas,
+        serialized=serialized,
+        token_estimate=estimate_tokens(serialized),
+        digest=hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:16],
+    )
+    logger.info("🧱 [PREFIX] Static prefix %s: %s tools, ~%s tokens", prefix.digest, len(tool_schemas), prefix.token_estimate)
+    return prefix
+
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+
+class PromptCacheStats:
+    """Process-wide counters for prompt tokens served from a provider cache."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.static_prefix_tokens = 0
+
+    def record(self, prompt_tokens: int, cached_tokens: int, static_prefix_tokens: int) -> None:
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_prompt_tokens += cached_tokens
+            self.static_prefix_tokens += static_prefix_tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            uncached = self.prompt_tokens - self.cached_prompt_tokens
+            return {
+                "llm_calls": self.llm_calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+                "uncached_prompt_tokens": uncached,
+                "cache_hit_ratio": round(self.cached_prompt_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+                "static_prefix_tokens_estimated": self.static_prefix_tokens,
+            }
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+def _collect_prompt_cache_metrics() -> list[str]:
+    snapshot = prompt_cache_stats.snapshot()
+    return [
+        "# TYPE zeus_prompt_tokens_total counter",
+        f'zeus_prompt_tokens_total{{cache="hit"}} {snapshot["cached_prompt_tokens"]}',
+        f'zeus_prompt_tokens_total{{cache="miss"}} {snapshot["uncached_prompt_tokens"]}',
+    ]
+
+
+registry.register_collector(_collect_prompt_cache_metrics)
+
+
+class PromptCacheCallback(BaseCallbackHandler):
+    """Feeds ``prompt_cache_stats`` from the usage metadata of each chat model call."""
+
+    def __init__(self, static_prefix: StaticPrefix) -> None:
+        self.static_prefix = static_prefix
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if not usage:
+                    continue
+                cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+                prompt_cache_stats.record(
+                    prompt_tokens=usage.get("input_tokens", 0),
+                    cached_tokens=cached,
+                    static_prefix_tokens=self.static_prefix.token_estimate,
+                )
+                return
+
+
+# ── Gemini cached content ─────────────────────────────────────────────────────
+
+@lru_cache(maxsize=1)
+def prefix_cache_unsupported() -> Optional[str]:
+    """
+    Why the installed langchain-google-genai cannot serve the prefix cache, or None.
+
+    The cache uses private parts of it (``_function_utils`` and
+    ``ChatGoogleGenerativeAI._prepare_request``); requirements.txt pins the
+    versions they were written against, and an unsupported version turns the
+    cache off at start-up instead of breaking requests.
+    """
+    try:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        from langchain_google_genai._function_utils import convert_to_genai_function_declarations  # noqa: F401
+    except ImportError as exc:
+        return str(exc)
+    if not callable(getattr(ChatGoogleGenerativeAI, "_prepare_request", None)):
+        return "ChatGoogleGenerativeAI._prepare_request is gone"
+    return None
+
+
+class GeminiPrefixCache:
+    """
+    Owns a Gemini ``cachedContents`` entry holding the system prompt and tool declarations.
+
+    ``on_change`` is called whenever the cache name changes (created, recreated or
+    dropped) so callers can rebuild anything that captured the old name.
+
+    The name is published in the shared store, so with several workers the first
+    one creates the entry and the others adopt it. With a shared store the entry
+    is left to expire on shutdown instead of being deleted under the other workers.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        static_prefix: StaticPrefix,
+        tools: list,
+        ttl_seconds: int = GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+        on_change: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.model = model
+        self.static_prefix = static_prefix
+        self.tools = tools
+        self.ttl_seconds = ttl_seconds
+        self.on_change = on_change
+        self.name: Optional[str] = None
+        self._client = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._shared_names = SharedCache("gemini_cached_content")
+        self._shared_key = f"{model}:{static_prefix.digest}"
+
+    def _get_client(self):
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+        return self._client
+
+    def _set_name(self, name: Optional[str]) -> None:
+        if name != self.name:
+            self.name = name
+            if self.on_change:
+                self.on_change()
+
+    async def _adopt_shared(self) -> Optional[str]:
+        """Reuse an entry another worker published, if it still exists."""
+        from google.genai import types
+
+        name = self._shared_names.get(self._shared_key)
+        if not name:
+            return None
+        try:
+            await self._get_client().aio.caches.update(
+                name=name,
+                config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+            )
+        except Exception as exc:
+            logger.info("🗄️  [PREFIX CACHE] Shared entry %s is gone (%s)", name, exc)
+            self._shared_names.delete(self._shared_key)
+            return None
+        logger.info("🗄️  [PREFIX CACHE] Adopted %s for %s", name, self.model)
+        self._set_name(name)
+        return name
+
+    async def create(self) -> Optional[str]:
+        """Create (or adopt) the cached content; on failure the service keeps running uncached."""
+        from google.genai import types
+        from langchain_google_genai._function_utils import convert_to_genai_function_declarations
+
+        adopted = await self._adopt_shared()
+        if adopted:
+            return adopted
+        try:
+            cache = await self._get_client().aio.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"zeus-prefix-{self.static_prefix.digest}",
+                    system_instruction=self.static_prefix.system_prompt,
+                    tools=[convert_to_genai_function_declarations(self.tools)],
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+        except Exception as exc:
+            logger.warning("⚠️  [PREFIX CACHE] Could not create Gemini cached content for %s: %s", self.model, exc)
+            self._set_name(None)
+            return None
+
+        logger.info("🗄️  [PREFIX CACHE] Created %s for %s (ttl %ss)", cache.name, self.model, self.ttl_seconds)
+        self._shared_names.set(self._shared_key, cache.name, self.ttl_seconds)
+        self._set_name(cache.name)
+        return cache.name
+
+    async def refresh(self) -> None:
+        """Extend the TTL; recreate the entry if it was evicted or never created."""
+        from google.genai import types
+
+        if self.name is None:
+            await self.create()
+            return
+        try:
+            await self._get_client().aio.caches.update(
+                name=self.name,
+                config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+            )
+            self._shared_names.set(self._shared_key, self.name, self.ttl_seconds)
+            logger.info("🔄 [PREFIX CACHE] Refreshed %s", self.name)
+        except Exception as exc:
+            logger.warning("⚠️  [PREFIX CACHE] Refresh of %s failed (%s), recreating", self.name, exc)
+            await self.create()
+
+    async def _refresh_loop(self) -> None:
+        interval = max(60, self.ttl_seconds // 2)
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh()
+
+    async def start(self) -> None:
+        unsupported = prefix_cache_unsupported()
+        if unsupported:
+            logger.warning("⚠️  [PREFIX CACHE] Off, langchain-google-genai is not a supported version: %s", unsupported)
+            return
+        await self.create()
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self) -> None:
+        if self._refresh_task:
+            self._refresh_task.cancel()
+        if self.name and self._shared_names.shared:
+            self._set_name(None)
+        elif self.name:
+            try:
+                await self._get_client().aio.caches.delete(name=self.name)
+                logger.info("🗑️  [PREFIX CACHE] Deleted %s", self.name)
+                self._shared_names.delete(self._shared_key)
+            except Exception as exc:
+                logger.warning("⚠️  [PREFIX CACHE] Could not delete %s: %s", self.name, exc)
+            self._set_name(None)
@@ -0,0 +1,91 @@
+"""
+Production entry point: gunicorn managing N uvicorn workers.
+
+    python serve.py                      # ZEUS_WORKERS workers (default: one per core) on :8000
+    ZEUS_WORKERS=4 ZEUS_BIND=0.0.0.0:8080 python serve.py
+
+The app is imported once in the master (``preload_app``) so workers fork with
+every module, tool schema and the static prompt prefix already loaded. Network
+clients are never created before the fork; each worker builds its own clients
+and agent executors in a background warm-up and reports ``/ready`` when done.
+
+On SIGTERM every worker stops accepting connections and lets in-flight
+requests, including SSE streams, finish for up to ``ZEUS_DRAIN_TIMEOUT_SECONDS``.
+It then runs the lifespan shutdown, which flushes spans and logs, before
+gunicorn's ``graceful_timeout`` would kill it.
+
+State that must be consistent across workers goes through ``shared_state``; set
+``ZEUS_SHARED_STATE_URL=redis://...`` when running more than one worker.
+"""
+
+import os
+import logging
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+logger = logging.getLogger("zeus.serve")
+
+WORKERS = int(os.environ.get("ZEUS_WORKERS", "0")) or (os.cpu_count() or 1)
+BIND = os.environ.get("ZEUS_BIND", "0.0.0.0:8000")
+DRAIN_TIMEOUT_SECONDS = int(os.environ.get("ZEUS_DRAIN_TIMEOUT_SECONDS", "90"))
+# Time left after draining for the lifespan shutdown (span / log flushes).
+SHUTDOWN_MARGIN_SECONDS = 10
+
+
+class ZeusUvicornWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "auto",
+        "http": "auto",
+        "lifespan": "on",
+        "timeout_graceful_shutdown": DRAIN_TIMEOUT_SECONDS,
+    }
+
+
+def _post_fork(server, worker) -> None:
+    from database import get_supabase_client
+
+    # Defensive: a client created in the master must not share sockets with the workers.
+    get_supabase_client.cache_clear()
+    logger.info("👷 [SERVE] Worker %s started", worker.pid)
+
+
+def _worker_exit(server, worker) -> None:
+    logger.info("🛑 [SERVE] Worker %s exited", worker.pid)
+
+
+class ZeusApplication(BaseApplication):
+    def __init__(self, options: dict) -> None:
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from main import app
+
+        return app
+
+
+def options() -> dict:
+    return {
+        "bind": BIND,
+        "workers": WORKERS,
+        "worker_class": ZeusUvicornWorker,
+        "preload_app": True,
+        "graceful_timeout": DRAIN_TIMEOUT_SECONDS + SHUTDOWN_MARGIN_SECONDS,
+        # LLM turns are long; the worker heartbeat is independent of request time.
+        "timeout": int(os.environ.get("ZEUS_WORKER_TIMEOUT_SECONDS", "120")),
+        "keepalive": int(os.environ.get("ZEUS_KEEPALIVE_SECONDS", "5")),
+        "max_requests": int(os.environ.get("ZEUS_MAX_REQUESTS", "0")),
+        "max_requests_jitter": int(os.environ.get("ZEUS_MAX_REQUESTS_JITTER", "0")),
+        "accesslog": None,
+        "post_fork": _post_fork,
+        "worker_exit": _worker_exit,
+    }
+
+
+if __name__ == "__main__":
+    ZeusApplication(options()).run()
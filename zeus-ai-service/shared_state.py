@@ -0,0 +1,257 @@
+"""
+Key/value state shared between worker processes.
+
+Caches whose hit rate should not drop by a factor of N when the service runs N
+workers (recognised vehicles, query embeddings, the Gemini cached-content
+name) go through ``SharedCache`` instead of a process-local dict.
+``ZEUS_SHARED_STATE_URL`` picks the backend:
+
+* unset or ``memory://`` — process-local LRU + TTL, the single-worker default;
+* ``redis://host:6379/0`` — Redis, needs the ``redis`` package.
+
+Values are JSON. The shared store is an optimisation, never a dependency:
+backend errors are logged and read as a miss.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Optional
+
+from telemetry import registry
+
+logger = logging.getLogger("zeus.shared_state")
+
+SHARED_STATE_URL = os.environ.get("ZEUS_SHARED_STATE_URL", "memory://")
+SHARED_STATE_PREFIX = os.environ.get("ZEUS_SHARED_STATE_PREFIX", "zeus:")
+MEMORY_MAX_ENTRIES = int(os.environ.get("ZEUS_SHARED_STATE_MAX_ENTRIES", "10000"))
+
+
+# ── Backends ──────────────────────────────────────────────────────────────────
+
+class _MemoryNamespace:
+    """The LRU + TTL entries of one namespace, with its own bound and counters."""
+
+    __slots__ = ("max_entries", "entries", "evictions", "expirations")
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, tuple[Optional[float], str]]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+
+class MemoryBackend:
+    """
+    Process-local LRU + TTL store; what every worker had before, one copy per process.
+
+    Each namespace is bounded on its own, so a busy one (query embeddings,
+    idempotency results) cannot push a quiet one's entries out.
+    """
+
+    shared = False
+
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._namespaces: dict[str, _MemoryNamespace] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        with self._lock:
+            space = self._namespaces.get(namespace)
+            entry = space.entries.get(key) if space is not None else None
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and time.monotonic() > expires_at:
+                del space.entries[key]
+                space.expirations += 1
+                return None
+            space.entries.move_to_end(key)
+            return value
+
+    def set(self, namespace: str, key: str, value: str, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None) -> None:
+        expires_at = time.monotonic() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            space = self._namespaces.get(namespace)
+            if space is None:
+                space = self._namespaces[namespace] = _MemoryNamespace(max_entries or self.max_entries)
+            space.entries[key] = (expires_at, value)
+            space.entries.move_to_end(key)
+            while len(space.entries) > space.max_entries:
+                space.entries.popitem(last=False)
+                space.evictions += 1
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            space = self._namespaces.get(namespace)
+            if space is not None:
+                space.entries.pop(key, None)
+
+    def count(self, namespace: str) -> Optional[int]:
+        with self._lock:
+            space = self._namespaces.get(namespace)
+            return len(space.entries) if space is not None else 0
+
+    def counters(self, namespace: str) -> Optional[dict]:
+        with self._lock:
+            space = self._namespaces.get(namespace)
+            if space is None:
+                return {"evictions": 0, "expirations": 0}
+            return {"evictions": space.evictions, "expirations": space.expirations}
+
+    def namespaces(self) -> list[str]:
+        with self._lock:
+            return list(self._namespaces)
+
+    def close(self) -> None:
+        pass
+
+
+class RedisBackend:
+    """Redis with short socket timeouts; a slow or absent Redis costs a cache miss, not a request."""
+
+    shared = True
+
+    def __init__(self, url: str, timeout_seconds: float = 0.25) -> None:
+        import redis
+
+        self._client = redis.Redis.from_url(
+            url,
+            socket_timeout=timeout_seconds,
+            socket_connect_timeout=timeout_seconds,
+            decode_responses=True,
+        )
+        self.url = url
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        key = namespace + key
+        try:
+            return self._client.get(key)
+        except Exception as exc:
+            logger.warning("⚠️  [SHARED STATE] GET %s failed: %s", key, exc)
+            return None
+
+    def set(self, namespace: str, key: str, value: str, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None) -> None:
+        # Redis bounds its memory with its own maxmemory policy.
+        key = namespace + key
+        try:
+            self._client.set(key, value, ex=int(ttl_seconds) if ttl_seconds else None)
+        except Exception as exc:
+            logger.warning("⚠️  [SHARED STATE] SET %s failed: %s", key, exc)
+
+    def delete(self, namespace: str, key: str) -> None:
+        key = namespace + key
+        try:
+            self._client.delete(key)
+        except Exception as exc:
+            logger.warning("⚠️  [SHARED STATE] DELETE %s failed: %s", key, exc)
+
+    def count(self, namespace: str) -> Optional[int]:
+        return None   # SCAN over a shared keyspace is too expensive for a stats endpoint
+
+    def counters(self, namespace: str) -> Optional[dict]:
+        return None   # evictions happen inside Redis (see its evicted_keys stat)
+
+    def namespaces(self) -> list[str]:
+        return []
+
+    def close(self) -> None:
+        self._client.close()
+
+
+@lru_cache(maxsize=1)
+def get_shared_backend():
+    """The process's backend, chosen from ``ZEUS_SHARED_STATE_URL``."""
+    url = SHARED_STATE_URL
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            backend = RedisBackend(url)
+        except ImportError:
+            logger.warning("⚠️  [SHARED STATE] ZEUS_SHARED_STATE_URL is Redis but the redis package is not installed; using memory")
+        else:
+            logger.info("🔗 [SHARED STATE] Using Redis at %s", url.split("@")[-1])
+            return backend
+    elif url not in ("", "memory://"):
+        logger.warning("⚠️  [SHARED STATE] Unsupported ZEUS_SHARED_STATE_URL %s; using memory", url)
+    return MemoryBackend()
+
+
+def close_shared_backend() -> None:
+    if get_shared_backend.cache_info().currsize:
+        get_shared_backend().close()
+        get_shared_backend.cache_clear()
+
+
+# ── Namespaced cache ──────────────────────────────────────────────────────────
+
+class SharedCache:
+    """
+    A JSON-valued namespace of the shared backend with a default TTL. In the
+    in-process backend the namespace holds at most ``max_entries`` (default
+    ``ZEUS_SHARED_STATE_MAX_ENTRIES``).
+    """
+
+    def __init__(self, namespace: str, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None) -> None:
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.prefix = f"{SHARED_STATE_PREFIX}{namespace}:"
+
+    @property
+    def backend(self):
+        return get_shared_backend()
+
+    @property
+    def shared(self) -> bool:
+        return self.backend.shared
+
+    def get(self, key: str) -> Any:
+        raw = self.backend.get(self.prefix, key)
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        self.backend.set(self.prefix, key, payload, ttl_seconds or self.ttl_seconds, self.max_entries)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(self.prefix, key)
+
+    def entries(self) -> Optional[int]:
+        """Number of live keys in the namespace, when the backend can tell cheaply."""
+        return self.backend.count(self.prefix)
+
+    def counters(self) -> Optional[dict]:
+        """Evictions and expirations of the namespace in the in-process backend; None for Redis."""
+        return self.backend.counters(self.prefix)
+
+
+def _collect_shared_state_metrics() -> list[str]:
+    """Per-namespace size, evictions and expirations of the in-process backend (none for Redis)."""
+    backend = get_shared_backend()
+    entries, evictions, expirations = [], [], []
+    for prefix in backend.namespaces():
+        label = f'namespace="{prefix[len(SHARED_STATE_PREFIX):].rstrip(":")}"'
+        counters = backend.counters(prefix)
+        entries.append(f"zeus_shared_state_entries{{{label}}} {backend.count(prefix)}")
+        evictions.append(f"zeus_shared_state_evictions_total{{{label}}} {counters['evictions']}")
+        expirations.append(f"zeus_shared_state_expirations_total{{{label}}} {counters['expirations']}")
+    if not entries:
+        return []
+    return [
+        "# TYPE zeus_shared_state_entries gauge", *entries,
+        "# TYPE zeus_shared_state_evictions_total counter", *evictions,
+        "# TYPE zeus_shared_state_expirations_total counter", *expirations,
+    ]
+
+
+registry.register_collector(_collect_shared_state_metrics)
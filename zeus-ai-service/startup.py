@@ -0,0 +1,156 @@
+"""
+Startup timing and readiness.
+
+``/health`` is liveness: the process is up. ``/ready`` is readiness: this worker
+has finished warm-up — the Gemini prefix cache, the Supabase client, the
+embedding client and the agent executors for ``ZEUS_WARM_MODELS`` exist — so a
+new pod is only put behind the load balancer once its first request will not
+pay for them. Requests that arrive earlier still work; they build what they
+need on first use.
+
+Warm-up runs in the background of the app lifespan, so the worker answers
+``/health`` right away. The phases are timed and logged, and exposed on
+``/ready`` and ``/metrics``.
+
+    python -m startup --imports          # slowest imports of ``main`` (python -X importtime)
+    python -m startup --imports --top 40
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import subprocess
+from typing import Optional
+
+# Taken when this module is imported, which main does before anything heavy.
+IMPORT_STARTED = time.monotonic()
+
+from telemetry import Gauge, registry
+
+logger = logging.getLogger("zeus.startup")
+
+STARTUP_SECONDS = registry.register(Gauge(
+    "zeus_startup_seconds", "Time this worker spent in each startup phase", ("phase",),
+))
+READY = registry.register(Gauge(
+    "zeus_ready", "1 once this worker has finished warm-up",
+))
+
+
+class Readiness:
+    """Where this worker is in its startup; read by ``/ready``."""
+
+    def __init__(self) -> None:
+        self.imported_at: Optional[float] = None
+        self.warm_up_started_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self.phases: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def record(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = round(seconds, 3)
+        STARTUP_SECONDS.set(seconds, phase=phase)
+
+    def to_dict(self) -> dict:
+        return {
+            "ready": self.ready,
+            "import_seconds": self.phases.get("import"),
+            "warm_up_seconds": self.phases.get("warm_up"),
+            "seconds_since_start": round(time.monotonic() - IMPORT_STARTED, 3),
+            "phases": self.phases,
+            "errors": self.errors,
+        }
+
+
+readiness = Readiness()
+
+
+def mark_imported() -> None:
+    """Called by main once every module is loaded."""
+    readiness.imported_at = time.monotonic()
+    readiness.record("import", readiness.imported_at - IMPORT_STARTED)
+
+
+async def _phase(name: str, step) -> None:
+    started = time.monotonic()
+    try:
+        result = step()
+        if asyncio.iscoroutine(result):
+            await result
+    except Exception as exc:
+        # A dependency that is down must not keep the worker out of rotation forever;
+        # the request that needs it will fail (and retry) on its own.
+        readiness.errors[name] = str(exc)
+        logger.warning("⚠️  [WARM-UP] %s failed: %s", name, exc)
+    finally:
+        readiness.record(name, time.monotonic() - started)
+
+
+async def warm_up(steps: list[tuple[str, object]]) -> None:
+    """
+    Run the named warm-up ``steps`` in order, then mark the worker ready.
+
+    A step is a coroutine function or a blocking callable; blocking ones run in a
+    thread so the event loop keeps answering ``/health`` meanwhile.
+    """
+    readiness.warm_up_started_at = time.monotonic()
+    for name, step in steps:
+        if asyncio.iscoroutinefunction(step):
+            await _phase(name, step)
+        else:
+            await _phase(name, lambda step=step: asyncio.to_thread(step))
+    readiness.ready_at = time.monotonic()
+    readiness.record("warm_up", readiness.ready_at - readiness.warm_up_started_at)
+    READY.set(1)
+    logger.info(
+        "✅ [WARM-UP] Ready in %.2fs (imports %.2fs, warm-up %.2fs)",
+        readiness.ready_at - IMPORT_STARTED, readiness.phases.get("import", 0.0), readiness.phases["warm_up"],
+    )
+
+
+# ── Import profile ────────────────────────────────────────────────────────────
+
+def import_profile(module: str = "main") -> list[tuple[str, float, float]]:
+    """``(module, self_seconds, cumulative_seconds)`` for every import made by ``import module``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--imports", action="store_true", help="profile `import main` and print the slowest modules")
+    parser.add_argument("--module", default="main", help="module to profile (default: main)")
+    parser.add_argument("--top", type=int, default=25, help="rows to print")
+    args = parser.parse_args()
+    if not args.imports:
+        parser.print_help()
+        return
+
+    rows = import_profile(args.module)
+    total = next((cumulative for name, _, cumulative in rows if name == args.module), 0.0)
+    print(f"import {args.module}: {total:.3f}s, {len(rows)} modules\n")
+    print(f"{'cumulative':>10}  {'self':>8}  module")
+    for name, self_seconds, cumulative in sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]:
+        print(f"{cumulative:>9.3f}s  {self_seconds:>7.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    main()
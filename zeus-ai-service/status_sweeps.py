@@ -0,0 +1,131 @@
+"""
+Date-driven statuses: expires quotations and unpaid orders, and activates and
+expires policies (see ``migrations/006_status_sweeps.sql``).
+
+Every ``ZEUS_STATUS_SWEEP_INTERVAL_SECONDS`` each worker calls the
+``sweep_statuses`` RPC. The RPC changes at most ``ZEUS_STATUS_SWEEP_BATCH_SIZE``
+rows of each kind:
+
+* quotations still draft or sent after ``valid_until``        → ``expired``
+* orders unpaid for ``ZEUS_ORDER_PAYMENT_DAYS``                → payment ``expired``, policy ``cancelled``,
+                                                                quotation ``expired``
+* paid orders whose ``policy_start_date`` has come             → policy ``active``
+* active policies past ``policy_end_date``                     → policy ``expired``
+
+Batches repeat until every kind comes back short of a full batch or
+``ZEUS_STATUS_SWEEP_MAX_BATCHES`` ran. The RPC takes a Postgres advisory lock,
+so when several workers or pods sweep at once, only one of them does the work
+and the rest skip. Readers can then trust the stored statuses instead of
+re-deriving them from the dates.
+
+    python status_sweeps.py --once     # one run now, then exit (cron, manual backfill)
+"""
+
+import os
+import time
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from periodic import PeriodicJob, once_main
+from telemetry import Counter, Gauge, Histogram, registry
+
+logger = logging.getLogger("zeus.status_sweeps")
+
+STATUS_SWEEP_ENABLED = os.environ.get("ZEUS_STATUS_SWEEP_ENABLED", "true").lower() in ("1", "true", "yes")
+STATUS_SWEEP_INTERVAL_SECONDS = float(os.environ.get("ZEUS_STATUS_SWEEP_INTERVAL_SECONDS", "300"))
+STATUS_SWEEP_BATCH_SIZE = int(os.environ.get("ZEUS_STATUS_SWEEP_BATCH_SIZE", "1000"))
+STATUS_SWEEP_MAX_BATCHES = int(os.environ.get("ZEUS_STATUS_SWEEP_MAX_BATCHES", "20"))
+ORDER_PAYMENT_DAYS = int(os.environ.get("ZEUS_ORDER_PAYMENT_DAYS", "7"))
+
+SWEEP_KINDS = ("quotations_expired", "orders_expired", "policies_activated", "policies_expired")
+
+SWEPT = registry.register(Counter(
+    "zeus_status_sweep_rows_total", "Rows whose status sweep_statuses changed", ("kind",),
+))
+SWEEP_BATCH_DURATION = registry.register(Histogram(
+    "zeus_status_sweep_batch_seconds", "Duration of one sweep_statuses batch",
+))
+SWEEP_RUNS = registry.register(Counter(
+    "zeus_status_sweep_runs_total", "Status sweep runs by outcome: swept, skipped (another worker held the lock), failed",
+    ("outcome",),
+))
+SWEEP_LAST_SUCCESS = registry.register(Gauge(
+    "zeus_status_sweep_last_success_timestamp_seconds", "Unix time of the last status sweep this worker completed",
+))
+
+
+def sweep_batch(batch_size: int = STATUS_SWEEP_BATCH_SIZE, payment_days: int = ORDER_PAYMENT_DAYS) -> dict:
+    """One ``sweep_statuses`` call (blocking)."""
+    from database import get_supabase_client
+
+    started = time.perf_counter()
+    response = get_supabase_client().rpc(
+        "sweep_statuses", {"p_batch_size": batch_size, "p_payment_days": payment_days},
+    ).execute()
+    SWEEP_BATCH_DURATION.observe(time.perf_counter() - started)
+    result = response.data or {}
+    for kind in SWEEP_KINDS:
+        SWEPT.inc(result.get(kind, 0), kind=kind)
+    return result
+
+
+class StatusSweeper(PeriodicJob):
+    """Runs status sweeps on a schedule in the background of the app lifespan."""
+
+    description = "Status sweep"
+    log_icon = "⏱️ "
+    log_tag = "[SWEEP]"
+    logger = logger
+    enabled = STATUS_SWEEP_ENABLED
+    run_at_start = True
+
+    def __init__(
+        self,
+        interval_seconds: float = STATUS_SWEEP_INTERVAL_SECONDS,
+        batch_size: int = STATUS_SWEEP_BATCH_SIZE,
+        max_batches: int = STATUS_SWEEP_MAX_BATCHES,
+    ) -> None:
+        super().__init__(interval_seconds)
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+
+    async def run_once(self) -> dict:
+        """Sweep until no kind fills a batch or ``max_batches`` ran; returns the totals of this run."""
+        started = time.perf_counter()
+        results, skipped = await self.run_batches(
+            lambda: sweep_batch(self.batch_size),
+            self.max_batches,
+            full=lambda result: any(result.get(kind, 0) >= self.batch_size for kind in SWEEP_KINDS),
+        )
+        totals = {kind: sum(result.get(kind, 0) for result in results) for kind in SWEEP_KINDS}
+        totals["batches"] = len(results)
+        if skipped:
+            totals["skipped"] = skipped
+        totals["seconds"] = round(time.perf_counter() - started, 3)
+        SWEEP_RUNS.inc(outcome="skipped" if skipped else "swept")
+        if not skipped:
+            SWEEP_LAST_SUCCESS.set(time.time())
+        if any(totals[kind] for kind in SWEEP_KINDS):
+            logger.info(
+                "⏱️  [SWEEP] Expired %s quotation(s) and %s unpaid order(s); activated %s and expired %s policy(ies) in %s batch(es)",
+                totals["quotations_expired"], totals["orders_expired"],
+                totals["policies_activated"], totals["policies_expired"], totals["batches"],
+            )
+        return totals
+
+    def failed(self, exc: Exception) -> None:
+        SWEEP_RUNS.inc(outcome="failed")
+
+
+status_sweeper = StatusSweeper()
+
+
+def main() -> None:
+    once_main(__doc__, "run the sweeps once and exit", StatusSweeper)
+
+
+if __name__ == "__main__":
+    main()
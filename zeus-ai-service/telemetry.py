@@ -0,0 +1,366 @@
+"""
+Latency instrumentation: spans per request / LLM call / tool / DB call, exported as
+Prometheus text on ``/metrics`` and, optionally, as OpenTelemetry spans.
+
+The metric registry is a small in-process implementation so the service has no
+hard dependency on ``prometheus_client``. OpenTelemetry is only used when
+``OTEL_EXPORTER_OTLP_ENDPOINT`` is set and the SDK is installed, e.g. to point
+at a local collector::
+
+    OTEL_EXPORTER_OTLP_ENDPOINT=http://localhost:4318 uvicorn main:app
+"""
+
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+from uuid import UUID
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger("zeus.telemetry")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("zeus_request_id", default=None)
+
+
+# ── Metric registry ───────────────────────────────────────────────────────────
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: Optional[tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self) -> dict[tuple[str, ...], tuple[float, int]]:
+        """(sum, count) per label set — used by the benchmark harness to diff runs."""
+        with self._lock:
+            return {key: (total, count) for key, (_, total, count) in self._values.items()}
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', str(bound)))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], list[str]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], list[str]]) -> None:
+        """Add a callable that renders extra exposition lines at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as exc:
+                logger.warning("⚠️  [METRICS] Collector %s failed: %s", collector.__name__, exc)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+SPAN_DURATION = registry.register(Histogram(
+    "zeus_span_duration_seconds", "Duration of instrumented spans", ("kind", "name"),
+))
+SPAN_ERRORS = registry.register(Counter(
+    "zeus_span_errors_total", "Spans that ended with an exception", ("kind", "name"),
+))
+HTTP_REQUESTS = registry.register(Counter(
+    "zeus_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"),
+))
+HTTP_DURATION = registry.register(Histogram(
+    "zeus_http_request_duration_seconds", "HTTP request latency (time to response headers for streams)", ("method", "route"),
+))
+ACTIVE_STREAMS = registry.register(Gauge(
+    "zeus_active_streams", "SSE chat streams currently open in this worker",
+))
+LLM_TTFT = registry.register(Histogram(
+    "zeus_llm_time_to_first_token_seconds", "Time from LLM call start to the first streamed token", ("model",),
+))
+STREAM_TTFT = registry.register(Histogram(
+    "zeus_stream_time_to_first_token_seconds", "Time from request start to the first SSE token sent to the client", ("model",),
+))
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+# ── OpenTelemetry hook ────────────────────────────────────────────────────────
+
+_tracer = None
+_trace_api = None
+
+
+def configure_tracing(service_name: str = "zeus-ai-service") -> bool:
+    """Export spans over OTLP/HTTP when OTEL_EXPORTER_OTLP_ENDPOINT is set and the SDK is installed."""
+    global _tracer, _trace_api
+    endpoint = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT")
+    if not endpoint:
+        return False
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        logger.warning("⚠️  [TRACING] OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk / exporter are not installed")
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=f"{endpoint.rstrip('/')}/v1/traces")))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("zeus")
+    _trace_api = trace
+    logger.info("📡 [TRACING] Exporting OpenTelemetry spans to %s", endpoint)
+    return True
+
+
+def shutdown_tracing() -> None:
+    """Flush spans still buffered in the batch processor; called on graceful shutdown."""
+    global _tracer
+    if _trace_api is None:
+        return
+    provider = _trace_api.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+    _tracer = None
+
+
+def _start_otel_span(name: str, attributes: dict):
+    if _tracer is None:
+        return None
+    return _tracer.start_span(name, attributes={k: str(v) for k, v in attributes.items() if v is not None})
+
+
+def _end_otel_span(otel_span, error: Optional[BaseException] = None) -> None:
+    if otel_span is None:
+        return
+    if error is not None:
+        otel_span.record_exception(error)
+    otel_span.end()
+
+
+# ── Spans ─────────────────────────────────────────────────────────────────────
+
+@contextmanager
+def span(kind: str, name: str, **attributes: Any) -> Iterator[None]:
+    """Time a block as a span of ``kind`` (request, llm, tool, db, ...)."""
+    otel_span = _start_otel_span(f"{kind} {name}", {"request_id": request_id_var.get(), **attributes})
+    start = time.perf_counter()
+    error: Optional[BaseException] = None
+    try:
+        if otel_span is not None:
+            # Make nested spans (tools, DB calls) children of this one
+            with _trace_api.use_span(otel_span, end_on_exit=False):
+                yield
+        else:
+            yield
+    except BaseException as exc:
+        error = exc
+        SPAN_ERRORS.inc(kind=kind, name=name)
+        raise
+    finally:
+        SPAN_DURATION.observe(time.perf_counter() - start, kind=kind, name=name)
+        _end_otel_span(otel_span, error)
+
+
+class _OpenSpan:
+    """A span started and finished from separate callbacks."""
+
+    __slots__ = ("kind", "name", "start", "first_token_at", "otel_span")
+
+    def __init__(self, kind: str, name: str, **attributes: Any) -> None:
+        self.kind = kind
+        self.name = name
+        self.start = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.otel_span = _start_otel_span(f"{kind} {name}", {"request_id": request_id_var.get(), **attributes})
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        SPAN_DURATION.observe(time.perf_counter() - self.start, kind=self.kind, name=self.name)
+        if error is not None:
+            SPAN_ERRORS.inc(kind=self.kind, name=self.name)
+        _end_otel_span(self.otel_span, error)
+
+
+def llm_model_name(serialized: Optional[dict], metadata: Optional[dict]) -> str:
+    if metadata and metadata.get("ls_model_name"):
+        return metadata["ls_model_name"]
+    kwargs = (serialized or {}).get("kwargs", {})
+    return kwargs.get("model") or kwargs.get("model_name") or "unknown"
+
+
+class TelemetryCallback(BaseCallbackHandler):
+    """Opens a span per LLM call and per tool call of an agent run, and records TTFT."""
+
+    # Run on the event loop, not in a thread: the spans and first-token times must be taken as
+    # the events happen, and the OTel context of the request must be the current one.
+    run_inline = True
+
+    def __init__(self) -> None:
+        self._spans: dict[UUID, _OpenSpan] = {}
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        self._spans[run_id] = _OpenSpan("llm", llm_model_name(serialized, metadata))
+
+    def on_llm_start(self, serialized: dict, prompts: list[str], *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        self._spans[run_id] = _OpenSpan("llm", llm_model_name(serialized, metadata))
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        open_span = self._spans.get(run_id)
+        if open_span is not None and open_span.first_token_at is None:
+            open_span.first_token_at = time.perf_counter()
+            LLM_TTFT.observe(open_span.first_token_at - open_span.start, model=open_span.name)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        open_span = self._spans.pop(run_id, None)
+        if open_span is not None:
+            open_span.finish()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        open_span = self._spans.pop(run_id, None)
+        if open_span is not None:
+            open_span.finish(error)
+
+    def on_tool_start(self, serialized: dict, input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._spans[run_id] = _OpenSpan("tool", (serialized or {}).get("name") or kwargs.get("name") or "tool")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        open_span = self._spans.pop(run_id, None)
+        if open_span is not None:
+            open_span.finish()
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        open_span = self._spans.pop(run_id, None)
+        if open_span is not None:
+            open_span.finish(error)
+
+
+# ── DB instrumentation ────────────────────────────────────────────────────────
+
+def _db_span_name(request) -> str:
+    path = request.url.path
+    target = path.split("/rest/v1/", 1)[-1] or path
+    return f"{request.method} {target}"
+
+
+class _DbSpanTransport(httpx.BaseTransport):
+    """Wraps a transport so each request is a ``db`` span, including ones the transport raises on."""
+
+    def __init__(self, transport: httpx.BaseTransport) -> None:
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with span("db", _db_span_name(request)):
+            return self._transport.handle_request(request)
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+def instrument_httpx_client(client: httpx.Client) -> None:
+    """Time every request made through an httpx client (the PostgREST session) as a ``db`` span."""
+    # Response event hooks never run for a connect error or timeout, so wrap the transport itself
+    client._transport = _DbSpanTransport(client._transport)
+    client._mounts = {
+        pattern: _DbSpanTransport(transport) if transport is not None else None
+        for pattern, transport in client._mounts.items()
+    }
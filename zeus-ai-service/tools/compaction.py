@@ -0,0 +1,132 @@
+import json
+import math
+import logging
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+
+logger = logging.getLogger("zeus.tools.compaction")
+
+
+@dataclass(frozen=True)
+class ToolOutputLimit:
+    """Projection, row cap and token budget applied to one tool's output."""
+    columns: Optional[tuple[str, ...]]
+    max_rows: int
+    max_tokens: int
+
+
+# Everything a tool returns is re-sent to the model on every following ReAct step,
+# so each tool only keeps the columns the agent actually needs to answer or to
+# chain into the next tool call (car_model_id / plan_id feed create_quotation).
+TOOL_OUTPUT_LIMITS: dict[str, ToolOutputLimit] = {
+    "search_quotation_details": ToolOutputLimit(
+        columns=(
+            "car_model_id", "plan_id", "brand", "model", "sub_model", "year",
+            "car_estimated_price", "plan_type", "plan_name", "base_premium", "deductible", "estimated",
+        ),
+        max_rows=24,
+        max_tokens=1500,
+    ),
+    "search_quotation_details.catalogue": ToolOutputLimit(
+        columns=("brand", "model"),
+        max_rows=1,
+        max_tokens=800,
+    ),
+    "search_policy_documents": ToolOutputLimit(
+        columns=("section", "plan_type", "similarity", "content"),
+        max_rows=4,
+        max_tokens=1200,
+    ),
+    "create_quotation": ToolOutputLimit(columns=None, max_rows=1, max_tokens=400),
+    # Matrix of at most MAX_VEHICLES trims x the plans, plus up to MAX_BULK_QUOTATIONS quotations.
+    "compare_quotations": ToolOutputLimit(columns=None, max_rows=8, max_tokens=1500),
+    "create_order": ToolOutputLimit(columns=None, max_rows=1, max_tokens=400),
+    "update_order_payment": ToolOutputLimit(columns=None, max_rows=1, max_tokens=300),
+    "get_order_status": ToolOutputLimit(columns=None, max_rows=1, max_tokens=300),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, conservative token estimate: ~4 ASCII chars per token, 1 token per non-ASCII char."""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def to_tool_json(payload: dict) -> str:
+    """Serialize a tool payload without whitespace or \\u-escaping Thai text."""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def select_columns(tool_name: str) -> str:
+    """Column list for a PostgREST ``select()`` matching the tool's projection."""
+    columns = TOOL_OUTPUT_LIMITS[tool_name].columns
+    return ", ".join(columns) if columns else "*"
+
+
+def compact_dict(data: dict, keys: Optional[Iterable[str]] = None) -> dict:
+    """Keep only ``keys`` (all when omitted) and drop empty values."""
+    selected = data.items() if keys is None else ((k, data.get(k)) for k in keys)
+    return {k: v for k, v in selected if v not in (None, "", [], {})}
+
+
+def encode_table(records: list[dict], columns: Optional[Iterable[str]] = None) -> dict:
+    """Encode a list of row dicts as a header plus positional rows."""
+    if columns is None:
+        columns = list(records[0].keys()) if records else []
+    columns = list(columns)
+    return {
+        "columns": columns,
+        "rows": [[_compact_value(record.get(col)) for col in columns] for record in records],
+    }
+
+
+def compact_records(
+    tool_name: str,
+    result: str,
+    records: list[dict],
+    more_hint: str = "narrow the search to see them",
+    **extra: Any,
+) -> str:
+    """
+    Render tabular tool output under the tool's row cap and token budget.
+
+    Rows beyond ``max_rows`` (or beyond the token budget) are dropped from the tail
+    and replaced by a ``more`` summary so the model knows to narrow its query.
+    """
+    limit = TOOL_OUTPUT_LIMITS[tool_name]
+    total = len(records)
+    kept = records[: limit.max_rows]
+
+    while True:
+        payload = {"result": result, **extra, **encode_table(kept, limit.columns)}
+        omitted = total - len(kept)
+        if omitted:
+            payload["more"] = f"{omitted} more row(s) omitted — {more_hint}."
+        text = to_tool_json(payload)
+        if len(kept) <= 1 or estimate_tokens(text) <= limit.max_tokens:
+            break
+        kept = kept[: max(1, len(kept) * 3 // 4)]
+
+    if len(kept) < total:
+        logger.info("✂️  [COMPACT] %s: kept %s/%s rows (~%s tokens)", tool_name, len(kept), total, estimate_tokens(text))
+    return text
+
+
+def compact_payload(tool_name: str, payload: dict) -> str:
+    """Render a single-object tool response, dropping empty fields to stay within budget."""
+    limit = TOOL_OUTPUT_LIMITS[tool_name]
+    cleaned = {
+        k: compact_dict(v) if isinstance(v, dict) else v
+        for k, v in payload.items()
+    }
+    text = to_tool_json(cleaned)
+    if estimate_tokens(text) > limit.max_tokens:
+        logger.warning("⚠️  [COMPACT] %s output (~%s tokens) exceeds budget of %s", tool_name, estimate_tokens(text), limit.max_tokens)
+    return text
+
+
+def _compact_value(value: Any) -> Any:
+    """Render whole-number floats (prices, premiums) without a trailing '.0'."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
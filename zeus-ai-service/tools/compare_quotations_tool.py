@@ -0,0 +1,249 @@
+import logging
+from typing import Optional
+from pydantic import BaseModel, Field
+from langchain_core.tools import tool
+from database import get_supabase_client
+from pricing import pricing_engine
+from tools.compaction import compact_dict, compact_payload, encode_table, _compact_value
+from tools.create_quotation_tool import QUOTATION_VALID_DAYS, quotation_record
+from tools.quotation_db_tool import _clean_sub_model
+
+logger = logging.getLogger("zeus.tools.compare_quotations")
+
+# A matrix wider than this is no longer a comparison the user can read.
+MAX_VEHICLES = 8
+# Quotations created by one call; more is almost certainly a mis-specified request.
+MAX_BULK_QUOTATIONS = 10
+
+PLAN_COLUMNS = ("plan_id", "plan_type", "plan_name", "insurer_name")
+
+
+class VehicleSpec(BaseModel):
+    """One vehicle to compare; split the name as for search_quotation_details."""
+    brand: Optional[str] = Field(None, description='Car brand only, e.g. "Honda".')
+    model: Optional[str] = Field(None, description='Car model only, e.g. "Civic". Do NOT include the brand.')
+    sub_model: Optional[str] = Field(None, description='Trim only, e.g. "e:HEV RS". Do NOT include the year.')
+    year: Optional[int] = Field(None, description="Manufacturing year, e.g. 2024.")
+
+    def label(self) -> str:
+        return " ".join(str(part) for part in (self.brand, self.model, self.sub_model, self.year) if part)
+
+
+def _term(value: str) -> str:
+    """A search term safe inside a PostgREST ``or`` filter (its delimiters and wildcards removed)."""
+    return "".join(ch for ch in value if ch not in ',()"*%\\').strip()
+
+
+def _vehicle_filter(vehicle: VehicleSpec) -> Optional[str]:
+    conditions = [
+        f'{column}.ilike."*{_term(value)}*"'
+        for column, value in (("brand", vehicle.brand), ("model", vehicle.model))
+        if value and _term(value)
+    ]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else f"and({','.join(conditions)})"
+
+
+def _contains(text: Optional[str], term: str) -> bool:
+    return term.lower() in (text or "").lower()
+
+
+def _resolve(vehicle: VehicleSpec, rows: list[dict], notes: list[str]) -> list[dict]:
+    """The catalog rows of one vehicle, relaxing trim and year like search_quotation_details does."""
+    matched = [
+        row for row in rows
+        if (not vehicle.brand or _contains(row["brand"], _term(vehicle.brand)))
+        and (not vehicle.model or _contains(row["model"], _term(vehicle.model)))
+    ]
+    if matched and vehicle.sub_model:
+        sub_model = _clean_sub_model(vehicle.sub_model)
+        narrowed = [row for row in matched if _contains(row["sub_model"], sub_model)]
+        if narrowed:
+            matched = narrowed
+        else:
+            notes.append(f"{vehicle.label()}: no '{sub_model}' trim, all trims shown")
+    if matched and vehicle.year:
+        narrowed = [row for row in matched if row["year"] == vehicle.year]
+        if narrowed:
+            matched = narrowed
+        else:
+            notes.append(f"{vehicle.label()}: not offered for {vehicle.year}, other years shown")
+    return matched
+
+
+def _cell(row: Optional[dict]) -> Optional[list]:
+    if row is None:
+        return None
+    cell = [_compact_value(float(row["base_premium"])), _compact_value(float(row["deductible"]))]
+    return cell + ["estimated"] if row.get("estimated") else cell
+
+
+@tool
+def compare_quotations(
+    vehicles: list[VehicleSpec],
+    plan_types: Optional[list[str]] = None,
+    create_quotations: bool = False,
+    session_id: Optional[str] = None,
+    customer_name: Optional[str] = None,
+    customer_email: Optional[str] = None,
+    customer_phone: Optional[str] = None,
+) -> str:
+    """
+    Compare insurance premiums for several vehicles and plans in ONE call, instead of
+    calling search_quotation_details once per car and create_quotation once per choice.
+    Returns a "plans" table and a "matrix" with one row per vehicle trim and one
+    "plan_<plan_id>" column per plan; each cell is [base_premium, deductible] in THB,
+    with a third "estimated" element when the premium is computed from the rate card.
+
+    Use this tool when the user wants to compare two or more cars, trims or plans.
+
+    Args:
+        vehicles: The vehicles to compare, each split into brand / model / sub_model / year.
+        plan_types: Optional plan types to include (e.g. ["Type 1", "Type 2+"]); all plans when omitted.
+        create_quotations: Also create a draft quotation for every cell of the matrix, in one insert.
+            Only when the user explicitly asks for quotations for all compared options.
+        session_id: The current chat session ID; required with create_quotations.
+        customer_name: Optional customer name for the created quotations.
+        customer_email: Optional customer email for the created quotations.
+        customer_phone: Optional customer phone number for the created quotations.
+    """
+    logger.info("⚖️  [COMPARE] Comparing %s vehicle(s), plans: %s", len(vehicles), plan_types or "all")
+
+    filters = [(vehicle, _vehicle_filter(vehicle)) for vehicle in vehicles]
+    unusable = [vehicle.label() or "(empty)" for vehicle, condition in filters if condition is None]
+    if unusable or not vehicles:
+        logger.warning("⚠️  [COMPARE] Vehicles without brand or model: %s", unusable)
+        return compact_payload("compare_quotations", {
+            "result": "Error: every vehicle needs at least a brand or a model.",
+            "invalid": unusable,
+        })
+    if create_quotations and not session_id:
+        return compact_payload("compare_quotations", {
+            "result": "Error: session_id is required to create quotations.",
+            "success": False,
+        })
+
+    # One catalog lookup for every vehicle; trims, years and plans are narrowed below.
+    client = get_supabase_client()
+    matrix = pricing_engine.try_matrix()
+    if matrix is not None:
+        # The matrix's name index finds each vehicle's cars; a car named twice is listed once,
+        # and rows stay in catalog order as with a full scan.
+        found = {
+            (matrix.car_index[row["car_model_id"]], matrix.plan_index[row["plan_id"]]): row
+            for vehicle, _ in filters
+            for row in matrix.search(_term(vehicle.brand or ""), _term(vehicle.model or ""))
+        }
+        rows = [found[cell] for cell in sorted(found)]
+    else:
+        rows = (
+            client.table("vw_quotation_details")
+            .select("*")
+            .or_(",".join(condition for _, condition in filters))
+            .execute()
+            .data
+        ) or []
+        logger.info("🔍 [COMPARE] Catalog lookup returned %s rows", len(rows))
+
+    if plan_types:
+        wanted = {plan_type.strip().lower() for plan_type in plan_types}
+        rows = [row for row in rows if row["plan_type"].lower() in wanted]
+
+    notes: list[str] = []
+    not_found: list[str] = []
+    by_vehicle: dict[int, list[dict]] = {}
+    # Share the matrix between the requested vehicles so one broad name cannot crowd out the rest.
+    per_vehicle = max(1, MAX_VEHICLES // len(vehicles))
+    for vehicle, _ in filters:
+        matched = _resolve(vehicle, rows, notes)
+        if not matched:
+            not_found.append(vehicle.label())
+        trims = list(dict.fromkeys(row["car_model_id"] for row in matched))
+        if len(trims) > per_vehicle:
+            notes.append(f"{vehicle.label()}: {len(trims) - per_vehicle} more trim(s) omitted — specify sub_model or year")
+        kept = set(trims[:per_vehicle])
+        for row in matched:
+            if row["car_model_id"] in kept and row not in by_vehicle.get(row["car_model_id"], []):
+                by_vehicle.setdefault(row["car_model_id"], []).append(row)
+
+    if not by_vehicle:
+        logger.warning("⚠️  [COMPARE] Nothing matched")
+        return compact_payload("compare_quotations", {
+            "result": "No matching vehicles or plans found. Use search_quotation_details to find the exact names.",
+            "not_found": not_found,
+        })
+
+    car_model_ids = list(by_vehicle)
+    if len(car_model_ids) > MAX_VEHICLES:
+        notes.append(f"{len(car_model_ids) - MAX_VEHICLES} more vehicle(s) omitted — compare fewer at a time")
+        car_model_ids = car_model_ids[:MAX_VEHICLES]
+
+    plans = {row["plan_id"]: row for ids in car_model_ids for row in by_vehicle[ids]}
+    plan_ids = sorted(plans)
+    cells = {(row["car_model_id"], row["plan_id"]): row for ids in car_model_ids for row in by_vehicle[ids]}
+
+    matrix_rows = []
+    for car_model_id in car_model_ids:
+        first = by_vehicle[car_model_id][0]
+        matrix_rows.append([
+            car_model_id,
+            f"{first['brand']} {first['model']} {first['sub_model']}",
+            first["year"],
+            _compact_value(float(first["car_estimated_price"])),
+            *[_cell(cells.get((car_model_id, plan_id))) for plan_id in plan_ids],
+        ])
+    logger.info("✅ [COMPARE] %s vehicle(s) x %s plan(s), %s cells", len(car_model_ids), len(plan_ids), len(cells))
+
+    payload = {
+        "result": (
+            f"Compared {len(car_model_ids)} vehicle(s) across {len(plan_ids)} plan(s). "
+            "Cells are [base_premium, deductible] in THB, marked \"estimated\" when computed from the rate card; "
+            "null means the plan is not offered for that car."
+        ),
+        "plans": encode_table([plans[plan_id] for plan_id in plan_ids], PLAN_COLUMNS),
+        "matrix": {
+            "columns": ["car_model_id", "vehicle", "year", "car_estimated_price", *[f"plan_{p}" for p in plan_ids]],
+            "rows": matrix_rows,
+        },
+        "not_found": not_found,
+        "notes": notes,
+    }
+
+    if create_quotations:
+        payload.update(_create_quotations(
+            client, list(cells.values()), session_id, customer_name, customer_email, customer_phone,
+        ))
+    return compact_payload("compare_quotations", compact_dict(payload))
+
+
+def _create_quotations(client, cells: list[dict], session_id: str, customer_name: Optional[str],
+                       customer_email: Optional[str], customer_phone: Optional[str]) -> dict:
+    """Draft quotations for every compared cell, in one insert."""
+    if len(cells) > MAX_BULK_QUOTATIONS:
+        logger.warning("⚠️  [COMPARE] Refusing to create %s quotations", len(cells))
+        return {
+            "success": False,
+            "quotations_error": (
+                f"{len(cells)} quotations requested, at most {MAX_BULK_QUOTATIONS} per call. "
+                "Ask the user which vehicles and plans they want quoted."
+            ),
+        }
+
+    records = [quotation_record(cell, session_id, customer_name, customer_email, customer_phone) for cell in cells]
+    logger.info("💾 [DATABASE] Inserting %s quotation records in one request", len(records))
+    try:
+        created = client.table("quotations").insert(records).execute().data or []
+    except Exception as e:
+        logger.error("❌ [EXCEPTION] Failed to create quotations: %s", str(e))
+        return {"success": False, "quotations_error": f"Error creating quotations: {str(e)}"}
+
+    logger.info("✅ [SUCCESS] Created %s quotations", len(created))
+    return {
+        "success": bool(created),
+        "valid_days": QUOTATION_VALID_DAYS,
+        "quotations": encode_table(
+            [{**row, "quotation_id": str(row["id"])} for row in created],
+            ("quotation_id", "quotation_number", "car_model_id", "plan_id", "total_premium"),
+        ),
+    }
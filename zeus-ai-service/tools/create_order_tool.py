@@ -1,13 +1,17 @@
-import json
 import uuid
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
 from langchain_core.tools import tool
 from database import get_supabase_client
+from tools.compaction import compact_payload
 
 logger = logging.getLogger("zeus.tools.order")
 
+# Orders in these states are closed: the status sweep expires unpaid orders and
+# cancels their policy and quotation, so a late payment must not reactivate them.
+CLOSED_PAYMENT_STATUSES = ("expired", "refunded")
+
 
 def _generate_order_number() -> str:
     """Generate a unique order number in format ORD-YYYYMMDD-XXXX"""
@@ -45,148 +49,117 @@ def create_order(
         A JSON string with the created order details including order number, payment instructions, and policy information.
     """
     logger.info("🛒 [CREATE ORDER] Starting order creation")
-    logger.info(f"   Quotation ID: {quotation_id}")
-    logger.info(f"   Payment method: {payment_method}")
+    logger.debug("   Quotation ID: %s", quotation_id)
+    logger.debug("   Payment method: %s", payment_method)
     
     client = get_supabase_client()
     
-    # Fetch the quotation
-    logger.info("🔍 [DATABASE] Fetching quotation...")
-    quotation_response = client.table("quotations").select("*").eq("id", quotation_id).execute()
+    # Generate order and policy numbers (discarded if the quotation already has an order)
+    order_number = _generate_order_number()
+    policy_number = _generate_policy_number()
     
-    if not quotation_response.data or len(quotation_response.data) == 0:
-        logger.error(f"❌ [ERROR] Quotation {quotation_id} not found")
-        return json.dumps({
-            "result": "Error: Quotation not found. Please provide a valid quotation ID.",
+    # Validate the quotation, create the order and accept the quotation in one transaction
+    # (migrations/003_order_rpcs.sql); retries get the existing order back.
+    logger.info("💾 [DATABASE] Creating order for quotation %s...", quotation_id)
+    try:
+        outcome = client.rpc("create_order_for_quotation", {
+            "p_quotation_id": quotation_id,
+            "p_payment_method": payment_method,
+            "p_order_number": order_number,
+            "p_policy_number": policy_number,
+        }).execute().data
+    except Exception as e:
+        logger.error("❌ [EXCEPTION] Failed to create order: %s", str(e))
+        logger.exception(e)
+        return compact_payload("create_order", {
+            "result": f"Error creating order: {str(e)}",
             "success": False
         })
     
-    quotation = quotation_response.data[0]
-    logger.info(f"✅ [FOUND] Quotation: {quotation['quotation_number']}")
-    logger.info(f"   Status: {quotation['status']}")
-    logger.info(f"   Total premium: {quotation['total_premium']} THB")
-    
-    # Check if quotation is still valid
-    valid_until = datetime.fromisoformat(quotation['valid_until'].replace('Z', '+00:00'))
-    logger.info(f"📅 [VALIDITY] Valid until: {valid_until.strftime('%Y-%m-%d')}")
-    if datetime.now(valid_until.tzinfo) > valid_until:
-        logger.error(f"❌ [ERROR] Quotation expired on {valid_until}")
-        return json.dumps({
-            "result": f"Error: This quotation expired on {valid_until.strftime('%Y-%m-%d')}. Please request a new quotation.",
+    status = outcome.get("status") if outcome else None
+    if status == "not_found":
+        logger.error("❌ [ERROR] Quotation %s not found", quotation_id)
+        return compact_payload("create_order", {
+            "result": "Error: Quotation not found. Please provide a valid quotation ID.",
+            "success": False
+        })
+    if status not in ("expired", "exists", "created"):
+        logger.error("❌ [ERROR] Failed to insert order")
+        return compact_payload("create_order", {
+            "result": "Error: Failed to create order. Please try again.",
             "success": False
         })
     
-    # Check if quotation status is appropriate
-    if quotation['status'] == 'expired':
-        return json.dumps({
-            "result": "Error: This quotation has expired. Please request a new quotation.",
+    quotation = outcome["quotation"]
+    logger.info("✅ [FOUND] Quotation: %s", quotation['quotation_number'])
+    logger.debug("   Status: %s", quotation['status'])
+    logger.debug("   Total premium: %s THB", quotation['total_premium'])
+    
+    if status == "expired":
+        valid_until = datetime.fromisoformat(quotation['valid_until'].replace('Z', '+00:00'))
+        if datetime.now(valid_until.tzinfo) > valid_until:
+            logger.error("❌ [ERROR] Quotation expired on %s", valid_until)
+            return compact_payload("create_order", {
+                "result": f"Error: This quotation expired on {valid_until.strftime('%Y-%m-%d')}. Please request a new quotation.",
+                "success": False
+            })
+        # Still within valid_until: the sweep expired it with an order left unpaid
+        logger.error("❌ [ERROR] Quotation %s expired with its unpaid order", quotation['quotation_number'])
+        return compact_payload("create_order", {
+            "result": "Error: This quotation has expired because its order was not paid in time. Please request a new quotation.",
             "success": False
         })
     
-    # Check if order already exists for this quotation
-    logger.info("🔍 [CHECK] Checking for existing orders...")
-    existing_order = client.table("orders").select("*").eq("quotation_id", quotation_id).execute()
-    if existing_order.data and len(existing_order.data) > 0:
-        existing = existing_order.data[0]
-        logger.warning(f"⚠️  [DUPLICATE] Order already exists: {existing['order_number']}")
-        return json.dumps({
+    order = outcome["order"]
+    if status == "exists":
+        logger.warning("⚠️  [DUPLICATE] Order already exists: %s", order['order_number'])
+        return compact_payload("create_order", {
             "result": "An order already exists for this quotation.",
             "success": True,
             "order": {
-                "order_id": str(existing['id']),
-                "order_number": existing['order_number'],
+                "order_id": str(order['id']),
+                "order_number": order['order_number'],
                 "quotation_number": quotation['quotation_number'],
-                "payment_status": existing['payment_status'],
-                "payment_method": existing['payment_method'],
+                "payment_status": order['payment_status'],
+                "payment_method": order['payment_method'],
                 "total_amount": float(quotation['total_premium']),
-                "policy_number": existing['policy_number'],
-                "policy_status": existing['policy_status']
+                "policy_number": order['policy_number'],
+                "policy_status": order['policy_status']
             }
         })
     
-    # Generate order and policy numbers
-    order_number = _generate_order_number()
-    policy_number = _generate_policy_number()
-    logger.info(f"🔢 [GENERATE] Order number: {order_number}")
-    logger.info(f"🔢 [GENERATE] Policy number: {policy_number}")
-    
-    # Calculate policy dates (1 year from today)
-    policy_start = datetime.now().date()
-    policy_end = policy_start + timedelta(days=365)
-    logger.info(f"📅 [POLICY] Coverage: {policy_start} to {policy_end}")
-    
-    # Create order record
-    order_record = {
-        "quotation_id": quotation_id,
-        "order_number": order_number,
-        "payment_status": "pending" if payment_method == "pending" else "awaiting_confirmation",
-        "payment_method": payment_method,
-        "policy_number": policy_number,
-        "policy_start_date": policy_start.isoformat(),
-        "policy_end_date": policy_end.isoformat(),
-        "policy_status": "inactive"  # Will become active after payment
+    logger.info("✅ [SUCCESS] Order created successfully")
+    logger.debug("   Order ID: %s", order['id'])
+    logger.debug("   Order Number: %s", order['order_number'])
+    logger.debug("   Payment status: %s", order['payment_status'])
+    logger.info("📅 [POLICY] Coverage: %s to %s", order['policy_start_date'], order['policy_end_date'])
+    
+    # Prepare payment instructions based on method
+    payment_instructions = {
+        "credit_card": "Please proceed to the payment gateway to complete your credit card payment.",
+        "bank_transfer": f"Please transfer {quotation['total_premium']} THB to:\nBank: Bangkok Bank\nAccount: 123-456-7890\nName: Zeus Insurance Co., Ltd.\nReference: {order['order_number']}",
+        "promptpay": f"Please scan the QR code or transfer to PromptPay ID: 0123456789\nAmount: {quotation['total_premium']} THB\nReference: {order['order_number']}",
+        "pending": "Payment method not selected. Please choose a payment method to proceed."
     }
     
-    logger.info(f"💾 [DATABASE] Inserting order record: {order_number}")
-    
-    try:
-        insert_response = client.table("orders").insert(order_record).execute()
-        
-        if not insert_response.data:
-            logger.error("❌ [ERROR] Failed to insert order")
-            return json.dumps({
-                "result": "Error: Failed to create order. Please try again.",
-                "success": False
-            })
-        
-        created_order = insert_response.data[0]
-        
-        # Update quotation status to 'accepted'
-        logger.info("📝 [UPDATE] Marking quotation as 'accepted'")
-        client.table("quotations").update({"status": "accepted"}).eq("id", quotation_id).execute()
-        
-        logger.info(f"✅ [SUCCESS] Order created successfully")
-        logger.info(f"   Order ID: {created_order['id']}")
-        logger.info(f"   Order Number: {order_number}")
-        logger.info(f"   Payment status: {created_order['payment_status']}")
-        
-        # Prepare payment instructions based on method
-        payment_instructions = {
-            "credit_card": "Please proceed to the payment gateway to complete your credit card payment.",
-            "bank_transfer": f"Please transfer {quotation['total_premium']} THB to:\nBank: Bangkok Bank\nAccount: 123-456-7890\nName: Zeus Insurance Co., Ltd.\nReference: {order_number}",
-            "promptpay": f"Please scan the QR code or transfer to PromptPay ID: 0123456789\nAmount: {quotation['total_premium']} THB\nReference: {order_number}",
-            "pending": "Payment method not selected. Please choose a payment method to proceed."
+    return compact_payload("create_order", {
+        "result": "Order created successfully!",
+        "success": True,
+        "order": {
+            "order_id": str(order['id']),
+            "order_number": order['order_number'],
+            "quotation_number": quotation['quotation_number'],
+            "customer_name": quotation['customer_name'],
+            "total_amount": float(quotation['total_premium']),
+            "payment_status": order['payment_status'],
+            "payment_method": payment_method,
+            "payment_instructions": payment_instructions.get(payment_method, "Please contact support for payment instructions."),
+            "policy_number": order['policy_number'],
+            "policy_start_date": order['policy_start_date'],
+            "policy_end_date": order['policy_end_date'],
+            "policy_status": "inactive (will activate upon payment confirmation)"
         }
-        
-        return json.dumps({
-            "result": "Order created successfully!",
-            "success": True,
-            "order": {
-                "order_id": str(created_order['id']),
-                "order_number": order_number,
-                "quotation_number": quotation['quotation_number'],
-                "customer_name": quotation['customer_name'],
-                "customer_email": quotation['customer_email'],
-                "customer_phone": quotation['customer_phone'],
-                "total_amount": float(quotation['total_premium']),
-                "payment_status": created_order['payment_status'],
-                "payment_method": payment_method,
-                "payment_instructions": payment_instructions.get(payment_method, "Please contact support for payment instructions."),
-                "policy_number": policy_number,
-                "policy_start_date": policy_start.isoformat(),
-                "policy_end_date": policy_end.isoformat(),
-                "policy_status": "inactive (will activate upon payment confirmation)",
-                "created_at": created_order['created_at']
-            }
-        })
-    
-    except Exception as e:
-        logger.error(f"❌ [EXCEPTION] Failed to create order: {str(e)}")
-        logger.exception(e)
-        return json.dumps({
-            "result": f"Error creating order: {str(e)}",
-            "success": False
-        })
+    })
 
 
 @tool
@@ -198,6 +171,7 @@ def update_order_payment(
     """
     Update the payment status of an order and activate the policy if payment is confirmed.
     This tool is typically used by admin/system to confirm payments.
+    Expired and refunded orders are closed and cannot be updated.
     
     Use this tool when:
     - Payment has been confirmed/verified
@@ -213,29 +187,14 @@ def update_order_payment(
         A JSON string with the updated order status and policy activation details.
     """
     logger.info("💳 [UPDATE PAYMENT] Starting payment update")
-    logger.info(f"   Order ID: {order_id}")
-    logger.info(f"   New status: {payment_status}")
-    logger.info(f"   Payment date: {payment_date or 'Auto-set if paid'}")
+    logger.debug("   Order ID: %s", order_id)
+    logger.debug("   New status: %s", payment_status)
+    logger.debug("   Payment date: %s", payment_date or 'Auto-set if paid')
     
     client = get_supabase_client()
     
-    # Fetch the order
-    logger.info("🔍 [DATABASE] Fetching order...")
-    order_response = client.table("orders").select("*").eq("id", order_id).execute()
-    
-    if not order_response.data or len(order_response.data) == 0:
-        logger.error(f"❌ [ERROR] Order {order_id} not found")
-        return json.dumps({
-            "result": "Error: Order not found.",
-            "success": False
-        })
-    
-    order = order_response.data[0]
-    logger.info(f"✅ [FOUND] Order: {order['order_number']}")
-    logger.info(f"   Current payment status: {order['payment_status']}")
-    logger.info(f"   Current policy status: {order['policy_status']}")
-    
-    # Prepare update data
+    # The update depends only on the arguments, so it goes straight out; the
+    # returned row doubles as the existence check.
     update_data = {
         "payment_status": payment_status,
         "updated_at": datetime.now().isoformat()
@@ -249,29 +208,56 @@ def update_order_payment(
     # If payment is confirmed, activate the policy
     if payment_status == "paid":
         update_data["policy_status"] = "active"
-        logger.info(f"🎉 [ACTIVATE] Activating policy {order['policy_number']}")
     
     try:
         logger.info("💾 [DATABASE] Updating order record...")
-        update_response = client.table("orders").update(update_data).eq("id", order_id).execute()
+        update_response = (
+            client.table("orders")
+            .update(update_data)
+            .eq("id", order_id)
+            .not_.in_("payment_status", list(CLOSED_PAYMENT_STATUSES))
+            .execute()
+        )
         
         if not update_response.data:
-            logger.error("❌ [ERROR] Failed to update order")
-            return json.dumps({
-                "result": "Error: Failed to update order payment status.",
-                "success": False
+            # Nothing updated: either there is no such order or it is closed.
+            existing = client.table("orders").select("order_number, payment_status").eq("id", order_id).limit(1).execute()
+            if not existing.data:
+                logger.error("❌ [ERROR] Order %s not found", order_id)
+                return compact_payload("update_order_payment", {
+                    "result": "Error: Order not found.",
+                    "success": False
+                })
+            closed = existing.data[0]
+            logger.warning("⚠️  [UPDATE PAYMENT] Order %s is %s, not updated", closed['order_number'], closed['payment_status'])
+            if closed['payment_status'] == "expired":
+                result_message = (
+                    f"Error: Order {closed['order_number']} has expired because it was not paid in time, "
+                    "and its policy was cancelled. Please request a new quotation."
+                )
+            else:
+                result_message = f"Error: Order {closed['order_number']} was {closed['payment_status']} and can no longer be updated."
+            return compact_payload("update_order_payment", {
+                "result": result_message,
+                "success": False,
+                "order": {
+                    "order_number": closed['order_number'],
+                    "payment_status": closed['payment_status'],
+                }
             })
         
         updated_order = update_response.data[0]
-        logger.info(f"✅ [SUCCESS] Payment status updated")
-        logger.info(f"   Payment status: {updated_order['payment_status']}")
-        logger.info(f"   Policy status: {updated_order['policy_status']}")
+        if payment_status == "paid":
+            logger.info("🎉 [ACTIVATE] Activated policy %s", updated_order['policy_number'])
+        logger.info("✅ [SUCCESS] Payment status updated")
+        logger.debug("   Payment status: %s", updated_order['payment_status'])
+        logger.debug("   Policy status: %s", updated_order['policy_status'])
         
         result_message = "Payment status updated successfully!"
         if payment_status == "paid":
-            result_message += f" Policy {order['policy_number']} is now ACTIVE."
+            result_message += f" Policy {updated_order['policy_number']} is now ACTIVE."
         
-        return json.dumps({
+        return compact_payload("update_order_payment", {
             "result": result_message,
             "success": True,
             "order": {
@@ -287,9 +273,9 @@ def update_order_payment(
         })
     
     except Exception as e:
-        logger.error(f"❌ [EXCEPTION] Failed to update payment: {str(e)}")
+        logger.error("❌ [EXCEPTION] Failed to update payment: %s", str(e))
         logger.exception(e)
-        return json.dumps({
+        return compact_payload("update_order_payment", {
             "result": f"Error updating order: {str(e)}",
             "success": False
         })
@@ -312,35 +298,36 @@ def get_order_status(order_number: str) -> str:
         A JSON string with the order details and current status.
     """
     logger.info("📋 [GET ORDER STATUS] Fetching order status")
-    logger.info(f"   Order number: {order_number}")
+    logger.debug("   Order number: %s", order_number)
     
     client = get_supabase_client()
     
-    # Fetch the order
+    # Fetch the order with its quotation embedded (orders.quotation_id → quotations)
     logger.info("🔍 [DATABASE] Querying orders table...")
-    order_response = client.table("orders").select("*").eq("order_number", order_number).execute()
+    order_response = (
+        client.table("orders")
+        .select("*, quotations(quotation_number, customer_name, total_premium)")
+        .eq("order_number", order_number)
+        .execute()
+    )
     
     if not order_response.data or len(order_response.data) == 0:
-        logger.warning(f"⚠️  [NOT FOUND] Order {order_number} not found")
-        return json.dumps({
+        logger.warning("⚠️  [NOT FOUND] Order %s not found", order_number)
+        return compact_payload("get_order_status", {
             "result": f"Order {order_number} not found. Please check the order number and try again.",
             "success": False
         })
     
     order = order_response.data[0]
+    quotation = order.get("quotations") or {}
     
-    # Fetch related quotation
-    logger.info("🔍 [DATABASE] Fetching related quotation...")
-    quotation_response = client.table("quotations").select("*").eq("id", order['quotation_id']).execute()
-    quotation = quotation_response.data[0] if quotation_response.data else {}
-    
-    logger.info(f"✅ [SUCCESS] Order found")
-    logger.info(f"   Payment status: {order['payment_status']}")
-    logger.info(f"   Policy status: {order['policy_status']}")
-    logger.info(f"   Policy number: {order['policy_number']}")
-    logger.info(f"   Total amount: {quotation.get('total_premium', 0)} THB")
+    logger.info("✅ [SUCCESS] Order found")
+    logger.debug("   Payment status: %s", order['payment_status'])
+    logger.debug("   Policy status: %s", order['policy_status'])
+    logger.debug("   Policy number: %s", order['policy_number'])
+    logger.debug("   Total amount: %s THB", quotation.get('total_premium', 0))
     
-    return json.dumps({
+    return compact_payload("get_order_status", {
         "result": "Order found.",
         "success": True,
         "order": {
@@ -1,13 +1,16 @@
-import json
 import uuid
 import logging
 from datetime import datetime, timedelta
 from typing import Optional
 from langchain_core.tools import tool
 from database import get_supabase_client
+from pricing import pricing_engine
+from tools.compaction import compact_payload
 
 logger = logging.getLogger("zeus.tools.create_quotation")
 
+QUOTATION_VALID_DAYS = 30
+
 
 def _generate_quotation_number() -> str:
     """Generate a unique quotation number in format QT-YYYYMMDD-XXXX"""
@@ -16,6 +19,32 @@ def _generate_quotation_number() -> str:
     return f"QT-{timestamp}-{random_suffix}"
 
 
+def quotation_record(
+    details: dict,
+    session_id: str,
+    customer_name: Optional[str] = None,
+    customer_email: Optional[str] = None,
+    customer_phone: Optional[str] = None,
+) -> dict:
+    """A draft ``quotations`` row for one catalog row (hand-set or estimated); shared with compare_quotations."""
+    # Base premium is the total for now; taxes/fees can be added here later.
+    return {
+        "session_id": session_id,
+        "car_model_id": details["car_model_id"],
+        "plan_id": details["plan_id"],
+        "customer_name": customer_name,
+        "customer_email": customer_email,
+        "customer_phone": customer_phone,
+        "car_estimated_price": float(details["car_estimated_price"]),
+        "base_premium": float(details["base_premium"]),
+        "deductible": float(details["deductible"]),
+        "total_premium": float(details["base_premium"]),
+        "quotation_number": _generate_quotation_number(),
+        "valid_until": (datetime.now() + timedelta(days=QUOTATION_VALID_DAYS)).isoformat(),
+        "status": "draft",
+    }
+
+
 @tool
 def create_quotation(
     session_id: str,
@@ -36,8 +65,8 @@ def create_quotation(
     
     Args:
         session_id: The current chat session ID (UUID string)
-        car_model_id: The ID of the selected car model from vw_quotation_details
-        plan_id: The ID of the selected insurance plan from vw_quotation_details
+        car_model_id: The ID of the selected car model from search_quotation_details
+        plan_id: The ID of the selected insurance plan from search_quotation_details
         customer_name: Optional customer name
         customer_email: Optional customer email for sending the quotation
         customer_phone: Optional customer phone number
@@ -46,78 +75,64 @@ def create_quotation(
         A JSON string with the created quotation details including quotation number and validity period.
     """
     logger.info("📝 [CREATE QUOTATION] Starting quotation creation")
-    logger.info(f"   Session ID: {session_id}")
-    logger.info(f"   Car Model ID: {car_model_id}")
-    logger.info(f"   Plan ID: {plan_id}")
-    logger.info(f"   Customer: {customer_name or 'Not provided'}")
-    logger.info(f"   Email: {customer_email or 'Not provided'}")
-    logger.info(f"   Phone: {customer_phone or 'Not provided'}")
+    logger.debug("   Session ID: %s", session_id)
+    logger.debug("   Car Model ID: %s", car_model_id)
+    logger.debug("   Plan ID: %s", plan_id)
+    logger.debug("   Customer: %s", customer_name or 'Not provided')
+    logger.debug("   Email: %s", customer_email or 'Not provided')
+    logger.debug("   Phone: %s", customer_phone or 'Not provided')
     
     client = get_supabase_client()
     
-    # Fetch the quotation details from the view
-    logger.info("🔍 [DATABASE] Fetching quotation details from view...")
-    quotation_data = client.table("vw_quotation_details").select("*").eq("car_model_id", car_model_id).eq("plan_id", plan_id).execute()
+    # Look the premium up in the pricing matrix; the view only when the matrix cannot be loaded
+    try:
+        details = pricing_engine.lookup(car_model_id, plan_id)
+    except Exception as e:
+        logger.warning("⚠️  [PRICING] Matrix unavailable (%s), fetching quotation details from view...", str(e))
+        quotation_data = client.table("vw_quotation_details").select("*").eq("car_model_id", car_model_id).eq("plan_id", plan_id).execute()
+        details = quotation_data.data[0] if quotation_data.data else None
     
-    if not quotation_data.data or len(quotation_data.data) == 0:
+    if details is None:
         logger.error("❌ [ERROR] No matching car/plan combination found")
-        return json.dumps({
+        return compact_payload("create_quotation", {
             "result": "Error: Could not find the selected car and plan combination. Please verify the IDs.",
             "success": False
         })
     
-    details = quotation_data.data[0]
-    logger.info(f"✅ [FOUND] {details['brand']} {details['model']} {details['sub_model']} ({details['year']})")
-    logger.info(f"   Plan: {details['plan_name']} ({details['plan_type']})")
-    logger.info(f"   Premium: {details['base_premium']} THB")
-    logger.info(f"   Deductible: {details['deductible']} THB")
-    
-    # Generate quotation number and validity
-    quotation_number = _generate_quotation_number()
-    valid_until = datetime.now() + timedelta(days=30)  # Valid for 30 days
-    logger.info(f"🔢 [GENERATE] Quotation number: {quotation_number}")
-    logger.info(f"📅 [VALIDITY] Valid until: {valid_until.strftime('%Y-%m-%d')}")
-    
-    # Calculate total premium (base premium is the total for now, can add taxes/fees later)
-    total_premium = float(details['base_premium'])
-    logger.info(f"💰 [CALCULATE] Total premium: {total_premium} THB")
+    logger.info("✅ [FOUND] %s %s %s (%s)", details['brand'], details['model'], details['sub_model'], details['year'])
+    logger.debug("   Plan: %s (%s)", details['plan_name'], details['plan_type'])
+    logger.debug("   Premium: %s THB", details['base_premium'])
+    logger.debug("   Deductible: %s THB", details['deductible'])
+    logger.debug("   Estimated: %s", details.get('estimated', False))
     
-    # Create quotation record
-    quotation_record = {
-        "session_id": session_id,
-        "car_model_id": car_model_id,
-        "plan_id": plan_id,
-        "customer_name": customer_name,
-        "customer_email": customer_email,
-        "customer_phone": customer_phone,
-        "car_estimated_price": float(details['car_estimated_price']),
-        "base_premium": float(details['base_premium']),
-        "deductible": float(details['deductible']),
-        "total_premium": total_premium,
-        "quotation_number": quotation_number,
-        "valid_until": valid_until.isoformat(),
-        "status": "draft"
-    }
+    # Generate quotation number, validity and total premium
+    record = quotation_record(details, session_id, customer_name, customer_email, customer_phone)
+    quotation_number = record["quotation_number"]
+    valid_until = datetime.fromisoformat(record["valid_until"])
+    total_premium = record["total_premium"]
+    logger.info("🔢 [GENERATE] Quotation number: %s", quotation_number)
+    logger.info("📅 [VALIDITY] Valid until: %s", valid_until.strftime('%Y-%m-%d'))
+    logger.info("💰 [CALCULATE] Total premium: %s THB", total_premium)
     
-    logger.info(f"💾 [DATABASE] Inserting quotation record: {quotation_number}")
+    logger.info("💾 [DATABASE] Inserting quotation record: %s", quotation_number)
     
     try:
-        insert_response = client.table("quotations").insert(quotation_record).execute()
+        insert_response = client.table("quotations").insert(record).execute()
         
         if not insert_response.data:
             logger.error("❌ [ERROR] Failed to insert quotation")
-            return json.dumps({
+            return compact_payload("create_quotation", {
                 "result": "Error: Failed to create quotation. Please try again.",
                 "success": False
             })
         
         created_quotation = insert_response.data[0]
-        logger.info(f"✅ [SUCCESS] Quotation created successfully")
-        logger.info(f"   Quotation ID: {created_quotation['id']}")
-        logger.info(f"   Quotation Number: {quotation_number}")
-        logger.info(f"   Status: draft")
+        logger.info("✅ [SUCCESS] Quotation created successfully")
+        logger.debug("   Quotation ID: %s", created_quotation['id'])
+        logger.debug("   Quotation Number: %s", quotation_number)
+        logger.debug("   Status: draft")
         
-        return json.dumps({
+        return compact_payload("create_quotation", {
             "result": "Quotation created successfully!",
             "success": True,
             "quotation": {
@@ -130,19 +145,18 @@ def create_quotation(
                 "insurer": details['insurer_name'],
                 "annual_premium": float(details['base_premium']),
                 "deductible": float(details['deductible']),
+                "premium_estimated": details.get('estimated', False),
                 "total_premium": total_premium,
                 "valid_until": valid_until.strftime("%Y-%m-%d"),
                 "customer_name": customer_name,
-                "customer_email": customer_email,
-                "customer_phone": customer_phone,
                 "status": "draft"
             }
         })
     
     except Exception as e:
-        logger.error(f"❌ [EXCEPTION] Failed to create quotation: {str(e)}")
+        logger.error("❌ [EXCEPTION] Failed to create quotation: %s", str(e))
         logger.exception(e)
-        return json.dumps({
+        return compact_payload("create_quotation", {
             "result": f"Error creating quotation: {str(e)}",
             "success": False
         })
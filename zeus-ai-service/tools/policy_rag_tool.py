@@ -1,20 +1,49 @@
-import json
 import os
+import array
+import base64
+import hashlib
 import logging
+from functools import lru_cache
 from langchain_core.tools import tool
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from database import get_supabase_client
+from tools.compaction import compact_records, to_tool_json
+from telemetry import span
+from shared_state import SharedCache
 
 logger = logging.getLogger("zeus.tools.policy_rag")
 
+EMBEDDING_DIMENSIONS = 2000
+# Query vectors are shared between workers; stored as base64 float32 (8 KB instead of ~40 KB of JSON).
+_query_embeddings = SharedCache("embedding", ttl_seconds=int(os.environ.get("ZEUS_EMBEDDING_CACHE_TTL_SECONDS", "86400")))
+
+
+@lru_cache(maxsize=1)
+def get_embeddings_model():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
-def _get_embeddings_model() -> GoogleGenerativeAIEmbeddings:
     return GoogleGenerativeAIEmbeddings(
         model="models/gemini-embedding-001",
         google_api_key=os.environ["GEMINI_API_KEY"],
     )
 
 
+def _embed_query(query: str) -> list[float]:
+    """Trimmed query embedding, from the shared cache when another request already asked."""
+    key = hashlib.sha256(" ".join(query.lower().split()).encode("utf-8")).hexdigest()
+    cached = _query_embeddings.get(key)
+    if cached:
+        logger.debug("   Query embedding served from cache")
+        return array.array("f", base64.b64decode(cached)).tolist()
+
+    with span("embedding", "gemini-embedding-001"):
+        query_embedding = get_embeddings_model().embed_query(query)
+    logger.debug("   Original dimensions: %s", len(query_embedding))
+    # Trim to 2000 dimensions to match DB schema
+    trimmed = query_embedding[:EMBEDDING_DIMENSIONS]
+    _query_embeddings.set(key, base64.b64encode(array.array("f", trimmed).tobytes()).decode("ascii"))
+    return trimmed
+
+
 @tool
 def search_policy_documents(query: str, section: str = None) -> str:
     """
@@ -30,23 +59,18 @@ def search_policy_documents(query: str, section: str = None) -> str:
                  Highly recommended to use 'Exclusion' when checking if something is NOT covered.
 
     Returns:
-        A JSON string with the most relevant policy document excerpts and their
-        similarity scores.
+        A JSON table ("columns" + "rows") with the most relevant policy document
+        excerpts, their section, plan type and similarity scores.
     """
     logger.info("📚 [POLICY RAG] Starting semantic search")
-    logger.info(f"   Query: {query[:100]}..." if len(query) > 100 else f"   Query: {query}")
-    logger.info(f"   Section filter: {section or 'None (all sections)'}")
+    logger.debug("   Query: %.100s", query)
+    logger.debug("   Section filter: %s", section or 'None (all sections)')
     
     client = get_supabase_client()
     
     logger.info("🔢 [EMBEDDING] Generating query embedding...")
-    embeddings_model = _get_embeddings_model()
-    query_embedding = embeddings_model.embed_query(query)
-    logger.info(f"   Original dimensions: {len(query_embedding)}")
-
-    # Trim to 2000 dimensions to match DB schema
-    trimmed_query_embedding = query_embedding[:2000]
-    logger.info(f"   Trimmed to: {len(trimmed_query_embedding)} dimensions")
+    trimmed_query_embedding = _embed_query(query)
+    logger.debug("   Trimmed to: %s dimensions", len(trimmed_query_embedding))
     logger.info("🔍 [DATABASE] Calling match_documents RPC...")
 
     response = client.rpc(
@@ -59,35 +83,36 @@ def search_policy_documents(query: str, section: str = None) -> str:
         },
     ).execute()
 
-    logger.info(f"📊 [RESULTS] Received {len(response.data) if response.data else 0} matches")
+    logger.info("📊 [RESULTS] Received %s matches", len(response.data) if response.data else 0)
 
     if not response.data:
         logger.warning("⚠️  [NO RESULTS] No documents found above similarity threshold 0.4")
-        return json.dumps(
+        return to_tool_json(
             {
                 "result": "No relevant policy documents found for this query.",
-                "documents": [],
+                "rows": [],
             }
         )
 
     documents = [
         {
+            "section": doc.get("section"),
+            "plan_type": doc.get("plan_type"),
+            "similarity": round(doc["similarity"], 3),
             "content": doc["content"],
-            "metadata": doc["metadata"],
-            "similarity": round(doc["similarity"], 4),
         }
         for doc in response.data
     ]
     
     for i, doc in enumerate(documents, 1):
-        logger.info(f"   [{i}] Similarity: {doc['similarity']:.4f} | {doc['content'][:80]}...")
+        logger.debug("   [%s] Similarity: %.4f | %.80s...", i, doc['similarity'], doc['content'])
     
-    logger.info(f"✅ [SUCCESS] Returning {len(documents)} relevant document(s)")
+    logger.info("✅ [SUCCESS] Returning %s relevant document(s)", len(documents))
 
-    return json.dumps(
-        {
-            "result": f"Found {len(documents)} relevant policy document(s).",
-            "documents": documents,
-        }
+    return compact_records(
+        "search_policy_documents",
+        f"Found {len(documents)} relevant policy document(s).",
+        documents,
+        more_hint="refine the query or add a section filter",
     )
 
@@ -1,18 +1,34 @@
 import re
-import json
 import logging
 from typing import Optional
 from langchain_core.tools import tool
 from database import get_supabase_client
+from pricing import pricing_engine
+from tools.compaction import TOOL_OUTPUT_LIMITS, compact_records, compact_payload, select_columns, to_tool_json
 
 logger = logging.getLogger("zeus.tools.quotation")
 
+# vw_quotation_details only holds hand-set premiums, so it has no ``estimated`` column.
+VIEW_COLUMNS = ", ".join(c for c in TOOL_OUTPUT_LIMITS["search_quotation_details"].columns if c != "estimated")
+ESTIMATE_NOTE = "Rows with estimated=true are priced from the rate card; say the premium is an estimate."
+
 
 def _clean_sub_model(sub_model: str) -> str:
     """Remove trailing year (4-digit number) accidentally included in sub_model by the LLM."""
     return re.sub(r'\b(19|20)\d{2}\b', '', sub_model).strip().strip('-').strip()
 
 
+def _contains(text: Optional[str], term: str) -> bool:
+    """In-memory equivalent of ``ILIKE '%term%'``."""
+    return text is not None and term.lower() in text.lower()
+
+
+def _found(result: str, data: list[dict], **kwargs) -> str:
+    if any(row.get("estimated") for row in data):
+        kwargs["note"] = ESTIMATE_NOTE
+    return compact_records("search_quotation_details", result, data, **kwargs)
+
+
 @tool
 def search_quotation_details(
     brand: Optional[str] = None,
@@ -21,9 +37,10 @@ def search_quotation_details(
     year: Optional[int] = None,
 ) -> str:
     """
-    Search the vw_quotation_details view for vehicle information and insurance premiums.
-    Returns brand, model, sub_model, year, car_estimated_price, plan_type, plan_name,
-    insurer_name, base_premium, and deductible.
+    Search the vehicle catalog for vehicle information and insurance premiums.
+    Returns a table ("columns" + "rows") with car_model_id, plan_id, brand, model, sub_model,
+    year, car_estimated_price, plan_type, plan_name, base_premium, deductible, and estimated
+    (true when the premium is computed from the rate card rather than hand-set).
 
     Use this tool whenever the user mentions a car brand, model name, or sub-model.
     IMPORTANT: Split the car name into separate arguments.
@@ -37,26 +54,34 @@ def search_quotation_details(
         year: The manufacturing year as an integer (e.g., 2024).
     """
     logger.info("🔍 [QUOTATION SEARCH] Starting vehicle search")
-    logger.info(f"   Brand: {brand}")
-    logger.info(f"   Model: {model}")
-    logger.info(f"   Sub-model: {sub_model}")
-    logger.info(f"   Year: {year}")
+    logger.debug("   Brand: %s", brand)
+    logger.debug("   Model: %s", model)
+    logger.debug("   Sub-model: %s", sub_model)
+    logger.debug("   Year: %s", year)
     
     if not any([brand, model, sub_model, year]):
         logger.warning("⚠️  [QUOTATION SEARCH] No search parameters provided")
-        return json.dumps({"result": "Error: You must provide at least one of brand, model, sub_model, or year."})
+        return to_tool_json({"result": "Error: You must provide at least one of brand, model, sub_model, or year."})
 
     # Clean year accidentally put into sub_model by LLM
     if sub_model:
         original_sub_model = sub_model
         sub_model = _clean_sub_model(sub_model)
         if original_sub_model != sub_model:
-            logger.info(f"   Cleaned sub_model: '{original_sub_model}' → '{sub_model}'")
+            logger.debug("   Cleaned sub_model: '%s' → '%s'", original_sub_model, sub_model)
 
+    # Every car with a hand-set or estimated premium, from memory; the view only if it cannot be loaded.
+    matrix = pricing_engine.try_matrix()
     client = get_supabase_client()
 
     def _run_query(b, m, s, y):
-        q = client.table("vw_quotation_details").select("*")
+        if matrix is not None:
+            return [
+                row for row in matrix.search(b, m)
+                if (not s or _contains(row["sub_model"], s))
+                and (not y or row["year"] == y)
+            ]
+        q = client.table("vw_quotation_details").select(VIEW_COLUMNS)
         if b:
             q = q.ilike("brand", f"%{b}%")
         if m:
@@ -71,55 +96,64 @@ def search_quotation_details(
     logger.info("🎯 [ATTEMPT 1] Exact match search (all parameters)")
     data = _run_query(brand, model, sub_model, year)
     if data:
-        logger.info(f"✅ [SUCCESS] Found {len(data)} exact matches")
-        return json.dumps({"result": "Found quotation details.", "records": data})
+        logger.info("✅ [SUCCESS] Found %s exact matches", len(data))
+        return _found("Found quotation details.", data)
 
     # Attempt 2: Drop year constraint
     if year:
         logger.info("🎯 [ATTEMPT 2] Relaxing year constraint")
         data = _run_query(brand, model, sub_model, None)
         if data:
-            logger.info(f"✅ [SUCCESS] Found {len(data)} matches (year relaxed)")
-            return json.dumps({"result": "Found quotation details (year relaxed).", "records": data})
+            logger.info("✅ [SUCCESS] Found %s matches (year relaxed)", len(data))
+            return _found("Found quotation details (year relaxed).", data)
 
     # Attempt 3: Drop sub_model constraint
     if sub_model:
         logger.info("🎯 [ATTEMPT 3] Relaxing sub_model constraint")
         data = _run_query(brand, model, None, year)
         if data:
-            logger.info(f"✅ [SUCCESS] Found {len(data)} matches (sub_model relaxed)")
-            return json.dumps({
-                "result": f"No exact match for sub_model '{sub_model}'. Here are available trims — pick the closest one.",
-                "records": data,
-            })
+            logger.info("✅ [SUCCESS] Found %s matches (sub_model relaxed)", len(data))
+            return _found(
+                f"No exact match for sub_model '{sub_model}'. Here are available trims — pick the closest one.",
+                data,
+            )
 
     # Attempt 4: Brand + model only
     if brand or model:
         logger.info("🎯 [ATTEMPT 4] Brand + model only")
         data = _run_query(brand, model, None, None)
         if data:
-            logger.info(f"✅ [SUCCESS] Found {len(data)} matches (brand+model only)")
-            return json.dumps({
-                "result": f"Could not match '{sub_model or ''}' trim. Here are all available variants for {brand or ''} {model or ''}.",
-                "records": data,
-            })
+            logger.info("✅ [SUCCESS] Found %s matches (brand+model only)", len(data))
+            return _found(
+                f"Could not match '{sub_model or ''}' trim. Here are all available variants for {brand or ''} {model or ''}.",
+                data,
+            )
 
     # Attempt 5: Brand only
     if brand:
         logger.info("🎯 [ATTEMPT 5] Brand only")
         data = _run_query(brand, None, None, None)
         if data:
-            logger.info(f"✅ [SUCCESS] Found {len(data)} matches (brand only)")
-            return json.dumps({
-                "result": f"Could not find exact model. Here are all available {brand} vehicles.",
-                "records": data,
-            })
-
-    # Last resort: return full catalogue
-    logger.warning("⚠️  [ATTEMPT 6] No matches found, returning full catalogue")
-    all_data = client.table("vw_quotation_details").select("brand, model, sub_model, year").execute().data
-    logger.info(f"📋 [CATALOGUE] Returning {len(all_data)} total vehicles")
-    return json.dumps({
-        "result": "No matching vehicle found. Here is the full catalogue to help you select the correct car.",
-        "records": all_data,
+            logger.info("✅ [SUCCESS] Found %s matches (brand only)", len(data))
+            return _found(
+                f"Could not find exact model. Here are all available {brand} vehicles.",
+                data,
+                more_hint="ask the user for the model name",
+            )
+
+    # Last resort: return the catalogue as distinct models grouped per brand
+    logger.warning("⚠️  [ATTEMPT 6] No matches found, returning catalogue summary")
+    if matrix is not None:
+        all_data = matrix.records()
+    else:
+        all_data = client.table("vw_quotation_details").select(select_columns("search_quotation_details.catalogue")).execute().data
+    catalogue: dict[str, list[str]] = {}
+    for row in all_data:
+        models = catalogue.setdefault(row["brand"], [])
+        if row["model"] not in models:
+            models.append(row["model"])
+    logger.info("📋 [CATALOGUE] Returning %s brands (%s rows collapsed)", len(catalogue), len(all_data))
+    return compact_payload("search_quotation_details.catalogue", {
+        "result": "No matching vehicle found. Here are the available brands and models — ask the user which one they mean.",
+        "catalogue": {brand: ", ".join(models) for brand, models in catalogue.items()},
     })
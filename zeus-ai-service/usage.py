@@ -0,0 +1,196 @@
+"""
+Token, tool-call and cost accounting for one agent run.
+
+A ``UsageCallback`` is attached to every ``/api/chat`` and ``/api/chat/stream``
+run. It sums the ``usage_metadata`` of each LLM call (every ReAct step, and the
+fallback model when the primary fails) and counts tool calls. The resulting
+``RequestUsage`` is returned to the client, stored in ``chat_usage`` and fed
+into the per-model metrics below.
+
+Prices are USD per million tokens and can be overridden with
+``ZEUS_MODEL_PRICES``, e.g.::
+
+    ZEUS_MODEL_PRICES='{"gemini-2.5-flash": {"input": 0.30, "output": 2.50, "cached": 0.03}}'
+
+Models without a price report ``cost_usd: null`` rather than a guess.
+"""
+
+import os
+import json
+import logging
+import threading
+from collections import Counter as TallyCounter
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from telemetry import Counter, Histogram, llm_model_name, registry
+
+logger = logging.getLogger("zeus.usage")
+
+DEFAULT_MODEL_PRICES: dict[str, dict[str, float]] = {
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50, "cached": 0.03},
+    "gemma-3-27b-it": {"input": 0.0, "output": 0.0, "cached": 0.0},
+    "glm4:9b": {"input": 0.0, "output": 0.0, "cached": 0.0},
+}
+
+
+def _load_prices() -> dict[str, dict[str, float]]:
+    prices = dict(DEFAULT_MODEL_PRICES)
+    raw = os.environ.get("ZEUS_MODEL_PRICES")
+    if raw:
+        try:
+            prices.update(json.loads(raw))
+        except ValueError as exc:
+            logger.warning("⚠️  [USAGE] Ignoring invalid ZEUS_MODEL_PRICES: %s", exc)
+    return prices
+
+
+MODEL_PRICES = _load_prices()
+
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+
+LLM_TOKENS = registry.register(Counter(
+    "zeus_llm_tokens_total", "LLM tokens by model and type (input, output, cached)", ("model", "type"),
+))
+LLM_CALLS = registry.register(Counter(
+    "zeus_llm_calls_total", "LLM calls (ReAct steps) by model", ("model",),
+))
+LLM_COST = registry.register(Counter(
+    "zeus_llm_cost_usd_total", "Estimated LLM spend in USD by model", ("model",),
+))
+TOOL_CALLS = registry.register(Counter(
+    "zeus_tool_calls_total", "Agent tool calls by tool", ("tool",),
+))
+AGENT_ITERATIONS = registry.register(Histogram(
+    "zeus_agent_iterations", "LLM steps per agent run", ("model",),
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 25),
+))
+REQUEST_TOKENS = registry.register(Histogram(
+    "zeus_request_tokens", "Total LLM tokens per agent run", ("model",),
+    buckets=(1_000, 2_000, 4_000, 8_000, 16_000, 32_000, 64_000, 128_000, 256_000),
+))
+
+
+# ── Accounting ────────────────────────────────────────────────────────────────
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    """USD cost of one call, or None when the model has no configured price."""
+    price = MODEL_PRICES.get(model)
+    if price is None:
+        return None
+    uncached = max(input_tokens - cached_tokens, 0)
+    cached_price = price.get("cached", price["input"])
+    return (uncached * price["input"] + cached_tokens * cached_price + output_tokens * price["output"]) / 1_000_000
+
+
+@dataclass
+class RequestUsage:
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    llm_calls: int = 0
+    tool_calls: dict[str, int] = field(default_factory=dict)
+    cost_usd: Optional[float] = None
+    models: list[str] = field(default_factory=list)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def to_dict(self) -> dict:
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "total_tokens": self.total_tokens,
+            "llm_calls": self.llm_calls,
+            "tool_calls": dict(self.tool_calls),
+            "cost_usd": None if self.cost_usd is None else round(self.cost_usd, 6),
+            "models": list(self.models),
+        }
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Accumulates the usage of one agent run; read it with ``summary()`` once the run ends."""
+
+    def __init__(self, model_choice: str) -> None:
+        self.model_choice = model_choice
+        self._lock = threading.Lock()
+        self._models: dict[UUID, str] = {}
+        self._usage = RequestUsage()
+        self._tools: TallyCounter = TallyCounter()
+        self._cost_known = True
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        self._models[run_id] = llm_model_name(serialized, metadata)
+
+    def on_llm_start(self, serialized: dict, prompts: list[str], *, run_id: UUID, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        self._models[run_id] = llm_model_name(serialized, metadata)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        model = self._models.pop(run_id, "unknown")
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                if usage:
+                    break
+        input_tokens = usage.get("input_tokens", 0) or 0
+        output_tokens = usage.get("output_tokens", 0) or 0
+        cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        cost = estimate_cost(model, input_tokens, output_tokens, cached)
+
+        LLM_CALLS.inc(model=model)
+        LLM_TOKENS.inc(input_tokens, model=model, type="input")
+        LLM_TOKENS.inc(output_tokens, model=model, type="output")
+        if cached:
+            LLM_TOKENS.inc(cached, model=model, type="cached")
+        if cost is not None:
+            LLM_COST.inc(cost, model=model)
+
+        with self._lock:
+            totals = self._usage
+            totals.llm_calls += 1
+            totals.input_tokens += input_tokens
+            totals.output_tokens += output_tokens
+            totals.cached_tokens += cached
+            if model not in totals.models:
+                totals.models.append(model)
+            if cost is None:
+                self._cost_known = False
+            else:
+                totals.cost_usd = (totals.cost_usd or 0.0) + cost
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._models.pop(run_id, None)
+
+    def on_tool_start(self, serialized: dict, input_str: str, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        TOOL_CALLS.inc(tool=name)
+        with self._lock:
+            self._tools[name] += 1
+
+    def summary(self) -> RequestUsage:
+        """Totals for the run so far; also observes the per-run histograms."""
+        with self._lock:
+            usage = RequestUsage(
+                input_tokens=self._usage.input_tokens,
+                output_tokens=self._usage.output_tokens,
+                cached_tokens=self._usage.cached_tokens,
+                llm_calls=self._usage.llm_calls,
+                tool_calls=dict(self._tools),
+                cost_usd=self._usage.cost_usd if self._cost_known else None,
+                models=list(self._usage.models),
+            )
+        AGENT_ITERATIONS.observe(usage.llm_calls, model=self.model_choice)
+        REQUEST_TOKENS.observe(usage.total_tokens, model=self.model_choice)
+        logger.info(
+            "🧮 [USAGE] %s LLM call(s), %s in / %s out tokens (%s cached), tools %s",
+            usage.llm_calls, usage.input_tokens, usage.output_tokens, usage.cached_tokens, usage.tool_calls or "none",
+        )
+        return usage
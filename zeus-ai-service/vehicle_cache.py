@@ -0,0 +1,206 @@
+"""
+Content-addressed cache of vehicle details recognised from uploaded images.
+
+When the agent sees a car or registration photo it reads the brand/model/year
+from it and immediately calls ``search_quotation_details`` with them — those
+tool arguments *are* the structured recognition result, so they are captured
+from the agent run at no extra inference cost. They are not cached when the
+user's message names the vehicle, since the model may have searched for what
+was typed rather than what is in the photo. The next upload of the same image
+(same SHA-256) is replaced by a short text note instead of being sent to the
+vision model again. A re-encoded copy matched only by its perceptual hash may
+be a different car, so the image is still sent, with the cached details
+attached as a hint.
+
+Entries live in the shared store (``shared_state``), so an image recognised by
+one worker is a hit on every other.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from typing import Iterable, Optional
+
+from image_processing import ProcessedImage
+from shared_state import SharedCache
+from telemetry import registry
+
+logger = logging.getLogger("zeus.vehicle_cache")
+
+VEHICLE_CACHE_MAX_ENTRIES = int(os.environ.get("ZEUS_VEHICLE_CACHE_MAX_ENTRIES", "2048"))
+VEHICLE_CACHE_TTL_SECONDS = int(os.environ.get("ZEUS_VEHICLE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+RECOGNITION_TOOL = "search_quotation_details"
+_BLANK_DHASH = "0" * 16
+
+
+@dataclass(frozen=True)
+class VehicleFields:
+    brand: Optional[str] = None
+    model: Optional[str] = None
+    sub_model: Optional[str] = None
+    year: Optional[int] = None
+
+    @classmethod
+    def from_tool_args(cls, args: dict) -> Optional["VehicleFields"]:
+        fields = cls(
+            brand=args.get("brand") or None,
+            model=args.get("model") or None,
+            sub_model=args.get("sub_model") or None,
+            year=args.get("year") or None,
+        )
+        return fields if (fields.brand or fields.model) else None
+
+    def describe(self) -> str:
+        return " ".join(str(v) for v in (self.brand, self.model, self.sub_model, self.year) if v)
+
+    def mentioned_in(self, text: str) -> bool:
+        """Whether the text names any of the fields, i.e. the search may not come from the image."""
+        folded = text.casefold()
+        return any(str(v).casefold() in folded for v in (self.brand, self.model, self.sub_model, self.year) if v)
+
+    def as_context(self, image: ProcessedImage) -> str:
+        """Text that stands in for the image on a cache hit."""
+        known = ", ".join(f"{k}={v}" for k, v in asdict(self).items() if v)
+        return (
+            f"[The user attached a vehicle photo (ref {image.sha256[:12]}) that was already analysed: "
+            f"{known}. Use these details instead of asking for the image again.]"
+        )
+
+    def as_hint(self, image: ProcessedImage) -> str:
+        """Text sent along with an image that only resembles one analysed before."""
+        known = ", ".join(f"{k}={v}" for k, v in asdict(self).items() if v)
+        return (
+            f"[The attached photo (ref {image.sha256[:12]}) resembles one already analysed as {known}. "
+            f"Confirm against the image before relying on these details.]"
+        )
+
+
+@dataclass(frozen=True)
+class CachedVehicle:
+    """A cache hit; ``exact`` when the image bytes matched, not only the perceptual hash."""
+
+    fields: VehicleFields
+    exact: bool
+
+
+class VehicleRecognitionCache:
+    """LRU + TTL map from image hashes to recognised vehicle fields in the shared store, with hit metrics."""
+
+    def __init__(self, max_entries: int = VEHICLE_CACHE_MAX_ENTRIES, ttl_seconds: int = VEHICLE_CACHE_TTL_SECONDS) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._store = SharedCache("vehicle", ttl_seconds, max_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _keys(image: ProcessedImage) -> list[str]:
+        keys = [f"sha256:{image.sha256}"]
+        if image.dhash != _BLANK_DHASH:
+            keys.append(f"dhash:{image.dhash}")
+        return keys
+
+    def get(self, image: ProcessedImage) -> Optional[CachedVehicle]:
+        for key in self._keys(image):
+            stored = self._store.get(key)
+            if not isinstance(stored, dict):
+                continue
+            fields = VehicleFields(**{k: stored.get(k) for k in ("brand", "model", "sub_model", "year")})
+            with self._lock:
+                self.hits += 1
+            logger.info("🚗 [VEHICLE CACHE] Hit %s → %s", key[:19], fields.describe())
+            return CachedVehicle(fields, exact=key.startswith("sha256:"))
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, image: ProcessedImage, fields: VehicleFields) -> None:
+        for key in self._keys(image):
+            self._store.set(key, asdict(fields))
+        logger.info("🚗 [VEHICLE CACHE] Stored %s → %s", image.sha256[:12], fields.describe())
+
+    # Redis calls block on the socket (up to its timeout per key), so from async
+    # code they run in a thread; the in-process backend answers inline.
+    async def aget(self, image: ProcessedImage) -> Optional[CachedVehicle]:
+        if self._store.shared:
+            return await asyncio.to_thread(self.get, image)
+        return self.get(image)
+
+    async def aput(self, image: ProcessedImage, fields: VehicleFields) -> None:
+        if self._store.shared:
+            await asyncio.to_thread(self.put, image, fields)
+        else:
+            self.put(image, fields)
+
+    def stats(self) -> dict:
+        """
+        Hit counters are per worker; ``entries``, ``evictions`` and ``expirations``
+        are only known for the in-process backend (Redis applies its own bound).
+        """
+        counters = self._store.counters() or {}
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "shared" if self._store.shared else "memory",
+                "entries": self._store.entries(),
+                "max_entries": None if self._store.shared else self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": counters.get("evictions"),
+                "expirations": counters.get("expirations"),
+            }
+
+
+def recognised_vehicle(tool_calls: Iterable[tuple[str, dict]], message: str = "") -> Optional[VehicleFields]:
+    """
+    The first ``search_quotation_details`` call of a turn carries what the model
+    read from the image, unless the user's message names the vehicle itself.
+    """
+    for name, args in tool_calls:
+        if name == RECOGNITION_TOOL and isinstance(args, dict):
+            fields = VehicleFields.from_tool_args(args)
+            if fields is not None and fields.mentioned_in(message):
+                logger.debug("🚗 [VEHICLE CACHE] Not caching %s: named in the message", fields.describe())
+                return None
+            return fields
+    return None
+
+
+def tool_calls_from_messages(messages: list) -> list[tuple[str, dict]]:
+    """(name, args) of every tool call requested by AI messages, in order."""
+    return [
+        (call["name"], call.get("args") or {})
+        for message in messages
+        for call in (getattr(message, "tool_calls", None) or [])
+    ]
+
+
+vehicle_cache = VehicleRecognitionCache()
+
+
+def _collect_vehicle_cache_metrics() -> list[str]:
+    stats = vehicle_cache.stats()
+    lines = [
+        "# TYPE zeus_vehicle_cache_lookups_total counter",
+        f'zeus_vehicle_cache_lookups_total{{result="hit"}} {stats["hits"]}',
+        f'zeus_vehicle_cache_lookups_total{{result="miss"}} {stats["misses"]}',
+    ]
+    if stats["entries"] is not None:
+        lines += ["# TYPE zeus_vehicle_cache_entries gauge", f"zeus_vehicle_cache_entries {stats['entries']}"]
+    if stats["evictions"] is not None:
+        lines += [
+            "# TYPE zeus_vehicle_cache_evictions_total counter",
+            f"zeus_vehicle_cache_evictions_total {stats['evictions']}",
+            "# TYPE zeus_vehicle_cache_expirations_total counter",
+            f"zeus_vehicle_cache_expirations_total {stats['expirations']}",
+        ]
+    return lines
+
+
+registry.register_collector(_collect_vehicle_cache_metrics)
@@ -11,12 +11,19 @@ function buildFastAPIBody(body: Record<string, any>) {
   });
 }
 
+// Forward the client's Idempotency-Key so FastAPI can coalesce re-sent messages
+function buildFastAPIHeaders(idempotencyKey: string | null): HeadersInit {
+  return idempotencyKey
+    ? { "Content-Type": "application/json", "Idempotency-Key": idempotencyKey }
+    : { "Content-Type": "application/json" };
+}
+
 // ── Streaming POST (/api/chat  with stream:true in body) ──────────────────────
 // Proxies FastAPI SSE → browser as ReadableStream (text/event-stream)
-async function handleStream(body: Record<string, any>): Promise<Response> {
+async function handleStream(body: Record<string, any>, idempotencyKey: string | null): Promise<Response> {
   const fastapiRes = await fetch(`${FASTAPI_URL}/api/chat/stream`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: buildFastAPIHeaders(idempotencyKey),
     body: buildFastAPIBody(body),
   });
 
@@ -43,10 +50,10 @@ async function handleStream(body: Record<string, any>): Promise<Response> {
 }
 
 // ── Non-streaming POST (standard JSON for Postman / fallback) ─────────────────
-async function handleJSON(body: Record<string, any>): Promise<Response> {
+async function handleJSON(body: Record<string, any>, idempotencyKey: string | null): Promise<Response> {
   const fastapiRes = await fetch(`${FASTAPI_URL}/api/chat`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: buildFastAPIHeaders(idempotencyKey),
     body: buildFastAPIBody(body),
   });
 
@@ -69,10 +76,11 @@ async function handleJSON(body: Record<string, any>): Promise<Response> {
 export async function POST(req: NextRequest) {
   try {
     const body = await req.json();
+    const idempotencyKey = req.headers.get("idempotency-key");
     if (body.stream === true) {
-      return handleStream(body);
+      return handleStream(body, idempotencyKey);
     }
-    return handleJSON(body);
+    return handleJSON(body, idempotencyKey);
   } catch (e: any) {
     return NextResponse.json(
       { error: e.message ?? "Unknown error" },